@@ -0,0 +1,102 @@
+"""@package benchmarks.import_time
+@author Kasper Rantamäki
+Benchmark that enforces the startup budget of the QuantForm Python library
+
+Each module is imported in a fresh interpreter a number of times and the median wall time of the import is compared
+against its budget. Additionally none of the heavy dependencies that the library loads lazily (QuantLib, matplotlib,
+pandas and the scipy submodules) may be loaded by the import itself. The script exits with a non-zero status if any
+of the checks fail, so it can be run as a part of the build.
+
+Usage: python benchmarks/import_time.py [--repeat N] [--scale X] [--json PATH]
+"""
+from typing import Dict, List
+from pathlib import Path
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+
+# The import time budgets in milliseconds. Most of the time is spent in importing numpy
+BUDGETS_MS = {
+  "quantform.pylib":                 100,
+  "quantform.pylib.curve":           250,
+  "quantform.pylib.surface":         300,
+  "quantform.pylib.equity":          250,
+  "quantform.pylib.risk_management": 250
+}
+
+
+# The dependencies that must not be loaded when the modules are imported
+LAZY_DEPENDENCIES = ["QuantLib", "matplotlib", "pandas", "scipy.interpolate", "scipy.integrate", "scipy.optimize",
+                     "scipy.special", "scipy.ndimage", "scipy.linalg", "scipy.sparse", "scipy.stats"]
+
+
+# Timed in the child process so that the interpreter startup is excluded
+_probe = """
+import time, sys, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {lazy} if name in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> Dict[str, any]:
+  """Function for measuring the import time of a module
+
+  @param module  The fully qualified name of the module
+  @param repeat  The number of fresh interpreters the import is timed in
+  @return        Dictionary with the median import time in milliseconds ('median_ms'), all of the measured times
+                 ('times_ms') and the lazy dependencies loaded by the import ('loaded')
+  """
+  env = dict(os.environ, PYTHONPATH=str(Path(__file__).resolve().parents[1] / "src"))
+
+  times, loaded = [], []
+  for _ in range(repeat):
+    output = subprocess.run([sys.executable, "-c", _probe.format(module=module, lazy=LAZY_DEPENDENCIES)], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    times.append(1000 * result["seconds"])
+    loaded = result["loaded"]
+
+  return {"median_ms": sorted(times)[len(times) // 2], "times_ms": times, "loaded": loaded}
+
+
+def main(argv: List[str]) -> int:
+  parser = argparse.ArgumentParser(description="Import time benchmark for the QuantForm Python library")
+  parser.add_argument("--repeat", type=int, default=5, help="The number of timed imports per module")
+  parser.add_argument("--scale", type=float, default=1., help="Multiplier for the budgets e.g. on slow machines")
+  parser.add_argument("--json", type=str, default=None, help="Path of a JSON file to write the results into")
+  args = parser.parse_args(argv)
+
+  results, failed = {}, False
+
+  print(f"{'Module':<36}{'Median [ms]':>12}{'Budget [ms]':>12}  Status")
+  for module, budget in BUDGETS_MS.items():
+    result = measure(module, args.repeat)
+    result["budget_ms"] = budget * args.scale
+
+    problems = []
+    if result["median_ms"] > result["budget_ms"]:
+      problems.append("over budget")
+    if result["loaded"]:
+      problems.append(f"loaded {', '.join(result['loaded'])}")
+
+    result["passed"] = not problems
+    failed           = failed or bool(problems)
+    results[module]  = result
+
+    print(f"{module:<36}{result['median_ms']:>12.1f}{result['budget_ms']:>12.1f}  {'; '.join(problems) or 'ok'}")
+
+  if args.json is not None:
+    with open(args.json, "w") as file:
+      json.dump(results, file, indent=2)
+
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,411 @@
+"""@package benchmarks.suite
+@author Kasper Rantamäki
+Benchmark suite for the computationally expensive parts of the QuantForm Python library
+
+The benchmarks are run against the bundled example data in 'examples/pylib/example_data' (the SPY option chains and
+the Treasury yields quoted EOD 2025-08-15) and the SPY price history in 'examples/misc/example_data'. Each benchmark
+is split into an untimed setup and a timed body, which is run a number of times after a warm-up round. The results
+are written as JSON together with the commit and the environment, so that a run can be compared against a baseline
+stored from another commit with '--compare'.
+
+Usage: python benchmarks/suite.py [--filter TEXT] [--repeat N] [--json PATH] [--compare PATH] [--threshold X]
+"""
+from typing import Callable, Dict, List, Optional
+from pathlib import Path
+import subprocess
+import statistics
+import platform
+import argparse
+import warnings
+import time
+import json
+import sys
+
+
+_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_root / "src"))
+
+import numpy as np
+import pandas as pd
+
+from quantform.pylib import QfDate, clear_year_fraction_cache
+
+
+_option_data  = _root / "examples" / "pylib" / "example_data"
+_history_data = _root / "examples" / "misc" / "example_data"
+
+
+# The market data is quoted EOD 2025-08-15. The underlying value is slightly below the actual 643.44 USD, as in the
+# example notebooks, so that the implied volatilities can be calculated from the possibly outdated bids and asks
+REPORT_DATE      = (2025, 8, 15)
+UNDERLYING_VALUE = 630.
+
+
+# The registered benchmarks as name -> (setup, default number of timed rounds, calls per round)
+_benchmarks: Dict[str, tuple] = {}
+
+
+def benchmark(name: str, repeat: int = 5, number: int = 1) -> Callable:
+  """Decorator for registering a benchmark
+
+  The decorated function does the untimed setup and returns the timed body as a callable without arguments. If the
+  benchmark cannot be run in the tree (e.g. a module fails to import) the setup should raise a RuntimeError, in which
+  case the benchmark is reported as skipped with the error message. The body is called 'number' times per timed round
+  so that the rounds of fast benchmarks are long enough to be measured reliably, and the times are reported per call.
+
+  @param name    The name of the benchmark. Dots are used for grouping
+  @param repeat  The default number of timed rounds
+  @param number  The number of calls of the body per timed round. Optional, defaults to 1
+  @return        The decorator
+  """
+  def register(setup: Callable[[ExampleData], Callable[[], None]]) -> Callable:
+    assert name not in _benchmarks, f"Benchmark '{name}' is already registered!"
+    _benchmarks[name] = (setup, repeat, number)
+    return setup
+
+  return register
+
+
+class ExampleData:
+  """Lazily loaded example data shared by the benchmarks"""
+
+  def __init__(self) -> None:
+    self.__cache = {}
+
+
+  def __get(self, key: str, load: Callable[[], any]) -> any:
+    if key not in self.__cache:
+      self.__cache[key] = load()
+    return self.__cache[key]
+
+
+  @property
+  def report_date(self) -> QfDate:
+    return QfDate(*REPORT_DATE)
+
+
+  @property
+  def treasury_curve(self):
+    """The Treasury yield curve as a discount curve"""
+    def load():
+      from quantform.pylib.curve import DiscountCurve
+      yields = pd.read_csv(_option_data / "Treasury_Yields_2025-08-15.tsv", sep=r"\s+", skiprows=1, header=None).to_numpy()
+      return DiscountCurve(yields[:, 0], yields[:, 1] / 100)
+
+    return self.__get("treasury_curve", load)
+
+
+  @property
+  def risk_free_rate(self) -> float:
+    """The two year Treasury yield, as used in the example notebooks"""
+    return float(self.treasury_curve(2.))
+
+
+  def quotes(self, kind: str) -> pd.DataFrame:
+    """The Yahoo Finance quotes for the 'Calls' or 'Puts'"""
+    return self.__get(f"quotes_{kind}", lambda: pd.read_csv(_option_data / f"SPY_{kind}_2025-08-15.tsv", sep="\t"))
+
+
+  def chain(self, kind: str):
+    """The quotes for the 'Calls' or 'Puts' as an OptionChain"""
+    def load():
+      from quantform.pylib.equity.derivative import OptionChain
+      return OptionChain.from_file(_option_data / f"SPY_{kind}_2025-08-15.tsv")
+
+    return self.__get(f"chain_{kind}", load)
+
+
+  @property
+  def call_options(self) -> list:
+    """The call options for which the implied volatility can be calculated, with the volatility solved"""
+    def load():
+      from quantform.pylib.equity.derivative import Option
+      from quantform.pylib.equity.utils import parse_option_id
+
+      options, quotes = [], self.quotes("Calls")
+      for contract_id, bid, ask in zip(quotes["Contract Name"], quotes["Bid"], quotes["Ask"]):
+        try:
+          options.append(Option(contract_id, *parse_option_id(contract_id), risk_free_rate=self.risk_free_rate,
+                                market_price=(bid + ask) / 2, underlying_value=UNDERLYING_VALUE, report_date=self.report_date))
+        except AssertionError:
+          pass
+      return options
+
+    return self.__get("call_options", load)
+
+
+  @property
+  def history(self) -> pd.DataFrame:
+    """The daily SPY price history"""
+    return self.__get("history", lambda: pd.read_csv(_history_data / "SPY_Historical_max.csv", index_col="Date"))
+
+
+@benchmark("chain.load", repeat=10)
+def _chain_load(data: ExampleData) -> Callable[[], None]:
+  from quantform.pylib.equity.derivative import OptionChain
+  paths = [_option_data / f"SPY_{kind}_2025-08-15.tsv" for kind in ("Calls", "Puts")]
+  return lambda: OptionChain.concatenate([OptionChain.from_file(path) for path in paths])
+
+
+@benchmark("bs.price.chain", repeat=20, number=100)
+def _bs_price_chain(data: ExampleData) -> Callable[[], None]:
+  chain = data.chain("Calls")
+  return lambda: chain.price(UNDERLYING_VALUE, data.report_date, data.risk_free_rate, 0.2)
+
+
+@benchmark("bs.price.options", repeat=5)
+def _bs_price_options(data: ExampleData) -> Callable[[], None]:
+  options, report_date = data.call_options, data.report_date
+  return lambda: [option(UNDERLYING_VALUE, report_date) for option in options]
+
+
+@benchmark("bs.greeks.options", repeat=10, number=10)
+def _bs_greeks_options(data: ExampleData) -> Callable[[], None]:
+  from quantform.pylib.equity.pricer import BlackScholesPricer
+  pricers, report_date = [option.pricer for option in data.call_options], data.report_date
+  return lambda: BlackScholesPricer.batch_risk(pricers, UNDERLYING_VALUE, report_date)
+
+
+@benchmark("bs.iv.chain", repeat=10, number=10)
+def _bs_iv_chain(data: ExampleData) -> Callable[[], None]:
+  chains = [data.chain(kind) for kind in ("Calls", "Puts")]
+  return lambda: [chain.implied_volatility(UNDERLYING_VALUE, data.report_date, data.risk_free_rate) for chain in chains]
+
+
+@benchmark("bs.iv.options", repeat=3)
+def _bs_iv_options(data: ExampleData) -> Callable[[], None]:
+  from quantform.pylib.equity.derivative import Option
+  from quantform.pylib.equity.utils import parse_option_id
+
+  quotes = data.quotes("Calls")
+  rows   = [(contract_id, parse_option_id(contract_id), (bid + ask) / 2)
+            for contract_id, bid, ask in zip(quotes["Contract Name"], quotes["Bid"], quotes["Ask"])]
+
+  def run() -> None:
+    for contract_id, parts, price in rows:
+      try:
+        Option(contract_id, *parts, risk_free_rate=data.risk_free_rate, market_price=price,
+               underlying_value=UNDERLYING_VALUE, report_date=data.report_date)
+      except AssertionError:
+        pass
+
+  return run
+
+
+@benchmark("surface.iv.build", repeat=3)
+def _iv_surface_build(data: ExampleData) -> Callable[[], None]:
+  from quantform.pylib.surface import ImpliedVolatilitySurface
+
+  # The same cleanup as in the implied volatility notebook
+  options = [option for option in data.call_options if 0 < option.pricer.volatility < 1]
+  return lambda: ImpliedVolatilitySurface(options, UNDERLYING_VALUE, data.report_date, interp_range=(400, 750),
+                                          extrap_range=(0, 1200), n_points=100)
+
+
+def _log_contract(data: ExampleData, pricer: str) -> Callable[[], None]:
+  from quantform.pylib.curve import ImpliedVolatilityCurve
+  from quantform.pylib.equity.derivative import LogContract
+
+  maturity_date = QfDate(2027, 12, 17)
+  options       = [option for option in data.call_options if option.maturity_date == maturity_date]
+  curve         = ImpliedVolatilityCurve(options, UNDERLYING_VALUE, data.report_date)
+
+  def run() -> None:
+    contract = LogContract("SPY271217LOG", "SPY", maturity_date, UNDERLYING_VALUE, data.risk_free_rate, curve, pricer)
+    contract(UNDERLYING_VALUE, data.report_date)
+
+  return run
+
+
+@benchmark("log_contract.breeden_litzenberger", repeat=5)
+def _log_contract_bl(data: ExampleData) -> Callable[[], None]:
+  return _log_contract(data, "BreedenLitzenberger")
+
+
+@benchmark("log_contract.neuberger", repeat=10, number=100)
+def _log_contract_neuberger(data: ExampleData) -> Callable[[], None]:
+  return _log_contract(data, "Neuberger")
+
+
+def _qfdate_timedelta(years: int, cold: bool) -> Callable[[], None]:
+  start = QfDate(*REPORT_DATE)
+  ends  = [start.date_shift(days) for days in range(1, 365 * years, 7)]
+
+  def run() -> None:
+    if cold:
+      clear_year_fraction_cache()
+    for convention in ("Business/252", "ACT/365", "30/360"):
+      for end in ends:
+        start.convention_delta(end, convention)
+
+  return run
+
+
+@benchmark("qfdate.timedelta.30y.cold", repeat=5)
+def _qfdate_timedelta_cold(data: ExampleData) -> Callable[[], None]:
+  return _qfdate_timedelta(30, cold=True)
+
+
+@benchmark("qfdate.timedelta.30y.warm", repeat=10, number=10)
+def _qfdate_timedelta_warm(data: ExampleData) -> Callable[[], None]:
+  return _qfdate_timedelta(30, cold=False)
+
+
+def _var(data: ExampleData, model: str) -> Callable[[], None]:
+  from quantform.pylib.risk_management import VaR
+
+  # The instance caches the scenario losses, so it is created for each call
+  history = data.history[["Open", "High", "Low", "Close"]]
+  return lambda: VaR(history)(model, 10, 0.99)
+
+
+@benchmark("var.historical", repeat=10, number=10)
+def _var_historical(data: ExampleData) -> Callable[[], None]:
+  return _var(data, "historical")
+
+
+@benchmark("var.linear", repeat=10, number=10)
+def _var_linear(data: ExampleData) -> Callable[[], None]:
+  return _var(data, "linear")
+
+
+def _linsolve(size: int) -> Callable[[], None]:
+  from scipy.sparse import diags
+  from quantform.cpplib import linsolve
+
+  # A symmetric positive definite tridiagonal system like the ones of the implicit finite difference schemes
+  matrix = diags([-np.ones(size - 1), 4 * np.ones(size), -np.ones(size - 1)], [-1, 0, 1], format="csr")
+  rhs    = np.random.default_rng(0).normal(size=size)
+
+  return lambda: linsolve(matrix, rhs, solver="CG", preconditioner="Jacobi", max_iter=10 * size, tol=1e-10)
+
+
+@benchmark("linsolve.cg.100", repeat=10, number=100)
+def _linsolve_100(data: ExampleData) -> Callable[[], None]:
+  return _linsolve(100)
+
+
+@benchmark("linsolve.cg.10000", repeat=10, number=5)
+def _linsolve_10000(data: ExampleData) -> Callable[[], None]:
+  return _linsolve(10_000)
+
+
+@benchmark("linsolve.cg.100000", repeat=5)
+def _linsolve_100000(data: ExampleData) -> Callable[[], None]:
+  return _linsolve(100_000)
+
+
+def run_benchmark(name: str, data: ExampleData, repeat: Optional[int] = None) -> Dict[str, any]:
+  """Function for running a single registered benchmark
+
+  @param name    The name of the benchmark
+  @param data    The example data
+  @param repeat  The number of timed rounds. Optional, defaults to None i.e. the default of the benchmark
+  @return        Dictionary with the statistics of the times per call in milliseconds, or the reason the benchmark was skipped
+  """
+  setup, default_repeat, number = _benchmarks[name]
+  repeat = default_repeat if repeat is None else repeat
+
+  try:
+    body = setup(data)
+  except RuntimeError as e:
+    return {"skipped": str(e)}
+
+  # Warm-up round so that lazy imports and caches filled by the first call are not timed
+  body()
+
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    for _ in range(number):
+      body()
+    times.append(1000 * (time.perf_counter() - start) / number)
+
+  return {"median_ms": statistics.median(times), "min_ms": min(times), "mean_ms": statistics.fmean(times),
+          "stdev_ms": statistics.stdev(times) if len(times) > 1 else 0., "repeat": repeat, "number": number}
+
+
+def environment() -> Dict[str, str]:
+  """Function for describing the commit and the environment the benchmarks are run in"""
+  try:
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=_root, capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    commit = None
+
+  import scipy
+  return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+          "pandas": pd.__version__, "machine": platform.machine(), "platform": platform.platform(),
+          "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+  """Function for comparing the median times against a baseline
+
+  @param results    The benchmark results
+  @param baseline   The benchmark results of the baseline run
+  @param threshold  The allowed relative slowdown e.g. 0.1 for 10 %
+  @return           The names of the benchmarks that regressed
+  """
+  regressions = []
+
+  print(f"\n{'Benchmark':<36}{'Baseline [ms]':>14}{'Current [ms]':>14}{'Ratio':>8}")
+  for name, result in results.items():
+    base = baseline.get(name, {})
+    if "median_ms" not in result or "median_ms" not in base:
+      continue
+
+    ratio = result["median_ms"] / base["median_ms"]
+    if ratio > 1 + threshold:
+      regressions.append(name)
+
+    print(f"{name:<36}{base['median_ms']:>14.3f}{result['median_ms']:>14.3f}{ratio:>8.2f}{'  regression' if ratio > 1 + threshold else ''}")
+
+  return regressions
+
+
+def main(argv: List[str]) -> int:
+  parser = argparse.ArgumentParser(description="Benchmark suite for the QuantForm Python library")
+  parser.add_argument("--filter", type=str, default=None, help="Only run the benchmarks whose name contains the text")
+  parser.add_argument("--repeat", type=int, default=None, help="The number of timed rounds, overriding the defaults")
+  parser.add_argument("--json", type=str, default=None, help="Path of a JSON file to write the results into")
+  parser.add_argument("--compare", type=str, default=None, help="Path of a JSON file with baseline results")
+  parser.add_argument("--threshold", type=float, default=.1, help="The allowed relative slowdown against the baseline")
+  parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+  args = parser.parse_args(argv)
+
+  names = [name for name in _benchmarks if args.filter is None or args.filter in name]
+
+  if args.list:
+    print("\n".join(names))
+    return 0
+
+  # The integration and optimization warnings of the pricers would only clutter the output
+  warnings.filterwarnings("ignore")
+
+  data, results = ExampleData(), {}
+
+  print(f"{'Benchmark':<36}{'Median [ms]':>12}{'Min [ms]':>12}{'Stdev [ms]':>12}")
+  for name in names:
+    result = results[name] = run_benchmark(name, data, args.repeat)
+
+    if "skipped" in result:
+      print(f"{name:<36}  skipped: {result['skipped']}")
+    else:
+      print(f"{name:<36}{result['median_ms']:>12.3f}{result['min_ms']:>12.3f}{result['stdev_ms']:>12.3f}")
+
+  if args.json is not None:
+    with open(args.json, "w") as file:
+      json.dump({"environment": environment(), "results": results}, file, indent=2)
+
+  if args.compare is not None:
+    with open(args.compare) as file:
+      baseline = json.load(file)["results"]
+
+    if compare(results, baseline, args.threshold):
+      return 1
+
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
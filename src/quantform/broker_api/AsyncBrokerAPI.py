@@ -0,0 +1,257 @@
+"""@package quantform.broker_api.AsyncBrokerAPI
+@author Kasper Rantamäki
+Submodule containing the asyncio counterpart of the BrokerAPI interface and an adapter running synchronous
+implementations in a thread pool
+
+Example:
+  async with ThreadedBrokerAPI(broker, max_concurrency=16) as api:
+    histories = await api.history_many(instrument_ids, "2024-01-01", "2024-12-31", "1d")
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+import functools
+import asyncio
+import weakref
+import pandas as pd
+
+from .BrokerAPI import BrokerAPI
+
+
+def _freeze(value: Any) -> Optional[Hashable]:
+  """Function for a hashable key of request arguments, None if they cannot be hashed"""
+  if isinstance(value, dict):
+    value = tuple((name, _freeze(item)) for name, item in sorted(value.items()))
+  elif isinstance(value, (list, tuple)):
+    value = tuple(_freeze(item) for item in value)
+
+  try:
+    hash(value)
+  except TypeError:
+    return None
+
+  return value
+
+
+class AsyncBrokerAPI(ABC):
+  """Abstract base class providing the standardized API interface with coroutine methods
+
+  The methods take the same arguments and return the same tuples as the ones of BrokerAPI, so the documentation of
+  BrokerAPI applies to them as well.
+  """
+
+  async def __aenter__(self) -> "AsyncBrokerAPI":
+    return self
+
+
+  async def __aexit__(self, *args) -> None:
+    await self.close()
+
+
+  async def close(self) -> None:
+    """Method for closing the API connection
+
+    @return  None
+    """
+    pass
+
+
+  @abstractmethod
+  async def bid(self, instrument_id: str, bid_price: float, bid_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    """Method for making buy (bid) requests, see BrokerAPI.bid
+
+    @param instrument_id  The identifier for the instrument to be purchased
+    @param bid_price      The price at which the instrument should be purchased
+    @param bid_size       The amount of the instrument to be purchased
+    @param **kwargs       Possible additional arguments needed by the method as key-value pairs
+    @return               Tuple of form (<return code>, <bid price>, <bid size>)
+    """
+    pass
+
+
+  @abstractmethod
+  async def ask(self, instrument_id: str, ask_price: float, ask_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    """Method for making sale (ask) requests, see BrokerAPI.ask
+
+    @param instrument_id  Identifier for the instrument to be sold
+    @param ask_price      The price at which the instrument should be sold
+    @param ask_size       The amount of the instrument to be sold
+    @param **kwargs       Possible additional arguments needed by the method as key-value pairs
+    @return               Tuple of form (<return code>, <ask price>, <ask size>)
+    """
+    pass
+
+
+  @abstractmethod
+  async def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for requesting a snapshot of the wanted instruments, see BrokerAPI.snap
+
+    @param instrument_ids  List of identifiers for the instruments for which the snap is wanted
+    @param **kwargs        Possible additional arguments needed by the method as key-value pairs
+    @return                Tuple of form (<return code>, <dataframe>)
+    """
+    pass
+
+
+  @abstractmethod
+  async def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for requesting historical market data for a given instrument, see BrokerAPI.history
+
+    @param instrument_id  Identifier for the instrument for which historical data is requested
+    @param start_time     The requested interval start time
+    @param end_time       The requested interval end_time
+    @param step_size      The step size specifying the granularity for the requested data
+    @param **kwargs       Possible additional arguments needed by the method as key-value pairs
+    @return               Tuple of form (<return code>, <dataframe>)
+    """
+    pass
+
+
+  @abstractmethod
+  async def fields(self, instrument_ids: list[str], field_ids: list[str],
+                   field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for requesting arbitrary field values for the wanted instruments, see BrokerAPI.fields
+
+    @param instrument_ids  List of identifiers for the instruments for which the field values are wanted
+    @param field_ids       List of identifiers specifying the wanted fields for the instruments
+    @param field_map       Dictionary for mapping the field ids into some other identifier. Optional
+    @param **kwargs        Possible additional arguments needed by the method as key-value pairs
+    @return                Tuple of form (<return code>, <dataframe>)
+    """
+    pass
+
+
+  async def history_many(self, instrument_ids: list[str], start_time: str, end_time: str, step_size: str,
+                         **kwargs) -> dict[str, tuple[int, Optional[pd.DataFrame]]]:
+    """Method for requesting the historical market data of several instruments concurrently
+
+    @param instrument_ids  List of identifiers for the instruments for which historical data is requested
+    @param start_time      The requested interval start time
+    @param end_time        The requested interval end_time
+    @param step_size       The step size specifying the granularity for the requested data
+    @param **kwargs        Possible additional arguments passed to 'history' as key-value pairs
+    @return                Dictionary from the instrument ids to the tuples returned by 'history'
+    """
+    results = await asyncio.gather(*(self.history(instrument_id, start_time, end_time, step_size, **kwargs)
+                                     for instrument_id in instrument_ids))
+
+    return dict(zip(instrument_ids, results))
+
+
+class ThreadedBrokerAPI(AsyncBrokerAPI):
+  """Adapter exposing a synchronous BrokerAPI implementation as an AsyncBrokerAPI
+
+  The blocking calls are run in a thread pool, so the wrapped implementation must be safe to call from several threads
+  at once. The number of requests in flight is bounded by a semaphore of each event loop. Identical market data requests (snap, history
+  and fields) made while one is already in flight wait for the result of the first one instead of being sent again.
+  Orders (bid and ask) are never coalesced.
+  """
+
+  def __init__(self, broker: BrokerAPI, max_concurrency: int = 8, coalesce: bool = True) -> None:
+    """Constructor method
+
+    @param broker           The synchronous API implementation
+    @param max_concurrency  The maximum number of requests in flight, which is also the number of threads. Optional,
+                            defaults to 8
+    @param coalesce         Boolean flag specifying if identical market data requests in flight are coalesced.
+                            Optional, defaults to True
+    @raises AssertionError  Raised if the maximum concurrency is not positive
+    @return                 None
+    """
+    assert max_concurrency > 0, f"The maximum concurrency must be positive! ({max_concurrency} <= 0)"
+
+    self.__broker          = broker
+    self.__max_concurrency = max_concurrency
+    self.__coalesce        = coalesce
+    self.__executor        = ThreadPoolExecutor(max_concurrency, thread_name_prefix="quantform-broker")
+    self.__semaphores      = weakref.WeakKeyDictionary()  # event loop -> semaphore
+    self.__in_flight       = {}
+    self.__stats           = {"requests": 0, "coalesced": 0}
+
+
+  def __str__(self) -> str:
+    return f"ThreadedBrokerAPI({type(self.__broker).__name__})"
+
+
+  def __repr__(self) -> str:
+    return f"Threaded Broker API\nBroker: {type(self.__broker).__name__}\nMaximum concurrency: {self.__max_concurrency}\n" \
+           f"Statistics: {self.stats}"
+
+
+  @property
+  def broker(self) -> BrokerAPI:
+    return self.__broker
+
+
+  @property
+  def stats(self) -> dict[str, int]:
+    """The numbers of requests sent to the broker ('requests') and served by a request in flight ('coalesced')"""
+    return dict(self.__stats)
+
+
+  async def close(self) -> None:
+    """Method for waiting for the requests in flight and shutting down the thread pool
+
+    The wrapped implementation is not closed, as it closes its connection when it is garbage collected.
+
+    @return  None
+    """
+    await asyncio.get_running_loop().run_in_executor(None, functools.partial(self.__executor.shutdown, wait=True))
+
+
+  async def __run(self, func: Callable, *args, **kwargs) -> Any:
+    """Method for running a blocking call in the thread pool once a slot is free"""
+    # A semaphore is bound to the event loop that first waits on it, so each loop needs its own
+    loop      = asyncio.get_running_loop()
+    semaphore = self.__semaphores.get(loop)
+    if semaphore is None:
+      semaphore = self.__semaphores[loop] = asyncio.Semaphore(self.__max_concurrency)
+
+    async with semaphore:
+      self.__stats["requests"] += 1
+      return await loop.run_in_executor(self.__executor, functools.partial(func, *args, **kwargs))
+
+
+  async def __request(self, name: str, *args, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for running a market data request, coalesced with an identical one in flight"""
+    func = getattr(self.__broker, name)
+    key  = _freeze((name, args, kwargs)) if self.__coalesce else None
+    if key is None:
+      return await self.__run(func, *args, **kwargs)
+
+    # The requests are tied to the event loop that made them
+    key  = (id(asyncio.get_running_loop()), key)
+    task = self.__in_flight.get(key)
+    if task is None:
+      task = asyncio.ensure_future(self.__run(func, *args, **kwargs))
+      self.__in_flight[key] = task
+      task.add_done_callback(lambda _: self.__in_flight.pop(key, None))
+    else:
+      self.__stats["coalesced"] += 1
+
+    # A cancelled waiter doesn't cancel the request for the others
+    code, df = await asyncio.shield(task)
+
+    # The waiters get copies of their own, so they cannot modify each other's results
+    return code, df.copy() if df is not None else None
+
+
+  async def bid(self, instrument_id: str, bid_price: float, bid_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    return await self.__run(self.__broker.bid, instrument_id, bid_price, bid_size, **kwargs)
+
+
+  async def ask(self, instrument_id: str, ask_price: float, ask_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    return await self.__run(self.__broker.ask, instrument_id, ask_price, ask_size, **kwargs)
+
+
+  async def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    return await self.__request("snap", instrument_ids, **kwargs)
+
+
+  async def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    return await self.__request("history", instrument_id, start_time, end_time, step_size, **kwargs)
+
+
+  async def fields(self, instrument_ids: list[str], field_ids: list[str],
+                   field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    return await self.__request("fields", instrument_ids, field_ids, field_map, **kwargs)
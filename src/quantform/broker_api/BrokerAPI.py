@@ -74,7 +74,7 @@ class BrokerAPI(ABC):
 
 
   @abstractmethod
-  def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.Dataframe]]:
+  def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
     """Method for requesting a snapshot of the wanted instruments
 
     The methods makes a request to get the current bids and asks for the wanted instruments. 
@@ -90,7 +90,7 @@ class BrokerAPI(ABC):
 
 
   @abstractmethod
-  def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.Dataframe]]:
+  def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
     """Method for requesting historical market data for a given instrument
 
     The method request historical market data for the given instrument. If the request is successful 
@@ -110,7 +110,7 @@ class BrokerAPI(ABC):
 
   @abstractmethod
   def fields(self, instrument_ids: list[str], field_ids: list[str], 
-             field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.Dataframe]]:
+             field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
     """Method for requesting arbitrary field values for the wanted instruments
 
     The method request wanted fields for the given instruments. The fields can be anything that the broker 
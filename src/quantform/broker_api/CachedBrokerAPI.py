@@ -0,0 +1,224 @@
+"""@package quantform.broker_api.CachedBrokerAPI
+@author Kasper Rantamäki
+Submodule containing a wrapper that caches the historical market data of a broker on the disk
+
+The fetched bars are stored in a TimeSeriesStore along with the time ranges that have been fetched. A history request
+only fetches the parts of its range that have not been fetched before, so repeated backfills use the rate limits of
+the broker only for the new data.
+
+Example:
+  broker    = CachedBrokerAPI(InteractiveBrokersAPI(), "data/history")
+  code, df  = broker.history("SPY", "2015-01-01", "2025-08-15", "1d")  # Fetches the whole range
+  code, df  = broker.history("SPY", "2015-01-01", "2025-08-18", "1d")  # Fetches only 2025-08-15 onwards
+"""
+from typing import Optional, Union
+from urllib.parse import urlencode
+from pathlib import Path
+import threading
+import json
+import os
+import pandas as pd
+
+from .BrokerAPI import BrokerAPI
+from ..db import TimeSeriesStore
+
+
+# The columns of the historical bars other than the timestamps
+_history_columns = ["Open Value", "Close Value", "High Value", "Low Value", "Volume"]
+
+
+def _missing(covered: list[list[int]], start: int, end: int) -> list[tuple[int, int]]:
+  """Function for the parts of the closed range [start, end] not covered by the sorted disjoint closed intervals"""
+  if start == end:
+    return [] if any(covered_start <= start <= covered_end for covered_start, covered_end in covered) else [(start, end)]
+
+  missing = []
+  for covered_start, covered_end in covered:
+    if covered_end < start:
+      continue
+    if covered_start > end:
+      break
+
+    if covered_start > start:
+      missing.append((start, covered_start))
+    start = max(start, covered_end)
+
+  if start < end:
+    missing.append((start, end))
+
+  return missing
+
+
+def _merge(covered: list[list[int]], start: int, end: int) -> list[list[int]]:
+  """Function for adding the closed range [start, end] into the sorted disjoint closed intervals"""
+  merged = []
+  for interval in sorted([*covered, [start, end]]):
+    if merged and interval[0] <= merged[-1][1]:
+      merged[-1][1] = max(merged[-1][1], interval[1])
+    else:
+      merged.append(list(interval))
+
+  return merged
+
+
+class CachedBrokerAPI(BrokerAPI):
+  """Wrapper around a BrokerAPI implementation caching the historical bars on the disk
+
+  The bars are cached separately for each instrument, step size and set of additional keyword arguments. A range
+  counts as fetched once the broker has answered for it, even if it returned no bars (e.g. over a holiday), so empty
+  ranges are not requested again. Ranges reaching the last step before the current time are never counted as
+  fetched, as the latest bar may still change. The other methods are passed to the wrapped broker as is.
+  """
+
+  def __init__(self, broker: BrokerAPI, store: Union[str, Path, TimeSeriesStore], **kwargs) -> None:
+    """Constructor method
+
+    @param broker    The wrapped broker
+    @param store     The time series store, or the root directory of one, where the bars are cached
+    @param **kwargs  Not used, accepted for the interface
+    @return          None
+    """
+    self.__broker = broker
+    self.__store  = store if isinstance(store, TimeSeriesStore) else TimeSeriesStore(store)
+    self.__path   = self.__store.root / "coverage.json"
+    self.__lock   = threading.Lock()
+    self.__locks  = {}  # cache key -> lock held while the gaps of the key are filled
+    self.__stats  = {"requests": 0, "fetches": 0, "fetched_bars": 0, "served_bars": 0}
+
+    self.__coverage = json.loads(self.__path.read_text()) if self.__path.exists() else {}
+
+
+  def __del__(self) -> None:
+    pass
+
+
+  def __str__(self) -> str:
+    return f"CachedBrokerAPI({self.__broker}, {self.__store})"
+
+
+  def __repr__(self) -> str:
+    return f"Cached Broker API\nBroker: {self.__broker}\nStore: {self.__store.root}\nStatistics: {self.stats}"
+
+
+  @property
+  def broker(self) -> BrokerAPI:
+    return self.__broker
+
+
+  @property
+  def store(self) -> TimeSeriesStore:
+    return self.__store
+
+
+  @property
+  def stats(self) -> dict[str, int]:
+    """The numbers of history requests ('requests'), the requests passed to the broker ('fetches') and the bars
+    fetched from the broker ('fetched_bars') and served from the cache ('served_bars')"""
+    return dict(self.__stats)
+
+
+  @staticmethod
+  def __key(instrument_id: str, step_size: str, kwargs: dict) -> str:
+    """Method for the name under which the bars of a request are stored"""
+    return f"{instrument_id}@{step_size}" + (f"?{urlencode(sorted(kwargs.items()))}" if kwargs else "")
+
+
+  def __save_coverage(self) -> None:
+    """Method for writing the fetched ranges to the disk atomically while holding the lock"""
+    staging = self.__path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    staging.write_text(json.dumps(self.__coverage))
+    os.replace(staging, self.__path)
+
+
+  def invalidate(self, instrument_id: Optional[str] = None) -> None:
+    """Method for dropping the cached bars
+
+    @param instrument_id  The instrument whose bars are dropped. Optional, defaults to None i.e. all of the instruments
+    @return               None
+    """
+    with self.__lock:
+      keys = [key for key in self.__coverage if instrument_id is None or key.split("@", 1)[0] == instrument_id]
+      for key in keys:
+        del self.__coverage[key]
+        self.__store.delete(key)
+
+      self.__save_coverage()
+
+
+  def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for requesting historical market data, fetching only the parts of the range that are not cached
+
+    The missing parts are requested from the broker with the start and end times formatted as 'YYYY-MM-DD hh:mm:ss'.
+    If any of the requests fails its return code is returned.
+
+    @param instrument_id  Identifier for the instrument for which historical data is requested
+    @param start_time     The requested interval start time
+    @param end_time       The requested interval end_time
+    @param step_size      The step size specifying the granularity for the requested data
+    @param **kwargs       Possible additional arguments passed to the broker as key-value pairs
+    @return               Tuple of form (<return code>, <dataframe>)
+    """
+    key        = self.__key(instrument_id, step_size, kwargs)
+    start, end = pd.Timestamp(start_time), pd.Timestamp(end_time)
+
+    # The latest bar is not final until the step after it has passed
+    try:
+      step = pd.to_timedelta(step_size)
+    except ValueError:
+      step = pd.Timedelta(0)
+    final = pd.Timestamp.now(tz=start.tz) - step
+
+    with self.__lock:
+      self.__stats["requests"] += 1
+      key_lock = self.__locks.setdefault(key, threading.Lock())
+
+    code = 0
+    with key_lock:
+      for gap_start, gap_end in _missing(self.__coverage.get(key, []), start.value, end.value):
+        gap_start, gap_end = pd.Timestamp(gap_start, tz=start.tz), pd.Timestamp(gap_end, tz=start.tz)
+
+        if (gap_start, gap_end) == (start, end):
+          code, df = self.__broker.history(instrument_id, start_time, end_time, step_size, **kwargs)
+        else:
+          code, df = self.__broker.history(instrument_id, gap_start.strftime("%Y-%m-%d %H:%M:%S"),
+                                           gap_end.strftime("%Y-%m-%d %H:%M:%S"), step_size, **kwargs)
+
+        with self.__lock:
+          self.__stats["fetches"] += 1
+
+        if df is None:
+          return code, None
+
+        if len(df) > 0:
+          self.__store.write(key, df.set_index(pd.DatetimeIndex(df["Timestamp"])).drop(columns="Timestamp"))
+
+        with self.__lock:
+          self.__stats["fetched_bars"] += len(df)
+          if min(gap_end, final) >= gap_start:
+            self.__coverage[key] = _merge(self.__coverage.get(key, []), gap_start.value, min(gap_end, final).value)
+            self.__save_coverage()
+
+    df = self.__store.read(key, start, end)
+    with self.__lock:
+      self.__stats["served_bars"] += len(df)
+
+    # The store keeps the columns in alphabetical order
+    columns = [name for name in _history_columns if name in df.columns]
+    return code, df[columns + [name for name in df.columns if name not in columns]].rename_axis("Timestamp").reset_index()
+
+
+  def bid(self, instrument_id: str, bid_price: float, bid_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    return self.__broker.bid(instrument_id, bid_price, bid_size, **kwargs)
+
+
+  def ask(self, instrument_id: str, ask_price: float, ask_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    return self.__broker.ask(instrument_id, ask_price, ask_size, **kwargs)
+
+
+  def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    return self.__broker.snap(instrument_ids, **kwargs)
+
+
+  def fields(self, instrument_ids: list[str], field_ids: list[str],
+             field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    return self.__broker.fields(instrument_ids, field_ids, field_map, **kwargs)
@@ -0,0 +1,485 @@
+"""@package quantform.broker_api.QuoteFeed
+@author Kasper Rantamäki
+Submodule containing the streaming market data interface and a feed replaying historical quotes
+
+Instead of polling with 'snap', the consumers subscribe to the instruments they need and the feed pushes the quote
+updates into the subscriptions. Each subscription buffers a bounded number of quotes per instrument, so a slow
+consumer never makes the feed or the other consumers wait and its memory use stays bounded. With the default
+'conflate' policy only the latest quote of each instrument is kept, which is what e.g. the IV surface or the UI
+needs.
+
+Example:
+  with ReplayFeed(quotes, speed=10.) as feed:
+    subscription = feed.subscribe(option_ids)
+    feed.start()
+    async for quote in subscription:  # Ends once the tape has been replayed
+      surface.update(quote.InstrumentID, quote.Bid, quote.Ask)
+"""
+from abc import ABC
+from collections import OrderedDict, deque
+from typing import Callable, Iterable, Literal, NamedTuple, Optional
+import threading
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+
+
+class Quote(NamedTuple):
+  """A quote update with the fields of the 'snap' columns"""
+  Timestamp:    pd.Timestamp
+  InstrumentID: str
+  Bid:          float
+  BidSize:      float
+  Ask:          float
+  AskSize:      float
+
+
+class Subscription:
+  """Bounded buffer of the quote updates of subscribed instruments
+
+  The feed publishes into the subscription from its own thread and the consumer reads the quotes either with 'get' or
+  'poll', by iterating (also asynchronously) or through a callback run on a thread of the subscription. The instruments
+  with pending quotes are served in turn, so a busy instrument doesn't starve the others.
+
+  When the buffer of an instrument is full a new quote replaces the oldest one, so the consumer always gets the latest
+  quote. With the 'conflate' policy the buffer holds a single quote i.e. the consumer gets the latest quote of each
+  instrument at the time it reads. With the 'drop_oldest' policy the buffer holds up to 'capacity' quotes.
+  """
+
+  def __init__(self, instrument_ids: Iterable[str], policy: Literal["conflate", "drop_oldest"] = "conflate",
+               capacity: int = 1024, callback: Optional[Callable[[Quote], None]] = None,
+               on_close: Optional[Callable[["Subscription"], None]] = None) -> None:
+    """Constructor method
+
+    The subscriptions are created with the 'subscribe' method of a feed.
+
+    @param instrument_ids   The subscribed instruments
+    @param policy           The conflation policy. Optional, defaults to 'conflate'
+    @param capacity         The number of buffered quotes per instrument with the 'drop_oldest' policy. Optional,
+                            defaults to 1024
+    @param callback         Function called with each quote on a thread of the subscription. Optional, defaults to None
+                            i.e. the quotes are read by the consumer
+    @param on_close         Function called by the feed when the subscription is closed. Optional, defaults to None
+    @raises AssertionError  Raised if an invalid policy is specified or the capacity is not positive
+    @return                 None
+    """
+    assert policy in ["conflate", "drop_oldest"], f"Invalid conflation policy specified! ('{policy}' not in ['conflate', 'drop_oldest'])"
+    assert capacity > 0, f"The capacity must be positive! ({capacity} <= 0)"
+
+    self.__instrument_ids = frozenset(instrument_ids)
+    self.__policy         = policy
+    self.__capacity       = 1 if policy == "conflate" else capacity
+    self.__buffers        = {instrument_id: deque(maxlen=self.__capacity) for instrument_id in self.__instrument_ids}
+    self.__pending        = OrderedDict()  # The instruments with buffered quotes in the order they are served
+    self.__condition      = threading.Condition()
+    self.__closed         = False
+    self.__on_close       = on_close
+    self.__waiters        = []  # The futures of the asynchronous consumers waiting for a quote
+    self.__stats          = {"published": 0, "delivered": 0, "dropped": 0}
+
+    self.__thread = None
+    if callback is not None:
+      self.__thread = threading.Thread(target=self.__dispatch, args=(callback,), name="quantform-subscription", daemon=True)
+      self.__thread.start()
+
+
+  def __str__(self) -> str:
+    return f"Subscription({len(self.__instrument_ids)} instruments, {self.__policy})"
+
+
+  def __repr__(self) -> str:
+    return f"Subscription\nInstruments: {len(self.__instrument_ids)}\nPolicy: {self.__policy}\nCapacity: {self.__capacity}\n" \
+           f"Statistics: {self.stats}"
+
+
+  def __enter__(self) -> "Subscription":
+    return self
+
+
+  def __exit__(self, *args) -> None:
+    self.close()
+
+
+  @property
+  def instrument_ids(self) -> frozenset[str]:
+    return self.__instrument_ids
+
+
+  @property
+  def closed(self) -> bool:
+    return self.__closed
+
+
+  @property
+  def stats(self) -> dict[str, int]:
+    """The numbers of quotes published into the subscription, delivered to the consumer and dropped by conflation"""
+    with self.__condition:
+      return dict(self.__stats)
+
+
+  def publish(self, quote: Quote) -> None:
+    """Method for pushing a quote into the buffer, used by the feeds
+
+    @param quote  The quote of a subscribed instrument
+    @return       None
+    """
+    with self.__condition:
+      if self.__closed:
+        return
+
+      buffer = self.__buffers[quote.InstrumentID]
+      if len(buffer) == self.__capacity:
+        self.__stats["dropped"] += 1
+
+      buffer.append(quote)
+      self.__stats["published"] += 1
+
+      if quote.InstrumentID not in self.__pending:
+        self.__pending[quote.InstrumentID] = None
+        self.__condition.notify()
+        self.__wake()
+
+
+  def __wake(self) -> None:
+    """Method for waking up the asynchronous consumers while holding the lock"""
+    for loop, future in self.__waiters:
+      # The loop of a consumer may have been closed without the consumer removing itself
+      if loop.is_closed():
+        continue
+      try:
+        loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+      except RuntimeError:
+        pass
+    self.__waiters.clear()
+
+
+  def __pop(self) -> Optional[Quote]:
+    """Method for taking the next quote while holding the lock, None if there are none"""
+    if not self.__pending:
+      return None
+
+    instrument_id = next(iter(self.__pending))
+    buffer        = self.__buffers[instrument_id]
+    quote         = buffer.popleft()
+
+    # An instrument with more quotes goes to the back of the line
+    del self.__pending[instrument_id]
+    if buffer:
+      self.__pending[instrument_id] = None
+
+    self.__stats["delivered"] += 1
+    return quote
+
+
+  def get(self, timeout: Optional[float] = None) -> Optional[Quote]:
+    """Method for taking the next quote, waiting for one if none are buffered
+
+    @param timeout  The number of seconds to wait. Optional, defaults to None i.e. waiting indefinitely
+    @return         The quote, or None if the timeout passed or the subscription was closed
+    """
+    with self.__condition:
+      self.__condition.wait_for(lambda: self.__pending or self.__closed, timeout)
+      return self.__pop()
+
+
+  def poll(self, max_quotes: Optional[int] = None) -> list[Quote]:
+    """Method for taking the buffered quotes without waiting
+
+    @param max_quotes  The maximum number of quotes taken. Optional, defaults to None i.e. all of them
+    @return            The quotes
+    """
+    quotes = []
+    with self.__condition:
+      while (max_quotes is None or len(quotes) < max_quotes) and (quote := self.__pop()) is not None:
+        quotes.append(quote)
+
+    return quotes
+
+
+  def latest(self) -> dict[str, Quote]:
+    """Method for taking the buffered quotes keeping only the latest one of each instrument
+
+    @return  Dictionary from the instrument ids to their latest quotes
+    """
+    with self.__condition:
+      quotes = {instrument_id: self.__buffers[instrument_id][-1] for instrument_id in self.__pending}
+      for instrument_id in self.__pending:
+        self.__stats["delivered"] += 1
+        self.__stats["dropped"]   += len(self.__buffers[instrument_id]) - 1
+        self.__buffers[instrument_id].clear()
+      self.__pending.clear()
+
+    return quotes
+
+
+  def __iter__(self) -> "Subscription":
+    return self
+
+
+  def __next__(self) -> Quote:
+    quote = self.get()
+    if quote is None:
+      raise StopIteration
+
+    return quote
+
+
+  def __aiter__(self) -> "Subscription":
+    return self
+
+
+  async def __anext__(self) -> Quote:
+    loop = asyncio.get_running_loop()
+
+    while True:
+      with self.__condition:
+        quote = self.__pop()
+        if quote is not None:
+          return quote
+        if self.__closed:
+          raise StopAsyncIteration
+
+        future = loop.create_future()
+        waiter = (loop, future)
+        self.__waiters.append(waiter)
+
+      # A cancelled consumer must not be left behind in the waiters
+      try:
+        await future
+      finally:
+        with self.__condition:
+          if waiter in self.__waiters:
+            self.__waiters.remove(waiter)
+
+
+  def __dispatch(self, callback: Callable[[Quote], None]) -> None:
+    """Method run on the thread of the subscription calling the callback with each quote"""
+    while (quote := self.get()) is not None:
+      callback(quote)
+
+
+  def close(self) -> None:
+    """Method for closing the subscription. The consumers get the buffered quotes and then stop
+
+    @return  None
+    """
+    with self.__condition:
+      if self.__closed:
+        return
+
+      self.__closed = True
+      self.__condition.notify_all()
+      self.__wake()
+
+    if self.__on_close is not None:
+      self.__on_close(self)
+
+    if self.__thread is not None and self.__thread is not threading.current_thread():
+      self.__thread.join()
+
+
+class QuoteFeed(ABC):
+  """Abstract base class for the streaming market data interface
+
+  The implementations push the quotes they receive with '_publish', and may override '_subscribed' to start the
+  updates of newly subscribed instruments at the broker.
+  """
+
+  def __init__(self) -> None:
+    """Constructor method
+
+    @return  None
+    """
+    self.__lock          = threading.Lock()
+    self.__subscriptions = {}  # instrument id -> subscriptions
+
+
+  def subscribe(self, instrument_ids: Iterable[str], policy: Literal["conflate", "drop_oldest"] = "conflate",
+                capacity: int = 1024, callback: Optional[Callable[[Quote], None]] = None) -> Subscription:
+    """Method for subscribing to the quote updates of instruments
+
+    @param instrument_ids  The instruments
+    @param policy          The conflation policy, see Subscription. Optional, defaults to 'conflate'
+    @param capacity        The number of buffered quotes per instrument with the 'drop_oldest' policy. Optional, defaults
+                           to 1024
+    @param callback        Function called with each quote on a thread of the subscription. Optional, defaults to None
+                           i.e. the quotes are read from the subscription
+    @return                The subscription, which is closed with its 'close' method
+    """
+    subscription = Subscription(instrument_ids, policy, capacity, callback, on_close=self.__unsubscribe)
+
+    with self.__lock:
+      for instrument_id in subscription.instrument_ids:
+        self.__subscriptions[instrument_id] = (*self.__subscriptions.get(instrument_id, ()), subscription)
+
+    self._subscribed(subscription.instrument_ids)
+    return subscription
+
+
+  def __unsubscribe(self, subscription: Subscription) -> None:
+    """Method for removing a closed subscription"""
+    with self.__lock:
+      for instrument_id in subscription.instrument_ids:
+        remaining = tuple(other for other in self.__subscriptions.get(instrument_id, ()) if other is not subscription)
+        if remaining:
+          self.__subscriptions[instrument_id] = remaining
+        else:
+          self.__subscriptions.pop(instrument_id, None)
+
+
+  def _subscribed(self, instrument_ids: frozenset[str]) -> None:
+    """Method called when instruments are subscribed to e.g. for requesting their updates from the broker
+
+    @param instrument_ids  The instruments
+    @return                None
+    """
+    pass
+
+
+  def _publish(self, quote: Quote) -> None:
+    """Method for pushing a quote into the subscriptions of its instrument, used by the implementations
+
+    @param quote  The quote
+    @return       None
+    """
+    for subscription in self.__subscriptions.get(quote.InstrumentID, ()):
+      subscription.publish(quote)
+
+
+  def close(self) -> None:
+    """Method for closing all of the subscriptions
+
+    @return  None
+    """
+    with self.__lock:
+      subscriptions = {subscription for group in self.__subscriptions.values() for subscription in group}
+
+    for subscription in subscriptions:
+      subscription.close()
+
+
+class ReplayFeed(QuoteFeed):
+  """Feed replaying a historical quote tape on a background thread, e.g. for testing the consumers locally
+
+  The replay is started with 'start' once the consumers have subscribed, as the quotes published before a subscription
+  are not delivered to it.
+  """
+
+  def __init__(self, quotes: pd.DataFrame, speed: Optional[float] = None, close_at_end: bool = True) -> None:
+    """Constructor method
+
+    @param quotes           The quote tape with the columns 'Timestamp', 'InstrumentID', 'Bid', 'BidSize', 'Ask' and
+                            'AskSize' e.g. from 'SimulatedBrokerAPI.read_option_quotes'
+    @param speed            The replay speed relative to the time stamps e.g. 10 for ten times faster than real time.
+                            Optional, defaults to None i.e. as fast as possible
+    @param close_at_end     Boolean flag specifying if the subscriptions are closed once the whole tape has been
+                            replayed, which ends the iteration of the consumers after the buffered quotes. Stopping the
+                            replay doesn't close them. Optional, defaults to True
+    @raises AssertionError  Raised if the speed is not positive
+    @return                 None
+    """
+    assert speed is None or speed > 0, f"The speed must be positive! ({speed} <= 0)"
+    super().__init__()
+
+    quotes = quotes.sort_values("Timestamp", kind="stable")
+
+    self.__times    = pd.to_datetime(quotes["Timestamp"]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    self.__quotes   = quotes[["Timestamp", "InstrumentID", "Bid", "BidSize", "Ask", "AskSize"]]
+    self.__speed    = speed
+    self.__close    = close_at_end
+    self.__stop     = threading.Event()
+    self.__thread   = None
+    self.__replayed = 0
+
+
+  def __str__(self) -> str:
+    return f"ReplayFeed({len(self.__quotes)} quotes)"
+
+
+  def __repr__(self) -> str:
+    return f"Replay Feed\nQuotes: {len(self.__quotes)}\nSpeed: {self.__speed}\nReplayed: {self.__replayed}"
+
+
+  def __enter__(self) -> "ReplayFeed":
+    return self
+
+
+  def __exit__(self, *args) -> None:
+    self.close()
+
+
+  @property
+  def replayed(self) -> int:
+    """The number of quotes replayed"""
+    return self.__replayed
+
+
+  @property
+  def running(self) -> bool:
+    return self.__thread is not None and self.__thread.is_alive()
+
+
+  def start(self) -> None:
+    """Method for starting the replay from the first quote
+
+    @raises RuntimeError  Raised if the replay is already running
+    @return               None
+    """
+    if self.running:
+      raise RuntimeError("The replay is already running!")
+
+    self.__stop.clear()
+    self.__thread = threading.Thread(target=self.__replay, name="quantform-replay", daemon=True)
+    self.__thread.start()
+
+
+  def join(self, timeout: Optional[float] = None) -> None:
+    """Method for waiting for the replay to finish
+
+    @param timeout  The number of seconds to wait. Optional, defaults to None i.e. waiting indefinitely
+    @return         None
+    """
+    if self.__thread is not None:
+      self.__thread.join(timeout)
+
+
+  def stop(self) -> None:
+    """Method for stopping the replay
+
+    @return  None
+    """
+    self.__stop.set()
+    self.join()
+
+
+  def close(self) -> None:
+    """Method for stopping the replay and closing all of the subscriptions
+
+    @return  None
+    """
+    self.stop()
+    super().close()
+
+
+  def __replay(self) -> None:
+    """Method run on the replay thread publishing the quotes"""
+    self.__replayed = 0
+    start_wall      = time.perf_counter()
+    start_time      = self.__times[0] if len(self.__times) > 0 else 0
+
+    for i, quote in enumerate(self.__quotes.itertuples(index=False, name=None)):
+      if self.__stop.is_set():
+        return
+
+      if self.__speed is not None:
+        delay = (self.__times[i] - start_time) / 1e9 / self.__speed - (time.perf_counter() - start_wall)
+        if delay > 0 and self.__stop.wait(delay):
+          return
+
+      self._publish(Quote(*quote))
+      self.__replayed += 1
+
+    # The end of the stream is signalled to the consumers by closing their subscriptions
+    if self.__close:
+      QuoteFeed.close(self)
@@ -0,0 +1,371 @@
+"""@package quantform.broker_api.RateLimitedBrokerAPI
+@author Kasper Rantamäki
+Submodule containing a client-side rate limiter and request batching for brokers with pacing limits
+
+The requests of all of the threads using the wrapper share the token buckets of the rate limiter, so the broker never
+sees more requests than its limits allow. When the requests queue up the orders go first. The snap and fields requests
+made while the limiter is waiting are merged into as few requests as the batch sizes allow, which keeps the
+throughput in instruments per second at its maximum.
+
+Example:
+  broker = RateLimitedBrokerAPI(InteractiveBrokersAPI(), limits=[(50, 1.), (60, 600.)], max_snap_batch=100)
+"""
+from typing import Any, Callable, Hashable, Iterable, Optional
+from collections import deque
+from itertools import islice, count
+import threading
+import random
+import heapq
+import time
+import pandas as pd
+
+from .BrokerAPI import BrokerAPI
+
+
+# The priority classes of the requests, lower goes first
+ORDER_PRIORITY = 0
+DATA_PRIORITY  = 1
+
+
+def _freeze(value: Any) -> Optional[Hashable]:
+  """Function for a hashable key of request arguments, None if they cannot be hashed"""
+  if isinstance(value, dict):
+    value = tuple((name, _freeze(item)) for name, item in sorted(value.items()))
+  elif isinstance(value, (list, tuple)):
+    value = tuple(_freeze(item) for item in value)
+
+  try:
+    hash(value)
+  except TypeError:
+    return None
+
+  return value
+
+
+class RateLimiter:
+  """Thread-safe rate limiter with one or more token buckets and priority classes
+
+  Each limit of n requests per t seconds is a bucket of n tokens. A request takes a token from every bucket and each
+  token returns to its bucket t seconds after it was taken. Unlike a bucket refilled continuously, this never lets
+  more than n requests through within any window of t seconds, which is how the brokers count their pacing limits.
+  The requests waiting for tokens are served by priority and then in arrival order.
+  """
+
+  def __init__(self, limits: Iterable[tuple[int, float]]) -> None:
+    """Constructor method
+
+    The buckets start full.
+
+    @param limits           The limits as tuples of form (<requests>, <seconds>)
+    @raises AssertionError  Raised if no limits are given or a limit is not positive
+    @return                 None
+    """
+    limits = [(int(requests), float(seconds)) for requests, seconds in limits]
+    assert len(limits) > 0, "At least one limit must be given!"
+    assert all(requests >= 1 and seconds > 0 for requests, seconds in limits), f"The limits must be positive! ({limits})"
+
+    self.__limits       = limits
+    self.__taken        = [deque(maxlen=requests) for requests, _ in limits]  # The times the tokens in use were taken
+    self.__paused_until = 0.
+    self.__condition    = threading.Condition()
+    self.__waiters      = []  # (priority, sequence)
+    self.__sequence     = count()
+
+
+  def __str__(self) -> str:
+    return f"RateLimiter({self.__limits})"
+
+
+  def __repr__(self) -> str:
+    return f"Rate Limiter\nLimits: {self.__limits}\nWaiting: {len(self.__waiters)}"
+
+
+  @property
+  def limits(self) -> list[tuple[int, float]]:
+    return list(self.__limits)
+
+
+  def __wait_time(self, now: float) -> float:
+    """Method for the number of seconds until every bucket has a token while holding the lock"""
+    # A full log means that the bucket is empty until its oldest token returns
+    return max(self.__paused_until - now, *(taken[0] + seconds - now if len(taken) == requests else 0.
+                                            for taken, (requests, seconds) in zip(self.__taken, self.__limits)))
+
+
+  def acquire(self, priority: int = DATA_PRIORITY, timeout: Optional[float] = None) -> bool:
+    """Method for waiting for a token of every bucket and taking them
+
+    @param priority  The priority class of the request, lower goes first. Optional, defaults to DATA_PRIORITY
+    @param timeout   The number of seconds to wait. Optional, defaults to None i.e. waiting indefinitely
+    @return          True if the tokens were taken, False if the timeout passed
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    with self.__condition:
+      ticket = (priority, next(self.__sequence))
+      heapq.heappush(self.__waiters, ticket)
+
+      try:
+        while True:
+          now  = time.monotonic()
+          wait = None
+          if self.__waiters[0] == ticket:
+            wait = self.__wait_time(now)
+            if wait <= 0:
+              for taken in self.__taken:
+                taken.append(now)
+              return True
+
+          if deadline is not None:
+            if deadline <= now:
+              return False
+            wait = min(wait, deadline - now) if wait is not None else deadline - now
+
+          self.__condition.wait(wait)
+      finally:
+        self.__waiters.remove(ticket)
+        heapq.heapify(self.__waiters)
+        self.__condition.notify_all()
+
+
+  def pause(self, seconds: float) -> None:
+    """Method for holding back all of the requests e.g. after the broker has throttled one
+
+    @param seconds  The number of seconds from now during which no tokens are handed out
+    @return         None
+    """
+    with self.__condition:
+      self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+      self.__condition.notify_all()
+
+
+class _Request:
+  """A snap or fields call waiting for the batches containing its instruments"""
+
+  __slots__ = ["instrument_ids", "remaining", "frames", "code", "failed"]
+
+  def __init__(self, instrument_ids: list[str]) -> None:
+    self.instrument_ids = list(dict.fromkeys(instrument_ids))
+    self.remaining      = set(self.instrument_ids)
+    self.frames         = {}
+    self.code           = 0
+    self.failed         = False
+
+
+  @property
+  def done(self) -> bool:
+    return self.failed or not self.remaining
+
+
+class _Batcher:
+  """Merger of concurrent calls of the same kind into requests of at most a maximum number of instruments
+
+  The first waiting caller becomes the leader, which sends the pending instruments in batches in arrival order until
+  its own call is complete, and then hands the leadership over to one of the other waiting callers.
+  """
+
+  def __init__(self, send: Callable[[list[str]], tuple[int, Optional[pd.DataFrame]]], max_batch: int) -> None:
+    self.__send      = send
+    self.__max_batch = max_batch
+    self.__condition = threading.Condition()
+    self.__pending   = {}  # instrument id -> requests waiting for it, in arrival order
+    self.__leading   = False
+
+
+  def __call__(self, instrument_ids: list[str]) -> tuple[int, Optional[pd.DataFrame]]:
+    request = _Request(instrument_ids)
+
+    # A call without instruments has nothing to merge, so the broker answers it as it would on its own
+    if not request.instrument_ids:
+      return self.__send(request.instrument_ids)
+
+    with self.__condition:
+      for instrument_id in request.instrument_ids:
+        self.__pending.setdefault(instrument_id, []).append(request)
+
+      while not request.done and self.__leading:
+        self.__condition.wait()
+
+      lead = not request.done
+      if lead:
+        self.__leading = True
+
+    if lead:
+      try:
+        while not request.done:
+          with self.__condition:
+            batch   = list(islice(self.__pending, self.__max_batch))
+            waiting = {instrument_id: self.__pending.pop(instrument_id) for instrument_id in batch}
+
+          try:
+            code, df = self.__send(batch)
+          except BaseException:
+            # The instruments are sent again by the next leader
+            with self.__condition:
+              for instrument_id, requests in waiting.items():
+                self.__pending.setdefault(instrument_id, []).extend(requests)
+            raise
+
+          rows = df.groupby("InstrumentID", sort=False).indices if df is not None else {}
+
+          with self.__condition:
+            for instrument_id, requests in waiting.items():
+              for waiter in requests:
+                if df is None:
+                  waiter.code, waiter.failed = code, True
+                else:
+                  waiter.code = code
+                  waiter.frames[instrument_id] = df.iloc[rows[instrument_id]] if instrument_id in rows else df.iloc[:0]
+                  waiter.remaining.discard(instrument_id)
+            self.__condition.notify_all()
+      finally:
+        with self.__condition:
+          self.__leading = False
+          self.__condition.notify_all()
+
+    if request.failed:
+      return request.code, None
+
+    frames = [request.frames[instrument_id] for instrument_id in request.instrument_ids]
+    return request.code, pd.concat([frame for frame in frames if len(frame) > 0] or frames[:1], ignore_index=True)
+
+
+class RateLimitedBrokerAPI(BrokerAPI):
+  """Wrapper around a BrokerAPI implementation keeping the requests within the pacing limits of the broker
+
+  Every request sent to the broker takes a token from the rate limiter, orders (bid and ask) with priority over the
+  market data requests. The snap and fields calls are split into batches of at most the maximum batch size, and the
+  calls made by other threads at the same time (with the same fields and keyword arguments) are merged into the same
+  batches. A request answered with a throttling return code is retried after an exponential backoff with full
+  jitter, during which the whole limiter is paused.
+  """
+
+  def __init__(self, broker: BrokerAPI, limits: Iterable[tuple[int, float]] = ((50, 1.),), max_snap_batch: int = 100,
+               max_fields_batch: int = 100, throttle_codes: Iterable[int] = (429,), max_retries: int = 5,
+               backoff: float = 0.1, max_backoff: float = 10., **kwargs) -> None:
+    """Constructor method
+
+    @param broker            The wrapped broker
+    @param limits            The pacing limits of the broker as tuples of form (<requests>, <seconds>). Optional,
+                             defaults to 50 requests per second
+    @param max_snap_batch    The maximum number of instruments in a snap request. Optional, defaults to 100
+    @param max_fields_batch  The maximum number of instruments in a fields request. Optional, defaults to 100
+    @param throttle_codes    The return codes of the broker for throttled requests. Optional, defaults to (429,)
+    @param max_retries       The maximum number of retries of a throttled request. Optional, defaults to 5
+    @param backoff           The upper bound of the first backoff in seconds, doubled on every retry. Optional,
+                             defaults to 0.1
+    @param max_backoff       The maximum upper bound of the backoff in seconds. Optional, defaults to 10
+    @param **kwargs          Not used, accepted for the interface
+    @raises AssertionError   Raised if a batch size is not positive or the retries are negative
+    @return                  None
+    """
+    assert max_snap_batch > 0 and max_fields_batch > 0, f"The batch sizes must be positive! ({max_snap_batch}, {max_fields_batch})"
+    assert max_retries >= 0, f"The number of retries must be non-negative! ({max_retries} < 0)"
+
+    self.__broker           = broker
+    self.__limiter          = RateLimiter(limits)
+    self.__max_snap_batch   = max_snap_batch
+    self.__max_fields_batch = max_fields_batch
+    self.__throttle_codes   = frozenset(throttle_codes)
+    self.__max_retries      = max_retries
+    self.__backoff          = backoff
+    self.__max_backoff      = max_backoff
+    self.__lock             = threading.Lock()
+    self.__batchers         = {}  # (method, arguments) -> batcher
+    self.__stats            = {"calls": 0, "requests": 0, "throttled": 0}
+
+
+  def __del__(self) -> None:
+    pass
+
+
+  def __str__(self) -> str:
+    return f"RateLimitedBrokerAPI({self.__broker}, {self.__limiter.limits})"
+
+
+  def __repr__(self) -> str:
+    return f"Rate Limited Broker API\nBroker: {self.__broker}\nLimits: {self.__limiter.limits}\n" \
+           f"Batch sizes: snap {self.__max_snap_batch}, fields {self.__max_fields_batch}\nStatistics: {self.stats}"
+
+
+  @property
+  def broker(self) -> BrokerAPI:
+    return self.__broker
+
+
+  @property
+  def limiter(self) -> RateLimiter:
+    return self.__limiter
+
+
+  @property
+  def stats(self) -> dict[str, int]:
+    """The numbers of calls of the wrapper ('calls'), requests sent to the broker ('requests') and throttled
+    requests ('throttled')"""
+    with self.__lock:
+      return dict(self.__stats)
+
+
+  def __count(self, name: str) -> None:
+    with self.__lock:
+      self.__stats[name] += 1
+
+
+  def __send(self, priority: int, method: Callable, *args, **kwargs) -> tuple:
+    """Method for sending a request within the limits, retrying it while it is throttled"""
+    for attempt in range(self.__max_retries + 1):
+      self.__limiter.acquire(priority)
+      self.__count("requests")
+
+      result = method(*args, **kwargs)
+      if result[0] not in self.__throttle_codes or attempt == self.__max_retries:
+        return result
+
+      # Full jitter keeps the throttled clients from retrying in lockstep
+      self.__count("throttled")
+      self.__limiter.pause(random.uniform(0, min(self.__max_backoff, self.__backoff * 2 ** attempt)))
+
+    return result
+
+
+  def __batched(self, name: str, max_batch: int, instrument_ids: list[str], *args, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for sending a snap or fields call through the batcher of its arguments"""
+    self.__count("calls")
+    method = getattr(self.__broker, name)
+
+    key = _freeze((name, args, kwargs))
+    if key is None:
+      # Calls with unhashable arguments are only split
+      batcher = _Batcher(lambda batch: self.__send(DATA_PRIORITY, method, batch, *args, **kwargs), max_batch)
+    else:
+      with self.__lock:
+        batcher = self.__batchers.get(key)
+        if batcher is None:
+          batcher = self.__batchers[key] = _Batcher(lambda batch: self.__send(DATA_PRIORITY, method, batch, *args, **kwargs),
+                                                    max_batch)
+
+    return batcher(instrument_ids)
+
+
+  def bid(self, instrument_id: str, bid_price: float, bid_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    self.__count("calls")
+    return self.__send(ORDER_PRIORITY, self.__broker.bid, instrument_id, bid_price, bid_size, **kwargs)
+
+
+  def ask(self, instrument_id: str, ask_price: float, ask_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    self.__count("calls")
+    return self.__send(ORDER_PRIORITY, self.__broker.ask, instrument_id, ask_price, ask_size, **kwargs)
+
+
+  def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    return self.__batched("snap", self.__max_snap_batch, instrument_ids, **kwargs)
+
+
+  def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    self.__count("calls")
+    return self.__send(DATA_PRIORITY, self.__broker.history, instrument_id, start_time, end_time, step_size, **kwargs)
+
+
+  def fields(self, instrument_ids: list[str], field_ids: list[str],
+             field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    return self.__batched("fields", self.__max_fields_batch, instrument_ids, field_ids, field_map, **kwargs)
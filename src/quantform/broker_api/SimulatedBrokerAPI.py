@@ -0,0 +1,620 @@
+"""@package quantform.broker_api.SimulatedBrokerAPI
+@author Kasper Rantamäki
+Submodule containing a local broker that replays historical quotes and matches orders in simulated time
+
+The simulated broker makes it possible to run strategies and the data ingestion against the BrokerAPI interface
+without a live account, e.g. for load testing and benchmarking the whole stack offline.
+
+Example:
+  quotes = SimulatedBrokerAPI.read_option_quotes("example_data/SPY_Calls_2025-08-15.tsv")
+  broker = SimulatedBrokerAPI(quotes=quotes, latency=0.002, jitter=0.001)
+  broker.advance("2025-08-15 16:00")
+  code, price, size = broker.bid("SPY250919C00650000", 5.2, 10)
+"""
+from typing import TYPE_CHECKING, Literal, Optional, Union
+from collections import deque
+from bisect import bisect_right
+from pathlib import Path
+import threading
+import itertools
+import heapq
+import numpy as np
+import pandas as pd
+
+from .BrokerAPI import BrokerAPI
+
+if TYPE_CHECKING:
+  from ..db import TimeSeriesStore
+
+
+# The return codes of the simulated broker
+FILLED    = 0   # The order was filled completely, or a data request succeeded
+UNFILLED  = 1   # The order was filled partially or not at all. The remainder rests in the book or is cancelled
+REJECTED  = -1  # The order or the data request was rejected e.g. for an unknown instrument
+
+
+# The columns of the quote tape, the snaps and the historical bars
+_quote_columns   = ["Timestamp", "InstrumentID", "Bid", "BidSize", "Ask", "AskSize"]
+_history_columns = ["Timestamp", "Open Value", "Close Value", "High Value", "Low Value", "Volume"]
+_bar_names       = {"Open": "Open Value", "Close": "Close Value", "High": "High Value", "Low": "Low Value"}
+
+
+def _nanoseconds(timestamp: Union[str, pd.Timestamp, np.datetime64]) -> int:
+  """Function for converting a timestamp into nanoseconds since the epoch in UTC"""
+  timestamp = pd.Timestamp(timestamp)
+  return (timestamp.tz_convert(None) if timestamp.tz is not None else timestamp).value
+
+
+class _Tape:
+  """The quotes of a single instrument as lists, which are faster than arrays to index one element at a time"""
+
+  __slots__ = ["times", "bids", "bid_sizes", "asks", "ask_sizes"]
+
+  def __init__(self, df: pd.DataFrame) -> None:
+    df = df.sort_values("Timestamp", kind="stable")
+
+    self.times     = df["Timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64).tolist()
+    self.bids      = df["Bid"].to_numpy(dtype=np.float64).tolist()
+    self.bid_sizes = df["BidSize"].to_numpy(dtype=np.float64).tolist()
+    self.asks      = df["Ask"].to_numpy(dtype=np.float64).tolist()
+    self.ask_sizes = df["AskSize"].to_numpy(dtype=np.float64).tolist()
+
+
+class _Book:
+  """The limit order book of a single instrument
+
+  The resting orders are kept in heaps ordered by price and then by arrival, i.e. in price-time priority. The orders
+  are lists [order id, side, price, remaining size, arrival time], and cancelled or filled ones are removed lazily when
+  they reach the top of their heap.
+  """
+
+  __slots__ = ["bids", "asks", "quote", "used_bid", "used_ask", "swept", "last_arrival"]
+
+  def __init__(self) -> None:
+    self.bids         = []  # (-price, sequence, order)
+    self.asks         = []  # (price, sequence, order)
+    self.quote        = -1  # The index of the quote whose liquidity has been used
+    self.used_bid     = 0.  # The size of the quoted bid taken by the orders
+    self.used_ask     = 0.  # The size of the quoted ask taken by the orders
+    self.swept        = -1  # The index of the last quote matched against the resting orders
+    self.last_arrival = 0
+
+
+  @staticmethod
+  def top(heap: list) -> Optional[list]:
+    """Method for the best live order of a side"""
+    while heap and heap[0][2][3] <= 0:
+      heapq.heappop(heap)
+
+    return heap[0][2] if heap else None
+
+
+class SimulatedBrokerAPI(BrokerAPI):
+  """Local broker replaying historical quotes in simulated time
+
+  The simulated clock starts at the first quote and is moved forward with 'advance'. The quote of an instrument in
+  effect at a time is its latest quote at or before the time.
+
+  The orders arrive at the broker after a latency. On arrival the buy (bid) orders are matched against the resting
+  sell orders and the quoted ask, and the sell (ask) orders against the resting buy orders and the quoted bid, best
+  price first and resting orders first at equal prices. Each quote provides its quoted size (times the fill ratio) of
+  liquidity, which is shared by all of the orders arriving while the quote is in effect, so large orders are only
+  partially filled. The remainder of a good-till-cancelled order rests in the book, where it is filled as later quotes
+  cross its price or as opposite orders arrive, while the remainder of an immediate-or-cancel order is cancelled.
+
+  The order methods return the code FILLED (0) for complete fills, UNFILLED (1) for partial or missing fills and
+  REJECTED (-1) for rejected orders, along with the average fill price and the filled size. The data methods return
+  FILLED on success and REJECTED on failure. The broker is thread safe.
+  """
+
+  def __init__(self, quotes: Optional[pd.DataFrame] = None, store: Optional["TimeSeriesStore"] = None,
+               instrument_ids: Optional[list[str]] = None, history: Optional[dict[str, pd.DataFrame]] = None,
+               fields: Optional[pd.DataFrame] = None, latency: float = 0., jitter: float = 0., fill_ratio: float = 1.,
+               quote_size: float = 100., seed: Optional[int] = None, max_fills: Optional[int] = None, **kwargs) -> None:
+    """Constructor method
+
+    The quotes and the bars in the time series store have the columns 'Bid', 'BidSize', 'Ask' and 'AskSize', or only
+    'Close' in which case it is used as both the bid and the ask, and the columns 'Open', 'High', 'Low', 'Close' and
+    'Volume' respectively.
+
+    @param quotes           The quote tape with the columns 'Timestamp', 'InstrumentID', 'Bid', 'BidSize', 'Ask' and
+                            'AskSize' e.g. from 'read_option_quotes'. Optional, defaults to None
+    @param store            Time series store holding the quotes and the bars of the instruments. Optional, defaults to
+                            None
+    @param instrument_ids   The instruments loaded from the store. Optional, defaults to None i.e. all of them
+    @param history          Dictionary from the instrument ids to the historical bars with the columns of 'history'
+                            e.g. from 'read_history'. Optional, defaults to None i.e. the bars are read from the store
+                            or built from the mid prices of the quotes
+    @param fields           The static field values with the column 'InstrumentID'. Optional, defaults to None
+    @param latency          The mean number of seconds from sending an order to its arrival. Optional, defaults to 0
+    @param jitter           The standard deviation of the latency in seconds. The latencies are drawn from a gamma
+                            distribution. Optional, defaults to 0
+    @param fill_ratio       The share of the quoted sizes available to the orders. Optional, defaults to 1
+    @param quote_size       The size used for quotes without sizes. Optional, defaults to 100
+    @param seed             The seed of the latency draws. Optional, defaults to None
+    @param max_fills        The number of the latest fills kept for 'fills', 0 for not recording them. The positions
+                            and the cash always include all of the fills. Optional, defaults to None i.e. all of them
+    @param **kwargs         Not used, accepted for the interface
+    @raises AssertionError  Raised if no quotes are given or a parameter is invalid
+    @return                 None
+    """
+    assert quotes is not None or store is not None, "Either the quotes or a time series store must be given!"
+    assert latency >= 0 and jitter >= 0, f"The latency must be non-negative! (latency {latency}, jitter {jitter})"
+    assert 0 < fill_ratio <= 1, f"The fill ratio must be within (0, 1]! ({fill_ratio})"
+    assert max_fills is None or max_fills >= 0, f"The maximum number of fills must be non-negative! ({max_fills} < 0)"
+
+    frames = [quotes] if quotes is not None else []
+    if store is not None:
+      frames.extend(self.__store_quotes(store, instrument_ids if instrument_ids is not None else store.instruments, quote_size))
+
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    df = df.assign(Timestamp=pd.to_datetime(df["Timestamp"]),
+                   BidSize=df["BidSize"].fillna(quote_size), AskSize=df["AskSize"].fillna(quote_size))
+
+    self.__tapes   = {instrument_id: _Tape(quotes) for instrument_id, quotes in df.groupby("InstrumentID", sort=False)}
+    self.__books   = {instrument_id: _Book() for instrument_id in self.__tapes}
+    self.__store   = store
+    self.__history = history if history is not None else {}
+    self.__fields  = fields.set_index("InstrumentID") if fields is not None else pd.DataFrame()
+
+    self.__latency    = latency
+    self.__jitter     = jitter
+    self.__fill_ratio = fill_ratio
+    self.__rng        = np.random.default_rng(seed)
+
+    self.__lock      = threading.Lock()
+    self.__now       = min((tape.times[0] for tape in self.__tapes.values() if tape.times), default=0)
+    self.__sequence  = itertools.count()
+    self.__orders    = {}   # order id -> resting order
+    self.__fills     = deque(maxlen=max_fills)  # (time, order id, instrument id, side, price, size, liquidity)
+    self.__positions = dict.fromkeys(self.__tapes, 0.)
+    self.__cash      = 0.
+
+
+  @staticmethod
+  def __store_quotes(store: "TimeSeriesStore", instrument_ids: list[str], quote_size: float) -> list[pd.DataFrame]:
+    """Method for reading the quotes of instruments from a time series store"""
+    frames = []
+    for instrument_id in instrument_ids:
+      columns = store.columns(instrument_id)
+      if {"Bid", "Ask"} <= set(columns):
+        df = store.read(instrument_id, columns=[name for name in ["Bid", "BidSize", "Ask", "AskSize"] if name in columns])
+      else:
+        close = store.read(instrument_id, columns=["Close"])["Close"]
+        df    = pd.DataFrame({"Bid": close, "Ask": close})
+
+      frames.append(df.reindex(columns=["Bid", "BidSize", "Ask", "AskSize"]).rename_axis("Timestamp").reset_index()
+                      .assign(InstrumentID=instrument_id, BidSize=lambda df: df["BidSize"].fillna(quote_size),
+                              AskSize=lambda df: df["AskSize"].fillna(quote_size)))
+
+    return frames
+
+
+  @staticmethod
+  def read_option_quotes(path: Union[str, Path], size: float = 100., sep: str = "\t") -> pd.DataFrame:
+    """Method for reading the option quotes of a Yahoo Finance option chain file (e.g. in 'example_data') into a tape
+
+    Each contract is quoted once at its last trade date with the given size on both sides.
+
+    @param path  The path to the file
+    @param size  The quoted bid and ask sizes. Optional, defaults to 100
+    @param sep   The column separator. Optional, defaults to tab
+    @return      The quote tape with the columns 'Timestamp', 'InstrumentID', 'Bid', 'BidSize', 'Ask' and 'AskSize'
+    """
+    df = pd.read_csv(path, sep=sep, usecols=["Contract Name", "Last Trade Date (EDT)", "Bid", "Ask"])
+
+    return pd.DataFrame({"Timestamp":    pd.to_datetime(df["Last Trade Date (EDT)"], format="%m/%d/%Y %I:%M %p"),
+                         "InstrumentID": df["Contract Name"],
+                         "Bid":          pd.to_numeric(df["Bid"], errors="coerce"),
+                         "BidSize":      size,
+                         "Ask":          pd.to_numeric(df["Ask"], errors="coerce"),
+                         "AskSize":      size})
+
+
+  @staticmethod
+  def read_history(path: Union[str, Path], sep: str = ",") -> pd.DataFrame:
+    """Method for reading the daily bars of a Yahoo Finance history file (e.g. in 'example_data')
+
+    @param path  The path to the file
+    @param sep   The column separator. Optional, defaults to comma
+    @return      The bars with the columns of 'history'
+    """
+    df = pd.read_csv(path, sep=sep, usecols=["Date", "Open", "High", "Low", "Close", "Volume"], parse_dates=["Date"])
+    return df.rename(columns={"Date": "Timestamp", **_bar_names})[_history_columns]
+
+
+  @staticmethod
+  def quotes_from_history(instrument_id: str, df: pd.DataFrame, spread: float = 0., size: float = 100.) -> pd.DataFrame:
+    """Method for building a quote tape from the closing prices of historical bars
+
+    @param instrument_id  The identifier of the instrument
+    @param df             The bars with the columns of 'history'
+    @param spread         The relative bid-ask spread around the closing prices. Optional, defaults to 0
+    @param size           The quoted bid and ask sizes. Optional, defaults to 100
+    @return               The quote tape
+    """
+    close = df["Close Value"].to_numpy(dtype=np.float64)
+
+    return pd.DataFrame({"Timestamp": df["Timestamp"].to_numpy(), "InstrumentID": instrument_id,
+                         "Bid": close * (1 - spread / 2), "BidSize": size, "Ask": close * (1 + spread / 2), "AskSize": size})
+
+
+  def __del__(self) -> None:
+    pass
+
+
+  def __str__(self) -> str:
+    return f"SimulatedBrokerAPI({len(self.__tapes)} instruments)"
+
+
+  def __repr__(self) -> str:
+    return f"Simulated Broker API\nInstruments: {len(self.__tapes)}\nTime: {self.now}\nLatency: {self.__latency} " \
+           f"(jitter {self.__jitter})\nFill ratio: {self.__fill_ratio}\nResting orders: {len(self.__orders)}\nFills: {len(self.__fills)}"
+
+
+  @property
+  def now(self) -> pd.Timestamp:
+    """The simulated time"""
+    return pd.Timestamp(self.__now)
+
+
+  @property
+  def instrument_ids(self) -> list[str]:
+    return list(self.__tapes)
+
+
+  @property
+  def positions(self) -> dict[str, float]:
+    """The net positions from the fills"""
+    with self.__lock:
+      return dict(self.__positions)
+
+
+  @property
+  def cash(self) -> float:
+    """The cash flows of the fills"""
+    return self.__cash
+
+
+  @property
+  def fills(self) -> pd.DataFrame:
+    """The fills with the columns 'Timestamp', 'OrderID', 'InstrumentID', 'Side', 'Price', 'Size' and 'Liquidity'
+    ('taker' for fills on arrival and 'maker' for fills while resting)"""
+    with self.__lock:
+      fills = list(self.__fills)
+
+    df = pd.DataFrame(fills, columns=["Timestamp", "OrderID", "InstrumentID", "Side", "Price", "Size", "Liquidity"])
+    return df.assign(Timestamp=pd.to_datetime(df["Timestamp"].to_numpy(dtype=np.int64)))
+
+
+  def open_orders(self, instrument_id: Optional[str] = None) -> pd.DataFrame:
+    """Method for getting the resting orders
+
+    @param instrument_id  The instrument. Optional, defaults to None i.e. all of the instruments
+    @return               The orders with the columns 'OrderID', 'InstrumentID', 'Side', 'Price', 'Remaining' and 'Arrival'
+    """
+    with self.__lock:
+      rows = [(order[0], order_instrument, order[1], order[2], order[3], order[4])
+              for order_instrument, book in self.__books.items() if instrument_id in (None, order_instrument)
+              for _, _, order in book.bids + book.asks if order[3] > 0]
+
+    df = pd.DataFrame(rows, columns=["OrderID", "InstrumentID", "Side", "Price", "Remaining", "Arrival"])
+    df["Arrival"] = pd.to_datetime(df["Arrival"].to_numpy(dtype=np.int64))
+
+    return df.sort_values("OrderID", ignore_index=True)
+
+
+  def cancel(self, order_id: Optional[int] = None, instrument_id: Optional[str] = None) -> int:
+    """Method for cancelling resting orders
+
+    @param order_id       The order to cancel. Optional, defaults to None i.e. all of the orders of the instrument
+    @param instrument_id  The instrument whose orders are cancelled. Optional, defaults to None i.e. all instruments
+    @return               The number of cancelled orders
+    """
+    with self.__lock:
+      orders = [self.__orders[order_id]] if order_id is not None and order_id in self.__orders else \
+               [] if order_id is not None else \
+               [order for book_instrument, book in self.__books.items() if instrument_id in (None, book_instrument)
+                for _, _, order in book.bids + book.asks]
+
+      cancelled = 0
+      for order in orders:
+        cancelled += order[3] > 0
+        order[3]   = 0.
+        self.__orders.pop(order[0], None)
+
+    return cancelled
+
+
+  def advance(self, until: Optional[Union[str, pd.Timestamp]] = None, seconds: Optional[float] = None) -> pd.Timestamp:
+    """Method for moving the simulated clock forward, matching the resting orders against the quotes passed
+
+    @param until    The new time. Optional, defaults to None
+    @param seconds  The number of seconds to move the clock by, if the new time is not given. Optional, defaults to
+                    None i.e. to the last quote
+    @return         The new time
+    """
+    with self.__lock:
+      if until is not None:
+        now = _nanoseconds(until)
+      elif seconds is not None:
+        now = self.__now + int(seconds * 1e9)
+      else:
+        now = max((tape.times[-1] for tape in self.__tapes.values() if tape.times), default=self.__now)
+
+      self.__now = max(self.__now, now)
+      for instrument_id, book in self.__books.items():
+        if book.bids or book.asks:
+          self.__sweep(instrument_id, book, self.__tapes[instrument_id], self.__now)
+
+      return pd.Timestamp(self.__now)
+
+
+  def __sweep(self, instrument_id: str, book: _Book, tape: _Tape, time: int) -> int:
+    """Method for filling the resting orders crossed by the quotes up to a time
+
+    @return  The index of the quote in effect at the time
+    """
+    index = bisect_right(tape.times, time) - 1
+
+    for quote in range(max(book.swept, -1) + 1, index + 1):
+      if not book.bids and not book.asks:
+        break
+
+      if quote != book.quote:
+        book.quote, book.used_bid, book.used_ask = quote, 0., 0.
+
+      for side, heap, price, size in (("BUY", book.bids, tape.asks[quote], tape.ask_sizes[quote]),
+                                      ("SELL", book.asks, tape.bids[quote], tape.bid_sizes[quote])):
+        available = size * self.__fill_ratio - (book.used_ask if side == "BUY" else book.used_bid)
+
+        while available > 0 and price == price:
+          order = _Book.top(heap)
+          if order is None or (order[2] < price if side == "BUY" else order[2] > price):
+            break
+
+          # The resting order is filled at its own limit price, which is at least as good as the quote
+          filled    = min(order[3], available)
+          available = available - filled
+          self.__fill(tape.times[quote], order, instrument_id, order[2], filled, "maker")
+
+          if side == "BUY":
+            book.used_ask += filled
+          else:
+            book.used_bid += filled
+
+    book.swept = max(book.swept, index)
+    return index
+
+
+  def __fill(self, time: int, order: list, instrument_id: str, price: float, size: float, liquidity: str) -> None:
+    """Method for recording a fill of an order"""
+    order[3] -= size
+    sign      = 1. if order[1] == "BUY" else -1.
+
+    self.__positions[instrument_id] += sign * size
+    self.__cash                     -= sign * size * price
+    self.__fills.append((time, order[0], instrument_id, order[1], price, size, liquidity))
+
+    # Only the resting orders are kept, so that the memory use doesn't grow with the number of orders sent
+    if order[3] <= 0:
+      self.__orders.pop(order[0], None)
+
+
+  def __latency_ns(self) -> int:
+    """Method for drawing the latency of an order in nanoseconds"""
+    if self.__jitter == 0:
+      return int(self.__latency * 1e9)
+
+    # A gamma distribution with the wanted mean and standard deviation
+    shape = (self.__latency / self.__jitter) ** 2 if self.__latency > 0 else 1.
+    scale = self.__jitter ** 2 / self.__latency if self.__latency > 0 else self.__jitter
+
+    return int(self.__rng.gamma(shape, scale) * 1e9)
+
+
+  def __order(self, side: Literal["BUY", "SELL"], instrument_id: str, price: float, size: float,
+              time_in_force: Literal["GTC", "IOC"]) -> tuple[int, Optional[float], Optional[float]]:
+    """Method for matching an arriving order and resting its remainder"""
+    price, size = float(price), float(size)
+
+    tape = self.__tapes.get(instrument_id)
+    if tape is None or not size > 0 or not price == price or time_in_force not in ("GTC", "IOC"):
+      return REJECTED, None, None
+
+    with self.__lock:
+      book = self.__books[instrument_id]
+
+      # The orders of an instrument arrive in the order they are sent
+      arrival           = max(self.__now + self.__latency_ns(), book.last_arrival)
+      book.last_arrival = arrival
+
+      quote = self.__sweep(instrument_id, book, tape, arrival)
+      if quote < 0:
+        return REJECTED, None, None
+
+      if quote != book.quote:
+        book.quote, book.used_bid, book.used_ask = quote, 0., 0.
+
+      order = [next(self.__sequence), side, price, size, arrival]
+
+      if side == "BUY":
+        opposite, quoted, quoted_size, used = book.asks, tape.asks[quote], tape.ask_sizes[quote], book.used_ask
+        crosses = lambda level: level <= price
+      else:
+        opposite, quoted, quoted_size, used = book.bids, tape.bids[quote], tape.bid_sizes[quote], book.used_bid
+        crosses = lambda level: level >= price
+
+      available = quoted_size * self.__fill_ratio - used if quoted == quoted else 0.
+      value     = 0.
+
+      while order[3] > 0:
+        resting = _Book.top(opposite)
+
+        # Resting orders have priority over the quote at equal prices
+        if resting is not None and (available <= 0 or (resting[2] <= quoted if side == "BUY" else resting[2] >= quoted)):
+          if not crosses(resting[2]):
+            break
+
+          filled = min(order[3], resting[3])
+          self.__fill(arrival, resting, instrument_id, resting[2], filled, "maker")
+          self.__fill(arrival, order, instrument_id, resting[2], filled, "taker")
+          value += filled * resting[2]
+        elif available > 0 and crosses(quoted):
+          filled     = min(order[3], available)
+          available -= filled
+          self.__fill(arrival, order, instrument_id, quoted, filled, "taker")
+          value += filled * quoted
+
+          if side == "BUY":
+            book.used_ask += filled
+          else:
+            book.used_bid += filled
+        else:
+          break
+
+      filled = size - order[3]
+      if order[3] > 0:
+        if time_in_force == "GTC":
+          heapq.heappush(book.bids if side == "BUY" else book.asks, (-price if side == "BUY" else price, order[0], order))
+          self.__orders[order[0]] = order
+        else:
+          order[3] = 0.
+
+      if filled == size:
+        return FILLED, value / filled, filled
+
+      return UNFILLED, value / filled if filled > 0 else None, filled
+
+
+  def bid(self, instrument_id: str, bid_price: float, bid_size: float, time_in_force: Literal["GTC", "IOC"] = "GTC",
+          **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    """Method for sending a limit buy (bid) order
+
+    @param instrument_id  The identifier for the instrument to be purchased
+    @param bid_price      The limit price
+    @param bid_size       The amount of the instrument to be purchased
+    @param time_in_force  Either 'GTC' for resting the unfilled remainder in the book or 'IOC' for cancelling it.
+                          Optional, defaults to 'GTC'
+    @param **kwargs       Not used, accepted for the interface
+    @return               Tuple of form (<return code>, <average fill price>, <filled size>). The price is None if
+                          nothing was filled
+    """
+    return self.__order("BUY", instrument_id, bid_price, bid_size, time_in_force)
+
+
+  def ask(self, instrument_id: str, ask_price: float, ask_size: float, time_in_force: Literal["GTC", "IOC"] = "GTC",
+          **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    """Method for sending a limit sell (ask) order
+
+    @param instrument_id  Identifier for the instrument to be sold
+    @param ask_price      The limit price
+    @param ask_size       The amount of the instrument to be sold
+    @param time_in_force  Either 'GTC' for resting the unfilled remainder in the book or 'IOC' for cancelling it.
+                          Optional, defaults to 'GTC'
+    @param **kwargs       Not used, accepted for the interface
+    @return               Tuple of form (<return code>, <average fill price>, <filled size>). The price is None if
+                          nothing was filled
+    """
+    return self.__order("SELL", instrument_id, ask_price, ask_size, time_in_force)
+
+
+  def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for the quotes of instruments in effect at the simulated time
+
+    @param instrument_ids  List of identifiers for the instruments
+    @param **kwargs        Not used, accepted for the interface
+    @return                Tuple of form (<return code>, <dataframe>). The request is rejected if any of the
+                           instruments is unknown. Instruments not quoted yet have missing values
+    """
+    if any(instrument_id not in self.__tapes for instrument_id in instrument_ids):
+      return REJECTED, None
+
+    now  = self.__now
+    rows = []
+    for instrument_id in instrument_ids:
+      tape  = self.__tapes[instrument_id]
+      index = bisect_right(tape.times, now) - 1
+      rows.append((tape.times[index], instrument_id, tape.bids[index], tape.bid_sizes[index], tape.asks[index], tape.ask_sizes[index])
+                  if index >= 0 else (np.iinfo(np.int64).min, instrument_id, np.nan, np.nan, np.nan, np.nan))
+
+    df = pd.DataFrame(rows, columns=_quote_columns)
+    return FILLED, df.assign(Timestamp=pd.to_datetime(df["Timestamp"].to_numpy(dtype=np.int64)))
+
+
+  def __bars(self, instrument_id: str) -> Optional[pd.DataFrame]:
+    """Method for the bars of an instrument with the timestamps as the index"""
+    if instrument_id in self.__history:
+      return self.__history[instrument_id].set_index("Timestamp")
+
+    if self.__store is not None and instrument_id in self.__store and "Close" in self.__store.columns(instrument_id):
+      columns = [name for name in [*_bar_names, "Volume"] if name in self.__store.columns(instrument_id)]
+      return self.__store.read(instrument_id, columns=columns).rename(columns=_bar_names)
+
+    if instrument_id in self.__tapes:
+      tape = self.__tapes[instrument_id]
+      mid  = (np.asarray(tape.bids) + np.asarray(tape.asks)) / 2
+      return pd.DataFrame({name: mid for name in _bar_names.values()} | {"Volume": 0.},
+                          index=pd.DatetimeIndex(np.asarray(tape.times, dtype="datetime64[ns]")))
+
+    return None
+
+
+  def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for the historical bars of an instrument, resampled to the step size
+
+    Bars after the simulated time are not served.
+
+    @param instrument_id  Identifier for the instrument
+    @param start_time     The requested interval start time
+    @param end_time       The requested interval end time
+    @param step_size      The step size as a pandas offset or timedelta e.g. '1D', '1h' or '5min'
+    @param **kwargs       Not used, accepted for the interface
+    @return               Tuple of form (<return code>, <dataframe>)
+    """
+    bars = self.__bars(instrument_id)
+    if bars is None:
+      return REJECTED, None
+
+    try:
+      end  = min(pd.Timestamp(end_time), pd.Timestamp(self.__now))
+      bars = bars.loc[pd.Timestamp(start_time):end]
+      bars = bars.resample(step_size).agg({"Open Value": "first", "Close Value": "last", "High Value": "max",
+                                           "Low Value": "min", "Volume": "sum"}).dropna(subset=["Close Value"])
+    except (ValueError, TypeError, KeyError):
+      return REJECTED, None
+
+    return FILLED, bars.rename_axis("Timestamp").reset_index()[_history_columns]
+
+
+  def fields(self, instrument_ids: list[str], field_ids: list[str],
+             field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    """Method for the field values of instruments
+
+    The fields are the static ones given to the constructor, the quote columns ('Bid', 'BidSize', 'Ask', 'AskSize')
+    and 'Mid' at the simulated time and the net position ('Position').
+
+    @param instrument_ids  List of identifiers for the instruments
+    @param field_ids       List of identifiers specifying the wanted fields
+    @param field_map       Dictionary for mapping the field ids into the column names. Optional
+    @param **kwargs        Not used, accepted for the interface
+    @return                Tuple of form (<return code>, <dataframe>). The request is rejected if a field is unknown
+    """
+    code, snap = self.snap(instrument_ids)
+    if code != FILLED:
+      return REJECTED, None
+
+    snap    = snap.assign(Mid=(snap["Bid"] + snap["Ask"]) / 2, Position=[self.__positions[id] for id in instrument_ids])
+    statics = self.__fields.reindex(instrument_ids)
+
+    columns = {"InstrumentID": instrument_ids}
+    for field_id in field_ids:
+      if field_id in statics.columns:
+        columns[field_id] = statics[field_id].to_numpy()
+      elif field_id in snap.columns and field_id not in ("Timestamp", "InstrumentID"):
+        columns[field_id] = snap[field_id].to_numpy()
+      else:
+        return REJECTED, None
+
+    df = pd.DataFrame(columns)
+    return FILLED, df.rename(columns=field_map) if field_map is not None else df
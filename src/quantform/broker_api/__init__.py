@@ -4,10 +4,22 @@ Module containing wrappers for easier interaction with the brokers.
 
 The module implements a BrokerAPI abstract base class and an InteractiveBrokersAPI class which wraps the
 interactive brokers RESTful API. The API can be used for both accessing market data and executing trades.
+
+The AsyncBrokerAPI is the asyncio counterpart of the interface and the ThreadedBrokerAPI adapts synchronous
+implementations to it. The SimulatedBrokerAPI replays historical quotes locally for testing and benchmarking without
+a live account. The CachedBrokerAPI caches the historical bars of any broker on the disk and only fetches the
+missing ranges. Quote updates are streamed into bounded Subscriptions of a QuoteFeed, such as the ReplayFeed of
+historical quotes. The RateLimitedBrokerAPI keeps the requests within the pacing limits of the broker with a
+RateLimiter and merges the snap and fields calls into batches.
 """
 
 
-__all__ = ["BrokerAPI"]
+__all__ = ["BrokerAPI", "AsyncBrokerAPI", "ThreadedBrokerAPI", "SimulatedBrokerAPI", "CachedBrokerAPI", "Quote", "Subscription", "QuoteFeed", "ReplayFeed", "RateLimiter", "RateLimitedBrokerAPI"]
 
 
 from .BrokerAPI import BrokerAPI
+from .AsyncBrokerAPI import AsyncBrokerAPI, ThreadedBrokerAPI
+from .SimulatedBrokerAPI import SimulatedBrokerAPI
+from .CachedBrokerAPI import CachedBrokerAPI
+from .QuoteFeed import Quote, Subscription, QuoteFeed, ReplayFeed
+from .RateLimitedBrokerAPI import RateLimiter, RateLimitedBrokerAPI
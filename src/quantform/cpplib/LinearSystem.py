@@ -0,0 +1,222 @@
+"""@package quantform.cpplib.LinearSystem
+@author Kasper Rantamäki
+Submodule with a linear system class that keeps the system matrix on the C++ side between solves
+"""
+from __future__ import annotations
+from typing import Dict, Literal, Optional, Tuple, Union
+from scipy.sparse import csr_matrix
+import ctypes
+import numpy as np
+
+from .linsolve import clinsolve, _as_buffer, _preconditioner_name, _observe_convergence, _double_array, _int_array, _int_ptr, _double_ptr
+from ..pylib.instrumentation import timed
+
+
+_int_vector = np.ctypeslib.ndpointer(dtype=np.intc, ndim=1, flags="C_CONTIGUOUS")
+
+
+clinsolve.linsysCreate.argtypes      = [ctypes.c_int, ctypes.c_int, ctypes.c_int, _double_array, _int_array, _int_array, ctypes.c_char_p, ctypes.c_double]
+clinsolve.linsysCreate.restype       = ctypes.c_void_p
+clinsolve.linsysFree.argtypes        = [ctypes.c_void_p]
+clinsolve.linsysFree.restype         = None
+clinsolve.linsysSetDiagonal.argtypes = [ctypes.c_void_p, _double_array]
+clinsolve.linsysSetDiagonal.restype  = ctypes.c_int
+clinsolve.linsysSolve.argtypes       = [ctypes.c_void_p, _double_array, _double_array, ctypes.c_char_p, ctypes.c_int, ctypes.c_double,
+                                        _int_ptr, _double_ptr, _double_array, _int_ptr]
+clinsolve.linsysSolve.restype        = ctypes.c_int
+clinsolve.linsysSolveMany.argtypes   = [ctypes.c_void_p, ctypes.c_int, _double_array, _double_array, ctypes.c_char_p, ctypes.c_int, 
+                                        ctypes.c_double, _int_vector, _double_array]
+clinsolve.linsysSolveMany.restype    = ctypes.c_int
+
+
+class LinearSystem:
+  """Sparse linear system with a persistent C++ handle
+
+  The system matrix is formed into the 'lalib' format once when the object is initialized and the same handle
+  is then reused for all solves. Setup needed by the solver (e.g. the transpose for the normal equation solvers)
+  is also done only once. This makes the object suitable for e.g. time stepping schemes where the same matrix
+  is solved against many right-hand sides. The same goes for the preconditioner, which is formed on the first solve.
+  """
+
+  def __init__(self, system_matrix: csr_matrix, solver: Literal['CG', 'CGNR', 'TCGNR', 'IRLS'] = 'CGNR',
+               preconditioner: Optional[Literal['Jacobi', 'ILU0', 'SSOR']] = None, max_iter: int = 1000, tol: float = 1e-7,
+               omega: float = 1.) -> None:
+    """Constructor method
+
+    Constructor method that passes the system matrix to the C++ side and stores the returned handle. See 'linsolve'
+    for details on the solver options.
+
+    @param system_matrix    The system matrix \f$A\f$ in CSR format
+    @param solver           The used solver method. Optional, defaults to 'CGNR'
+    @param preconditioner   The used preconditioner. Optional, defaults to None i.e. no preconditioning
+    @param max_iter         The maximum number of iterations. Optional, defaults to 1000
+    @param tol              The tolerance for the squared residual norm. Optional, defaults to 1e-7
+    @param omega            The relaxation parameter for SSOR in (0, 2). Optional, defaults to 1
+    @raises AssertionError  Raised if an invalid solver or preconditioner is specified
+    @raises RuntimeError    Raised if the system matrix cannot be formed on the C++ side
+    @return                 None
+    """
+    assert solver.upper() in ['CG', 'CGNR', 'TCGNR', 'IRLS'], f"Invalid solver specified! ('{solver}' not in ['CG', 'CGNR', 'TCGNR', 'IRLS'])"
+    assert max_iter > 0, f"The maximum number of iterations must be positive! ({max_iter} <= 0)"
+    assert tol > 0, f"The tolerance must be positive! ({tol} <= 0)"
+
+    # Set first so that the destructor works even if the initialization fails
+    self.__handle = None
+
+    if not isinstance(system_matrix, csr_matrix):
+      system_matrix = csr_matrix(system_matrix)
+
+    self.__shape         = system_matrix.shape
+    self.__solver        = bytes(solver, "utf-8")
+    self.__max_iter      = max_iter
+    self.__tol           = tol
+    self.__last_solution = None
+
+    values      = _as_buffer(system_matrix.data, np.float64)
+    col_indexes = _as_buffer(system_matrix.indices, np.int32)
+    row_ptrs    = _as_buffer(system_matrix.indptr, np.int32)
+
+    self.__handle = clinsolve.linsysCreate(self.__shape[0], self.__shape[1], len(values), values, row_ptrs, col_indexes,
+                                           _preconditioner_name(preconditioner), omega)
+
+    if not self.__handle:
+      raise RuntimeError("Could not form the system matrix on the C++ side!")
+
+
+  def __del__(self) -> None:
+    """Destructor method that releases the C++ handle"""
+    if self.__handle:
+      clinsolve.linsysFree(self.__handle)
+      self.__handle = None
+
+
+  @property
+  def shape(self) -> Tuple[int, int]:
+    """The shape of the system matrix"""
+    return self.__shape
+
+
+  @property
+  def last_solution(self) -> Optional[np.ndarray]:
+    """The solution from the latest call to 'solve'. None if the system has not been solved yet"""
+    return self.__last_solution
+
+
+  def set_diagonal(self, diagonal: np.ndarray) -> None:
+    """Method for replacing the diagonal of the system matrix e.g. with a penalty term that changes between solves
+
+    Only the diagonal is updated on the C++ side, so the cost is that of copying the matrix instead of forming it from
+    scratch. The preconditioner is formed again on the next solve.
+
+    @param diagonal         The new diagonal of length min(n_rows, n_cols)
+    @raises AssertionError  Raised if the dimensions don't match
+    @raises RuntimeError    Raised if the diagonal cannot be set on the C++ side
+    @return                 None
+    """
+    diagonal = _as_buffer(diagonal, np.float64)
+    assert len(diagonal) == min(self.__shape), f"The diagonal has invalid dimensions! ({len(diagonal)} != {min(self.__shape)})"
+
+    if clinsolve.linsysSetDiagonal(self.__handle, diagonal) != 0:
+      raise RuntimeError("Could not set the diagonal on the C++ side!")
+
+
+  @timed
+  def solve(self, rhs_vector: np.ndarray, x0: Optional[np.ndarray] = None, warm_start: bool = False,
+            return_info: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, Dict]]:
+    """Method for solving the system for a single right-hand side
+
+    @param rhs_vector       The right-hand side vector \f$b\f$
+    @param x0               The initial guess. Optional, defaults to None i.e. zeros or the previous solution is used
+    @param warm_start       Boolean flag specifying if the previous solution is used as the initial guess when 'x0' is
+                            not given. Optional, defaults to False
+    @param return_info      Boolean flag specifying if the convergence info is returned. Optional, defaults to False
+    @raises AssertionError  Raised if the dimensions don't match
+    @raises RuntimeError    Raised if the C++ solver fails
+    @return                 The solution vector \f$x\f$ and if 'return_info' is True also a dictionary with the number 
+                            of iterations ('iterations'), which is at most 'max_iter', the final residual ('residual'),
+                            whether the residual is below the tolerance ('converged') and the residual after each
+                            iteration ('residual_history')
+    """
+    rhs = _as_buffer(rhs_vector, np.float64)
+    assert len(rhs) == self.__shape[0], f"The dimensions of the system matrix and the right-hand side vector don't match! ({len(rhs)} != {self.__shape[0]})"
+
+    # The initial guess is copied as the solver overwrites it with the solution
+    if x0 is not None:
+      solution = np.array(x0, dtype=np.float64)
+    elif warm_start and self.__last_solution is not None:
+      solution = self.__last_solution.copy()
+    else:
+      solution = np.zeros(self.__shape[1], dtype=np.float64)
+
+    assert solution.shape == (self.__shape[1],), f"The initial guess has invalid dimensions! ({solution.shape} != {(self.__shape[1],)})"
+
+    n_iterations   = ctypes.c_int(0)
+    residual       = ctypes.c_double(0.)
+    history        = np.zeros(self.__max_iter + 1, dtype=np.float64)
+    history_length = ctypes.c_int(len(history))
+
+    ret = clinsolve.linsysSolve(self.__handle, rhs, solution, self.__solver, self.__max_iter, self.__tol, ctypes.byref(n_iterations),
+                                ctypes.byref(residual), history, ctypes.byref(history_length))
+
+    if ret != 0:
+      raise RuntimeError(f"The C++ solver failed! (Return code: {ret})")
+
+    self.__last_solution = solution
+
+    _observe_convergence("LinearSystem.solve", (n_iterations.value,), (residual.value,))
+
+    if return_info:
+      return solution, {"iterations": n_iterations.value, "residual": residual.value, "converged": residual.value < self.__tol,
+                        "residual_history": history[:history_length.value]}
+
+    return solution
+
+
+  @timed
+  def solve_many(self, rhs_matrix: np.ndarray, x0: Optional[np.ndarray] = None,
+                 return_info: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, Dict]]:
+    """Method for solving the system for multiple right-hand sides
+
+    The right-hand sides are solved in parallel on the C++ side with all solves sharing the same system matrix.
+
+    @param rhs_matrix       The right-hand side vectors as the columns of a matrix of shape (n_rows, n_rhs)
+    @param x0               The initial guesses as the columns of a matrix of shape (n_cols, n_rhs). Optional, defaults
+                            to None i.e. zeros are used
+    @param return_info      Boolean flag specifying if the convergence info is returned. Optional, defaults to False
+    @raises AssertionError  Raised if the dimensions don't match
+    @raises RuntimeError    Raised if the C++ solver fails for any of the right-hand sides
+    @return                 The solution vectors as the columns of a matrix of shape (n_cols, n_rhs) and if 'return_info'
+                            is True also a dictionary with the number of iterations ('iterations'), the final residuals
+                            ('residual') and whether the residuals are below the tolerance ('converged') as arrays of
+                            length n_rhs
+    """
+    rhs_matrix = np.asarray(rhs_matrix, dtype=np.float64)
+    assert rhs_matrix.ndim == 2 and rhs_matrix.shape[0] == self.__shape[0], f"The right-hand side matrix has invalid dimensions! ({rhs_matrix.shape[0]} != {self.__shape[0]})"
+
+    n_rhs = rhs_matrix.shape[1]
+
+    # Each right-hand side (and solution) is stored contiguously, which is the row-major layout of the transpose
+    rhs_vectors = _as_buffer(rhs_matrix.T.ravel(), np.float64)
+
+    if x0 is not None:
+      x0 = np.asarray(x0, dtype=np.float64)
+      assert x0.shape == (self.__shape[1], n_rhs), f"The initial guesses have invalid dimensions! ({x0.shape} != {(self.__shape[1], n_rhs)})"
+      solutions = np.array(x0.T, dtype=np.float64, order='C')
+    else:
+      solutions = np.zeros((n_rhs, self.__shape[1]), dtype=np.float64)
+
+    n_iterations = np.zeros(n_rhs, dtype=np.intc)
+    residuals    = np.zeros(n_rhs, dtype=np.float64)
+
+    n_failed = clinsolve.linsysSolveMany(self.__handle, n_rhs, rhs_vectors, solutions.reshape(-1), self.__solver, self.__max_iter,
+                                         self.__tol, n_iterations, residuals)
+
+    if n_failed != 0:
+      raise RuntimeError(f"The C++ solver failed for {n_failed} of the {n_rhs} right-hand sides!")
+
+    _observe_convergence("LinearSystem.solve_many", n_iterations, residuals)
+
+    if return_info:
+      return solutions.T, {"iterations": n_iterations, "residual": residuals, "converged": residuals < self.__tol}
+
+    return solutions.T
@@ -7,7 +7,8 @@ The C++ functions should be exported as dll or so objects and a Python wrapper c
 for them, which are then available from this module.
 """
 
-__all__ = ["linsolve"]
+__all__ = ["linsolve", "LinearSystem"]
 
 
-from .linsolve import linsolve
\ No newline at end of file
+from .linsolve import linsolve
+from .LinearSystem import LinearSystem
\ No newline at end of file
@@ -2,6 +2,7 @@
 #include <vector>
 #include <map>
 #include <cmath>
+#include <algorithm>
 
 #include "lalib/lalib.hpp"  // Also includes ulib
 
@@ -20,35 +21,176 @@
 using val_t = double;
 
 
+/*
+ * Writes the convergence info of a solved system into the given output pointers, any of which may be null. 
+ * On input 'historyLength' holds the capacity of 'residualHistory' and on output the number of residuals written.
+ */
+void writeInfo(lalib::LinearSolver<val_t>& solver, int* nIterations, double* residual, double* residualHistory, int* historyLength) {
+
+  if ( nIterations ) *nIterations = solver.getIterations();
+  if ( residual ) *residual = solver.getResidual();
+
+  if ( residualHistory && historyLength ) {
+    const std::vector<val_t>& history = solver.getResidualHistory();
+    int len = std::min(*historyLength, (int)history.size());
+
+    std::copy(history.begin(), history.begin() + len, residualHistory);
+    *historyLength = len;
+  }
+}
+
+
 extern "C" {
 
-  void linsolve(int rows, int cols, int nValues, double* values, int* rowPointers, int* columnIndexes, double* rhsVector, double* x0Vector, char* solverMethod) {
+  /*
+   * Solves the system given in CRS format. The arrays are read in place and the solution is written into 'x0Vector',
+   * which also holds the initial guess. The preconditioner is one of 'none', 'jacobi', 'ilu0' and 'ssor' with 'omega'
+   * being the relaxation parameter of SSOR. The convergence info is written into the output pointers (see 'writeInfo').
+   * Returns 0 on success and 1 if the solver raised an error, as exceptions cannot be allowed to propagate over the 
+   * C interface.
+   */
+  int linsolve(int rows, int cols, int nValues, const double* values, const int* rowPointers, const int* columnIndexes, 
+               const double* rhsVector, double* x0Vector, const char* solverMethod, const char* preconditioner, double omega,
+               int maxIter, double tolerance, int* nIterations, double* residual, double* residualHistory, int* historyLength) {
 
     ulib::verbosity(2);
     //ulib::verbosity(5);
     //ulib::logfile("log.txt");
 
-    std::vector<double> valueVec(values, values + nValues);
-    std::vector<int> rowPointerVec(rowPointers, rowPointers + (rows + 1));
-    std::vector<int> colIndexVec(columnIndexes, columnIndexes + nValues);
-    std::vector<double> rhsVec(rhsVector, rhsVector + rows);
-    std::vector<double> x0Vec(x0Vector, x0Vector + cols);
+    try {
+      lalib::LinearSolver<val_t> solver = lalib::LinearSolver<val_t>(rows, cols, nValues, values, columnIndexes, rowPointers, rhsVector);
+      lalib::Vector<val_t> x0 = lalib::Vector<val_t>(cols, x0Vector);
+
+      solver.setPreconditioner(preconditioner, omega);
+      solver.solve(solverMethod, x0, maxIter, tolerance, PRINT_FREQUENCY, 1.0);
+
+      solver.getSolution().copyElems(x0Vector);
+      writeInfo(solver, nIterations, residual, residualHistory, historyLength);
+    }
+    catch (const std::exception&) {
+      return 1;
+    }
+
+    return 0;
+  }
 
-    lalib::Matrix<val_t> A  = lalib::Matrix<val_t>(rows, cols, valueVec, colIndexVec, rowPointerVec);
-    lalib::Vector<val_t> b  = lalib::Vector<val_t>(rows, rhsVec);
-    lalib::Vector<val_t> x0 = lalib::Vector<val_t>(cols, x0Vec);
 
-    lalib::LinearSolver<val_t> solver = lalib::LinearSolver<val_t>(A, b);
 
-    solver.solve(solverMethod, x0, 1000, 1e-7, PRINT_FREQUENCY, 1.0);
+  /*
+   * Creates a persistent handle to a linear system with the given CRS system matrix and preconditioner. The matrix
+   * and the preconditioner are built once and reused by all subsequent solves through the handle. Returns a null 
+   * pointer if the matrix cannot be formed. The handle must be released with 'linsysFree'.
+   */
+  void* linsysCreate(int rows, int cols, int nValues, const double* values, const int* rowPointers, const int* columnIndexes,
+                     const char* preconditioner, double omega) {
+
+    ulib::verbosity(2);
+
+    try {
+      lalib::LinearSolver<val_t>* solver = new lalib::LinearSolver<val_t>(rows, cols, nValues, values, columnIndexes, rowPointers);
+      solver->setPreconditioner(preconditioner, omega);
+
+      return solver;
+    }
+    catch (const std::exception&) {
+      return nullptr;
+    }
+  }
+
+
+  // Releases a handle created with 'linsysCreate'
+  void linsysFree(void* handle) {
+    delete static_cast<lalib::LinearSolver<val_t>*>(handle);
+  }
+
+
+  /*
+   * Replaces the diagonal of the system matrix behind the handle with the 'min(rows, cols)' values in 'diagonal'. The
+   * preconditioner is formed again on the next solve. Returns 0 on success and 1 if the solver raised an error.
+   */
+  int linsysSetDiagonal(void* handle, const double* diagonal) {
+
+    lalib::LinearSolver<val_t>* solver = static_cast<lalib::LinearSolver<val_t>*>(handle);
+
+    try {
+      solver->setDiagonal(lalib::Vector<val_t>(std::min(solver->numRows(), solver->numCols()), diagonal));
+    }
+    catch (const std::exception&) {
+      return 1;
+    }
+
+    return 0;
+  }
+
+
+  /*
+   * Solves the system behind the handle for a single right-hand side. 'x0Vector' holds the initial guess and is
+   * overwritten with the solution. The convergence info is written into the output pointers (see 'writeInfo').
+   * Returns 0 on success and 1 if the solver raised an error.
+   */
+  int linsysSolve(void* handle, const double* rhsVector, double* x0Vector, const char* solverMethod, int maxIter, double tolerance,
+                  int* nIterations, double* residual, double* residualHistory, int* historyLength) {
+
+    lalib::LinearSolver<val_t>* solver = static_cast<lalib::LinearSolver<val_t>*>(handle);
+
+    try {
+      int rows = solver->numRows(), cols = solver->numCols();
+
+      solver->setRHS(lalib::Vector<val_t>(rows, rhsVector));
+      solver->solve(solverMethod, lalib::Vector<val_t>(cols, x0Vector), maxIter, tolerance, PRINT_FREQUENCY, 1.0);
+
+      solver->getSolution().copyElems(x0Vector);
+      writeInfo(*solver, nIterations, residual, residualHistory, historyLength);
+    }
+    catch (const std::exception&) {
+      return 1;
+    }
+
+    return 0;
+  }
+
+
+  /*
+   * Solves the system behind the handle for 'nRhs' right-hand sides in parallel. The right-hand sides and the 
+   * initial guesses are stored contiguously one after the other (i.e. the transpose of the column matrix) and the
+   * solutions are written over the initial guesses. The iteration counts and final residuals for each right-hand side
+   * are written into 'nIterations' and 'residuals' if they are not null. Returns the number of right-hand sides for 
+   * which the solver failed.
+   */
+  int linsysSolveMany(void* handle, int nRhs, const double* rhsVectors, double* x0Vectors, const char* solverMethod, 
+                      int maxIter, double tolerance, int* nIterations, double* residuals) {
+
+    lalib::LinearSolver<val_t>* solver = static_cast<lalib::LinearSolver<val_t>*>(handle);
+    int rows = solver->numRows(), cols = solver->numCols();
+
+    // Do the shared setup before the copies are made so that it is paid only once
+    try {
+      solver->prepare(solverMethod);
+    }
+    catch (const std::exception&) {
+      return nRhs;
+    }
+
+    int nFailed = 0;
+
+    #pragma omp parallel for schedule(dynamic, 1) reduction(+:nFailed)
+    for (int i = 0; i < nRhs; i++) {
+      try {
+        // The copy shares the system matrix with the handle, only the vectors are thread local
+        lalib::LinearSolver<val_t> localSolver = lalib::LinearSolver<val_t>(*solver);
 
-    lalib::Vector<val_t> x = solver.getSolution();
-    
+        localSolver.setRHS(lalib::Vector<val_t>(rows, rhsVectors + (long)i * rows));
+        localSolver.solve(solverMethod, lalib::Vector<val_t>(cols, x0Vectors + (long)i * cols), maxIter, tolerance, PRINT_FREQUENCY, 1.0);
 
-    for (int i = 0; i < cols; i++) {
-      x0Vector[i] = x(i);
+        localSolver.getSolution().copyElems(x0Vectors + (long)i * cols);
+        writeInfo(localSolver, nIterations ? nIterations + i : nullptr, residuals ? residuals + i : nullptr, nullptr, nullptr);
+      }
+      catch (const std::exception&) {
+        nFailed++;
+      }
     }
 
+    return nFailed;
   }
 
-}
\ No newline at end of file
+}
@@ -39,6 +39,10 @@
 #include "src/Vector.hpp" 
 
 
+// Include the preconditioners
+#include "src/Preconditioner.hpp"
+
+
 // Include the linear solvers
 #include "src/LinearSolver.hpp"
 
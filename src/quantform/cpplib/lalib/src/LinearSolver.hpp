@@ -5,10 +5,12 @@
 #include <chrono>
 #include <math.h>
 #include <functional>
+#include <memory>
 
 #include "../lalib.hpp"
 #include "Vector.hpp"
 #include "Matrix.hpp"
+#include "Preconditioner.hpp"
 
 
 namespace lalib {
@@ -16,7 +18,7 @@ namespace lalib {
 
   // The norm that is minimized in least squares
   template <class val_t>
-  val_t minimizedNorm(Matrix<val_t> A, Vector<val_t> x, Vector<val_t> b, val_t p = (val_t)2.) {
+  val_t minimizedNorm(const Matrix<val_t>& A, const Vector<val_t>& x, const Vector<val_t>& b, val_t p = (val_t)2.) {
     return (A.matmul(x) - b).pNorm();
   }
 
@@ -26,6 +28,12 @@ namespace lalib {
    * Each algorithm will be implemented as their own method.
    * The solution vector and other useful info like number of iterations taken
    * and the final residual are also stored in the object.
+   *
+   * The system matrix and its transpose are shared between copies of the object, so
+   * a prepared solver can be copied cheaply and reused with different right-hand sides.
+   *
+   * CG and CGNR can optionally be preconditioned (see 'setPreconditioner'). CG is then the
+   * standard preconditioned CG and CGNR is preconditioned from the right.
    */
   template <class val_t>
   class LinearSolver {
@@ -43,6 +51,9 @@ namespace lalib {
       // The final residual
       val_t residual = -1.;
 
+      // The residual after each iteration (starting from the initial residual)
+      std::vector<val_t> residualHistory;
+
       // The number of milliseconds taken
       int milliseconds = -1;
 
@@ -53,11 +64,22 @@ namespace lalib {
       // These are filled by constructor method
 
       // The system matrix
-      Matrix<val_t> systemMatrix;
+      std::shared_ptr<const Matrix<val_t>> systemMatrix;
+
+      // The transpose of the system matrix. Formed lazily when first needed by a solver
+      std::shared_ptr<const Matrix<val_t>> systemMatrixT;
 
       // The right-hand side vector
       Vector<val_t> rhsVector;
 
+      // The preconditioner. Formed lazily when first needed by a solver and shared between copies
+      std::shared_ptr<const Preconditioner<val_t>> preconditioner;
+
+      // The preconditioner method, its relaxation parameter and whether it was formed for the normal equations
+      std::string preconditionerMethod = "none";
+      val_t preconditionerOmega = 1.;
+      bool preconditionerNormal = false;
+
 
       // These are passed as parameters to solver methods
 
@@ -87,20 +109,158 @@ namespace lalib {
         this->solution = that.solution;
         this->nIterations = that.nIterations;
         this->residual = that.residual;
+        this->milliseconds = that.milliseconds;
         this->param = that.param;
         this->systemMatrix = that.systemMatrix;
+        this->systemMatrixT = that.systemMatrixT;
         this->rhsVector = that.rhsVector;
+        this->residualHistory = that.residualHistory;
+        this->preconditioner = that.preconditioner;
+        this->preconditionerMethod = that.preconditionerMethod;
+        this->preconditionerOmega = that.preconditionerOmega;
+        this->preconditionerNormal = that.preconditionerNormal;
       }
 
 
       // Main constructor
-      LinearSolver(Matrix<val_t> system, Vector<val_t> rhs) {
+      LinearSolver(const Matrix<val_t>& system, const Vector<val_t>& rhs) {
+
+        this->systemMatrix = std::make_shared<const Matrix<val_t>>(system);
+        this->rhsVector = rhs;
+      }
+
+
+      /*
+       * CRS raw array constructor. Builds the system matrix and the right-hand side vector in place from the given buffers.
+       * If no right-hand side is given it is initialized to zeros and should be set with 'setRHS' before solving
+       */
+      LinearSolver(int rows, int cols, int nValues, const val_t* values, const int* colIndexes, const int* rowPointers, const val_t* rhs = nullptr) :
+        systemMatrix(std::make_shared<const Matrix<val_t>>(rows, cols, nValues, values, colIndexes, rowPointers)),
+        rhsVector(rhs == nullptr ? Vector<val_t>(rows) : Vector<val_t>(rows, rhs)) { }
+
+
+      // ====================== SETUP ======================
+
+
+      // Setter for the right-hand side vector. Allows reusing the same system matrix for multiple solves
+      void setRHS(const Vector<val_t>& rhs) {
+
+        if ( rhs.len() != this->systemMatrix->numRows() ) {
+          ERROR("Improper dimensions!");
+        }
 
-        this->systemMatrix = system;
         this->rhsVector = rhs;
       }
 
 
+      // Forms the transpose of the system matrix if it hasn't been formed yet and returns it
+      const Matrix<val_t>& _transpose() {
+
+        if ( !this->systemMatrixT ) {
+          DEBUG("Calling transpose...");
+          auto start = std::chrono::high_resolution_clock::now();
+          // TODO: Fix the fast transpose
+          //this->systemMatrixT = std::make_shared<const Matrix<val_t>>(this->systemMatrix->T());
+          this->systemMatrixT = std::make_shared<const Matrix<val_t>>(this->systemMatrix->naiveTranspose());
+          auto end = std::chrono::high_resolution_clock::now();
+          DEBUG("Success!")
+
+          LOWPRIORITY(ulib::formString("Time taken on transpose: ", (int)std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count(), " ms"));
+        }
+
+        return *this->systemMatrixT;
+      }
+
+
+      /*
+       * Setter for the diagonal of the system matrix, e.g. for a penalty term that changes between solves. The matrix
+       * shared with the copies of the object is not modified. The transpose is updated instead of being formed again and
+       * the preconditioner is formed again when next needed
+       */
+      void setDiagonal(const Vector<val_t>& diagonal) {
+
+        int n = std::min(this->systemMatrix->numRows(), this->systemMatrix->numCols());
+        if ( diagonal.len() != n ) {
+          ERROR("Improper dimensions!");
+        }
+
+        std::shared_ptr<Matrix<val_t>> matrix = std::make_shared<Matrix<val_t>>(*this->systemMatrix);
+        for (int i = 0; i < n; i++) {
+          matrix->place(i + INDEX_OFFSET, i + INDEX_OFFSET, diagonal(i + INDEX_OFFSET));
+        }
+        this->systemMatrix = matrix;
+
+        if ( this->systemMatrixT ) {
+          std::shared_ptr<Matrix<val_t>> matrixT = std::make_shared<Matrix<val_t>>(*this->systemMatrixT);
+          for (int i = 0; i < n; i++) {
+            matrixT->place(i + INDEX_OFFSET, i + INDEX_OFFSET, diagonal(i + INDEX_OFFSET));
+          }
+          this->systemMatrixT = matrixT;
+        }
+
+        this->preconditioner.reset();
+      }
+
+
+      /*
+       * Setter for the preconditioner. The method is one of 'none', 'jacobi', 'ilu0' and 'ssor' and 'omega' is the
+       * relaxation parameter for SSOR. The preconditioner itself is formed when first needed
+       */
+      void setPreconditioner(std::string method, val_t omega = 1.) {
+
+        this->preconditionerMethod = ulib::toLower(method);
+        this->preconditionerOmega = omega;
+        this->preconditioner.reset();
+      }
+
+
+      /*
+       * Forms the preconditioner if it hasn't been formed yet (for the same kind of system) and returns a pointer to it.
+       * Returns a null pointer if no preconditioner is used
+       */
+      const Preconditioner<val_t>* _preconditioner(bool normalEquations) {
+
+        if ( this->preconditionerMethod == "none" ) {
+          return nullptr;
+        }
+
+        if ( !this->preconditioner || this->preconditionerNormal != normalEquations ) {
+          DEBUG("Forming the preconditioner...");
+          auto start = std::chrono::high_resolution_clock::now();
+          this->preconditioner = std::make_shared<const Preconditioner<val_t>>(*this->systemMatrix, this->preconditionerMethod, 
+                                                                               this->preconditionerOmega, normalEquations);
+          this->preconditionerNormal = normalEquations;
+          auto end = std::chrono::high_resolution_clock::now();
+          DEBUG("Success!")
+
+          LOWPRIORITY(ulib::formString("Time taken on the preconditioner: ", (int)std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count(), " ms"));
+        }
+
+        return this->preconditioner.get();
+      }
+
+
+      /*
+       * Does the setup work needed by the given solver (e.g. forming the transpose for the normal equation solvers and the 
+       * preconditioner) up front. Should be called before copying the object for multiple solves so that the copies share the setup.
+       */
+      void prepare(std::string solver) {
+
+        std::string lowerSolver = ulib::toLower(solver);
+
+        if ( lowerSolver == "cgnr" || lowerSolver == "irls" ) {
+          this->_transpose();
+        }
+
+        if ( lowerSolver == "cg" ) {
+          this->_preconditioner(false);
+        }
+        else if ( lowerSolver == "cgnr" ) {
+          this->_preconditioner(true);
+        }
+      }
+
+
       // ====================== SOLVERS ======================
 
 
@@ -112,6 +272,12 @@ namespace lalib {
         this->_maxIter = maxIter;
         this->_tolerance = tolerance;
         this->_printFrequency = printFrequency;
+        this->residualHistory.clear();
+
+        if ( this->preconditionerMethod != "none" && 
+             (ulib::toLower(solver) == "tcgnr" || ulib::toLower(solver) == "irls") ) {
+          WARNING(ulib::formString("Preconditioning is not supported by ", solver, "! Preconditioner '", this->preconditionerMethod, "' is ignored"));
+        }
 
         auto start = std::chrono::high_resolution_clock::now();
 
@@ -138,57 +304,73 @@ namespace lalib {
       }
 
 
-      // Sparse conjugate gradient method. To be called by 'solve' method
+      // Sparse (preconditioned) conjugate gradient method. To be called by 'solve' method
       void _cgSolve(Vector<val_t> x0) {
 
-        if ( this->systemMatrix.numRows() != x0.len() ||
-             this->systemMatrix.numRows() != this->rhsVector.len() ) {
+        if ( this->systemMatrix->numRows() != x0.len() ||
+             this->systemMatrix->numRows() != this->rhsVector.len() ) {
           ERROR("Improper dimensions!");
         }
 
-        if ( this->systemMatrix.numRows() != this->systemMatrix.numCols() ) {
+        if ( this->systemMatrix->numRows() != this->systemMatrix->numCols() ) {
           ERROR("Coefficient matrix must be square!");
         }
 
+        const Preconditioner<val_t>* M = this->_preconditioner(false);
+
         Vector<val_t> xk = Vector<val_t>(x0);
-        Vector<val_t> r = this->rhsVector - this->systemMatrix.matmul(xk);
-        Vector<val_t> p = Vector<val_t>(r);
+        Vector<val_t> r = this->rhsVector - this->systemMatrix->matmul(xk);
+        Vector<val_t> z = M ? M->apply(r) : r;
+        Vector<val_t> p = Vector<val_t>(z);
 
         val_t oldResidual = r.dot(r);
+        val_t rz = r.dot(z);
+
+        this->residualHistory.push_back(oldResidual);
 
         int iter = 0;
-        for (; iter <= this->_maxIter; iter++) {
+        for (; iter < this->_maxIter; iter++) {
 
-          Vector<val_t> Ap = this->systemMatrix.matmul(p);
+          Vector<val_t> Ap = this->systemMatrix->matmul(p);
 
-          val_t alpha = oldResidual / (p.dot(Ap));
+          val_t alpha = rz / (p.dot(Ap));
 
           xk += alpha * p;
           r -= alpha * Ap;
 
           val_t newResidual = r.dot(r);
+          this->residualHistory.push_back(newResidual);
 
           if ( newResidual < this->_tolerance ) {
             LOWPRIORITY(ulib::formString("Iteration: ", iter, " - Residual: ", newResidual, " - Norm: ", 
-              minimizedNorm(this->systemMatrix, xk, this->rhsVector)));
+              minimizedNorm(*this->systemMatrix, xk, this->rhsVector)));
 
             this->solution = xk;
-            this->nIterations = iter;
+            this->nIterations = iter + 1;
             this->residual = newResidual;
             return;
           }
 
-          val_t beta = newResidual / oldResidual;
+          if ( M ) {
+            z = M->apply(r);
+          }
+          else {
+            z = r;
+          }
+
+          val_t newRz = r.dot(z);
+          val_t beta = newRz / rz;
 
           p *= beta;
-          p += r;
+          p += z;
 
           oldResidual = newResidual;
+          rz = newRz;
 
           if ( iter % this->_printFrequency == 0 ) {
             if ( ulib::verbosity() >= 4 ) {
               LOWPRIORITY(ulib::formString("Iteration: ", iter, " - Residual: ", newResidual, " - Norm: ", 
-                minimizedNorm(this->systemMatrix, xk, this->rhsVector)));
+                minimizedNorm(*this->systemMatrix, xk, this->rhsVector)));
             }
           }
 
@@ -202,33 +384,53 @@ namespace lalib {
       }
 
 
-      // CGNR solver subprocess to be called by multiple linear solver methods
-      void _cgnrSubprocess(Matrix<val_t> A, Matrix<val_t>A_T, Vector<val_t> b, Vector<val_t> x0) {
+      /*
+       * CGNR solver subprocess to be called by multiple linear solver methods. If a preconditioner M is given the system
+       * A M^-1 y = b is solved for y and the iterate is kept as x = M^-1 y. The residual is then that of the preconditioned
+       * normal equations M^-T A^T (b - A x)
+       */
+      void _cgnrSubprocess(const Matrix<val_t>& A, const Matrix<val_t>& A_T, const Vector<val_t>& b, const Vector<val_t>& x0, 
+                           const Preconditioner<val_t>* M = nullptr) {
 
         Vector<val_t> xk = Vector<val_t>(x0);
         Vector<val_t> r = A_T.matmul(b) - A_T.matmul(A.matmul(xk));
+
+        if ( M ) {
+          r = M->applyTranspose(r);
+        }
+
         Vector<val_t> p = Vector<val_t>(r);
 
         val_t oldResidual = r.dot(r);
 
+        this->residualHistory.push_back(oldResidual);
+
         int iter = 0;
-        for (; iter <= this->_maxIter; iter++) {
+        for (; iter < this->_maxIter; iter++) {
 
-          Vector<val_t> Ap = A.matmul(p);
+          Vector<val_t> Mp = M ? M->apply(p) : p;
+          Vector<val_t> Ap = A.matmul(Mp);
 
           val_t alpha = oldResidual / (Ap.dot(Ap));
 
-          xk += alpha * p;
-          r -= alpha * A_T.matmul(Ap);
+          xk += alpha * Mp;
+
+          if ( M ) {
+            r -= alpha * M->applyTranspose(A_T.matmul(Ap));
+          }
+          else {
+            r -= alpha * A_T.matmul(Ap);
+          }
 
           val_t newResidual = r.dot(r);
+          this->residualHistory.push_back(newResidual);
 
           if ( newResidual < this->_tolerance ) {
             LOWPRIORITY(ulib::formString("Iteration: ", iter, " - Residual: ", newResidual, " - Norm: ", 
               minimizedNorm(A, xk, b)));
 
             this->solution = xk;
-            this->nIterations = iter;
+            this->nIterations = iter + 1;
             this->residual = newResidual;
             return;
           }
@@ -259,7 +461,7 @@ namespace lalib {
 
 
       // Weighted CGNR solver subprocess to be called by multiple linear solver methods
-      void _wcgnrSubprocess(Vector<val_t> w, Matrix<val_t> A, Matrix<val_t>A_T, Vector<val_t> b, Vector<val_t> x0) {
+      void _wcgnrSubprocess(const Vector<val_t>& w, const Matrix<val_t>& A, const Matrix<val_t>& A_T, const Vector<val_t>& b, const Vector<val_t>& x0) {
 
         // Form the weighting matrices
         Matrix<val_t> W = Matrix<val_t>(w);
@@ -277,7 +479,7 @@ namespace lalib {
         val_t oldResidual = r.dot(r);
 
         int iter = 0;
-        for (; iter <= this->_maxIter; iter++) {
+        for (; iter < this->_maxIter; iter++) {
 
           Vector<val_t> Ap = A.matmul(W.matmul(p));
 
@@ -293,7 +495,7 @@ namespace lalib {
               minimizedNorm(A, xk, b)));
 
             this->solution = xk;
-            this->nIterations = iter;
+            this->nIterations = iter + 1;
             this->residual = newResidual;
             return;
           }
@@ -326,22 +528,12 @@ namespace lalib {
       // Sparse conjugate gradient on normal equations method. To be called by 'solve' method
       void _cgnrSolve(Vector<val_t> x0) {
 
-        if ( this->systemMatrix.numCols() != x0.len() ||
-             this->systemMatrix.numRows() != this->rhsVector.len() ) {
+        if ( this->systemMatrix->numCols() != x0.len() ||
+             this->systemMatrix->numRows() != this->rhsVector.len() ) {
           ERROR("Improper dimensions!");
         }
 
-        DEBUG("Calling transpose...");
-        auto start = std::chrono::high_resolution_clock::now();
-        // TODO: Fix the fast transpose
-        //Matrix<val_t> systemMatrixT = this->systemMatrix.T();
-        Matrix<val_t> systemMatrixT = this->systemMatrix.naiveTranspose();
-        auto end = std::chrono::high_resolution_clock::now();
-        DEBUG("Success!")
-
-        LOWPRIORITY(ulib::formString("Time taken on transpose: ", (int)std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count(), " ms"));
-
-        this->_cgnrSubprocess(this->systemMatrix, systemMatrixT, this->rhsVector, x0);
+        this->_cgnrSubprocess(*this->systemMatrix, this->_transpose(), this->rhsVector, x0, this->_preconditioner(true));
 
       }
 
@@ -349,17 +541,17 @@ namespace lalib {
       // Sparse Tikhonov regularized CGNR. To be called by 'solve' method
       void _tcgnrSolve(Vector<val_t> x0) {
         
-        if ( this->systemMatrix.numCols() != x0.len() ||
-             this->systemMatrix.numRows() != this->rhsVector.len() ) {
+        if ( this->systemMatrix->numCols() != x0.len() ||
+             this->systemMatrix->numRows() != this->rhsVector.len() ) {
           ERROR("Improper dimensions!");
         }
 
-        Matrix<val_t> newSysMatrix = this->systemMatrix.addRows(Matrix<val_t>(this->systemMatrix.numCols(), this->systemMatrix.numCols(), sqrt(this->param)));
-        Vector<val_t> newRHSVector = this->rhsVector.addRows(Vector<val_t>(this->systemMatrix.numCols()));
+        Matrix<val_t> newSysMatrix = this->systemMatrix->addRows(Matrix<val_t>(this->systemMatrix->numCols(), this->systemMatrix->numCols(), sqrt(this->param)));
+        Vector<val_t> newRHSVector = this->rhsVector.addRows(Vector<val_t>(this->systemMatrix->numCols()));
 
         DEBUG("Calling transpose...");
         auto start = std::chrono::high_resolution_clock::now();
-        //Matrix<val_t> systemMatrixT = this->systemMatrix.T();
+        //Matrix<val_t> systemMatrixT = this->systemMatrix->T();
         Matrix<val_t> newSysMatrixT = newSysMatrix.naiveTranspose();
         auto end = std::chrono::high_resolution_clock::now();
         DEBUG("Success!")
@@ -374,29 +566,26 @@ namespace lalib {
       // Sparse iteratively reweighted least squares. To be called by 'solve' method
       void _irlsSolve(Vector<val_t> x0) {
 
-        if ( this->systemMatrix.numCols() != x0.len() ||
-             this->systemMatrix.numRows() != this->rhsVector.len() ) {
+        if ( this->systemMatrix->numCols() != x0.len() ||
+             this->systemMatrix->numRows() != this->rhsVector.len() ) {
           ERROR("Improper dimensions!");
         }
 
-        DEBUG("Calling transpose...");
-        auto start = std::chrono::high_resolution_clock::now();
-        //Matrix<val_t> systemMatrixT = this->systemMatrix.T();
-        Matrix<val_t> systemMatrixT = this->systemMatrix.naiveTranspose();
-        auto end = std::chrono::high_resolution_clock::now();
-        DEBUG("Success!")
+        const Matrix<val_t>& systemMatrixT = this->_transpose();
 
-        LOWPRIORITY(ulib::formString("Time taken on transpose: ", (int)std::chrono::duration_cast<std::chrono::milliseconds>(end - start).count(), " ms"));
         int irlsIter = 0;
         val_t irlsNorm = 1000.;
 
         // Initial assumption is that W = I so just use the standard CGNR
-        this->_cgnrSubprocess(this->systemMatrix, systemMatrixT, this->rhsVector, x0);
+        this->_cgnrSubprocess(*this->systemMatrix, systemMatrixT, this->rhsVector, x0);
         Vector xk = this->solution;
 
-        irlsNorm = minimizedNorm(this->systemMatrix, xk, this->rhsVector, this->param);
+        irlsNorm = minimizedNorm(*this->systemMatrix, xk, this->rhsVector, this->param);
         irlsIter++; 
 
+        // The history of IRLS consists of the norms after each reweighting
+        this->residualHistory.assign(1, irlsNorm);
+
 
         val_t param = this->param;
         val_t tol   = this->_tolerance;
@@ -407,12 +596,14 @@ namespace lalib {
         while ( irlsNorm > this->_tolerance && irlsIter < this->_maxIter ) {
 
           Vector<val_t> w = xk.apply(weight);
-          this->_wcgnrSubprocess(w, this->systemMatrix, systemMatrixT, this->rhsVector, xk);
+          this->_wcgnrSubprocess(w, *this->systemMatrix, systemMatrixT, this->rhsVector, xk);
           Vector xk = this->solution;
 
-          irlsNorm = minimizedNorm(this->systemMatrix, xk, this->rhsVector, this->param);
+          irlsNorm = minimizedNorm(*this->systemMatrix, xk, this->rhsVector, this->param);
           irlsIter++; 
 
+          this->residualHistory.push_back(irlsNorm);
+
         }
 
         if ( irlsIter == this->_maxIter ) {
@@ -436,6 +627,14 @@ namespace lalib {
       }
 
 
+      // Number of rows in the system matrix
+      const int numRows() const { return this->systemMatrix->numRows(); }
+
+
+      // Number of columns in the system matrix
+      const int numCols() const { return this->systemMatrix->numCols(); }
+
+
       int getSolveTime() {
         if ( this->milliseconds >= 0 ) {
           return this->milliseconds;
@@ -445,6 +644,34 @@ namespace lalib {
         return this->milliseconds;  // Should not get here
       }
 
+
+      int getIterations() {
+        if ( this->nIterations >= 0 ) {
+          return this->nIterations;
+        }
+
+        ERROR("System has not been solved yet!");
+        return this->nIterations;  // Should not get here
+      }
+
+
+      val_t getResidual() {
+        if ( this->residual >= 0 ) {
+          return this->residual;
+        }
+
+        ERROR("System has not been solved yet!");
+        return this->residual;  // Should not get here
+      }
+
+
+      // The residual after each iteration. Empty if the system has not been solved yet
+      const std::vector<val_t>& getResidualHistory() const { return this->residualHistory; }
+
+
+      // The name of the used preconditioner method
+      const std::string getPreconditioner() const { return this->preconditionerMethod; }
+
   };
 
 }
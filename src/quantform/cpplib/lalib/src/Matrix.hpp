@@ -245,14 +245,26 @@ namespace lalib {
 
 
       // CRS array constructor that takes in an array of values. Assumes that indexing starts from 0
-      Matrix(int rows, int cols, const std::vector<val_t>& newValues, const std::vector<int>& newColIndexes, const std::vector<int>& newRowPointers) {
+      Matrix(int rows, int cols, const std::vector<val_t>& newValues, const std::vector<int>& newColIndexes, const std::vector<int>& newRowPointers) :
+        Matrix(rows, cols, (int)newValues.size(), newValues.data(), newColIndexes.data(), newRowPointers.data()) { }
+
+
+      /*
+       * CRS raw array constructor. Reads the values directly from the given buffers so that e.g. arrays owned by
+       * Python can be used without first copying them into std::vectors. Assumes that indexing starts from 0
+       */
+      Matrix(int rows, int cols, int nValues, const val_t* newValues, const int* newColIndexes, const int* newRowPointers) {
+
+        if ( cols < 1 || rows < 1 ) {
+          ERROR("Matrix dimensions must be positive!");
+        }
 
         int newVectsPerRow = ulib::ceil(cols, vectSize);
         
-        if ( (*std::max_element(newColIndexes.begin(), newColIndexes.end()) >= cols) ||                        // Check that no column index is out of bounds
-             (*std::max_element(newRowPointers.begin(), newRowPointers.end()) > (int)newColIndexes.size()) ||  // Check that the rows pointers are in bounds
-             (*std::min_element(newColIndexes.begin(), newColIndexes.end()) < 0 + INDEX_OFFSET) ||             // Check that column indexes are not less than wanted minimum value
-             (*std::min_element(newRowPointers.begin(), newRowPointers.end()) < 0 + INDEX_OFFSET)) {           // Check that row pointers are not less than wanted minimum value
+        if ( (nValues > 0 && *std::max_element(newColIndexes, newColIndexes + nValues) >= cols) ||           // Check that no column index is out of bounds
+             (*std::max_element(newRowPointers, newRowPointers + rows + 1) > nValues) ||                     // Check that the rows pointers are in bounds
+             (nValues > 0 && *std::min_element(newColIndexes, newColIndexes + nValues) < 0 + INDEX_OFFSET) ||  // Check that column indexes are not less than wanted minimum value
+             (*std::min_element(newRowPointers, newRowPointers + rows + 1) < 0 + INDEX_OFFSET)) {              // Check that row pointers are not less than wanted minimum value
           ERROR("Matrix dimensions out of bounds!");
         }
         
@@ -260,7 +272,11 @@ namespace lalib {
         this->nRows = rows;
 
         this->vectsPerRow = newVectsPerRow;
-        this->rowPointers = std::vector<int>(this->nRows + 1, 0);;
+        this->rowPointers = std::vector<int>(this->nRows + 1, 0);
+
+        // Upper bound for the number of SIMD vectors needed, avoids reallocations while filling
+        this->values.reserve(nValues);
+        this->colVectIndexes.reserve(nValues);
 
         int nVects = 0;
         int lastVectIndex = -1;
@@ -990,7 +1006,7 @@ namespace lalib {
 
 
       // Add rows from another matrix to this one
-      const Matrix addRows(const Matrix<val_t>& that) {
+      const Matrix addRows(const Matrix<val_t>& that) const {
 
         if ( this->nCols != that.nCols ) {
           ERROR("Matrices must have the same number of columns!");
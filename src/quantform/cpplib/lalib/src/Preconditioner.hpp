@@ -0,0 +1,377 @@
+#ifndef PRECONDITIONER_HPP
+#define PRECONDITIONER_HPP
+
+#include <string>
+#include <vector>
+#include <cmath>
+
+#include "../lalib.hpp"
+#include "Vector.hpp"
+#include "Matrix.hpp"
+
+
+namespace lalib {
+
+
+  /*
+   * Preconditioner for the iterative linear solvers. Supports the Jacobi ('jacobi'), incomplete LU with zero
+   * fill-in ('ilu0') and symmetric successive over-relaxation ('ssor') preconditioners.
+   *
+   * The triangular solves needed by ILU(0) and SSOR are inherently sequential, so the preconditioner keeps its
+   * own scalar (non-SIMD) CRS copy of the relevant matrix. For ILU(0) this holds the L and U factors in the
+   * sparsity pattern of the system matrix (L with an implicit unit diagonal) and for SSOR the system matrix itself.
+   *
+   * When used with the normal equation solvers the preconditioner is applied from the right, i.e. the solved
+   * system is A M^-1 y = b with x = M^-1 y. In this case the Jacobi preconditioner scales the columns with their
+   * norms (i.e. uses the diagonal of A^T A) so that it is also applicable to non-square systems.
+   */
+  template <class val_t>
+  class Preconditioner {
+
+    protected:
+
+      // The name of the preconditioner method
+      std::string method = "none";
+
+      // The relaxation parameter for SSOR
+      val_t omega = 1.;
+
+      // The dimension of the (square) preconditioner
+      int n = 0;
+
+      // The inverse of the diagonal used by the Jacobi preconditioner
+      std::vector<val_t> invDiag;
+
+      // Scalar CRS arrays for ILU(0) and SSOR
+      std::vector<val_t> values;
+      std::vector<int> colIndexes;
+      std::vector<int> rowPointers;
+
+      // Index of the diagonal element on each row in the CRS arrays
+      std::vector<int> diagPointers;
+
+
+      // Unpacks the SIMD blocks of the matrix into scalar CRS arrays and locates the diagonal elements
+      void _unpack(const Matrix<val_t>& A) {
+
+        int vectSize = SIMD_SIZE / (int)sizeof(val_t);
+
+        auto simdValues = A.getValues();
+        std::vector<int> colVectIndexes = A.getColVectIndexes();
+        std::vector<int> simdRowPointers = A.getRowPointers();
+
+        this->rowPointers = std::vector<int>(this->n + 1, 0);
+        this->diagPointers = std::vector<int>(this->n, -1);
+
+        for (int row = 0; row < this->n; row++) {
+          for (int i = simdRowPointers[row]; i < simdRowPointers[row + 1]; i++) {
+            for (int vectElem = 0; vectElem < vectSize; vectElem++) {
+              val_t val = simdValues[i][vectElem];
+
+              if ( val == (val_t)0. ) continue;
+
+              int col = colVectIndexes[i] * vectSize + vectElem;
+
+              if ( col == row ) {
+                this->diagPointers[row] = (int)this->values.size();
+              }
+
+              this->values.push_back(val);
+              this->colIndexes.push_back(col);
+            }
+          }
+
+          if ( this->diagPointers[row] < 0 ) {
+            ERROR(ulib::formString("Zero diagonal element on row ", row, "! Preconditioner '", this->method, "' cannot be formed"));
+          }
+
+          this->rowPointers[row + 1] = (int)this->values.size();
+        }
+      }
+
+
+      // Forms the inverses of the column norms of the matrix, i.e. the Jacobi preconditioner for the normal equations
+      void _columnNorms(const Matrix<val_t>& A) {
+
+        int vectSize = SIMD_SIZE / (int)sizeof(val_t);
+
+        auto simdValues = A.getValues();
+        std::vector<int> colVectIndexes = A.getColVectIndexes();
+
+        std::vector<val_t> squares = std::vector<val_t>(this->n, 0.);
+
+        for (int i = 0; i < (int)simdValues.size(); i++) {
+          for (int vectElem = 0; vectElem < vectSize; vectElem++) {
+            int col = colVectIndexes[i] * vectSize + vectElem;
+
+            if ( col < this->n ) {
+              squares[col] += simdValues[i][vectElem] * simdValues[i][vectElem];
+            }
+          }
+        }
+
+        this->invDiag = std::vector<val_t>(this->n, 0.);
+
+        for (int col = 0; col < this->n; col++) {
+          if ( squares[col] == (val_t)0. ) {
+            ERROR(ulib::formString("Column ", col, " is empty! Preconditioner '", this->method, "' cannot be formed"));
+          }
+
+          this->invDiag[col] = (val_t)1. / std::sqrt(squares[col]);
+        }
+      }
+
+
+      // Incomplete LU factorization with zero fill-in. Overwrites the unpacked values with the factors
+      void _factorize() {
+
+        // Maps the column indexes on the current row to their positions in the CRS arrays
+        std::vector<int> rowPositions(this->n, -1);
+
+        for (int row = 1; row < this->n; row++) {
+          for (int i = this->rowPointers[row]; i < this->rowPointers[row + 1]; i++) {
+            rowPositions[this->colIndexes[i]] = i;
+          }
+
+          for (int i = this->rowPointers[row]; i < this->diagPointers[row]; i++) {
+            int k = this->colIndexes[i];
+
+            this->values[i] /= this->values[this->diagPointers[k]];
+
+            for (int j = this->diagPointers[k] + 1; j < this->rowPointers[k + 1]; j++) {
+              int pos = rowPositions[this->colIndexes[j]];
+
+              if ( pos >= 0 ) {
+                this->values[pos] -= this->values[i] * this->values[j];
+              }
+            }
+          }
+
+          if ( this->values[this->diagPointers[row]] == (val_t)0. ) {
+            ERROR(ulib::formString("Zero pivot on row ", row, " in the incomplete LU factorization!"));
+          }
+
+          for (int i = this->rowPointers[row]; i < this->rowPointers[row + 1]; i++) {
+            rowPositions[this->colIndexes[i]] = -1;
+          }
+        }
+      }
+
+
+      /*
+       * Forward substitution with the lower triangle (L + D_L) y = b, where L is the strictly lower part scaled with 'scale'
+       * and D_L either the unit diagonal or the stored diagonal
+       */
+      std::vector<val_t> _lowerSolve(std::vector<val_t> b, bool unitDiag, val_t scale) const {
+
+        for (int row = 0; row < this->n; row++) {
+          val_t sum = b[row];
+
+          for (int i = this->rowPointers[row]; i < this->diagPointers[row]; i++) {
+            sum -= scale * this->values[i] * b[this->colIndexes[i]];
+          }
+
+          b[row] = unitDiag ? sum : sum / this->values[this->diagPointers[row]];
+        }
+
+        return b;
+      }
+
+
+      // Backward substitution with the upper triangle (U + D) z = b, where U is the strictly upper part scaled with 'scale'
+      std::vector<val_t> _upperSolve(std::vector<val_t> b, val_t scale) const {
+
+        for (int row = this->n - 1; row >= 0; row--) {
+          val_t sum = b[row];
+
+          for (int i = this->diagPointers[row] + 1; i < this->rowPointers[row + 1]; i++) {
+            sum -= scale * this->values[i] * b[this->colIndexes[i]];
+          }
+
+          b[row] = sum / this->values[this->diagPointers[row]];
+        }
+
+        return b;
+      }
+
+
+      // Forward substitution with the transposed upper triangle (U + D)^T y = b. Traverses the rows and scatters the updates
+      std::vector<val_t> _upperTransposeSolve(std::vector<val_t> b, val_t scale) const {
+
+        for (int row = 0; row < this->n; row++) {
+          b[row] /= this->values[this->diagPointers[row]];
+
+          for (int i = this->diagPointers[row] + 1; i < this->rowPointers[row + 1]; i++) {
+            b[this->colIndexes[i]] -= scale * this->values[i] * b[row];
+          }
+        }
+
+        return b;
+      }
+
+
+      // Backward substitution with the transposed lower triangle (L + D_L)^T z = b. Traverses the rows and scatters the updates
+      std::vector<val_t> _lowerTransposeSolve(std::vector<val_t> b, bool unitDiag, val_t scale) const {
+
+        for (int row = this->n - 1; row >= 0; row--) {
+          if ( !unitDiag ) {
+            b[row] /= this->values[this->diagPointers[row]];
+          }
+
+          for (int i = this->rowPointers[row]; i < this->diagPointers[row]; i++) {
+            b[this->colIndexes[i]] -= scale * this->values[i] * b[row];
+          }
+        }
+
+        return b;
+      }
+
+
+      // Multiplies the elements with the stored diagonal
+      std::vector<val_t> _diagMul(std::vector<val_t> b) const {
+
+        for (int row = 0; row < this->n; row++) {
+          b[row] *= this->values[this->diagPointers[row]];
+        }
+
+        return b;
+      }
+
+
+      // Applies either M^-1 or M^-T to the given elements
+      std::vector<val_t> _apply(std::vector<val_t> elems, bool transpose) const {
+
+        if ( this->method == "jacobi" ) {
+          for (int i = 0; i < this->n; i++) {
+            elems[i] *= this->invDiag[i];
+          }
+
+          return elems;
+        }
+
+        if ( this->method == "ilu0" ) {
+          if ( transpose ) {
+            return this->_lowerTransposeSolve(this->_upperTransposeSolve(elems, 1.), true, 1.);
+          }
+
+          return this->_upperSolve(this->_lowerSolve(elems, true, 1.), 1.);
+        }
+
+        // SSOR: M = (D + wL) D^-1 (D + wU) / (w (2 - w))
+        std::vector<val_t> ret;
+
+        if ( transpose ) {
+          ret = this->_lowerTransposeSolve(this->_diagMul(this->_upperTransposeSolve(elems, this->omega)), false, this->omega);
+        }
+        else {
+          ret = this->_upperSolve(this->_diagMul(this->_lowerSolve(elems, false, this->omega)), this->omega);
+        }
+
+        for (int i = 0; i < this->n; i++) {
+          ret[i] *= this->omega * (2. - this->omega);
+        }
+
+        return ret;
+      }
+
+
+    public:
+
+
+      // ====================== CONSTRUCTORS ======================
+
+
+      // Default constructor. Forms the identity preconditioner
+      Preconditioner(void) { }
+
+
+      /*
+       * Main constructor. The method is one of 'none', 'jacobi', 'ilu0' and 'ssor' and 'omega' is the relaxation parameter
+       * used by SSOR. If 'normalEquations' is true the preconditioner is formed for right preconditioning of A^T A
+       */
+      Preconditioner(const Matrix<val_t>& A, std::string method, val_t omega = 1., bool normalEquations = false) {
+
+        this->method = ulib::toLower(method);
+        this->omega = omega;
+
+        if ( this->method == "none" ) {
+          return;
+        }
+
+        if ( this->method != "jacobi" && this->method != "ilu0" && this->method != "ssor" ) {
+          ERROR(ulib::formString("Invalid preconditioner: ", method, " passed!"));
+        }
+
+        if ( this->method == "ssor" && (omega <= 0. || omega >= 2.) ) {
+          ERROR(ulib::formString("The SSOR relaxation parameter must be in (0, 2)! (omega = ", omega, ")"));
+        }
+
+        // Column norm scaling for the normal equations works for any shape
+        if ( this->method == "jacobi" && normalEquations ) {
+          this->n = A.numCols();
+          this->_columnNorms(A);
+          return;
+        }
+
+        if ( A.numRows() != A.numCols() ) {
+          ERROR(ulib::formString("Preconditioner '", method, "' requires a square matrix!"));
+        }
+
+        this->n = A.numRows();
+        this->_unpack(A);
+
+        if ( this->method == "jacobi" ) {
+          this->invDiag = std::vector<val_t>(this->n, 0.);
+
+          for (int row = 0; row < this->n; row++) {
+            this->invDiag[row] = (val_t)1. / this->values[this->diagPointers[row]];
+          }
+
+          // The CRS copy is not needed by the Jacobi preconditioner
+          this->values.clear();
+          this->colIndexes.clear();
+          this->rowPointers.clear();
+          this->diagPointers.clear();
+        }
+        else if ( this->method == "ilu0" ) {
+          this->_factorize();
+        }
+      }
+
+
+      // ====================== APPLICATION ======================
+
+
+      // Applies the inverse of the preconditioner M^-1 to the given vector
+      const Vector<val_t> apply(const Vector<val_t>& vect) const {
+
+        if ( this->method == "none" ) return vect;
+
+        std::vector<val_t> elems = this->_apply(vect.getElems(), false);
+        return Vector<val_t>(vect.len(), elems.data());
+      }
+
+
+      // Applies the inverse of the transposed preconditioner M^-T to the given vector
+      const Vector<val_t> applyTranspose(const Vector<val_t>& vect) const {
+
+        if ( this->method == "none" ) return vect;
+
+        std::vector<val_t> elems = this->_apply(vect.getElems(), true);
+        return Vector<val_t>(vect.len(), elems.data());
+      }
+
+
+      // Whether the preconditioner is the identity
+      bool isIdentity() const { return this->method == "none"; }
+
+
+      // The name of the preconditioner method
+      const std::string name() const { return this->method; }
+
+  };
+
+}
+
+
+#endif
@@ -176,6 +176,23 @@ namespace lalib {
       }
 
 
+      // Raw array copying constructor. Reads the elements straight from the given buffer without intermediate copies
+      Vector(int nElems, const val_t* elems) {
+
+        if ( nElems < 1 ) {
+          ERROR("Vector length must be positive!");
+        }
+
+        this->nElems = nElems;
+        this->totalVectCount = ulib::ceil(nElems, vectSize);
+        this->values = std::vector<vect_t>(this->totalVectCount, zeroVect);
+
+        for (int i = 0; i < nElems; i++) {
+          this->values[this->_vectIndex(i)][this->_vectElem(i)] = elems[i];
+        }
+      }
+
+
       // SIMD vector copying constructor
       Vector(int nElems, std::vector<vect_t>& elems) {
 
@@ -532,6 +549,14 @@ namespace lalib {
       }
 
 
+      // Writes the elements into the given buffer, which must hold at least nElems values
+      void copyElems(val_t* dst) const {
+        for (int i = 0; i < this->nElems; i++) {
+          dst[i] = this->values[this->_vectIndex(i)][this->_vectElem(i)];
+        }
+      }
+
+
       // Add rows from another vector to this
       const Vector addRows(const Vector<val_t>& that) const {
         std::vector<vect_t> newValues = this->values;
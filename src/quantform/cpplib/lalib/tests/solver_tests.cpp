@@ -62,6 +62,79 @@ namespace internalLinearSolverTesting {
   }
 
 
+  bool test_pcg_small() {
+
+    lalib::Matrix<val_t> A = lalib::Matrix<val_t>("lalib/tests/test_files/solver_tests/linsys_A_small.dat", 1);
+    lalib::Vector<val_t> b = lalib::Vector<val_t>("lalib/tests/test_files/solver_tests/linsys_b_small.dat", 1);
+
+    lalib::Vector<val_t> x0 = lalib::Vector<val_t>(b.len());
+    bool passed = true;
+
+    for (std::string preconditioner : {"jacobi", "ilu0", "ssor"}) {
+      lalib::LinearSolver<val_t> solver = lalib::LinearSolver<val_t>(A, b);
+      solver.setPreconditioner(preconditioner, 1.2);
+
+      solver.solve("CG", x0);
+      lalib::Vector<val_t> x = solver.getSolution();
+      lalib::Vector<val_t> b_tmp = A.matmul(x);
+
+      passed = passed && b.isClose(b_tmp, 1e-2);
+      passed = passed && (int)solver.getResidualHistory().size() == solver.getIterations() + 1;
+    }
+
+    return passed;
+  }
+
+
+  bool test_pcgnr_small() {
+
+    lalib::Matrix<val_t> A = lalib::Matrix<val_t>("lalib/tests/test_files/solver_tests/linsys_A_small.dat", 1);
+    lalib::Vector<val_t> b = lalib::Vector<val_t>("lalib/tests/test_files/solver_tests/linsys_b_small.dat", 1);
+
+    lalib::Vector<val_t> x0 = lalib::Vector<val_t>(b.len());
+    bool passed = true;
+
+    for (std::string preconditioner : {"jacobi", "ilu0", "ssor"}) {
+      lalib::LinearSolver<val_t> solver = lalib::LinearSolver<val_t>(A, b);
+      solver.setPreconditioner(preconditioner);
+
+      solver.solve("CGNR", x0);
+      lalib::Vector<val_t> x = solver.getSolution();
+      lalib::Vector<val_t> b_tmp = A.matmul(x);
+
+      passed = passed && b.isClose(b_tmp, 1e-2);
+    }
+
+    return passed;
+  }
+
+
+  bool test_cgnr_small_reuse() {
+
+    lalib::Matrix<val_t> A = lalib::Matrix<val_t>("lalib/tests/test_files/solver_tests/linsys_A_small.dat", 1);
+    lalib::Vector<val_t> b = lalib::Vector<val_t>("lalib/tests/test_files/solver_tests/linsys_b_small.dat", 1);
+    lalib::Vector<val_t> b2 = 2. * b;
+
+    lalib::Vector<val_t> x0 = lalib::Vector<val_t>(b.len());
+    lalib::LinearSolver<val_t> solver = lalib::LinearSolver<val_t>(A, b);
+    solver.prepare("CGNR");
+
+    // The copy shares the system matrix and the transpose with the original
+    lalib::LinearSolver<val_t> solver2 = lalib::LinearSolver<val_t>(solver);
+    solver2.setRHS(b2);
+
+    solver.solve("CGNR", x0);
+    solver2.solve("CGNR", x0);
+
+    lalib::Vector<val_t> b_tmp = A.matmul(solver.getSolution());
+    lalib::Vector<val_t> b2_tmp = A.matmul(solver2.getSolution());
+
+    bool passed = b.isClose(b_tmp, 1e-2) && b2.isClose(b2_tmp, 1e-2);
+
+    return passed;
+  }
+
+
   bool test_cg_medium() {
 
     lalib::Matrix<val_t> A = lalib::Matrix<val_t>("lalib/tests/test_files/solver_tests/linsys_A_medium.dat", 1);
@@ -233,6 +306,9 @@ namespace internalLinearSolverTesting {
   bool __addLinearSolverTests() {
     lalib::tests.addTest(test_cg_small);
     lalib::tests.addTest(test_cgnr_small);
+    lalib::tests.addTest(test_cgnr_small_reuse);
+    lalib::tests.addTest(test_pcg_small);
+    lalib::tests.addTest(test_pcgnr_small);
     lalib::tests.addTest(test_cg_medium);
     lalib::tests.addTest(test_cgnr_medium);
     lalib::tests.addTest(test_cg_large);
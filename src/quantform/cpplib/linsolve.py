@@ -2,33 +2,138 @@
 @author Kasper Rantamäki
 Submodule with basic linear solver implementation
 """
-from typing import List, Literal
+from typing import Dict, Literal, Optional, Sequence, Tuple, Union
 from pathlib import Path
 from scipy.sparse import csr_matrix
 import ctypes
 import numpy as np
 
+from ..pylib.instrumentation import timed, observe, RESIDUAL_BUCKETS
+
 
 clinsolve = ctypes.cdll.LoadLibrary(Path(__file__).parent.resolve() / "clinsolve.so")
 
 
-def linsolve(system_matrix: csr_matrix[float], rhs_vector: np.ndarray[float], solver: Literal['CG', 'CGNR', 'TCGNR', 'IRLS'] = 'CGNR') -> np.ndarray[float]:
+# Pointer types for passing the NumPy buffers directly to the shared object
+_double_array = np.ctypeslib.ndpointer(dtype=np.float64, ndim=1, flags="C_CONTIGUOUS")
+_int_array    = np.ctypeslib.ndpointer(dtype=np.int32, ndim=1, flags="C_CONTIGUOUS")
+_int_ptr      = ctypes.POINTER(ctypes.c_int)
+_double_ptr   = ctypes.POINTER(ctypes.c_double)
+
+
+clinsolve.linsolve.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int, _double_array, _int_array, _int_array,
+                               _double_array, _double_array, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_double,
+                               ctypes.c_int, ctypes.c_double, _int_ptr, _double_ptr, _double_array, _int_ptr]
+clinsolve.linsolve.restype  = ctypes.c_int
+
+
+# The names of the preconditioners on the C++ side
+_preconditioners = {None: "none", "JACOBI": "jacobi", "ILU0": "ilu0", "SSOR": "ssor"}
+
+
+def _as_buffer(array: np.ndarray, dtype: type) -> np.ndarray:
+  """Function that returns the array as a one dimensional C-contiguous buffer of the wanted type
+
+  The array is only copied if it doesn't already satisfy the requirements, so for the usual float64 data and
+  int32 index arrays of a csr_matrix the original memory is passed on as is.
+
+  @param array            The array to be passed to the shared object
+  @param dtype            The wanted data type of the buffer
+  @raises AssertionError  Raised if the array is not one dimensional
+  @return                 The array as a contiguous buffer
   """
-  TODO
+  buffer = np.ascontiguousarray(array, dtype=dtype)
+  assert buffer.ndim == 1, f"The array must be one dimensional! ({buffer.ndim} != 1)"
+
+  return buffer
+
+
+def _preconditioner_name(preconditioner: Optional[str]) -> bytes:
+  """Function that validates the preconditioner and returns its name on the C++ side
+
+  @param preconditioner   The preconditioner. One of None, 'Jacobi', 'ILU0' or 'SSOR'
+  @raises AssertionError  Raised if an invalid preconditioner is specified
+  @return                 The name of the preconditioner as bytes
+  """
+  key = preconditioner.upper() if preconditioner is not None else None
+  assert key in _preconditioners, f"Invalid preconditioner specified! ('{preconditioner}' not in [None, 'Jacobi', 'ILU0', 'SSOR'])"
+
+  return bytes(_preconditioners[key], "utf-8")
+
+
+def _observe_convergence(name: str, iterations: Sequence[int], residuals: Sequence[float]) -> None:
+  """Function that adds the iteration counts and the final residuals of the solves into the instrumentation histograms"""
+  observe(f"{name}.iterations", iterations)
+  observe(f"{name}.residual", residuals, RESIDUAL_BUCKETS)
+
+
+@timed
+def linsolve(system_matrix: csr_matrix, rhs_vector: np.ndarray, solver: Literal['CG', 'CGNR', 'TCGNR', 'IRLS'] = 'CGNR',
+             preconditioner: Optional[Literal['Jacobi', 'ILU0', 'SSOR']] = None, max_iter: int = 1000, tol: float = 1e-7,
+             omega: float = 1., return_info: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, Dict]]:
+  """Function for solving a sparse linear system
+
+  Solves the system \f$Ax = b\f$ with the C++ solvers in 'lalib'. The CSR arrays of the system matrix and the
+  right-hand side vector are passed to the shared object as pointers to the NumPy buffers and the solution is
+  written in place into the returned array, so no Python level copies proportional to the number of non-zeros
+  are made.
+
+  The CG and CGNR solvers can be preconditioned. With CG the preconditioner should be symmetric (i.e. Jacobi or
+  SSOR for a symmetric system) and with CGNR it is applied from the right, in which case Jacobi scales the columns
+  with their norms. TCGNR and IRLS ignore the preconditioner. Note that the solvers compare the squared 2-norm of 
+  the residual (of the preconditioned normal equations for CGNR) against the tolerance.
+
+  @param system_matrix    The system matrix \f$A\f$ in CSR format
+  @param rhs_vector       The right-hand side vector \f$b\f$
+  @param solver           The used solver method. Optional, defaults to 'CGNR'
+  @param preconditioner   The used preconditioner. Optional, defaults to None i.e. no preconditioning
+  @param max_iter         The maximum number of iterations. Optional, defaults to 1000
+  @param tol              The tolerance for the squared residual norm. Optional, defaults to 1e-7
+  @param omega            The relaxation parameter for SSOR in (0, 2). Optional, defaults to 1 (i.e. symmetric Gauss-Seidel)
+  @param return_info      Boolean flag specifying if the convergence info is returned. Optional, defaults to False
+  @raises AssertionError  Raised if an invalid solver or preconditioner is specified or the dimensions don't match
+  @raises RuntimeError    Raised if the C++ solver fails
+  @return                 The solution vector \f$x\f$ and if 'return_info' is True also a dictionary with the number 
+                          of iterations ('iterations'), which is at most 'max_iter', the final residual ('residual'),
+                          whether the residual is below the tolerance ('converged') and the residual after each
+                          iteration ('residual_history')
   """
   assert solver.upper() in ['CG', 'CGNR', 'TCGNR', 'IRLS'], f"Invalid solver specified! ('{solver}' not in ['CG', 'CGNR', 'TCGNR', 'IRLS'])"
-  
-  # Convert the Python lists into C arrays
-  value_arr  = (ctypes.c_double * len(system_matrix.data))(*list(system_matrix.data))
-  colInd_arr = (ctypes.c_int * len(system_matrix.indices))(*list(system_matrix.indices))
-  rowPtr_arr = (ctypes.c_int * len(system_matrix.indptr))(*list(system_matrix.indptr))
-  rhs_arr    = (ctypes.c_double * len(rhs_vector))(*list(rhs_vector))
-  x0_arr     = (ctypes.c_double * system_matrix.shape[1])(*([0.0] * system_matrix.shape[1]))
-
-  # Set the return type for the linsolve function
-  # clinsolve.linsolve.restype = np.ctypeslib.ndpointer(dtype=ctypes.c_double, shape=(system_matrix.shape[1],))
-  
-  # Solve the problem
-  clinsolve.linsolve(system_matrix.shape[0], system_matrix.shape[1], len(system_matrix.data), value_arr, rowPtr_arr, colInd_arr, rhs_arr, x0_arr, bytes(solver, "utf-8"))
-  
-  return x0_arr[0:system_matrix.shape[1]]
\ No newline at end of file
+  assert max_iter > 0, f"The maximum number of iterations must be positive! ({max_iter} <= 0)"
+  assert tol > 0, f"The tolerance must be positive! ({tol} <= 0)"
+
+  if not isinstance(system_matrix, csr_matrix):
+    system_matrix = csr_matrix(system_matrix)
+
+  n_rows, n_cols = system_matrix.shape
+
+  values      = _as_buffer(system_matrix.data, np.float64)
+  col_indexes = _as_buffer(system_matrix.indices, np.int32)
+  row_ptrs    = _as_buffer(system_matrix.indptr, np.int32)
+  rhs         = _as_buffer(rhs_vector, np.float64)
+
+  assert len(rhs) == n_rows, f"The dimensions of the system matrix and the right-hand side vector don't match! ({len(rhs)} != {n_rows})"
+
+  # The initial guess, which the solver overwrites with the solution
+  solution = np.zeros(n_cols, dtype=np.float64)
+
+  # Outputs for the convergence info. The history holds the initial residual and one residual per iteration
+  n_iterations   = ctypes.c_int(0)
+  residual       = ctypes.c_double(0.)
+  history        = np.zeros(max_iter + 1, dtype=np.float64)
+  history_length = ctypes.c_int(len(history))
+
+  ret = clinsolve.linsolve(n_rows, n_cols, len(values), values, row_ptrs, col_indexes, rhs, solution, bytes(solver, "utf-8"),
+                           _preconditioner_name(preconditioner), omega, max_iter, tol, ctypes.byref(n_iterations),
+                           ctypes.byref(residual), history, ctypes.byref(history_length))
+
+  if ret != 0:
+    raise RuntimeError(f"The C++ solver failed! (Return code: {ret})")
+
+  _observe_convergence("linsolve", (n_iterations.value,), (residual.value,))
+
+  if return_info:
+    return solution, {"iterations": n_iterations.value, "residual": residual.value, "converged": residual.value < tol,
+                     "residual_history": history[:history_length.value]}
+
+  return solution
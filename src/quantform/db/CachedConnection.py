@@ -0,0 +1,414 @@
+"""@package quantform.db.CachedConnection
+@author Kasper Rantamäki
+Submodule with an in-memory cache of query results in front of a database connection
+
+The results are keyed on the normalized query text and the parameters and evicted on expiry, least recently used first
+when the cache is full, and whenever a write through the connection touches one of the tables the query reads.
+
+Example:
+  connection = CachedConnection(SQLiteConnection("trades.db"), ttl=60.)
+  positions  = connection.select_sql("SELECT * FROM positions WHERE book = ?", ("FX",))  # Read from the database
+  positions  = connection.select_sql("SELECT * FROM positions WHERE book = ?", ("FX",))  # Served from memory
+  connection.insert_sql("main", "positions", df)                                          # Invalidates the above
+"""
+from typing import Dict, FrozenSet, Hashable, Iterable, Optional, Sequence, Tuple, Union
+from collections import OrderedDict
+import threading
+import time
+import re
+import pandas as pd
+
+from .DatabaseConnection import DatabaseConnection
+
+
+# The string literals and quoted identifiers, which are kept as is when the query text is normalized
+_literal_pattern = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])""")
+
+# A plain or quoted identifier and a possibly schema-qualified table name following a keyword
+_name       = r"""(?:"(?:[^"]|"")+"|`[^`]+`|\[[^\]]+\]|[\w$]+)"""
+_identifier = rf"({_name}(?:\s*\.\s*{_name})?)"
+
+# The tables read by a query and the tables written by a statement. The names following commas are included for the
+# implicit joins, which may add column names to the tables of a query but never leaves a table out
+_read_pattern  = re.compile(rf"(?:\b(?:FROM|JOIN)\s+|,\s*){_identifier}", re.IGNORECASE)
+_write_pattern = re.compile(rf"\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+{_identifier}",
+                            re.IGNORECASE)
+
+
+def _normalize(query: str) -> str:
+  """Function for normalizing the whitespace and the letter case of a query outside of its literals"""
+  parts = _literal_pattern.split(query.strip().rstrip(";").strip())
+
+  # The odd parts are the literals captured by the split
+  return "".join(part if i % 2 else re.sub(r"\s+", " ", part).upper() for i, part in enumerate(parts))
+
+
+def _table_name(identifier: str) -> str:
+  """Function for the unquoted lowercase name of a table without its schema"""
+  name = re.findall(_name, identifier)[-1]
+  if name[0] in "\"`[":
+    name = name[1:-1]
+
+  return name.lower()
+
+
+def _tables(query: str, pattern: re.Pattern) -> FrozenSet[str]:
+  """Function for the names of the tables matched in a query"""
+  return frozenset(_table_name(identifier) for identifier in pattern.findall(query))
+
+
+def _key(values: any) -> Optional[Hashable]:
+  """Function for a hashable key of query parameters or other arguments, None if they cannot be hashed"""
+  if isinstance(values, dict):
+    key = tuple((name, _key(value)) for name, value in sorted(values.items()))
+  elif isinstance(values, (list, tuple)):
+    key = tuple(_key(value) for value in values)
+  else:
+    key = values
+
+  try:
+    hash(key)
+  except TypeError:
+    return None
+
+  return key
+
+
+class QueryCache:
+  """Thread-safe cache of query results with expiry, least recently used eviction and a memory limit
+
+  Every entry records the tables its query reads. The tables have generation counters that are incremented when they
+  are invalidated, so a result read while a write to its tables was in progress is never stored.
+  """
+
+  def __init__(self, ttl: Optional[float] = 60., max_entries: int = 1024, max_bytes: int = 256 * 2 ** 20, copy: bool = True) -> None:
+    """Constructor method
+
+    @param ttl              The number of seconds an entry is served for. Optional, defaults to 60. None keeps the
+                            entries until they are evicted or invalidated
+    @param max_entries      The maximum number of entries. Optional, defaults to 1024
+    @param max_bytes        The maximum total size of the cached data frames in bytes. Optional, defaults to 256 MB
+    @param copy             Boolean flag specifying if the stored and the returned data frames are deep copies, so that
+                            modifying a result never modifies the cached one. Without the copies the results must not
+                            be modified in place. Optional, defaults to True
+    @raises AssertionError  Raised if a limit is not positive
+    @return                 None
+    """
+    assert ttl is None or ttl > 0, f"The time to live must be positive! ({ttl} <= 0)"
+    assert max_entries > 0, f"The maximum number of entries must be positive! ({max_entries} <= 0)"
+    assert max_bytes > 0, f"The maximum size must be positive! ({max_bytes} <= 0)"
+
+    self.__ttl         = ttl
+    self.__max_entries = max_entries
+    self.__max_bytes   = max_bytes
+    self.__copy        = copy
+    self.__lock        = threading.Lock()
+    self.__entries     = OrderedDict()  # key -> (frame, tables, expiry, size)
+    self.__generations = {}             # table -> generation
+    self.__generation  = 0              # Incremented when all of the tables are invalidated
+    self.__bytes       = 0
+    self.__stats       = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+  def __str__(self) -> str:
+    return f"QueryCache({len(self.__entries)} entries, {self.__bytes} bytes)"
+
+
+  def __repr__(self) -> str:
+    return f"Query Cache\nEntries: {len(self.__entries)}/{self.__max_entries}\nBytes: {self.__bytes}/{self.__max_bytes}\n" \
+           f"Time to live: {self.__ttl}\nStatistics: {self.stats}"
+
+
+  def __len__(self) -> int:
+    return len(self.__entries)
+
+
+  @property
+  def nbytes(self) -> int:
+    """The total size of the cached data frames in bytes"""
+    return self.__bytes
+
+
+  @property
+  def stats(self) -> Dict[str, Union[int, float, None]]:
+    """The numbers of hits, misses, evictions and invalidated entries along with the hit rate"""
+    with self.__lock:
+      stats = dict(self.__stats)
+
+    lookups = stats["hits"] + stats["misses"]
+    return {**stats, "hit_rate": stats["hits"] / lookups if lookups > 0 else None}
+
+
+  def version(self, tables: Iterable[str]) -> Tuple[int, ...]:
+    """Method for the current generations of tables, which are passed to 'put' to detect concurrent invalidations
+
+    @param tables  The table names
+    @return        The generations
+    """
+    with self.__lock:
+      return (self.__generation, *(self.__generations.get(table, 0) for table in sorted(tables)))
+
+
+  def get(self, key: Hashable) -> Optional[pd.DataFrame]:
+    """Method for looking up a result
+
+    @param key  The key of the result
+    @return     The result, or None if it is not cached or has expired
+    """
+    with self.__lock:
+      entry = self.__entries.get(key)
+
+      if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+        self.__remove(key)
+        entry = None
+
+      if entry is None:
+        self.__stats["misses"] += 1
+        return None
+
+      self.__entries.move_to_end(key)
+      self.__stats["hits"] += 1
+
+    return entry[0].copy() if self.__copy else entry[0]
+
+
+  def put(self, key: Hashable, frame: pd.DataFrame, tables: FrozenSet[str], version: Tuple[int, ...]) -> None:
+    """Method for storing a result
+
+    The result is not stored if it alone exceeds the memory limit or if its tables have been invalidated since the
+    version was taken.
+
+    @param key      The key of the result
+    @param frame    The result
+    @param tables   The tables read by the query
+    @param version  The generations of the tables taken with 'version' before the query was run
+    @return         None
+    """
+    size = int(frame.memory_usage(index=True, deep=True).sum())
+    if size > self.__max_bytes:
+      return
+
+    with self.__lock:
+      if (self.__generation, *(self.__generations.get(table, 0) for table in sorted(tables))) != version:
+        return
+
+      if key in self.__entries:
+        self.__remove(key)
+
+      expiry = time.monotonic() + self.__ttl if self.__ttl is not None else None
+      self.__entries[key] = (frame.copy() if self.__copy else frame, tables, expiry, size)
+      self.__bytes       += size
+
+      while len(self.__entries) > self.__max_entries or self.__bytes > self.__max_bytes:
+        self.__remove(next(iter(self.__entries)))
+        self.__stats["evictions"] += 1
+
+
+  def invalidate(self, tables: Optional[Iterable[str]] = None) -> int:
+    """Method for dropping the results that read any of the tables
+
+    @param tables  The table names (case insensitive, without the schema). Optional, defaults to None i.e. all of the
+                   results are dropped
+    @return        The number of dropped results
+    """
+    with self.__lock:
+      if tables is None:
+        self.__generation += 1
+        keys = list(self.__entries)
+      else:
+        tables = {_table_name(table) for table in tables}
+        for table in tables:
+          self.__generations[table] = self.__generations.get(table, 0) + 1
+        keys = [key for key, entry in self.__entries.items() if not entry[1].isdisjoint(tables)]
+
+      for key in keys:
+        self.__remove(key)
+      self.__stats["invalidations"] += len(keys)
+
+    return len(keys)
+
+
+  def clear(self) -> None:
+    """Method for dropping all of the results
+
+    @return  None
+    """
+    self.invalidate()
+
+
+  def __remove(self, key: Hashable) -> None:
+    """Method for removing an entry while holding the lock"""
+    self.__bytes -= self.__entries.pop(key)[3]
+
+
+class CachedConnection(DatabaseConnection):
+  """Database connection serving repeated select queries from a QueryCache
+
+  The writes made through 'insert_sql', 'delete_sql' and the call method invalidate the cached results of the tables
+  they touch. The views read by a query are resolved into the tables they read from the 'sqlite_master' table, which
+  is read on the first query and again after each call of the call method e.g. for a 'CREATE VIEW'. With connections
+  that have no 'sqlite_master' table, or views created outside of the wrapper later on, the results reading views must
+  be invalidated with 'invalidate'. Writes that bypass the wrapper (e.g. from other processes or with 'write' of the wrapped connection) are
+  only picked up when the entries expire, or when 'invalidate' is called. The other attributes are those of the wrapped
+  connection.
+  """
+
+  def __init__(self, connection: DatabaseConnection, ttl: Optional[float] = 60., max_entries: int = 1024,
+               max_bytes: int = 256 * 2 ** 20, copy: bool = True) -> None:
+    """Constructor method
+
+    @param connection   The wrapped connection
+    @param ttl          The number of seconds a result is served for. Optional, defaults to 60. None keeps the results
+                        until they are evicted or invalidated
+    @param max_entries  The maximum number of cached results. Optional, defaults to 1024
+    @param max_bytes    The maximum total size of the cached results in bytes. Optional, defaults to 256 MB
+    @param copy         Boolean flag specifying if the results are deep copies of the cached ones. Without the copies
+                        the results must not be modified in place. Optional, defaults to True
+    @return             None
+    """
+    self.__connection = connection
+    self.__cache      = QueryCache(ttl, max_entries, max_bytes, copy)
+    self.__views      = None  # view name -> tables read by the view, None until read
+
+
+  def __getattr__(self, name: str) -> any:
+    if name.startswith("_CachedConnection__"):
+      raise AttributeError(name)
+
+    return getattr(self.__connection, name)
+
+
+  def __enter__(self) -> "CachedConnection":
+    return self
+
+
+  def __exit__(self, *args) -> None:
+    self.close()
+
+
+  def __str__(self) -> str:
+    return f"CachedConnection({self.__connection})"
+
+
+  def __repr__(self) -> str:
+    return f"Cached Connection\nConnection: {self.__connection}\nCache: {self.__cache}"
+
+
+  @property
+  def connection(self) -> DatabaseConnection:
+    return self.__connection
+
+
+  @property
+  def cache(self) -> QueryCache:
+    return self.__cache
+
+
+  def close(self) -> None:
+    """Method for dropping the cached results and closing the wrapped connection
+
+    @return  None
+    """
+    self.__cache.clear()
+    self.__connection.close()
+
+
+  def invalidate(self, tables: Optional[Iterable[str]] = None) -> int:
+    """Method for dropping the cached results of tables e.g. after writing to them outside of the wrapper
+
+    @param tables  The table names. Optional, defaults to None i.e. all of the results are dropped
+    @return        The number of dropped results
+    """
+    return self.__cache.invalidate(tables)
+
+
+  def __call__(self, query: str, *args, **kwargs) -> None:
+    """Call method for running generic writes, which drop all of the cached results
+
+    @param query  The query
+    @return       None
+    """
+    try:
+      return self.__connection(query, *args, **kwargs)
+    finally:
+      self.__views = None
+      self.__cache.invalidate()
+
+
+  def insert_sql(self, schema: str, table: str, df: pd.DataFrame, *args, **kwargs) -> any:
+    """Method for inserting the rows of a data frame into a table, dropping the cached results reading the table
+
+    @param schema  The schema
+    @param table   The name of the table
+    @param df      The rows to be inserted
+    @return        The return value of the wrapped connection
+    """
+    try:
+      return self.__connection.insert_sql(schema, table, df, *args, **kwargs)
+    finally:
+      self.__cache.invalidate([table])
+
+
+  def delete_sql(self, query: str, *args, **kwargs) -> any:
+    """Method for running a delete (or update) query, dropping the cached results reading the affected tables
+
+    @param query  The query. If no table can be recognized in it, all of the cached results are dropped
+    @return       The return value of the wrapped connection
+    """
+    tables = _tables(query, _write_pattern)
+
+    try:
+      return self.__connection.delete_sql(query, *args, **kwargs)
+    finally:
+      self.__cache.invalidate(tables if tables else None)
+
+
+  def __resolve(self, tables: FrozenSet[str]) -> FrozenSet[str]:
+    """Method for adding the tables read through views to the tables read by a query"""
+    views = self.__views
+    if views is None:
+      try:
+        df    = self.__connection.select_sql("SELECT name, sql FROM sqlite_master WHERE type = 'view'")
+        views = {name.lower(): _tables(_normalize(sql), _read_pattern) for name, sql in zip(df["name"], df["sql"])}
+      except Exception:
+        views = {}
+      self.__views = views
+
+    resolved, pending = set(), list(tables)
+    while pending:
+      table = pending.pop()
+      if table not in resolved:
+        resolved.add(table)
+        pending.extend(views.get(table, ()))
+
+    return frozenset(resolved)
+
+
+  def select_sql(self, query: str, params: Optional[Union[Sequence, Dict]] = None, *args, **kwargs) -> pd.DataFrame:
+    """Method for running a select query, served from the cache if the same query has been run before
+
+    Two queries are the same if they differ only in the whitespace and letter case outside of their literals and have
+    equal parameters and other arguments.
+
+    @param query   The query
+    @param params  The parameters bound to the placeholders of the query. Optional, defaults to None
+    @return        The result
+    """
+    select = (lambda: self.__connection.select_sql(query, params, *args, **kwargs)) if params is not None else \
+             (lambda: self.__connection.select_sql(query, *args, **kwargs))
+
+    normalized = _normalize(query)
+    key        = _key((normalized, params, args, kwargs))
+    if key is None:
+      return select()
+
+    frame = self.__cache.get(key)
+    if frame is not None:
+      return frame
+
+    tables  = self.__resolve(_tables(normalized, _read_pattern))
+    version = self.__cache.version(tables)
+    frame   = select()
+    self.__cache.put(key, frame, tables, version)
+
+    return frame
@@ -0,0 +1,155 @@
+"""@package quantform.db.ConnectionPool
+@author Kasper Rantamäki
+Submodule with a bounded thread-safe pool of database connections
+
+The pool can be used underneath any DatabaseConnection implementation whose driver connections have a 'close' method.
+"""
+from typing import Callable, Generic, Iterator, Optional, TypeVar
+from contextlib import contextmanager
+import threading
+import os
+
+
+Connection = TypeVar("Connection")
+
+
+class ConnectionPool(Generic[Connection]):
+  """Bounded pool of database connections shared between threads
+
+  Each connection is used by at most one thread at a time. A thread that acquires a connection while it already holds
+  one gets the same connection again, so nested queries within a thread never wait on the pool or deadlock. Idle
+  connections are reused most recently released first, which keeps the prepared statement caches of the drivers warm.
+
+  The pool is bound to the process that created it. After a fork the connections inherited from the parent are
+  dropped without closing them and new ones are opened in the child.
+  """
+
+  def __init__(self, factory: Callable[[], Connection], max_size: int = 4, timeout: Optional[float] = None) -> None:
+    """Constructor method
+
+    The connections are opened lazily when they are first needed.
+
+    @param factory          Function opening a new connection
+    @param max_size         The maximum number of open connections. Optional, defaults to 4
+    @param timeout          The number of seconds to wait for an idle connection before raising a TimeoutError.
+                            Optional, defaults to None i.e. waiting indefinitely
+    @raises AssertionError  Raised if the maximum size is not positive
+    @return                 None
+    """
+    assert max_size > 0, f"The maximum size of the pool must be positive! ({max_size} <= 0)"
+
+    self.__factory   = factory
+    self.__max_size  = max_size
+    self.__timeout   = timeout
+    self.__condition = threading.Condition()
+    self.__closed    = False
+    self.__reset()
+
+
+  def __reset(self) -> None:
+    """Method for forgetting all of the connections e.g. when the pool is used in a new process"""
+    self.__pid    = os.getpid()
+    self.__idle   = []
+    self.__opened = 0
+    self.__local  = threading.local()
+
+
+  def __str__(self) -> str:
+    return f"ConnectionPool({self.__opened}/{self.__max_size} open)"
+
+
+  def __repr__(self) -> str:
+    return f"Connection Pool\nMaximum size: {self.__max_size}\nOpen: {self.__opened}\nIdle: {len(self.__idle)}"
+
+
+  @property
+  def max_size(self) -> int:
+    return self.__max_size
+
+
+  @property
+  def size(self) -> int:
+    """The number of open connections"""
+    return self.__opened
+
+
+  @contextmanager
+  def acquire(self) -> Iterator[Connection]:
+    """Context manager for borrowing a connection
+
+    @raises RuntimeError  Raised if the pool has been closed
+    @raises TimeoutError  Raised if no connection becomes available within the timeout
+    @return               The connection, which is returned to the pool when the context exits
+    """
+    if self.__pid != os.getpid():
+      with self.__condition:
+        if self.__pid != os.getpid():
+          self.__reset()
+
+    # Re-entrant use within the thread holding a connection
+    held = getattr(self.__local, "connection", None)
+    if held is not None:
+      yield held
+      return
+
+    connection = self.__take()
+    self.__local.connection = connection
+
+    try:
+      yield connection
+    finally:
+      self.__local.connection = None
+      self.__give(connection)
+
+
+  def __take(self) -> Connection:
+    """Method for taking an idle connection or opening a new one if the pool is not full"""
+    with self.__condition:
+      if self.__closed:
+        raise RuntimeError("The connection pool has been closed!")
+
+      if not self.__condition.wait_for(lambda: self.__idle or self.__opened < self.__max_size, self.__timeout):
+        raise TimeoutError(f"No database connection became available in {self.__timeout} seconds!")
+
+      if self.__idle:
+        return self.__idle.pop()
+
+      self.__opened += 1
+
+    try:
+      return self.__factory()
+    except Exception:
+      with self.__condition:
+        self.__opened -= 1
+        self.__condition.notify()
+      raise
+
+
+  def __give(self, connection: Connection) -> None:
+    """Method for returning a connection to the idle ones"""
+    with self.__condition:
+      if self.__pid != os.getpid():
+        return
+
+      if not self.__closed:
+        self.__idle.append(connection)
+        self.__condition.notify()
+        return
+
+      self.__opened -= 1
+
+    connection.close()
+
+
+  def close(self) -> None:
+    """Method for closing the pool. The idle connections are closed at once and the ones in use when they are returned
+
+    @return  None
+    """
+    with self.__condition:
+      self.__closed     = True
+      idle, self.__idle = self.__idle, []
+      self.__opened    -= len(idle)
+
+    for connection in idle:
+      connection.close()
@@ -31,10 +31,12 @@ class DatabaseConnection(ABC):
 
   @staticmethod
   def read_sql(sql_path: Path) -> str:
+    """Method for reading a query from a file
+
+    @param sql_path  The path to the SQL file
+    @return          The query
     """
-    TODO
-    """
-    pass
+    return Path(sql_path).read_text()
   
 
   @abstractmethod
@@ -1,12 +1,494 @@
+"""@package quantform.db.SQLiteConnection
+@author Kasper Rantamäki
+Submodule with a SQLite database connection tuned for storing trades and market data
+
+The database is opened in WAL mode, so readers are not blocked by a writer and vice versa. The reads are run on a
+pool of connections and all of the writes are serialized through a queue onto a single writer connection, so that
+concurrent writers never fail on 'database is locked'. Bulk inserts are done with 'executemany' inside a single
+transaction and selects can be streamed in chunks, so that large results never need to be held in memory at once.
 """
-TODO
-"""
+from typing import Callable, Dict, Iterator, Literal, Optional, Sequence, Union
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+import threading
+import sqlite3
+import queue
+import uuid
+import os
+import numpy as np
+import pandas as pd
+
 from .DatabaseConnection import DatabaseConnection
+from .ConnectionPool import ConnectionPool
 
 
-class SQLiteConnection(DatabaseConnection):
+# The pragmas set on every connection. WAL with 'synchronous=NORMAL' only syncs at checkpoints, which is durable against
+# application crashes but may lose the last transactions on a power loss
+_default_pragmas = {"journal_mode": "WAL",
+                    "synchronous":  "NORMAL",
+                    "temp_store":   "MEMORY",
+                    "cache_size":   -64_000,      # In KiB i.e. 64 MB
+                    "mmap_size":    268_435_456,  # 256 MB
+                    "foreign_keys": "ON"}
+
+
+# The SQLite column types for the NumPy dtype kinds. Timestamps are stored as nanoseconds since the epoch
+_column_types = {"b": "INTEGER", "i": "INTEGER", "u": "INTEGER", "f": "REAL", "M": "INTEGER", "O": "TEXT", "U": "TEXT", "S": "BLOB"}
+
+
+def _quote(identifier: str) -> str:
+  """Function for quoting a schema, table or column name"""
+  return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _to_sqlite(column: pd.Series) -> list:
+  """Function that converts a column into a list of values that can be bound to a statement
+
+  The values are converted in bulk into the Python types 'sqlite3' accepts. NaN is stored as NULL by SQLite and
+  timestamps as integer nanoseconds since the epoch (in UTC for timezone aware timestamps), which is several times
+  faster to write and read than text.
+
+  @param column  The column
+  @return        The values as a list
   """
-  TODO
+  if column.dtype.kind == "M":
+    values = column.dt.tz_convert(None) if column.dt.tz is not None else column
+    values = values.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    return np.where(column.isna().to_numpy(), None, values).tolist() if column.hasnans else values.tolist()
+
+  if column.dtype.kind in "biuf":
+    return column.to_numpy().tolist()
+
+  return column.astype(object).where(column.notna(), None).tolist()
+
+
+def _to_frame(rows: list, columns: list, parse_dates: Optional[Sequence[str]]) -> pd.DataFrame:
+  """Function for forming a data frame from the fetched rows, with the given columns converted back into timestamps"""
+  frame = pd.DataFrame.from_records(rows, columns=columns)
+
+  for name in (parse_dates if parse_dates is not None else []):
+    frame[name] = pd.to_datetime(frame[name], unit="ns")
+
+  return frame
+
+
+def _create_table_query(schema: str, table: str, df: pd.DataFrame, primary_key: Optional[Sequence[str]] = None) -> str:
+  """Function for the query creating a table, if it doesn't exist, with columns matching those of a data frame"""
+  columns = [f"{_quote(name)} {_column_types.get(dtype.kind, 'TEXT')}" for name, dtype in df.dtypes.items()]
+  if primary_key is not None:
+    columns.append(f"PRIMARY KEY ({', '.join(_quote(name) for name in primary_key)})")
+
+  return f"CREATE TABLE IF NOT EXISTS {_quote(schema)}.{_quote(table)} ({', '.join(columns)})"
+
+
+class _Writer:
+  """Thread owning the single writer connection of a database
+
+  The submitted jobs are run in the order they were submitted. The jobs waiting in the queue are committed together
+  in one transaction (group commit), with each job inside its own savepoint so that a failing job is rolled back
+  without affecting the others. The futures of the jobs are resolved only after the commit.
   """
 
-  
\ No newline at end of file
+  def __init__(self, connect: Callable[[], sqlite3.Connection], max_batch: int) -> None:
+    self.__queue     = queue.Queue()
+    self.__max_batch = max_batch
+    self.__lock      = threading.Lock()
+    self.__error     = None  # The error raised when opening the writer connection
+    self.__closed    = False
+    self.__thread    = threading.Thread(target=self.__run, args=(connect,), name="quantform-sqlite-writer", daemon=True)
+    self.__thread.start()
+
+
+  def submit(self, job: Callable[[sqlite3.Connection], any], transactional: bool = True) -> Future:
+    """Method for queueing a job, which is called with the writer connection. Jobs that are not transactional are run
+    on their own outside of any transaction (e.g. scripts, which commit on their own)
+
+    @raises RuntimeError  Raised if the writer has been closed or its connection could not be opened
+    """
+    future = Future()
+    with self.__lock:
+      if self.__closed:
+        raise RuntimeError("The writer connection has been closed!")
+      if self.__error is not None:
+        raise RuntimeError("The writer connection could not be opened!") from self.__error
+      self.__queue.put((job, future, transactional))
+
+    return future
+
+
+  def close(self) -> None:
+    """Method for finishing the queued jobs and closing the writer connection"""
+    # No job can be queued behind the sentinel, where it would never be run
+    with self.__lock:
+      if not self.__closed:
+        self.__closed = True
+        self.__queue.put(None)
+    self.__thread.join()
+
+
+  def __run(self, connect: Callable[[], sqlite3.Connection]) -> None:
+    try:
+      connection = connect()
+    except BaseException as e:
+      # No more jobs are queued once the error is set, so the ones already queued can be failed
+      with self.__lock:
+        self.__error = e
+      while True:
+        try:
+          item = self.__queue.get_nowait()
+        except queue.Empty:
+          return
+        if item is not None and item[1].set_running_or_notify_cancel():
+          item[1].set_exception(e)
+
+    running = True
+
+    while running:
+      batch = [self.__queue.get()]
+
+      # Drain the transactional jobs that are already waiting into the same transaction
+      while batch[-1] is not None and batch[-1][2] and len(batch) < self.__max_batch:
+        try:
+          batch.append(self.__queue.get_nowait())
+        except queue.Empty:
+          break
+
+      if batch[-1] is None:
+        running = False
+        batch.pop()
+
+      # A job run outside of a transaction is always the last one in the batch
+      if batch and not batch[-1][2]:
+        batch, single = batch[:-1], batch[-1]
+      else:
+        single = None
+
+      if batch:
+        self.__commit(connection, batch)
+      if single is not None:
+        self.__run_single(connection, *single[:2])
+
+    connection.close()
+
+
+  @staticmethod
+  def __run_single(connection: sqlite3.Connection, job: Callable, future: Future) -> None:
+    if future.set_running_or_notify_cancel():
+      try:
+        future.set_result(job(connection))
+      except BaseException as e:
+        future.set_exception(e)
+
+
+  @staticmethod
+  def __commit(connection: sqlite3.Connection, batch: list) -> None:
+    results = []
+
+    try:
+      connection.execute("BEGIN IMMEDIATE")
+
+      for job, future, _ in batch:
+        if not future.set_running_or_notify_cancel():
+          results.append(None)
+          continue
+
+        connection.execute("SAVEPOINT job")
+        try:
+          results.append((True, job(connection)))
+          connection.execute("RELEASE job")
+        except Exception as e:
+          connection.execute("ROLLBACK TO job")
+          connection.execute("RELEASE job")
+          results.append((False, e))
+
+      connection.execute("COMMIT")
+    except Exception as e:
+      try:
+        if connection.in_transaction:
+          connection.execute("ROLLBACK")
+      except sqlite3.Error:
+        pass
+
+      # Every job of the batch is failed, including the ones not yet started when e.g. 'BEGIN' failed
+      for _, future, _ in batch:
+        if not future.done() and (future.running() or future.set_running_or_notify_cancel()):
+          future.set_exception(e)
+      return
+
+    for (_, future, _), result in zip(batch, results):
+      if result is None:
+        continue
+      if result[0]:
+        future.set_result(result[1])
+      else:
+        future.set_exception(result[1])
+
+
+class SQLiteConnection(DatabaseConnection):
+  """Connection to a SQLite database file that can be shared between threads
+
+  The reads are run on a bounded pool of connections, each of which keeps its own cache of prepared statements. All
+  of the writes go through a single writer thread, which commits the writes queued at the same time in one transaction.
+  A write method returns once its transaction has been committed, so the written rows are visible to subsequent reads.
+  Several statements that must be committed or rolled back together are run as a single job with 'write'.
+  """
+
+  def __init__(self, database: Union[str, Path], user: Optional[str] = None, password: Optional[str] = None,
+               timeout: float = 30., pragmas: Optional[Dict[str, Union[str, int]]] = None, cached_statements: int = 256,
+               pool_size: int = 4, max_write_batch: int = 64) -> None:
+    """Constructor method
+
+    The compiled statements are cached by 'sqlite3' on their SQL text, so repeated queries with parameters are only
+    prepared once per connection. Note that an in-memory database (':memory:') is shared between the connections
+    with the shared cache, in which case the reads are not isolated from the writes in progress.
+
+    @param database           The path to the database file or ':memory:' for an in-memory database
+    @param user               Not used by SQLite. Optional, defaults to None
+    @param password           Not used by SQLite. Optional, defaults to None
+    @param timeout            The number of seconds to wait for a lock held by another process. Optional, defaults to 30
+    @param pragmas            Pragmas overriding or adding to the defaults. Optional, defaults to None i.e. WAL mode with
+                              normal synchronization, a 64 MB page cache and 256 MB of memory-mapped I/O
+    @param cached_statements  The number of prepared statements cached per connection. Optional, defaults to 256
+    @param pool_size          The maximum number of read connections. Optional, defaults to 4
+    @param max_write_batch    The maximum number of queued writes committed in one transaction. Optional, defaults to 64
+    @raises AssertionError    Raised if the pool size or the write batch size is not positive
+    @return                   None
+    """
+    assert max_write_batch > 0, f"The maximum write batch size must be positive! ({max_write_batch} <= 0)"
+
+    self.__database          = str(database)
+    self.__timeout           = timeout
+    self.__cached_statements = cached_statements
+    self.__max_write_batch   = max_write_batch
+    self.__pragmas = {**_default_pragmas, "busy_timeout": int(1000 * timeout), **(pragmas if pragmas is not None else {})}
+
+    # Separate connections only see the same in-memory database through the shared cache
+    self.__uri = f"file:quantform-{uuid.uuid4().hex}?mode=memory&cache=shared" if self.__database == ":memory:" else None
+
+    self.__lock   = threading.Lock()
+    self.__pool   = ConnectionPool(lambda: self.__connect(reader=True), pool_size)
+    self.__pid    = os.getpid()
+    self.__writer = _Writer(self.__connect, max_write_batch)
+
+
+  def __connect(self, reader: bool = False) -> sqlite3.Connection:
+    """Method for opening a new connection with the pragmas set
+
+    @param reader  Boolean flag specifying if the connection is only used for reading. Optional, defaults to False
+    @return        The connection
+    """
+    # The transactions are controlled explicitly, so the implicit ones of the module are turned off
+    connection = sqlite3.connect(self.__uri or self.__database, timeout=self.__timeout, isolation_level=None,
+                                 check_same_thread=False, cached_statements=self.__cached_statements, uri=self.__uri is not None)
+
+    for name, value in self.__pragmas.items():
+      connection.execute(f"PRAGMA {name} = {value}")
+
+    if reader:
+      connection.execute("PRAGMA query_only = ON")
+      if self.__uri is not None:
+        connection.execute("PRAGMA read_uncommitted = ON")
+
+    return connection
+
+
+  def __enter__(self) -> "SQLiteConnection":
+    return self
+
+
+  def __exit__(self, *args) -> None:
+    self.close()
+
+
+  def __str__(self) -> str:
+    return f"SQLiteConnection({self.__database})"
+
+
+  def __repr__(self) -> str:
+    return f"SQLite Connection\nDatabase: {self.__database}\nPragmas: {self.__pragmas}\nPool: {self.__pool}"
+
+
+  @property
+  def database(self) -> str:
+    return self.__database
+
+
+  @property
+  def pool(self) -> ConnectionPool:
+    return self.__pool
+
+
+  def close(self) -> None:
+    """Method for finishing the queued writes and closing the connections
+
+    @return  None
+    """
+    self.__writer.close()
+    self.__pool.close()
+
+
+  @contextmanager
+  def acquire(self) -> Iterator[sqlite3.Connection]:
+    """Context manager for borrowing a read-only connection from the pool e.g. for custom reads
+
+    @return  The connection, which is returned to the pool when the context exits
+    """
+    with self.__pool.acquire() as connection:
+      yield connection
+
+
+  def write(self, job: Callable[[sqlite3.Connection], any], wait: bool = True) -> Union[any, Future]:
+    """Method for running a custom write on the writer connection
+
+    The job is run inside a transaction (and a savepoint of its own), which it must not commit or roll back.
+
+    @param job   Function that is called with the writer connection
+    @param wait  Boolean flag specifying if the call waits for the commit. Optional, defaults to True
+    @return      The return value of the job, or a future resolving to it once committed if not waiting
+    """
+    future = self.__submit(job)
+    return future.result() if wait else future
+
+
+  def __submit(self, job: Callable[[sqlite3.Connection], any], transactional: bool = True) -> Future:
+    """Method for queueing a job to the writer, which is restarted if the object is used in a forked process"""
+    if self.__pid != os.getpid():
+      with self.__lock:
+        if self.__pid != os.getpid():
+          self.__pid, self.__writer = os.getpid(), _Writer(self.__connect, self.__max_write_batch)
+
+    return self.__writer.submit(job, transactional)
+
+
+  def __call__(self, query: str, params: Optional[Union[Sequence, Dict]] = None) -> None:
+    """Call method for running generic writes e.g. creating tables or indexes
+
+    @param query   The query. Without parameters it may consist of several statements separated by semicolons, which
+                   are run outside of a transaction
+    @param params  The parameters bound to the placeholders of a single statement. Optional, defaults to None
+    @return        None
+    """
+    if params is None:
+      self.__submit(lambda connection: connection.executescript(query), transactional=False).result()
+    else:
+      self.__submit(lambda connection: connection.execute(query, params)).result()
+
+
+  def table_exists(self, schema: str, table: str) -> bool:
+    """Method for checking if a table exists
+
+    @param schema  The schema i.e. the name of the database the table is in ('main' for the opened database)
+    @param table   The name of the table
+    @return        True if the table exists
+    """
+    query = f"SELECT 1 FROM {_quote(schema)}.sqlite_master WHERE type = 'table' AND name = ?"
+
+    with self.__pool.acquire() as connection:
+      return connection.execute(query, (table,)).fetchone() is not None
+
+
+  def create_table(self, schema: str, table: str, df: pd.DataFrame, primary_key: Optional[Sequence[str]] = None) -> None:
+    """Method for creating a table with columns matching those of a data frame
+
+    @param schema       The schema i.e. the name of the database the table is in ('main' for the opened database)
+    @param table        The name of the table
+    @param df           The data frame whose column names and types are used
+    @param primary_key  The columns forming the primary key. Optional, defaults to None i.e. no primary key
+    @return             None
+    """
+    self.write(lambda connection: connection.execute(_create_table_query(schema, table, df, primary_key)))
+
+
+  def insert_sql(self, schema: str, table: str, df: pd.DataFrame, chunksize: int = 500_000,
+                 on_conflict: Optional[Literal["REPLACE", "IGNORE"]] = None) -> int:
+    """Method for inserting the rows of a data frame into a table
+
+    The table is created if it doesn't exist. The rows are converted one chunk at a time and inserted with a single
+    prepared statement inside one transaction, so either all or none of the rows are inserted.
+
+    @param schema           The schema i.e. the name of the database the table is in ('main' for the opened database)
+    @param table            The name of the table
+    @param df               The rows to be inserted. The column names must match those of the table
+    @param chunksize        The number of rows converted at a time. Optional, defaults to 500 000
+    @param on_conflict      The conflict resolution for rows violating a uniqueness constraint. Optional, defaults to None
+                            i.e. the insert fails
+    @raises AssertionError  Raised if the chunk size is not positive or an invalid conflict resolution is specified
+    @return                 The number of inserted rows
+    """
+    assert chunksize > 0, f"The chunk size must be positive! ({chunksize} <= 0)"
+    assert on_conflict in [None, "REPLACE", "IGNORE"], f"Invalid conflict resolution specified! ('{on_conflict}' not in [None, 'REPLACE', 'IGNORE'])"
+
+    verb  = "INSERT" if on_conflict is None else f"INSERT OR {on_conflict}"
+    query = f"{verb} INTO {_quote(schema)}.{_quote(table)} ({', '.join(_quote(name) for name in df.columns)}) " \
+            f"VALUES ({', '.join(['?'] * len(df.columns))})"
+
+    def insert(connection: sqlite3.Connection) -> int:
+      connection.execute(_create_table_query(schema, table, df))
+
+      for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start:start + chunksize]
+        connection.executemany(query, zip(*[_to_sqlite(chunk[name]) for name in chunk.columns]))
+
+      return len(df)
+
+    return self.write(insert)
+
+
+  def delete_sql(self, query: str, params: Optional[Union[Sequence, Dict]] = None) -> int:
+    """Method for running a delete (or update) query in a transaction
+
+    @param query   The query
+    @param params  The parameters bound to the placeholders of the query. Optional, defaults to None
+    @return        The number of affected rows
+    """
+    return self.write(lambda connection: connection.execute(query, params if params is not None else ()).rowcount)
+
+
+  def select_sql(self, query: str, params: Optional[Union[Sequence, Dict]] = None,
+                 parse_dates: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Method for running a select query into a data frame
+
+    @param query        The query
+    @param params       The parameters bound to the placeholders of the query. Optional, defaults to None
+    @param parse_dates  The columns holding timestamps, which are converted from nanoseconds since the epoch. Optional,
+                        defaults to None
+    @return             The result with the column names of the query
+    """
+    with self.__pool.acquire() as connection:
+      cursor = connection.execute(query, params if params is not None else ())
+      return _to_frame(cursor.fetchall(), [column[0] for column in cursor.description], parse_dates)
+
+
+  def select_chunks(self, query: str, params: Optional[Union[Sequence, Dict]] = None, chunksize: int = 100_000,
+                    output: Literal["pandas", "numpy"] = "pandas",
+                    parse_dates: Optional[Sequence[str]] = None) -> Iterator[Union[pd.DataFrame, Dict[str, np.ndarray]]]:
+    """Method for streaming the result of a select query in chunks
+
+    Only a single chunk of the result is held in memory at a time. The chunks are read within the same read
+    transaction on a connection borrowed from the pool until the iteration ends. In WAL mode this doesn't block the
+    writer, but it keeps the checkpoints from completing.
+
+    @param query            The query
+    @param params           The parameters bound to the placeholders of the query. Optional, defaults to None
+    @param chunksize        The maximum number of rows in a chunk. Optional, defaults to 100 000
+    @param output           The type of the chunks. Either 'pandas' for data frames or 'numpy' for dictionaries from the
+                            column names to arrays. Optional, defaults to 'pandas'
+    @param parse_dates      The columns holding timestamps, which are converted from nanoseconds since the epoch.
+                            Optional, defaults to None
+    @raises AssertionError  Raised if the chunk size is not positive or an invalid output type is specified
+    @return                 Iterator over the chunks
+    """
+    assert chunksize > 0, f"The chunk size must be positive! ({chunksize} <= 0)"
+    assert output in ["pandas", "numpy"], f"Invalid output type specified! ('{output}' not in ['pandas', 'numpy'])"
+
+    with self.__pool.acquire() as connection:
+      cursor  = connection.execute(query, params if params is not None else ())
+      columns = [column[0] for column in cursor.description]
+
+      try:
+        while rows := cursor.fetchmany(chunksize):
+          frame = _to_frame(rows, columns, parse_dates)
+          yield frame if output == "pandas" else {name: frame[name].to_numpy() for name in columns}
+      finally:
+        cursor.close()
@@ -0,0 +1,355 @@
+"""@package quantform.db.TimeSeriesStore
+@author Kasper Rantamäki
+Submodule with a columnar on-disk store for historical time series
+
+The series are stored as uncompressed NumPy arrays, one file per column, partitioned by instrument and by period.
+Each write of a partition creates a new immutable version of it and then publishes the version by replacing the
+manifest of the partition:
+
+  <root>/<instrument>/<period>/current.json                The current version, its columns and its length
+  <root>/<instrument>/<period>/<version>/index.npy         The timestamps as datetime64[ns], sorted and unique
+  <root>/<instrument>/<period>/<version>/col.<column>.npy  The values of the column
+
+The files are opened as memory maps, so reads only touch the pages of the projected columns and the requested range,
+and a range within a single partition is returned without copying.
+"""
+from typing import Dict, List, Literal, Optional, Sequence, Union
+from urllib.parse import quote, unquote
+from pathlib import Path
+import shutil
+import json
+import uuid
+import os
+import numpy as np
+import pandas as pd
+
+
+# The NumPy datetime units of the partition periods
+_partition_units = {"year": "Y", "month": "M", "day": "D", "none": None}
+
+
+# The dtype kinds that can be memory mapped i.e. booleans, numbers and timestamps
+_mappable_kinds = "biufmM"
+
+
+# The number of times a read is attempted when a version it is reading is removed by a write
+_read_attempts = 5
+
+
+def _name(name: str) -> str:
+  """Function for escaping an instrument or column name into a file name"""
+  return quote(str(name), safe="")
+
+
+def _manifest(partition: Path) -> Optional[dict]:
+  """Function for reading the manifest of a partition, None if no version of it has been published yet"""
+  try:
+    return json.loads((partition / "current.json").read_text())
+  except FileNotFoundError:
+    return None
+
+
+def _timestamps(values: Union[pd.Index, pd.Series, np.ndarray, str, None]) -> Optional[np.ndarray]:
+  """Function for converting timestamps into naive datetime64[ns] in UTC"""
+  if values is None:
+    return None
+
+  values = pd.DatetimeIndex(np.atleast_1d(values)) if not isinstance(values, pd.DatetimeIndex) else values
+  if values.tz is not None:
+    values = values.tz_convert(None)
+
+  return values.to_numpy(dtype="datetime64[ns]")
+
+
+def _values(column: pd.Series) -> np.ndarray:
+  """Function for the values of a column as an array that can be memory mapped, with timestamps as naive
+  datetime64[ns] in UTC"""
+  return _timestamps(pd.DatetimeIndex(column)) if column.dtype.kind == "M" else column.to_numpy()
+
+
+class TimeSeriesStore:
+  """Columnar store for the historical time series of instruments e.g. daily prices
+
+  A write publishes new versions of the affected partitions by atomically replacing their manifests and then removes
+  the old versions. A reader reads each partition from the single version its manifest pointed to, so it never mixes
+  the files of two versions. If the version is removed while it is being read, the read is retried with the new
+  version. There should only be a single writer per instrument at a time.
+  """
+
+  def __init__(self, root: Union[str, Path], partition: Literal["year", "month", "day", "none"] = "none") -> None:
+    """Constructor method
+
+    The partitioning is stored with the data when the store is created. When an existing store is opened the stored
+    partitioning is used.
+
+    @param root             The root directory of the store, which is created if it doesn't exist
+    @param partition        The period of the date partitions. A single partition per instrument ('none') suits daily
+                            data, which is mostly read whole e.g. by 'read_panel', and days suit tick data. Optional,
+                            defaults to 'none'
+    @raises AssertionError  Raised if an invalid partitioning is specified
+    @return                 None
+    """
+    assert partition in _partition_units, f"Invalid partitioning specified! ('{partition}' not in {list(_partition_units)})"
+
+    self.__root = Path(root)
+    self.__root.mkdir(parents=True, exist_ok=True)
+
+    metadata_path = self.__root / "store.json"
+    if metadata_path.exists():
+      partition = json.loads(metadata_path.read_text())["partition"]
+    else:
+      metadata_path.write_text(json.dumps({"partition": partition}))
+
+    self.__partition = partition
+    self.__unit      = _partition_units[partition]
+
+
+  def __str__(self) -> str:
+    return f"TimeSeriesStore({self.__root})"
+
+
+  def __repr__(self) -> str:
+    return f"Time Series Store\nRoot: {self.__root}\nPartition: {self.__partition}\nInstruments: {len(self.instruments)}"
+
+
+  def __contains__(self, instrument: str) -> bool:
+    return (self.__root / _name(instrument)).is_dir()
+
+
+  @property
+  def root(self) -> Path:
+    return self.__root
+
+
+  @property
+  def partition(self) -> str:
+    return self.__partition
+
+
+  @property
+  def instruments(self) -> List[str]:
+    """The stored instruments"""
+    return sorted(unquote(path.name) for path in self.__root.iterdir() if path.is_dir() and not path.name.startswith("."))
+
+
+  def columns(self, instrument: str) -> List[str]:
+    """Method for getting the stored columns of an instrument
+
+    @param instrument  The instrument
+    @return            The column names
+    """
+    columns = set()
+    for partition in self.__partitions(instrument):
+      manifest = _manifest(partition)
+      columns.update(manifest["columns"] if manifest is not None else [])
+
+    return sorted(columns)
+
+
+  def __partitions(self, instrument: str, start: Optional[np.datetime64] = None,
+                   end: Optional[np.datetime64] = None) -> List[Path]:
+    """Method for the partitions of an instrument overlapping the closed range [start, end] in chronological order"""
+    directory = self.__root / _name(instrument)
+    if not directory.is_dir():
+      return []
+
+    partitions = sorted(path for path in directory.iterdir() if path.is_dir() and not path.name.startswith("."))
+
+    if self.__unit is None:
+      return partitions
+
+    def overlaps(path: Path) -> bool:
+      period_start = np.datetime64(path.name, self.__unit)
+      return (start is None or start < period_start + 1) and (end is None or period_start <= end)
+
+    return [path for path in partitions if overlaps(path)]
+
+
+  def __partition_keys(self, index: np.ndarray) -> np.ndarray:
+    """Method for the partition names of the timestamps"""
+    if self.__unit is None:
+      return np.full(len(index), "all")
+
+    return np.datetime_as_string(index.astype(f"datetime64[{self.__unit}]"))
+
+
+  def write(self, instrument: str, df: pd.DataFrame) -> None:
+    """Method for writing the rows of a data frame into the store
+
+    The rows are merged with the stored ones column by column. Where the timestamps coincide the new values replace
+    the stored ones, except for missing (NaN or NaT) new values and columns not written, which keep the stored values.
+    Columns missing from either side are otherwise filled with NaN (or NaT). Only the partitions the rows fall into are
+    rewritten.
+
+    @param instrument       The instrument
+    @param df               The rows with the timestamps as a DatetimeIndex. The columns must be boolean, numeric or
+                            timestamps. Timezone aware timestamps are stored as naive timestamps in UTC
+    @raises AssertionError  Raised if the index is not a DatetimeIndex or a column cannot be memory mapped
+    @return                 None
+    """
+    assert isinstance(df.index, pd.DatetimeIndex), f"The index must be a DatetimeIndex! ({type(df.index).__name__})"
+    for name, dtype in df.dtypes.items():
+      assert dtype.kind in _mappable_kinds, f"Column '{name}' cannot be memory mapped! (dtype {dtype})"
+
+    if len(df) == 0:
+      return
+
+    index = _timestamps(df.index)
+    keys  = self.__partition_keys(index)
+
+    for key in np.unique(keys):
+      rows = keys == key
+      new  = pd.DataFrame({name: _values(df[name])[rows] for name in df.columns}, index=index[rows])
+      new  = new[~new.index.duplicated(keep="last")]
+
+      path     = self.__root / _name(instrument) / key
+      manifest = _manifest(path)
+      if manifest is not None:
+        old = self.__read_partitions([path], None, None, manifest["columns"])
+        old = pd.DataFrame({name: np.array(values) for name, values in old.items() if name != "index"}, index=old["index"])
+        # Only the stored rows overlapping the new ones are merged, so the other rows keep their dtypes as they are
+        overlap = old.index.isin(new.index)
+        columns = list(old.columns) + [name for name in new.columns if name not in old.columns]
+        new     = pd.concat([old[~overlap], new.combine_first(old[overlap])]).sort_index()[columns]
+      else:
+        new = new.sort_index()
+
+      self.__write_partition(path, new)
+
+
+  @staticmethod
+  def __write_partition(path: Path, df: pd.DataFrame) -> None:
+    """Method for writing a new version of a partition and publishing it by replacing the manifest"""
+    version = uuid.uuid4().hex
+    (path / version).mkdir(parents=True)
+
+    np.save(path / version / "index.npy", df.index.to_numpy(dtype="datetime64[ns]"))
+    for name in df.columns:
+      np.save(path / version / f"col.{_name(name)}.npy", df[name].to_numpy())
+
+    staging = path / f".current.{version}.json"
+    staging.write_text(json.dumps({"version": version, "columns": [str(name) for name in df.columns], "rows": len(df)}))
+    os.replace(staging, path / "current.json")
+
+    # Readers holding memory maps of the old files keep them alive until they are released. The versions left behind
+    # by failed writes are removed as well
+    for old in path.iterdir():
+      if old.is_dir() and old.name != version:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+  def read_arrays(self, instrument: str, start: Optional[Union[str, pd.Timestamp]] = None,
+                  end: Optional[Union[str, pd.Timestamp]] = None, columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+    """Method for reading a range of the series of an instrument as arrays
+
+    The arrays of a range within a single partition are read-only views of the memory-mapped files, so no data is
+    copied or read from the disk until it is accessed. Ranges spanning several partitions are concatenated.
+
+    @param instrument  The instrument
+    @param start       The first included timestamp. Optional, defaults to None i.e. from the start of the series
+    @param end         The last included timestamp. Optional, defaults to None i.e. until the end of the series
+    @param columns     The projected columns. Optional, defaults to None i.e. all of the columns
+    @return            Dictionary with the timestamps ('index') and the projected columns. Columns missing from a
+                       partition are filled with NaN (or NaT)
+    """
+    start, end = (value[0] if value is not None else None for value in (_timestamps(start), _timestamps(end)))
+    columns    = list(columns) if columns is not None else self.columns(instrument)
+    partitions = self.__partitions(instrument, start, end)
+
+    for attempt in range(_read_attempts):
+      try:
+        return self.__read_partitions(partitions, start, end, columns)
+      except FileNotFoundError:
+        if attempt == _read_attempts - 1:
+          raise
+
+
+  @staticmethod
+  def __read_partitions(partitions: List[Path], start: Optional[np.datetime64], end: Optional[np.datetime64],
+                        columns: List[str]) -> Dict[str, np.ndarray]:
+    """Method for reading the closed range [start, end] of the columns from the current versions of the partitions
+
+    @raises FileNotFoundError  Raised if a version is removed by a write while it is being read
+    """
+    parts = []
+    for partition in partitions:
+      manifest = _manifest(partition)
+      if manifest is None:
+        continue
+
+      version = partition / manifest["version"]
+      index   = np.load(version / "index.npy", mmap_mode="r")
+
+      first = np.searchsorted(index, start, "left") if start is not None else 0
+      last  = np.searchsorted(index, end, "right") if end is not None else len(index)
+      if first >= last:
+        continue
+
+      part = {"index": index[first:last]}
+      for name in columns:
+        part[name] = np.load(version / f"col.{_name(name)}.npy", mmap_mode="r")[first:last] if str(name) in manifest["columns"] else None
+
+      parts.append(part)
+
+    if len(parts) == 1 and all(values is not None for values in parts[0].values()):
+      return parts[0]
+
+    if not parts:
+      return {"index": np.zeros(0, dtype="datetime64[ns]"), **{name: np.zeros(0) for name in columns}}
+
+    result = {"index": np.concatenate([part["index"] for part in parts])}
+    for name in columns:
+      # Missing timestamps are filled with NaT and other missing values with NaN
+      is_time = any(part[name] is not None and part[name].dtype.kind == "M" for part in parts)
+      missing = np.datetime64("NaT", "ns") if is_time else np.nan
+
+      result[name] = np.concatenate([part[name] if part[name] is not None else np.full(len(part["index"]), missing)
+                                     for part in parts])
+
+    return result
+
+
+  def read(self, instrument: str, start: Optional[Union[str, pd.Timestamp]] = None,
+           end: Optional[Union[str, pd.Timestamp]] = None, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Method for reading a range of the series of an instrument as a data frame
+
+    @param instrument  The instrument
+    @param start       The first included timestamp. Optional, defaults to None i.e. from the start of the series
+    @param end         The last included timestamp. Optional, defaults to None i.e. until the end of the series
+    @param columns     The projected columns. Optional, defaults to None i.e. all of the columns
+    @return            The rows with the timestamps as the index
+    """
+    arrays = self.read_arrays(instrument, start, end, columns)
+    index  = pd.DatetimeIndex(arrays.pop("index"))
+
+    return pd.DataFrame(arrays, index=index, copy=False)
+
+
+  def read_panel(self, instruments: Sequence[str], column: str, start: Optional[Union[str, pd.Timestamp]] = None,
+                 end: Optional[Union[str, pd.Timestamp]] = None) -> pd.DataFrame:
+    """Method for reading a single column of several instruments side by side e.g. the closing prices for 'VaR'
+
+    @param instruments  The instruments
+    @param column       The column
+    @param start        The first included timestamp. Optional, defaults to None i.e. from the start of the series
+    @param end          The last included timestamp. Optional, defaults to None i.e. until the end of the series
+    @return             The values with the timestamps as the index and the instruments as the columns. The timestamps
+                        are the union over the instruments with the missing values filled with NaN
+    """
+    arrays = [self.read_arrays(instrument, start, end, [column]) for instrument in instruments]
+    index  = np.unique(np.concatenate([values["index"] for values in arrays])) if arrays else np.zeros(0, dtype="datetime64[ns]")
+
+    panel = np.full((len(index), len(arrays)), np.nan)
+    for i, values in enumerate(arrays):
+      panel[np.searchsorted(index, values["index"]), i] = values[column]
+
+    return pd.DataFrame(panel, index=pd.DatetimeIndex(index), columns=list(instruments))
+
+
+  def delete(self, instrument: str) -> None:
+    """Method for deleting all of the series of an instrument
+
+    @param instrument  The instrument
+    @return            None
+    """
+    shutil.rmtree(self.__root / _name(instrument), ignore_errors=True)
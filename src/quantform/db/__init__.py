@@ -3,12 +3,18 @@
 Module for database connections
 
 The module implements a DatabaseConnection abstract base class and a SQLiteConnection class which provides useful
-methods for database operators using the 'sqlite3' Python library.
+methods for database operators using the 'sqlite3' Python library. The connections of the backends are shared
+between threads with a ConnectionPool. Historical time series are stored as memory-mapped columns with the
+TimeSeriesStore. Repeated select queries can be served from memory by wrapping a connection with a
+CachedConnection.
 """
 
 
-__all__ = ["DatabaseConnection", "SQLiteConnection"]
+__all__ = ["DatabaseConnection", "ConnectionPool", "SQLiteConnection", "TimeSeriesStore", "QueryCache", "CachedConnection"]
 
 
 from .DatabaseConnection import DatabaseConnection
+from .ConnectionPool import ConnectionPool
 from .SQLiteConnection import SQLiteConnection
+from .TimeSeriesStore import TimeSeriesStore
+from .CachedConnection import QueryCache, CachedConnection
@@ -3,24 +3,43 @@
 Module for QuantForm date class
 """
 from __future__ import annotations
-from typing import Literal, Callable
+from typing import Literal, Callable, Dict, Optional, Tuple
+from datetime import date
+from collections import OrderedDict
+from threading import Lock
 from math import ceil
-import QuantLib as ql
 
+from .lazy import lazy_import
 
-__all__ = ["QfDate", "comparable"]
+ql = lazy_import("QuantLib")
 
 
-# Map from the name of the calendar to the ql.Calendar object
+__all__ = ["QfDate", "comparable", "year_fraction_cache_info", "clear_year_fraction_cache", "set_year_fraction_cache_size"]
+
+
+# Map from the name of the calendar to a function forming the ql.Calendar object. The calendars (and QuantLib itself)
+# are only loaded when a date first needs one
 _calendar_map = {
-  "Eurex":     ql.Germany(ql.Germany.Eurex),
-  "Frankfurt": ql.Germany(ql.Germany.FrankfurtStockExchange),
-  "Xetra":     ql.Germany(ql.Germany.Xetra),
-  "London":    ql.UnitedKingdom(ql.UnitedKingdom.Exchange),
-  "NYSE":      ql.UnitedStates(ql.UnitedStates.NYSE)
+  "Eurex":     lambda: ql.Germany(ql.Germany.Eurex),
+  "Frankfurt": lambda: ql.Germany(ql.Germany.FrankfurtStockExchange),
+  "Xetra":     lambda: ql.Germany(ql.Germany.Xetra),
+  "London":    lambda: ql.UnitedKingdom(ql.UnitedKingdom.Exchange),
+  "NYSE":      lambda: ql.UnitedStates(ql.UnitedStates.NYSE)
 }
 
 
+# The ql.Calendar objects formed so far
+_calendars = {}
+
+
+def _calendar(name: str) -> ql.Calendar:
+  """Function for getting the ql.Calendar object by its name. The object is formed on the first call"""
+  if name not in _calendars:
+    _calendars[name] = _calendar_map[name]()
+
+  return _calendars[name]
+
+
 # Map from the convention name to the function for calculating the time delta
 _convention_map = {
   "30/360": lambda end, start: (360 * (end.year - start.year) + 30 * (end.month - start.month) + (end.day - start.day)) / 360,
@@ -30,6 +49,17 @@ _convention_map = {
 }
 
 
+# The calendars and conventions are interned as their indexes in these lists
+_calendar_names   = list(_calendar_map.keys())
+_calendar_ids     = {name: i for i, name in enumerate(_calendar_names)}
+_convention_names = list(_convention_map.keys())
+_convention_ids   = {name: i for i, name in enumerate(_convention_names)}
+
+
+# The difference between the proleptic Gregorian ordinal of a date and its serial number (the ordinal of 1899-12-30)
+_serial_offset = date(1899, 12, 30).toordinal()
+
+
 # Map from the convention name to the number of days in the year
 _day_count_map = {
   "30/360": 360,
@@ -39,6 +69,52 @@ _day_count_map = {
 }
 
 
+# Bounded LRU cache from (calendar, convention, start serial number, end serial number) to the year fraction. Counting
+# business days walks the calendar one day at a time, so e.g. valuing thousands of contracts against the same report
+# date should pay for each distinct maturity only once
+_year_fraction_cache      = OrderedDict()
+_year_fraction_cache_size = 100_000
+_year_fraction_cache_lock = Lock()
+_year_fraction_cache_info = {"hits": 0, "misses": 0}
+
+
+def year_fraction_cache_info() -> Dict[str, int]:
+  """Function for getting the statistics of the year fraction cache
+
+  @return  Dictionary with the number of cache hits ('hits') and misses ('misses'), the number of cached year fractions
+           ('size') and the maximum number of cached year fractions ('maxsize')
+  """
+  with _year_fraction_cache_lock:
+    return {**_year_fraction_cache_info, "size": len(_year_fraction_cache), "maxsize": _year_fraction_cache_size}
+
+
+def clear_year_fraction_cache() -> None:
+  """Function for emptying the year fraction cache and resetting its statistics
+
+  @return  None
+  """
+  with _year_fraction_cache_lock:
+    _year_fraction_cache.clear()
+    _year_fraction_cache_info.update(hits=0, misses=0)
+
+
+def set_year_fraction_cache_size(maxsize: int) -> None:
+  """Function for setting the maximum number of cached year fractions. The least recently used ones are dropped if needed
+
+  @param maxsize          The maximum number of cached year fractions. Zero disables the cache
+  @raises AssertionError  Raised if the size is negative
+  @return                 None
+  """
+  global _year_fraction_cache_size
+  assert maxsize >= 0, f"The cache size must be non-negative! ({maxsize} < 0)"
+
+  with _year_fraction_cache_lock:
+    _year_fraction_cache_size = maxsize
+
+    while len(_year_fraction_cache) > maxsize:
+      _year_fraction_cache.popitem(last=False)
+
+
 def comparable(func: Callable[[QfDate, QfDate], any]) -> Callable:
   """Decorator that asserts that two QfDate instances are comparable i.e. share the calendar and day count convention
   
@@ -57,7 +133,15 @@ def comparable(func: Callable[[QfDate, QfDate], any]) -> Callable:
 
 
 class QfDate:
-  """QuantForm dateclass. Works as a wrapper for the QuantLib date object"""
+  """QuantForm dateclass. Works as a wrapper for the QuantLib date object
+
+  The dates are compact immutable value types: each instance stores only its serial number (the days since 1899-12-30,
+  as with QuantLib) and small integer indexes for the interned calendar and day count convention. Ordering and hashing
+  work on the serial number and the QuantLib date object is only formed when a calendar query needs it.
+  """
+
+  __slots__ = ("__serial_number", "__calendar_id", "__convention_id", "__ql_date")
+
 
   def __init__(self, year: int, month: int, day: int, calendar: Literal["Eurex", "Frankfurt", "Xetra", "London", "NYSE"] = "Frankfurt", 
                convention: Literal["30/360", "ACT/365", "ACT/360", "Business/252"] = "Business/252") -> None:
@@ -65,33 +149,96 @@ class QfDate:
     TODO
     """
     
-    assert calendar in list(_calendar_map.keys()), f"Invalid calendar given! ({calendar} not in {list(_calendar_map.keys())})"
-    assert convention in list(_convention_map.keys()), f"Invalid day count convention given! ({convention} not in {list(_convention_map.keys())})"
-    
-    self.__year            = year
-    self.__month           = month
-    self.__day             = day
-    self.__calendar_name   = calendar
-    self.__calendar        = _calendar_map[calendar]
-    self.__convention_name = convention
-    self.__convention      = _convention_map[convention]
-    self.__ql_date         = ql.Date(day, month, year)
-    self.__serial_number   = self.__ql_date.serialNumber()
+    assert calendar in _calendar_ids, f"Invalid calendar given! ({calendar} not in {_calendar_names})"
+    assert convention in _convention_ids, f"Invalid day count convention given! ({convention} not in {_convention_names})"
+
+    QfDate.__initialize(self, date(year, month, day).toordinal() - _serial_offset, _calendar_ids[calendar], _convention_ids[convention])
+
+
+  @classmethod
+  def from_serial_number(cls, serial_number: int, calendar: Literal["Eurex", "Frankfurt", "Xetra", "London", "NYSE"] = "Frankfurt",
+                         convention: Literal["30/360", "ACT/365", "ACT/360", "Business/252"] = "Business/252") -> QfDate:
+    """Method for forming a date from its serial number (the days since 1899-12-30, as with QuantLib and Excel)
+
+    @param serial_number    The serial number of the date
+    @param calendar         The name of the calendar. Optional, defaults to 'Frankfurt'
+    @param convention       The day count convention. Optional, defaults to 'Business/252'
+    @raises AssertionError  Raised if an invalid calendar or convention is given
+    @return                 The date
+    """
+    assert calendar in _calendar_ids, f"Invalid calendar given! ({calendar} not in {_calendar_names})"
+    assert convention in _convention_ids, f"Invalid day count convention given! ({convention} not in {_convention_names})"
+
+    return QfDate.__from_ids(int(serial_number), _calendar_ids[calendar], _convention_ids[convention])
+
+
+  @staticmethod
+  def __initialize(this: QfDate, serial_number: int, calendar_id: int, convention_id: int) -> None:
+    """Method that sets the slots of a new date, bypassing the immutability"""
+    object.__setattr__(this, "_QfDate__serial_number", serial_number)
+    object.__setattr__(this, "_QfDate__calendar_id", calendar_id)
+    object.__setattr__(this, "_QfDate__convention_id", convention_id)
+    object.__setattr__(this, "_QfDate__ql_date", None)
+
+
+  @staticmethod
+  def __from_ids(serial_number: int, calendar_id: int, convention_id: int) -> QfDate:
+    """Method that forms a date from the serial number and the interned calendar and convention without validation"""
+    new_date = object.__new__(QfDate)
+    QfDate.__initialize(new_date, serial_number, calendar_id, convention_id)
+
+    return new_date
+
+
+  def __shifted(self, serial_number: int) -> QfDate:
+    """Method that forms a date with the given serial number and the calendar and convention of this date"""
+    return QfDate.__from_ids(serial_number, self.__calendar_id, self.__convention_id)
+
+
+  def __setattr__(self, name: str, value: any) -> None:
+    raise AttributeError("QfDate objects are immutable!")
+
+
+  def __delattr__(self, name: str) -> None:
+    raise AttributeError("QfDate objects are immutable!")
+
+
+  def __reduce__(self) -> Tuple[Callable, Tuple[int, str, str]]:
+    """Pickles the date as its serial number, calendar and convention"""
+    return (QfDate.from_serial_number, (self.__serial_number, self.calendar, self.convention))
+
+
+  def __date(self) -> date:
+    """The date as a standard library date object"""
+    return date.fromordinal(self.__serial_number + _serial_offset)
+
+
+  def __ql(self) -> ql.Date:
+    """The QuantLib date object, which is formed on the first call"""
+    if self.__ql_date is None:
+      object.__setattr__(self, "_QfDate__ql_date", ql.Date(self.__serial_number))
+
+    return self.__ql_date
+
+
+  def __check(self, other: QfDate) -> None:
+    """Method that asserts that the dates are comparable i.e. share the calendar and day count convention"""
+    assert self.__convention_id == other.__convention_id, f"The conventions must match! ({self.convention} != {other.convention})"
+    assert self.__calendar_id == other.__calendar_id, f"The calendars must match! ({self.calendar} != {other.calendar})"
     
     
   def __str__(self) -> str:
-    return f"{self.__year}-{self.__month:02}-{self.__day:02}"
+    return self.__date().isoformat()
   
   
   def __repr__(self) -> str:
-    return f"Date: {self}\nConvention: {self.__convention_name}\nCalendar: {self.__calendar_name}"
+    return f"Date: {self}\nConvention: {self.convention}\nCalendar: {self.calendar}"
 
 
-  def __hash__(self) -> str:
-    return hash(repr(self))
+  def __hash__(self) -> int:
+    return hash((self.__serial_number, self.__calendar_id, self.__convention_id))
 
 
-  # Adding and subtracting return a new date object where the day has been changed by the given amount (under a given day count convention)
   def __add__(self, num: int) -> QfDate:
     """
     TODO
@@ -99,10 +246,9 @@ class QfDate:
     
     # The given parameter num is assumed to hold for the prevailing convention. Thus, for example under Business/252 convention if num
     # is 252 the calculated date should be a full year (365 days) in the future under normal day count convention.
-    normalised_num = ceil(num * (365. / _day_count_map[self.__convention_name]))
-    new_ql_date = ql.Date(self.__serial_number + normalised_num)
+    normalised_num = ceil(num * (365. / _day_count_map[self.convention]))
     
-    return QfDate(new_ql_date.year(), new_ql_date.month(), new_ql_date.dayOfMonth(), calendar=self.__calendar_name, convention=self.__convention_name)
+    return self.__shifted(self.__serial_number + normalised_num)
   
   
   def __sub__(self, num: int) -> QfDate:
@@ -118,74 +264,80 @@ class QfDate:
     """
     TODO
     """
-    return self + num * _day_count_map[self.__convention_name]
+    return self + num * _day_count_map[self.convention]
   
   
   def __div__(self, num: float) -> QfDate:
     """
     TODO
     """
-    return self - num * _day_count_map[self.__convention_name]
+    return self - num * _day_count_map[self.convention]
   
   
-  @comparable
   def __eq__(self, other: QfDate) -> bool:
-    return (self.year == other.year) and (self.month == other.month) and (self.day == other.day)
+    if not isinstance(other, QfDate):
+      return NotImplemented
+
+    self.__check(other)
+    return self.__serial_number == other.__serial_number
   
   
-  @comparable
   def __gt__(self, other: QfDate) -> bool:
-    return ((self.year == other.year) and (self.month == other.month) and (self.day > other.day)) or \
-           ((self.year == other.year) and (self.month > other.month)) or \
-           (self.year > other.year)
+    self.__check(other)
+    return self.__serial_number > other.__serial_number
   
   
-  @comparable
   def __lt__(self, other: QfDate) -> bool:
-    return not (self >= other)
+    self.__check(other)
+    return self.__serial_number < other.__serial_number
   
   
-  @comparable
   def __ge__(self, other: QfDate) -> bool:
-    return (self > other) or (self == other)
+    self.__check(other)
+    return self.__serial_number >= other.__serial_number
   
   
-  @comparable
   def __le__(self, other: QfDate) -> bool:
-    return (self < other) or (self == other)
+    self.__check(other)
+    return self.__serial_number <= other.__serial_number
   
   
   @property
   def year(self) -> int:
-    return self.__year
+    return self.__date().year
   
   
   @property
   def month(self) -> int:
-    return self.__month
+    return self.__date().month
   
   
   @property
   def day(self) -> int:
-    return self.__day
+    return self.__date().day
   
   
   @property
   def calendar(self) -> str:
-    return self.__calendar_name
+    return _calendar_names[self.__calendar_id]
   
   
   @property
   def convention(self) -> str:
-    return self.__convention_name
+    return _convention_names[self.__convention_id]
+
+
+  @property
+  def serial_number(self) -> int:
+    """The serial number of the date i.e. the days since 1899-12-30 (as with QuantLib and Excel)"""
+    return self.__serial_number
   
   
   def date_shift(self, num: int) -> QfDate:
     """
     TODO
     """
-    new_ql_date = ql.Date(self.__serial_number + num)
-    return QfDate(new_ql_date.year(), new_ql_date.month(), new_ql_date.dayOfMonth(), calendar=self.__calendar_name, convention=self.__convention_name)
+    return self.__shifted(self.__serial_number + num)
   
   
   @comparable
@@ -195,9 +347,9 @@ class QfDate:
     """
     
     if self > other_date:
-      return -self.__convention(self, other_date)
+      return -QfDate.__year_fraction(other_date, self, self.convention)
     
-    return self.__convention(other_date, self)
+    return QfDate.__year_fraction(self, other_date, self.convention)
   
 
   def convention_delta(self, other_date: QfDate,
@@ -208,11 +360,37 @@ class QfDate:
     assert convention in _convention_map, f"Invalid day count convention specified! ({convention} not in ['30/360', 'ACT/365', 'ACT/360', 'Business/252'])"
 
     if self > other_date:
-      return -_convention_map[convention](self, other_date)
+      return -QfDate.__year_fraction(other_date, self, convention)
     
-    return _convention_map[convention](other_date, self)
+    return QfDate.__year_fraction(self, other_date, convention)
   
   
+  @staticmethod
+  def __year_fraction(start: QfDate, end: QfDate, convention: str) -> float:
+    """Method that calculates the year fraction from 'start' to 'end' under the given convention through the cache"""
+    key = (start.__calendar_id, convention, start.__serial_number, end.__serial_number)
+
+    with _year_fraction_cache_lock:
+      if key in _year_fraction_cache:
+        _year_fraction_cache.move_to_end(key)
+        _year_fraction_cache_info["hits"] += 1
+        return _year_fraction_cache[key]
+
+      _year_fraction_cache_info["misses"] += 1
+
+    # Computed outside of the lock as walking the business days can take a while
+    year_fraction = _convention_map[convention](end, start)
+
+    with _year_fraction_cache_lock:
+      if _year_fraction_cache_size > 0:
+        _year_fraction_cache[key] = year_fraction
+
+        if len(_year_fraction_cache) > _year_fraction_cache_size:
+          _year_fraction_cache.popitem(last=False)
+
+    return year_fraction
+
+
   @comparable
   def days_until(self, other_date: QfDate) -> int:
     """
@@ -238,18 +416,10 @@ class QfDate:
     """
     assert self <= other_date, f"The given date cannot be less than the instance date! ({self} < {other_date})"
     
-    prod_day_count = 0
-    
-    if self.is_prod_date():
-      prod_day_count += 1
-      
-    date = self.next_prod_date()
-    
-    while date < other_date:
-      prod_day_count += 1
-      date = date.next_prod_date()
-      
-    return prod_day_count
+    if self == other_date:
+      return int(self.is_prod_date())
+
+    return _calendar(self.calendar).businessDaysBetween(self.__ql(), other_date.__ql(), True, False)
   
 
   @comparable
@@ -265,7 +435,7 @@ class QfDate:
     """
     TODO
     """
-    return self.__calendar.isBusinessDay(self.__ql_date)
+    return _calendar(self.calendar).isBusinessDay(self.__ql())
   
   
   def next_prod_date(self) -> QfDate:
@@ -297,16 +467,16 @@ class QfDate:
     TODO
     """
     if self.month == 12:
-      return QfDate(self.year + 1, 1, 1, calendar=self.__calendar_name, convention=self.__convention_name)
+      return QfDate(self.year + 1, 1, 1, calendar=self.calendar, convention=self.convention)
     
-    return QfDate(self.year, self.month + 1, 1, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year, self.month + 1, 1, calendar=self.calendar, convention=self.convention)
   
   
   def this_month_start(self) -> QfDate:
     """
     TODO
     """
-    return QfDate(self.year, self.month, 1, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year, self.month, 1, calendar=self.calendar, convention=self.convention)
   
   
   def prev_month_start(self) -> QfDate:
@@ -314,30 +484,30 @@ class QfDate:
     TODO
     """
     if self.month == 1:
-      return QfDate(self.year - 1, 12, 1, calendar=self.__calendar_name, convention=self.__convention_name)
+      return QfDate(self.year - 1, 12, 1, calendar=self.calendar, convention=self.convention)
     
-    return QfDate(self.year, self.month - 1, 1, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year, self.month - 1, 1, calendar=self.calendar, convention=self.convention)
   
   
   def next_year_start(self) -> QfDate:
     """
     TODO
     """
-    return QfDate(self.year + 1, 1, 1, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year + 1, 1, 1, calendar=self.calendar, convention=self.convention)
   
   
   def this_year_start(self) -> QfDate:
     """
     TODO
     """
-    return QfDate(self.year, 1, 1, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year, 1, 1, calendar=self.calendar, convention=self.convention)
   
   
   def prev_year_start(self) -> QfDate:
     """
     TODO
     """
-    return QfDate(self.year - 1, 1, 1, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year - 1, 1, 1, calendar=self.calendar, convention=self.convention)
   
   
   def next_month_end(self) -> QfDate:
@@ -365,19 +535,19 @@ class QfDate:
     """
     TODO
     """
-    return QfDate(self.year + 1, 12, 31, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year + 1, 12, 31, calendar=self.calendar, convention=self.convention)
   
   
   def this_year_end(self) -> QfDate:
     """
     TODO
     """
-    return QfDate(self.year, 12, 31, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year, 12, 31, calendar=self.calendar, convention=self.convention)
   
   
   def prev_year_end(self) -> QfDate:
     """
     TODO
     """
-    return QfDate(self.year - 1, 12, 31, calendar=self.__calendar_name, convention=self.__convention_name)
+    return QfDate(self.year - 1, 12, 31, calendar=self.calendar, convention=self.convention)
   
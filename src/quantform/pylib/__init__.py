@@ -4,8 +4,8 @@ Module with lots of utility classes for quantitative finance
 """
 
 
-__all__ = ["QfDate", "comparable"]
+__all__ = ["QfDate", "comparable", "year_fraction_cache_info", "clear_year_fraction_cache", "set_year_fraction_cache_size", "instrument", "Recorder"]
 
 
-from .QfDate import QfDate, comparable
-
+from .QfDate import QfDate, comparable, year_fraction_cache_info, clear_year_fraction_cache, set_year_fraction_cache_size
+from .instrumentation import instrument, Recorder
@@ -2,10 +2,14 @@
 @author Kasper Rantamäki
 Submodule with a generic abstract base class for various curves
 """
+from __future__ import annotations
 from typing import Optional, Tuple
 from abc import ABC, abstractmethod
 import numpy as np
-import matplotlib.pyplot as plt
+
+from ..lazy import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
 
 
 class CurveABC(ABC):
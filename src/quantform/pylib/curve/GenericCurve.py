@@ -4,10 +4,12 @@ A submodule for a generic curve defined by a set of x and y values
 """
 from typing import Literal
 import numpy as np
-from scipy.interpolate import CubicSpline
-from scipy.ndimage import gaussian_filter1d
 
 from .CurveABC import CurveABC
+from ..lazy import lazy_import
+
+interpolate = lazy_import("scipy.interpolate")
+ndimage     = lazy_import("scipy.ndimage")
 
 
 class GenericCurve(CurveABC):
@@ -45,11 +47,11 @@ class GenericCurve(CurveABC):
         point_dist = np.mean(np.diff(self.__x))
         self.__x = np.concat([np.linspace(max(0, self.__x[0] - point_dist * 11), self.__x[0] - point_dist, 10), self.__x, np.linspace(self.__x[-1] + point_dist, self.__x[-1] + point_dist * 11, 10)])
         self.__y = np.concat([np.array([self.__y[0]] * 10), self.__y, np.array([self.__y[-1]] * 10)])
-        self.__y = gaussian_filter1d(self.__y, self.__gaussian_sd)
+        self.__y = ndimage.gaussian_filter1d(self.__y, self.__gaussian_sd)
       else:
-        self.__y = gaussian_filter1d(self.__y, self.__gaussian_sd)
+        self.__y = ndimage.gaussian_filter1d(self.__y, self.__gaussian_sd)
     
-    self.__interpolator = CubicSpline(self.__x, self.__y)
+    self.__interpolator = interpolate.CubicSpline(self.__x, self.__y)
     
 
   def __call__(self, x: float) -> float:
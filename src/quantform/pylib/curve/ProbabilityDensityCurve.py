@@ -5,10 +5,12 @@ TODO
 from __future__ import annotations
 from typing import Callable, Tuple
 import numpy as np
-from scipy.integrate import quad
-from scipy.interpolate import CubicSpline
 
 from .CurveABC import CurveABC
+from ..lazy import lazy_import
+
+integrate   = lazy_import("scipy.integrate")
+interpolate = lazy_import("scipy.interpolate")
 
 
 class ProbabilityDensityCurve(CurveABC):
@@ -46,7 +48,7 @@ class ProbabilityDensityCurve(CurveABC):
     """
     assert len(x_values) == len(y_values), f"The arrays must have the same dimensions! ({len(x_values)} != {len(y_values)})"
     
-    interp = CubicSpline(x_values, y_values)
+    interp = interpolate.CubicSpline(x_values, y_values)
     return cls(interp, value_range)
     
   
@@ -112,7 +114,7 @@ class ProbabilityDensityCurve(CurveABC):
     ...
     """
     assert (x >= self.min) and (x <= self.max), f"Given value outside of value range! ({x} not between {self.min} and {self.max})" 
-    return quad(self.__interpolator, self.__min, x)[0]
+    return integrate.quad(self.__interpolator, self.__min, x)[0]
     
   
   def moment(self, n: int, c: float = 0.) -> float:
@@ -121,7 +123,7 @@ class ProbabilityDensityCurve(CurveABC):
     """
     integrand = lambda x: (x - c) ** n * self(x)
     
-    return quad(integrand, self.__min, self.__max)[0]
+    return integrate.quad(integrand, self.__min, self.__max)[0]
   
   
   def interval(self, start: float, end: float) -> float:
@@ -134,4 +136,4 @@ class ProbabilityDensityCurve(CurveABC):
     assert (end >= self.min) and (end <= self.max), f"Given value outside of value range! ('end' = {end} not between {self.min} and {self.max})" 
     assert start <= end, f"The interval start must be before the interval end! ({start} > {end})" 
      
-    return quad(self.__interpolator, start, end)[0]
+    return integrate.quad(self.__interpolator, start, end)[0]
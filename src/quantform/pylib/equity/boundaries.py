@@ -42,7 +42,7 @@ def call_option_boundary_factory(strike: float, short_position: bool = False) ->
   mult = 1 if not short_position else -1
   
   def func(underlying_value: float) -> float:
-    return mult * np.max(0., underlying_value - strike)
+    return mult * np.maximum(0., underlying_value - strike)
   
   return func
 
@@ -58,7 +58,7 @@ def put_option_boundary_factory(strike: float, short_position: bool = False) ->
   mult = 1 if not short_position else -1
   
   def func(underlying_value: float) -> float:
-    return mult * np.max(0., strike - underlying_value)
+    return mult * np.maximum(0., strike - underlying_value)
   
   return func
 
@@ -73,6 +73,8 @@ def constant_boundary_factory(strike: float, constant_value: float) -> Callable[
   """
   def func(time_to_maturity: float) -> float:
     return (strike, constant_value)
+  
+  return func
 
 
 def out_boundary_factory(strike: float) -> Callable[[float], Tuple[float, float]]:
@@ -100,5 +102,5 @@ def trivial_expiration_boundary(underlying_value: float) -> float:
   @param underlying_value  The value of the underlying at the maturity
   @return                  The payoff i.e. the value of the underlying
   """
-  return futures_boundary_factory(0.)
+  return futures_boundary_factory(0.)(underlying_value)
 
@@ -1,24 +1,26 @@
 """@package quantform.pylib.equity.derivative.Option
 @author Kasper Rantamäki
-Submodule with a class implementation for a generic European option
+Submodule with a class implementation for a generic European or American option
 """
 from __future__ import annotations
 import numpy as np
-from typing import Literal, Optional
+from typing import List, Literal, Optional, Tuple
 
 from .EquityDerivativeABC import EquityDerivativeABC
 from ...QfDate import QfDate
 from ..pricer.BlackScholesPricer import BlackScholesPricer
+from ..pricer.LatticePricer import LatticePricer
 from ..pricer.EquityPricerABC import EquityPricerABC
-from ..utils import discount, form_option_id, parse_option_id
+from ..utils import discount, form_option_id
 
 
 class Option(EquityDerivativeABC):
-  """Class for European options"""
+  """Class for European and American options"""
   
   def __init__(self, contract_id: str, underlying: str, maturity_date: QfDate, type: Literal["Call", "Put"], strike: float,
-               risk_free_rate: float, volatility: Optional[float] = None, pricer: Literal["BlackScholes"] = "BlackScholes", 
-               market_price: Optional[float] = None, underlying_value: Optional[float] = None, report_date: Optional[QfDate] = None) -> None:
+               risk_free_rate: float, volatility: Optional[float] = None, pricer: Literal["BlackScholes", "Binomial", "Trinomial"] = "BlackScholes", 
+               market_price: Optional[float] = None, underlying_value: Optional[float] = None, report_date: Optional[QfDate] = None,
+               american: Optional[bool] = None, dividends: Optional[List[Tuple[QfDate, float]]] = None, n_steps: int = 500) -> None:
     """Constructor method
     
     Constructor method that stores the given parameters as instance variables and initializes the wanted pricer object.
@@ -34,7 +36,12 @@ class Option(EquityDerivativeABC):
     @param market_price      The market price for the option. Optional, defaults to None
     @param underlying_value  The value of the underlying for the market price. Optional, defaults to None
     @param report_date       The date for the market price and the underlying value. Optional, defaults to None
+    @param american          Boolean flag specifying if the option can be exercised early. Must be given for the lattice pricers. Optional
+                             for the Black-Scholes pricer, which only prices European options. Defaults to None
+    @param dividends         List of the ex-dividend dates and the cash dividends for the lattice pricers. Optional, defaults to None
+    @param n_steps           The number of time steps for the lattice pricers. Optional, defaults to 500
     @raises AssertionError   Raised if volatility is not given and cannot be computed or if an invalid parameter for 'type' or 'pricer' is passed
+    @raises AssertionError   Raised if the exercise style is not given for a lattice pricer
     @return                  None
     """
     
@@ -53,10 +60,15 @@ class Option(EquityDerivativeABC):
    
     match pricer.lower():
       case "blackscholes":
+        assert not american, "Black-Scholes pricer can't be used for American options!"
         self.__pricer = BlackScholesPricer(self.__maturity_date, self.__type, self.__strike, self.__risk_free_rate, self.__volatility,
                                            self.__market_price, underlying_value, report_date)
+      case "binomial" | "trinomial":
+        assert american is not None, f"The exercise style must be specified for the {pricer} pricer! (american=None)"
+        self.__pricer = LatticePricer(self.__maturity_date, self.__type, self.__strike, self.__risk_free_rate, self.__volatility,
+                                      american, pricer, n_steps, dividends, self.__market_price, underlying_value, report_date)
       case _:
-        assert False, f"Invalid pricer name given! ({pricer} not in ['BlackScholes'])"
+        assert False, f"Invalid pricer name given! ({pricer} not in ['BlackScholes', 'Binomial', 'Trinomial'])"
         
       
   @property
@@ -106,16 +118,14 @@ class Option(EquityDerivativeABC):
     """
     if self.type.lower() == "call":
       put_id = form_option_id(self.__underlying, self.__maturity_date, "Put", self.__strike)
-      return Option(put_id, *parse_option_id(put_id, calendar=self.__maturity_date.calendar, convention=self.__maturity_date.convention), 
-                    self.__risk_free_rate, 
+      return Option(put_id, self.__underlying, self.__maturity_date, "Put", self.__strike, self.__risk_free_rate, 
                     market_price = self(underlying_value, report_date) - discount(self.__risk_free_rate, report_date.timedelta(self.__maturity_date)) * (underlying_value - self.__strike),
                     underlying_value = underlying_value,
                     report_date = report_date)
                     
     else:
       call_id = form_option_id(self.__underlying, self.__maturity_date, "Call", self.__strike)
-      return Option(call_id, *parse_option_id(call_id, calendar=self.__maturity_date.calendar, convention=self.__maturity_date.convention),
-                    self.__risk_free_rate, 
+      return Option(call_id, self.__underlying, self.__maturity_date, "Call", self.__strike, self.__risk_free_rate, 
                     market_price = self(underlying_value, report_date) + discount(self.__risk_free_rate, report_date.timedelta(self.__maturity_date)) * (underlying_value - self.__strike),
                     underlying_value = underlying_value,
                     report_date = report_date)
@@ -0,0 +1,406 @@
+"""@package quantform.pylib.equity.derivative.OptionChain
+@author Kasper Rantamäki
+Submodule with a columnar container for option chains
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, List, Literal, Optional, Union
+from pathlib import Path
+import numpy as np
+
+from ...QfDate import QfDate
+from ..utils import parse_option_ids, form_option_ids, _serial_epoch
+from ..pricer.BlackScholesPricer import _black_scholes
+from ...lazy import lazy_import
+from ... import instrumentation
+
+pd = lazy_import("pandas")
+
+
+# The default column names in the quote files (the format used by Yahoo Finance)
+_default_columns = {"contract_id": "Contract Name",
+                    "last":        "Last Price",
+                    "bid":         "Bid",
+                    "ask":         "Ask",
+                    "volume":      "Volume"}
+
+
+def _to_float(column: pd.Series) -> np.ndarray:
+  """Function that converts a quote column into floats with missing values (e.g. '-') as NaN"""
+  return pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64)
+
+
+class OptionChain:
+  """Columnar (struct-of-arrays) container for an option chain
+
+  The contracts are stored as typed NumPy arrays instead of per-contract 'Option' objects: the underlyings as integer
+  codes into a table of names, the maturity dates as serial numbers, the option types as boolean call flags and the
+  strikes and quotes as floats. Pricing, implied volatilities and greeks are computed over the whole chain at once with
+  the Black-Scholes model, evaluating the time to maturity only once for each distinct maturity date.
+  """
+
+  def __init__(self, underlying_codes: np.ndarray, underlyings: List[str], maturity_serials: np.ndarray, is_call: np.ndarray,
+               strikes: np.ndarray, bid: Optional[np.ndarray] = None, ask: Optional[np.ndarray] = None,
+               last: Optional[np.ndarray] = None, volume: Optional[np.ndarray] = None,
+               calendar: Literal["Eurex", "Frankfurt", "Xetra", "London", "NYSE"] = "Frankfurt",
+               convention: Literal["30/360", "ACT/365", "ACT/360", "Business/252"] = "Business/252") -> None:
+    """Constructor method
+
+    @param underlying_codes  Integer codes of the underlyings indexing into 'underlyings'
+    @param underlyings       The identifiers (tickers) of the underlyings
+    @param maturity_serials  The serial numbers of the maturity dates
+    @param is_call           Boolean flags that are True for calls and False for puts
+    @param strikes           The strike prices
+    @param bid               The bid prices. Optional, defaults to None i.e. NaN
+    @param ask               The ask prices. Optional, defaults to None i.e. NaN
+    @param last              The last traded prices. Optional, defaults to None i.e. NaN
+    @param volume            The traded volumes. Optional, defaults to None i.e. zeros
+    @param calendar          The name of the calendar used with the maturity dates. Optional, defaults to 'Frankfurt'
+    @param convention        The day count convention used with the maturity dates. Optional, defaults to 'Business/252'
+    @raises AssertionError   Raised if the arrays are not of the same length
+    @return                  None
+    """
+    n = len(strikes)
+
+    def column(values: Optional[np.ndarray], dtype: type, fill: float) -> np.ndarray:
+      if values is None:
+        return np.full(n, fill, dtype=dtype)
+
+      values = np.asarray(values, dtype=dtype)
+      assert values.shape == (n,), f"All columns must have the same length! ({values.shape} != {(n,)})"
+
+      return values
+
+    self.__underlying_codes = column(underlying_codes, np.int32, 0)
+    self.__underlyings      = np.asarray(underlyings, dtype=str)
+    self.__maturity_serials = column(maturity_serials, np.int32, 0)
+    self.__is_call          = column(is_call, bool, False)
+    self.__strikes          = column(strikes, np.float64, np.nan)
+    self.__bid              = column(bid, np.float64, np.nan)
+    self.__ask              = column(ask, np.float64, np.nan)
+    self.__last             = column(last, np.float64, np.nan)
+    self.__volume           = column(volume, np.int64, 0)
+    self.__calendar         = calendar
+    self.__convention       = convention
+
+
+  @classmethod
+  def from_contract_ids(cls, contract_ids: Union[np.ndarray, pd.Series, List[str]], bid: Optional[np.ndarray] = None,
+                        ask: Optional[np.ndarray] = None, last: Optional[np.ndarray] = None, volume: Optional[np.ndarray] = None,
+                        calendar: Literal["Eurex", "Frankfurt", "Xetra", "London", "NYSE"] = "Frankfurt",
+                        convention: Literal["30/360", "ACT/365", "ACT/360", "Business/252"] = "Business/252") -> OptionChain:
+    """Method for forming the chain from option ids (e.g. 'AAPL250815C00237500')
+
+    The ids are parsed over the whole column at once with 'parse_option_ids'.
+
+    @param contract_ids  The option identifiers
+    @param bid           The bid prices. Optional, defaults to None i.e. NaN
+    @param ask           The ask prices. Optional, defaults to None i.e. NaN
+    @param last          The last traded prices. Optional, defaults to None i.e. NaN
+    @param volume        The traded volumes. Optional, defaults to None i.e. zeros
+    @param calendar      The name of the calendar used with the maturity dates. Optional, defaults to 'Frankfurt'
+    @param convention    The day count convention used with the maturity dates. Optional, defaults to 'Business/252'
+    @return              The option chain
+    """
+    names, serials, is_call, strikes = parse_option_ids(contract_ids)
+    underlyings, codes = np.unique(names, return_inverse=True)
+
+    return cls(codes, list(underlyings), serials, is_call, strikes, bid, ask, last, volume, calendar, convention)
+
+
+  @classmethod
+  def from_file(cls, path: Union[str, Path], columns: Optional[Dict[str, str]] = None, sep: Optional[str] = None,
+                chunksize: int = 100_000, calendar: Literal["Eurex", "Frankfurt", "Xetra", "London", "NYSE"] = "Frankfurt",
+                convention: Literal["30/360", "ACT/365", "ACT/360", "Business/252"] = "Business/252") -> OptionChain:
+    """Method for loading the chain from a TSV, CSV or Parquet file
+
+    The file is streamed in chunks that are converted into the typed columns one at a time, so only the needed columns
+    of a single chunk are ever held as strings. The format is deduced from the file extension.
+
+    @param path        The path to the file
+    @param columns     Mapping from the keys 'contract_id', 'last', 'bid', 'ask' and 'volume' to the column names in the file.
+                       Optional, defaults to None i.e. the column names of the Yahoo Finance quotes are used
+    @param sep         The column separator for text files. Optional, defaults to None i.e. tab for '.tsv' and comma otherwise
+    @param chunksize   The number of rows read at a time. Optional, defaults to 100 000
+    @param calendar    The name of the calendar used with the maturity dates. Optional, defaults to 'Frankfurt'
+    @param convention  The day count convention used with the maturity dates. Optional, defaults to 'Business/252'
+    @return            The option chain
+    """
+    path    = Path(path)
+    columns = {**_default_columns, **(columns if columns is not None else {})}
+
+    chunks = [cls.from_contract_ids(chunk[columns["contract_id"]], _to_float(chunk[columns["bid"]]), _to_float(chunk[columns["ask"]]),
+                                    _to_float(chunk[columns["last"]]), np.nan_to_num(_to_float(chunk[columns["volume"]])),
+                                    calendar, convention)
+              for chunk in cls.__read_chunks(path, list(columns.values()), sep, chunksize)]
+
+    return cls.concatenate(chunks) if len(chunks) > 0 else cls([], [], [], [], [], calendar=calendar, convention=convention)
+
+
+  @staticmethod
+  def __read_chunks(path: Path, usecols: List[str], sep: Optional[str], chunksize: int) -> Iterator[pd.DataFrame]:
+    """Generator for the chunks of the given columns in a file"""
+    if path.suffix.lower() == ".parquet":
+      import pyarrow.parquet as pq
+
+      for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=usecols):
+        yield batch.to_pandas()
+
+      return
+
+    if sep is None:
+      sep = '\t' if path.suffix.lower() == ".tsv" else ','
+
+    yield from pd.read_csv(path, sep=sep, usecols=usecols, dtype=str, chunksize=chunksize)
+
+
+  @classmethod
+  def concatenate(cls, chains: List[OptionChain]) -> OptionChain:
+    """Method for concatenating multiple chains into one
+
+    @param chains           The chains to concatenate
+    @raises AssertionError  Raised if the chains use different calendars or day count conventions
+    @return                 The concatenated chain
+    """
+    assert len(chains) > 0, "At least one chain must be given!"
+    assert all(chain.calendar == chains[0].calendar and chain.convention == chains[0].convention for chain in chains), "The calendars and conventions must match!"
+
+    underlyings, codes = np.unique(np.concatenate([chain.underlying for chain in chains]), return_inverse=True)
+
+    return cls(codes, list(underlyings), np.concatenate([chain.maturity_serials for chain in chains]),
+               np.concatenate([chain.is_call for chain in chains]), np.concatenate([chain.strikes for chain in chains]),
+               np.concatenate([chain.bid for chain in chains]), np.concatenate([chain.ask for chain in chains]),
+               np.concatenate([chain.last for chain in chains]), np.concatenate([chain.volume for chain in chains]),
+               chains[0].calendar, chains[0].convention)
+
+
+  def __len__(self) -> int:
+    return len(self.__strikes)
+
+
+  def __getitem__(self, index: Union[np.ndarray, slice]) -> OptionChain:
+    """Method for selecting a subset of the chain with a boolean mask, an index array or a slice"""
+    return OptionChain(self.__underlying_codes[index], list(self.__underlyings), self.__maturity_serials[index],
+                       self.__is_call[index], self.__strikes[index], self.__bid[index], self.__ask[index],
+                       self.__last[index], self.__volume[index], self.__calendar, self.__convention)
+
+
+  def __str__(self) -> str:
+    """Simple string representation"""
+    return f"Option chain of {len(self)} contracts on {', '.join(self.__underlyings)}"
+
+
+  def __repr__(self) -> str:
+    """Exhaustive string representation"""
+    return f"Option Chain\nContracts: {len(self)}\nUnderlyings: {list(self.__underlyings)}\n" +\
+           f"Maturity Dates: {[str(date) for date in self.maturity_dates]}\nCalendar: {self.__calendar}\nConvention: {self.__convention}"
+
+
+  @property
+  def calendar(self) -> str:
+    return self.__calendar
+
+
+  @property
+  def convention(self) -> str:
+    return self.__convention
+
+
+  @property
+  def underlying_codes(self) -> np.ndarray:
+    """The integer codes of the underlyings"""
+    return self.__underlying_codes
+
+
+  @property
+  def underlyings(self) -> np.ndarray:
+    """The distinct underlyings that the codes refer to"""
+    return self.__underlyings
+
+
+  @property
+  def underlying(self) -> np.ndarray:
+    """The underlying of each contract"""
+    return self.__underlyings[self.__underlying_codes] if len(self.__underlyings) > 0 else np.array([], dtype=str)
+
+
+  @property
+  def maturity_serials(self) -> np.ndarray:
+    """The serial numbers of the maturity dates"""
+    return self.__maturity_serials
+
+
+  @property
+  def maturity_dates(self) -> List[QfDate]:
+    """The distinct maturity dates in ascending order"""
+    return [self.__to_date(serial) for serial in np.unique(self.__maturity_serials)]
+
+
+  @property
+  def is_call(self) -> np.ndarray:
+    return self.__is_call
+
+
+  @property
+  def strikes(self) -> np.ndarray:
+    return self.__strikes
+
+
+  @property
+  def bid(self) -> np.ndarray:
+    return self.__bid
+
+
+  @property
+  def ask(self) -> np.ndarray:
+    return self.__ask
+
+
+  @property
+  def last(self) -> np.ndarray:
+    return self.__last
+
+
+  @property
+  def volume(self) -> np.ndarray:
+    return self.__volume
+
+
+  @property
+  def mid(self) -> np.ndarray:
+    """The mid prices"""
+    return (self.__bid + self.__ask) / 2
+
+
+  @property
+  def contract_ids(self) -> np.ndarray:
+    """The option identifiers (e.g. 'AAPL250815C00237500')"""
+    return form_option_ids(self.underlying, self.__maturity_serials, self.__is_call, self.__strikes)
+
+
+  def to_pandas(self) -> pd.DataFrame:
+    """Method for converting the chain into a DataFrame"""
+    return pd.DataFrame({"contract_id": self.contract_ids, "underlying": self.underlying,
+                         "maturity_date": (_serial_epoch + self.__maturity_serials.astype("timedelta64[D]")).astype("datetime64[D]"),
+                         "type": np.where(self.__is_call, "Call", "Put"), "strike": self.__strikes, "bid": self.__bid,
+                         "ask": self.__ask, "last": self.__last, "volume": self.__volume})
+
+
+  def __to_date(self, serial: int) -> QfDate:
+    """Method for converting a serial number into a date with the calendar and convention of the chain"""
+    return QfDate.from_serial_number(int(serial), self.__calendar, self.__convention)
+
+
+  def time_to_maturity(self, report_date: QfDate) -> np.ndarray:
+    """Method for calculating the times to maturity
+
+    The time delta is calculated once for each distinct maturity date and broadcast to the contracts.
+
+    @param report_date  The valuation date
+    @return             The times to maturity in years. Negative for expired contracts
+    """
+    serials, inverse = np.unique(self.__maturity_serials, return_inverse=True)
+    taus = np.array([report_date.timedelta(self.__to_date(serial)) for serial in serials], dtype=np.float64)
+
+    return taus[inverse] if len(taus) > 0 else np.zeros(0)
+
+
+  def price(self, underlying_value: float, report_date: QfDate, risk_free_rate: float,
+            volatility: Union[float, np.ndarray]) -> np.ndarray:
+    """Method for calculating the Black-Scholes prices of the contracts
+
+    @param underlying_value  The value of the underlying security
+    @param report_date       The valuation date
+    @param risk_free_rate    The prevailing risk-free rate
+    @param volatility        The volatility as a scalar or as an array with a value for each contract
+    @return                  The prices. Expired contracts are worthless
+    """
+    taus  = self.time_to_maturity(report_date)
+    vols  = np.broadcast_to(np.asarray(volatility, dtype=np.float64), taus.shape)
+    signs = np.where(self.__is_call, 1., -1.)
+
+    return _black_scholes(underlying_value, self.__strikes, taus, risk_free_rate, vols, signs, ["price"])["price"]
+
+
+  def greeks(self, underlying_value: float, report_date: QfDate, risk_free_rate: float,
+             volatility: Union[float, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Method for calculating the Black-Scholes greeks of the contracts
+
+    @param underlying_value  The value of the underlying security
+    @param report_date       The valuation date
+    @param risk_free_rate    The prevailing risk-free rate
+    @param volatility        The volatility as a scalar or as an array with a value for each contract
+    @return                  Dictionary with the arrays 'delta', 'gamma', 'vega', 'theta' (per year) and 'rho'. Zero for
+                             contracts at or past maturity
+    """
+    taus   = self.time_to_maturity(report_date)
+    vols   = np.broadcast_to(np.asarray(volatility, dtype=np.float64), taus.shape)
+    signs  = np.where(self.__is_call, 1., -1.)
+    greeks = _black_scholes(underlying_value, self.__strikes, taus, risk_free_rate, vols, signs,
+                            ["delta", "gamma", "vega", "theta", "rho"])
+
+    return {name: np.where(taus > 0, value, 0.) for name, value in greeks.items()}
+
+
+  @instrumentation.timed
+  def implied_volatility(self, underlying_value: float, report_date: QfDate, risk_free_rate: float,
+                         market_prices: Optional[np.ndarray] = None, tol: float = 1e-8, max_iter: int = 100) -> np.ndarray:
+    """Method for calculating the implied volatilities of the contracts
+
+    All contracts are solved simultaneously with a safeguarded Newton iteration: each contract keeps a bracket for the
+    volatility and falls back to bisection whenever the Newton step would leave it.
+
+    @param underlying_value  The value of the underlying for the market prices
+    @param report_date       The date for the market prices and the underlying value
+    @param risk_free_rate    The prevailing risk-free rate
+    @param market_prices     The market prices. Optional, defaults to None i.e. the mid prices are used
+    @param tol               The tolerance for the price difference. Optional, defaults to 1e-8
+    @param max_iter          The maximum number of iterations. Optional, defaults to 100
+    @return                  The implied volatilities. NaN where the price is outside the no-arbitrage bounds, the contract
+                             has expired or the iteration did not converge
+    """
+    prices = self.mid if market_prices is None else np.asarray(market_prices, dtype=np.float64)
+    taus   = self.time_to_maturity(report_date)
+    t      = np.where(taus > 0, taus, 1.)
+    signs  = np.where(self.__is_call, 1., -1.)
+
+    # The no-arbitrage bounds for the prices
+    discounted = self.__strikes * np.exp(-risk_free_rate * t)
+    lower_bound = np.maximum(np.where(self.__is_call, underlying_value - discounted, discounted - underlying_value), 0.)
+    upper_bound = np.where(self.__is_call, underlying_value, discounted)
+
+    valid = (taus > 0) & np.isfinite(prices) & (prices > lower_bound) & (prices < upper_bound)
+
+    lower = np.full(len(self), 1e-6)
+    upper = np.full(len(self), 10.)
+    vols  = np.full(len(self), 0.3)
+    converged = ~valid
+
+    # The iterations per contract are only counted for the instrumentation
+    iterations = np.zeros(len(self), dtype=np.int64) if instrumentation.enabled() else None
+
+    for _ in range(max_iter):
+      values = _black_scholes(underlying_value, self.__strikes, t, risk_free_rate, vols, signs, ["price", "vega"])
+      diff   = values["price"] - prices
+      converged |= np.abs(diff) < tol
+
+      if iterations is not None:
+        iterations += ~converged
+
+      if converged.all():
+        break
+
+      # Narrow the brackets, as the price is increasing in the volatility
+      lower = np.where(diff < 0, vols, lower)
+      upper = np.where(diff > 0, vols, upper)
+
+      with np.errstate(divide="ignore", invalid="ignore"):
+        newton = vols - diff / values["vega"]
+
+      newton = np.where((newton > lower) & (newton < upper), newton, (lower + upper) / 2)
+      vols   = np.where(converged, vols, newton)
+
+    if iterations is not None:
+      instrumentation.observe("OptionChain.implied_volatility.iterations", iterations[valid])
+      instrumentation.count("OptionChain.implied_volatility.not_converged", int(np.sum(valid & ~converged)))
+
+    return np.where(valid & converged, vols, np.nan)
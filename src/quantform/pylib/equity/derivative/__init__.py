@@ -3,10 +3,10 @@
 Module for class implementations of various derivatives
 """
 
-__all__ = ["EquityDerivativeABC", "Option", "LogContract"] 
+__all__ = ["EquityDerivativeABC", "Option", "LogContract", "OptionChain"] 
 
 
 from .EquityDerivativeABC import EquityDerivativeABC
 from .Option import Option
 from .LogContract import LogContract
-
+from .OptionChain import OptionChain
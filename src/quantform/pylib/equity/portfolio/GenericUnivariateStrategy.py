@@ -1,14 +1,21 @@
 """
 """
-from typing import List
+from typing import Dict, List, Optional, Sequence, Union
+import numpy as np
 
 from ..derivative import EquityDerivativeABC
 from .UnivariateStrategyABC import UnivariateStrategyABC
+from .ScenarioGrid import ScenarioGrid
 from ...QfDate import QfDate
 
 
 class GenericUnivariateStrategy(UnivariateStrategyABC):
-  """Generic class for equity derivatives strategies on a single underlying"""
+  """Generic class for equity derivatives strategies on a single underlying
+
+  The legs are grouped by the type of their pricer and their maturity date when the strategy is initialized. Each group
+  is then valued with a single call to the 'batch_risk' method of the pricer class, which evaluates all of the legs in
+  the group over a whole vector of underlying values at once.
+  """
 
 
   def __init__(self, derivatives: List[EquityDerivativeABC], position_sizes: List[float]) -> None:
@@ -19,27 +26,98 @@ class GenericUnivariateStrategy(UnivariateStrategyABC):
     self.__derivatives = derivatives
     self.__position_sizes = position_sizes
 
+    # The indexes of the legs for each pricer type and maturity date
+    self.__groups = {}
+    for i, derivative in enumerate(derivatives):
+      self.__groups.setdefault((type(derivative.pricer), derivative.maturity_date), []).append(i)
+
 
   def __call__(self, underlying_value: float, report_date: QfDate) -> float:
     """
     """
-    return sum([self.__position_sizes[i] * self.__derivatives[i](underlying_value, report_date) for i in range(len(self.__derivatives))])
+    return self.__batched(underlying_value, report_date, ["price"])["price"]
 
 
   def delta(self, underlying_value: float, report_date: QfDate) -> float:
     """
     """
-    return sum([self.__position_sizes[i] * self.__derivatives[i].delta(underlying_value, report_date) for i in range(len(self.__derivatives))])
+    return self.__batched(underlying_value, report_date, ["delta"])["delta"]
 
 
   def gamma(self, underlying_value: float, report_date: QfDate) -> float:
     """
     """
-    return sum([self.__position_sizes[i] * self.__derivatives[i].gamma(underlying_value, report_date) for i in range(len(self.__derivatives))])
+    return self.__batched(underlying_value, report_date, ["gamma"])["gamma"]
 
 
   def vega(self, underlying_value: float, report_date: QfDate) -> float:
     """
     """
-    return sum([self.__position_sizes[i] * self.__derivatives[i].vega(underlying_value, report_date) for i in range(len(self.__derivatives))])
-  
\ No newline at end of file
+    return self.__batched(underlying_value, report_date, ["vega"])["vega"]
+
+
+  def risk(self, underlying_values: Union[float, np.ndarray], report_date: QfDate) -> Dict[str, Union[float, np.ndarray]]:
+    """Method for calculating the value and the greeks of the strategy over a vector of underlying values
+
+    Useful for e.g. payoff diagrams and hedging grids, as each group of legs is valued over all of the underlying values
+    with a single vectorized call.
+
+    @param underlying_values  The value or an array of values of the underlying security
+    @param report_date        The valuation date
+    @return                   Dictionary with the keys 'price', 'delta', 'gamma', 'vega' and 'theta' holding floats for a
+                              single underlying value and arrays otherwise
+    """
+    return self.__batched(underlying_values, report_date, ["price", "delta", "gamma", "vega", "theta"])
+
+
+  def scenarios(self, underlying_value: float, report_date: QfDate, spot_shocks: Sequence[float],
+                vol_shocks: Sequence[float] = (0.,), days_forward: Sequence[int] = (0,), relative: bool = True) -> ScenarioGrid:
+    """Method for calculating a scenario ladder over the full grid of spot shocks, volatility shocks and days forward
+
+    The shifted report dates are formed once for each number of days forward and each group of legs is valued over all
+    of the spot and volatility shocks with a single call, so the year fractions of each maturity are computed only once
+    per report date.
+
+    @param underlying_value  The current value of the underlying security
+    @param report_date       The current valuation date
+    @param spot_shocks       The shocks to the value of the underlying
+    @param vol_shocks        The absolute shocks to the volatilities. Optional, defaults to (0,) i.e. no shocks
+    @param days_forward      The numbers of calendar days the report date is moved forward. Optional, defaults to (0,)
+    @param relative          Boolean flag specifying if the spot shocks are relative (the shocked value is
+                             \f$S(1 + shock)\f$) instead of absolute (\f$S + shock\f$). Optional, defaults to True
+    @raises AssertionError   Raised if any of the days forward is negative
+    @return                  The values of the strategy as a labeled grid
+    """
+    spot_shocks  = np.atleast_1d(np.asarray(spot_shocks, dtype=np.float64))
+    vol_shocks   = np.atleast_1d(np.asarray(vol_shocks, dtype=np.float64))
+    days_forward = np.atleast_1d(np.asarray(days_forward, dtype=np.int64))
+    assert (days_forward >= 0).all(), f"The days forward must be non-negative! ({days_forward.min()} < 0)"
+
+    spots  = underlying_value * (1 + spot_shocks) if relative else underlying_value + spot_shocks
+    values = np.zeros((len(spots), len(vol_shocks), len(days_forward)))
+
+    for k, days in enumerate(days_forward):
+      shifted_date = report_date.date_shift(int(days)) if days > 0 else report_date
+      values[:, :, k] = self.__batched(spots, shifted_date, ["price"], vol_shocks)["price"]
+
+    return ScenarioGrid(values, spot_shocks, vol_shocks, days_forward, self(underlying_value, report_date), spots)
+
+
+  def __batched(self, underlying_values: Union[float, np.ndarray], report_date: QfDate, measures: Sequence[str],
+                vol_shifts: Optional[np.ndarray] = None) -> Dict[str, Union[float, np.ndarray]]:
+    """Method that values the groups of legs and sums them weighted by the position sizes"""
+    spots  = np.atleast_1d(np.asarray(underlying_values, dtype=np.float64))
+    shape  = (len(spots),) if vol_shifts is None else (len(spots), len(vol_shifts))
+    totals = {measure: np.zeros(shape) for measure in measures}
+
+    for (pricer_type, _), indexes in self.__groups.items():
+      values = pricer_type.batch_risk([self.__derivatives[i].pricer for i in indexes], spots, report_date, measures, vol_shifts)
+      sizes  = np.array([self.__position_sizes[i] for i in indexes], dtype=np.float64)
+
+      for measure in measures:
+        totals[measure] += values[measure] @ sizes
+
+    if np.ndim(underlying_values) == 0:
+      return {measure: float(total[0]) for measure, total in totals.items()}
+
+    return totals
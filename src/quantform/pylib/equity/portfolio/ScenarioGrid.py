@@ -0,0 +1,117 @@
+"""@package quantform.pylib.equity.portfolio.ScenarioGrid
+@author Kasper Rantamäki
+Submodule with a labeled container for scenario ladders
+"""
+from __future__ import annotations
+from typing import Dict, Optional
+import numpy as np
+
+from ...lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+# The names of the axes of the grid in order
+_axes = ["spot_shock", "vol_shock", "days_forward"]
+
+
+class ScenarioGrid:
+  """Labeled three dimensional array of strategy values over spot shocks, volatility shocks and days forward
+
+  The values are stored in a NumPy array of shape (n_spot_shocks, n_vol_shocks, n_days_forward) together with the labels
+  of each axis and the unshocked value of the strategy, from which the profit and loss is computed.
+  """
+
+  def __init__(self, values: np.ndarray, spot_shocks: np.ndarray, vol_shocks: np.ndarray, days_forward: np.ndarray,
+               base_value: float, underlying_values: Optional[np.ndarray] = None) -> None:
+    """Constructor method
+
+    @param values             The values of the strategy of shape (n_spot_shocks, n_vol_shocks, n_days_forward)
+    @param spot_shocks        The labels of the spot shock axis
+    @param vol_shocks         The labels of the volatility shock axis
+    @param days_forward       The labels of the days forward axis
+    @param base_value         The value of the strategy without any shocks
+    @param underlying_values  The shocked values of the underlying. Optional, defaults to None
+    @raises AssertionError    Raised if the shape of the values doesn't match the labels
+    @return                   None
+    """
+    self.__values       = np.asarray(values, dtype=np.float64)
+    self.__labels       = {"spot_shock":   np.asarray(spot_shocks),
+                           "vol_shock":    np.asarray(vol_shocks),
+                           "days_forward": np.asarray(days_forward)}
+    self.__base_value   = base_value
+    self.__underlyings  = underlying_values
+
+    shape = tuple(len(self.__labels[axis]) for axis in _axes)
+    assert self.__values.shape == shape, f"The shape of the values doesn't match the labels! ({self.__values.shape} != {shape})"
+
+
+  def __repr__(self) -> str:
+    """Exhaustive string representation"""
+    return f"Scenario Grid\nShape: {self.__values.shape}\nBase Value: {self.__base_value}\n" +\
+           "\n".join(f"{axis}: {self.__labels[axis]}" for axis in _axes)
+
+
+  @property
+  def values(self) -> np.ndarray:
+    """The values of the strategy of shape (n_spot_shocks, n_vol_shocks, n_days_forward)"""
+    return self.__values
+
+
+  @property
+  def pnl(self) -> np.ndarray:
+    """The profit and loss relative to the unshocked value of the strategy"""
+    return self.__values - self.__base_value
+
+
+  @property
+  def base_value(self) -> float:
+    """The value of the strategy without any shocks"""
+    return self.__base_value
+
+
+  @property
+  def labels(self) -> Dict[str, np.ndarray]:
+    """The labels of the axes ('spot_shock', 'vol_shock' and 'days_forward')"""
+    return self.__labels
+
+
+  @property
+  def underlying_values(self) -> Optional[np.ndarray]:
+    """The shocked values of the underlying"""
+    return self.__underlyings
+
+
+  def sel(self, spot_shock: Optional[float] = None, vol_shock: Optional[float] = None,
+          days_forward: Optional[int] = None) -> np.ndarray:
+    """Method for selecting values by their labels
+
+    @param spot_shock       The label of the spot shock. Optional, defaults to None i.e. all spot shocks
+    @param vol_shock        The label of the volatility shock. Optional, defaults to None i.e. all volatility shocks
+    @param days_forward     The label of the days forward. Optional, defaults to None i.e. all days
+    @raises AssertionError  Raised if a label is not found
+    @return                 The selected values with the axes that were not selected on left in place
+    """
+    index = []
+
+    for axis, label in zip(_axes, [spot_shock, vol_shock, days_forward]):
+      if label is None:
+        index.append(slice(None))
+        continue
+
+      matches = np.flatnonzero(np.isclose(self.__labels[axis], label))
+      assert len(matches) > 0, f"Label not found on axis '{axis}'! ({label} not in {self.__labels[axis]})"
+      index.append(matches[0])
+
+    return self.__values[tuple(index)]
+
+
+  def to_pandas(self, pnl: bool = False) -> pd.Series:
+    """Method for converting the grid into a series with a (spot_shock, vol_shock, days_forward) multi-index
+
+    @param pnl  Boolean flag specifying if the profit and loss is returned instead of the values. Optional, defaults to False
+    @return     The values of the grid as a series
+    """
+    index = pd.MultiIndex.from_product([self.__labels[axis] for axis in _axes], names=_axes)
+
+    return pd.Series((self.pnl if pnl else self.__values).ravel(), index=index, name="pnl" if pnl else "value")
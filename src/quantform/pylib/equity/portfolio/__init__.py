@@ -3,8 +3,9 @@
 Module for class implementations of various strategies and portfolios
 """
 
-__all__ = ["UnivariateStrategyABC", "GenericUnivariateStrategy"] 
+__all__ = ["UnivariateStrategyABC", "GenericUnivariateStrategy", "ScenarioGrid"] 
 
 
 from .UnivariateStrategyABC import UnivariateStrategyABC
-from .GenericUnivariateStrategy import GenericUnivariateStrategy
\ No newline at end of file
+from .ScenarioGrid import ScenarioGrid
+from .GenericUnivariateStrategy import GenericUnivariateStrategy
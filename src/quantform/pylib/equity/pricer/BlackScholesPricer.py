@@ -2,14 +2,66 @@
 @author Kasper Rantamäki
 Submodule with a very basic analytical Black-Scholes pricer
 """
-from typing import Optional, Literal
+from typing import Dict, Optional, Literal, Sequence, Tuple, Union
 import numpy as np
-from scipy.stats import norm
-from scipy.optimize import root_scalar
 
 from .EquityPricerABC import EquityPricerABC
 from ...QfDate import QfDate
 from ..utils import discount
+from ...numerics import norm_cdf, norm_pdf
+from ...lazy import lazy_import
+from ...instrumentation import timed, observe
+
+optimize = lazy_import("scipy.optimize")
+
+
+# The measures supported by 'greeks' and 'batch_risk'
+_greeks = ["price", "delta", "gamma", "vega", "theta", "rho", "vanna", "volga", "charm"]
+
+
+def _black_scholes(spots: np.ndarray, strikes: np.ndarray, taus: np.ndarray, rates: Union[float, np.ndarray],
+                   vols: np.ndarray, signs: np.ndarray, measures: Sequence[str]) -> Dict[str, np.ndarray]:
+  """The Black-Scholes price and greeks over broadcastable arrays
+
+  Shared by 'BlackScholesPricer.batch_risk' and the option chains. The terms \f$d_\pm\f$, the normal density and the
+  discounted strikes are computed once for all of the measures. Contracts at maturity (zero time to maturity) are valued
+  at their intrinsic value and expired contracts (negative time to maturity) as worthless.
+
+  @param spots     The values of the underlying security
+  @param strikes   The strike prices
+  @param taus      The times to maturity in years
+  @param rates     The risk-free rates
+  @param vols      The volatilities
+  @param signs     1 for calls and -1 for puts
+  @param measures  The calculated quantities out of '_greeks'
+  @return          Dictionary with the requested measures broadcast over the arguments
+  """
+  live   = taus > 0
+  tau_t  = np.where(live, taus, 1.)
+  sqrt_t = np.sqrt(tau_t)
+  disc_k = strikes * np.exp(-rates * np.where(live, taus, 0.))
+
+  with np.errstate(divide="ignore", invalid="ignore"):
+    d_plus  = (np.log(spots / strikes) + (rates + vols ** 2 / 2) * tau_t) / (vols * sqrt_t)
+    d_minus = d_plus - vols * sqrt_t
+    pdf     = norm_pdf(d_plus)
+
+    # Contracts at maturity get their intrinsic value and expired ones (tau < 0) nothing
+    intrinsic = np.where(taus == 0, np.maximum(signs * (spots - strikes), 0.), 0.)
+    exercised = np.where(taus == 0, (signs * (spots - strikes) > 0) * signs, 0.)
+
+    formulas = {"price": lambda: signs * (spots * norm_cdf(signs * d_plus) - disc_k * norm_cdf(signs * d_minus)),
+                "delta": lambda: signs * norm_cdf(signs * d_plus),
+                "gamma": lambda: pdf / (spots * vols * sqrt_t),
+                "vega":  lambda: spots * pdf * sqrt_t,
+                "theta": lambda: -spots * pdf * vols / (2 * sqrt_t) - signs * rates * disc_k * norm_cdf(signs * d_minus),
+                "rho":   lambda: signs * disc_k * tau_t * norm_cdf(signs * d_minus),
+                "vanna": lambda: -pdf * d_minus / vols,
+                "volga": lambda: spots * pdf * sqrt_t * d_plus * d_minus / vols,
+                "charm": lambda: -pdf * (2 * rates * tau_t - d_minus * vols * sqrt_t) / (2 * tau_t * vols * sqrt_t)}
+    expired  = {"price": intrinsic, "delta": exercised}
+
+    return {measure: np.where(live, formulas[measure](), expired.get(measure, 0.)) for measure in measures}
 
 
 class BlackScholesPricer(EquityPricerABC):
@@ -54,6 +106,7 @@ class BlackScholesPricer(EquityPricerABC):
       self.__vol_type = "Implied"
     
     
+  @timed
   def __call__(self, underlying_value: float, report_date: QfDate, vol: Optional[float] = None) -> float:
     if report_date > self.__maturity_date:
       # Expired option is worthless
@@ -62,16 +115,15 @@ class BlackScholesPricer(EquityPricerABC):
     if self.__maturity_date == report_date: 
       if self.__option_type == 'Call': return max(0, underlying_value - self.__strike)
       else: return max(0, self.__strike - underlying_value)
+
+    tau              = report_date.timedelta(self.__maturity_date)
+    d_plus, d_minus  = self.__d_terms(underlying_value, tau, vol)
     
     if self.__option_type == 'Call':
-      return norm.cdf(self.d_plus(underlying_value, report_date, vol = vol)) * underlying_value -\
-             norm.cdf(self.d_minus(underlying_value, report_date, vol = vol)) * self.__strike *\
-             discount(self.__rf, report_date.timedelta(self.__maturity_date))
+      return norm_cdf(d_plus) * underlying_value - norm_cdf(d_minus) * self.__strike * discount(self.__rf, tau)
 
     # Else
-    return norm.cdf(-self.d_minus(underlying_value, report_date, vol = vol)) * self.__strike *\
-           discount(self.__rf, report_date.timedelta(self.__maturity_date)) -\
-           norm.cdf(-self.d_plus(underlying_value, report_date, vol = vol)) * underlying_value
+    return norm_cdf(-d_minus) * self.__strike * discount(self.__rf, tau) - norm_cdf(-d_plus) * underlying_value
            
            
   def __str__(self) -> str:
@@ -93,29 +145,114 @@ class BlackScholesPricer(EquityPricerABC):
     if report_date > self.__maturity_date:
       # Expired option has no sensitivities
       return 0
-    
-    return norm.cdf(self.d_plus(underlying_value, report_date))
+
+    d_plus, _ = self.__d_terms(underlying_value, report_date.timedelta(self.__maturity_date))
+
+    if self.__option_type == 'Call':
+      return norm_cdf(d_plus)
+
+    # Else
+    return norm_cdf(d_plus) - 1
   
   
   def vega(self, underlying_value: float, report_date: QfDate) -> float:
     if report_date > self.__maturity_date:
       # Expired option has no sensitivities
       return 0
+
+    tau       = report_date.timedelta(self.__maturity_date)
+    d_plus, _ = self.__d_terms(underlying_value, tau)
     
-    return underlying_value * np.exp(-self.d_plus(underlying_value, report_date) ** 2 / 2) * \
-           np.sqrt(report_date.timedelta(self.__maturity_date)) / np.sqrt(2 * np.pi)
+    return underlying_value * norm_pdf(d_plus) * np.sqrt(tau)
             
   
   def gamma(self, underlying_value: float, report_date: QfDate) -> float:
     if report_date > self.__maturity_date:
       # Expired option has no sensitivities
       return 0
+
+    tau        = report_date.timedelta(self.__maturity_date)
+    _, d_minus = self.__d_terms(underlying_value, tau)
     
-    return self.__strike * discount(self.__rf, report_date.timedelta(self.__maturity_date)) * \
-           norm.pdf(self.d_minus(underlying_value, report_date)) / (underlying_value ** 2 * self.__vol * \
-           np.sqrt(report_date.timedelta(self.__maturity_date)))
+    return self.__strike * discount(self.__rf, tau) * norm_pdf(d_minus) / (underlying_value ** 2 * self.__vol * np.sqrt(tau))
+
+
+  def greeks(self, underlying_value: Union[float, np.ndarray], report_date: QfDate) -> Dict[str, Union[float, np.ndarray]]:
+    """Method for calculating the price and the full set of greeks at once
+
+    The time to maturity, \f$d_\pm\f$, the normal density and distribution terms and the discount factor are computed
+    only once and shared by all of the greeks. Theta and charm are given per year of passing time.
+
+    @param underlying_value  The value or an array of values of the underlying security
+    @param report_date       The valuation date
+    @return                  Dictionary with the keys 'price', 'delta', 'gamma', 'vega', 'theta', 'rho', 'vanna', 'volga'
+                             and 'charm' holding floats for a single underlying value and arrays otherwise
+    """
+    result = type(self).batch_risk([self], underlying_value, report_date, _greeks)
+
+    if np.ndim(underlying_value) == 0:
+      return {greek: float(values[0, 0]) for greek, values in result.items()}
+
+    return {greek: values[:, 0] for greek, values in result.items()}
                                                
   
+  @classmethod
+  @timed
+  def batch_risk(cls, pricers: Sequence[EquityPricerABC], underlying_values: np.ndarray, report_date: QfDate,
+                 measures: Sequence[str] = ("price", "delta", "gamma", "vega", "theta"),
+                 vol_shifts: Optional[Sequence[float]] = None) -> Dict[str, np.ndarray]:
+    """Method for calculating the price and greeks for a group of pricers over a vector of underlying values
+
+    Evaluates the closed form expressions over arrays of shape (n_underlying_values, n_vol_shifts, n_pricers), with the
+    time to maturity computed only once for each distinct maturity date. Contracts at maturity are valued at their
+    intrinsic value and expired contracts as worthless. Besides the common measures the second order greeks 'rho',
+    'vanna', 'volga' and 'charm' can be requested.
+
+    @param pricers            The Black-Scholes pricers to evaluate
+    @param underlying_values  The values of the underlying security
+    @param report_date        The valuation date
+    @param measures           The calculated quantities out of 'price', 'delta', 'gamma', 'vega', 'theta', 'rho', 'vanna',
+                              'volga' and 'charm'. Optional, defaults to the price and the first order greeks with gamma
+    @param vol_shifts         Absolute shifts added to the volatilities of the pricers. Optional, defaults to None i.e. the
+                              volatilities are not shifted
+    @raises AssertionError    Raised if an invalid measure is requested
+    @return                   Dictionary with the requested measures as arrays of shape (n_underlying_values, n_pricers) or
+                              (n_underlying_values, n_vol_shifts, n_pricers) if 'vol_shifts' is given
+    """
+    assert all(measure in _greeks for measure in measures), f"Invalid measure requested! ({measures} not a subset of {_greeks})"
+
+    spots  = np.atleast_1d(np.asarray(underlying_values, dtype=np.float64))[:, None, None]
+    shifts = np.zeros(1) if vol_shifts is None else np.atleast_1d(np.asarray(vol_shifts, dtype=np.float64))
+
+    # Negative time to maturity marks the expired contracts
+    taus = {}
+    for pricer in pricers:
+      if pricer.__maturity_date in taus:
+        continue
+
+      if report_date > pricer.__maturity_date:
+        taus[pricer.__maturity_date] = -1.
+      elif report_date == pricer.__maturity_date:
+        taus[pricer.__maturity_date] = 0.
+      else:
+        taus[pricer.__maturity_date] = report_date.timedelta(pricer.__maturity_date)
+
+    tau     = np.array([taus[pricer.__maturity_date] for pricer in pricers])
+    strikes = np.array([pricer.__strike for pricer in pricers], dtype=np.float64)
+    rates   = np.array([pricer.__rf for pricer in pricers], dtype=np.float64)
+    vols    = np.array([pricer.__vol for pricer in pricers], dtype=np.float64)[None, :] + shifts[:, None]
+    signs   = np.array([1. if pricer.__option_type.lower() == "call" else -1. for pricer in pricers])
+
+    result  = {measure: np.broadcast_to(values, (spots.shape[0], len(shifts), len(pricers)))
+               for measure, values in _black_scholes(spots, strikes, tau, rates, vols, signs, measures).items()}
+
+    if vol_shifts is None:
+      return {measure: values[:, 0, :] for measure, values in result.items()}
+
+    return result
+
+
+  @timed
   def implied_volatility(self, market_price: float, underlying_value: float, report_date: QfDate) -> float:
     """Method for calculating the implied volatility
     
@@ -142,9 +279,10 @@ class BlackScholesPricer(EquityPricerABC):
 
     assert upper < 100, "Implied volatility can't be calculated as the difference is not positive for any upped bound!"
 
-    implied_vol = root_scalar(diff_func, method="bisect", bracket=(lower, upper)).root
+    result = optimize.root_scalar(diff_func, method="bisect", bracket=(lower, upper))
+    observe("BlackScholesPricer.implied_volatility.iterations", (result.iterations,))
 
-    return implied_vol
+    return result.root
   
   
   def d_plus(self, underlying_value: float, report_date: QfDate, vol: float = None) -> float:
@@ -155,16 +293,7 @@ class BlackScholesPricer(EquityPricerABC):
     @param vol               The volatility of the underlying. Optional, defaults to None i.e. the instance variable is used for volatility
     return                   The value of the \f$d_+\f$ argument
     """
-    
-    if vol is None:
-      return 1 / (self.__vol * np.sqrt(report_date.timedelta(self.__maturity_date))) * \
-             (np.log(underlying_value / self.__strike) + (self.__rf + self.__vol ** 2 / 2) * \
-             report_date.timedelta(self.__maturity_date))
-    
-    # Else
-    return 1 / (vol * np.sqrt(report_date.timedelta(self.__maturity_date))) * \
-           (np.log(underlying_value / self.__strike) + (self.__rf + vol ** 2 / 2) * \
-           report_date.timedelta(self.__maturity_date))
+    return self.__d_terms(underlying_value, report_date.timedelta(self.__maturity_date), vol)[0]
 
 
   def d_minus(self, underlying_value: float, report_date: QfDate, vol: float = None) -> float:
@@ -175,12 +304,14 @@ class BlackScholesPricer(EquityPricerABC):
     @param vol               The volatility of the underlying. Optional, defaults to None i.e. the instance variable is used for volatility
     return                   The value of the \f$d_-\f$ argument
     """
-    
+    return self.__d_terms(underlying_value, report_date.timedelta(self.__maturity_date), vol)[1]
+
+
+  def __d_terms(self, underlying_value: float, tau: float, vol: Optional[float] = None) -> Tuple[float, float]:
+    """Method that calculates both \f$d_+\f$ and \f$d_-\f$ for an already computed time to maturity"""
     if vol is None:
-      return self.d_plus(underlying_value, report_date) - \
-             self.__vol * np.sqrt(report_date.timedelta(self.__maturity_date))
+      vol = self.__vol
 
-    # Else
-    return self.d_plus(underlying_value, report_date, vol = vol) - \
-           vol * np.sqrt(report_date.timedelta(self.__maturity_date))
+    d_plus = (np.log(underlying_value / self.__strike) + (self.__rf + vol ** 2 / 2) * tau) / (vol * np.sqrt(tau))
 
+    return d_plus, d_plus - vol * np.sqrt(tau)
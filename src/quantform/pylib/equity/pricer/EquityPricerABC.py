@@ -4,9 +4,15 @@ Submodule with an abstract base class for equity derivative pricers
 """
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import List, Dict, Callable
+from typing import List, Dict, Callable, Optional, Sequence
+import numpy as np
 
 from ...QfDate import QfDate
+from ...instrumentation import timed
+
+
+# The quantities supported by 'batch_risk'
+_risk_measures = ["price", "delta", "gamma", "vega", "theta"]
 
 
 class EquityPricerABC(ABC):
@@ -128,3 +134,56 @@ class EquityPricerABC(ABC):
     """
     return lambda vol: self(underlying_value, report_date, vol = vol) - market_price
 
+
+  @classmethod
+  @timed
+  def batch_risk(cls, pricers: Sequence[EquityPricerABC], underlying_values: np.ndarray, report_date: QfDate,
+                 measures: Sequence[str] = tuple(_risk_measures), vol_shifts: Optional[Sequence[float]] = None) -> Dict[str, np.ndarray]:
+    """Method for calculating the price and greeks for a group of pricers over a vector of underlying values
+
+    This is the extension point used by the strategies to value their legs in groups. The default implementation simply
+    loops over the pricers and the underlying values, while subclasses with vectorized kernels override it. Theta is taken
+    from the pricer's 'theta' method if it has one and otherwise approximated with a forward difference over the next
+    production date. All of the pricers are expected to be instances of the class the method is called on.
+
+    @param pricers            The pricers to evaluate
+    @param underlying_values  The values of the underlying security
+    @param report_date        The valuation date
+    @param measures           The calculated quantities out of 'price', 'delta', 'gamma', 'vega' and 'theta'. Optional,
+                              defaults to all of them
+    @param vol_shifts         Absolute shifts added to the volatilities of the pricers. The default implementation only
+                              supports them for the price. Optional, defaults to None i.e. the volatilities are not shifted
+    @raises AssertionError    Raised if an invalid measure is requested
+    @return                   Dictionary with the requested measures as arrays of shape (n_underlying_values, n_pricers) or
+                              (n_underlying_values, n_vol_shifts, n_pricers) if 'vol_shifts' is given
+    """
+    assert all(measure in _risk_measures for measure in measures), f"Invalid measure requested! ({measures} not a subset of {_risk_measures})"
+    assert (vol_shifts is None) or (list(measures) == ["price"]), "Volatility shifts are only supported for the price!"
+
+    spots  = np.atleast_1d(np.asarray(underlying_values, dtype=np.float64))
+    shifts = np.zeros(1) if vol_shifts is None else np.atleast_1d(np.asarray(vol_shifts, dtype=np.float64))
+    result = {measure: np.zeros((len(spots), len(shifts), len(pricers))) for measure in measures}
+
+    for j, pricer in enumerate(pricers):
+      for i, spot in enumerate(spots):
+        if vol_shifts is not None:
+          for k, shift in enumerate(shifts):
+            result["price"][i, k, j] = pricer(spot, report_date, vol = pricer.volatility + shift)
+          continue
+
+        if "price" in measures: result["price"][i, 0, j] = pricer(spot, report_date)
+        if "delta" in measures: result["delta"][i, 0, j] = pricer.delta(spot, report_date)
+        if "gamma" in measures: result["gamma"][i, 0, j] = pricer.gamma(spot, report_date)
+        if "vega" in measures:  result["vega"][i, 0, j]  = pricer.vega(spot, report_date)
+
+        if "theta" in measures:
+          if hasattr(pricer, "theta"):
+            result["theta"][i, 0, j] = pricer.theta(spot, report_date)
+          else:
+            next_date = report_date.next_prod_date()
+            result["theta"][i, 0, j] = (pricer(spot, next_date) - pricer(spot, report_date)) / report_date.timedelta(next_date)
+
+    if vol_shifts is None:
+      return {measure: values[:, 0, :] for measure, values in result.items()}
+
+    return result
@@ -0,0 +1,439 @@
+"""@package quantform.pylib.equity.pricer.FiniteDifferencePricer
+@author Kasper Rantamäki
+Submodule with a finite difference (theta-scheme) pricer for European, American and barrier contracts
+"""
+from typing import Callable, Dict, Literal, Optional, Tuple
+import numpy as np
+
+from .EquityPricerABC import EquityPricerABC
+from ...QfDate import QfDate
+from ...lazy import lazy_import
+from ...instrumentation import timed
+
+linalg = lazy_import("scipy.linalg")
+sparse = lazy_import("scipy.sparse")
+
+
+def _evaluate(func: Callable[[float], float], values: np.ndarray) -> np.ndarray:
+  """Function that evaluates a payoff function over an array of values of the underlying
+
+  The boundary factories in 'boundaries.py' produce functions that accept arrays, but scalar only functions are also
+  supported by falling back to evaluating them element by element.
+
+  @param func    The payoff function
+  @param values  The values of the underlying
+  @return        The payoffs as an array of the same shape as 'values'
+  """
+  try:
+    return np.broadcast_to(np.asarray(func(values), dtype=np.float64), values.shape).copy()
+  except (TypeError, ValueError):
+    return np.array([func(value) for value in values], dtype=np.float64)
+
+
+class FiniteDifferencePricer(EquityPricerABC):
+  """Finite difference pricer for the Black-Scholes PDE
+
+  Solves the Black-Scholes PDE in log-spot \f$x = \ln S\f$ backwards from the expiration boundary with a theta-scheme
+  (Crank-Nicolson for \f$\theta = 1/2\f$). The first steps are taken fully implicitly (Rannacher smoothing) to damp the
+  oscillations caused by the kinks in the payoff. The boundaries are given in the same form as for 'MonteCarloPricer',
+  i.e. the expiration boundary is a function of the value of the underlying at maturity and the side boundaries are
+  functions of the time to maturity returning the barrier level and the payoff on the barrier. Where no barrier is given
+  the grid is truncated a number of standard deviations away from the spot and the discounted payoff at the forward
+  is used as the far-field value.
+
+  Early exercise is handled either with a penalty method or with projected SOR (PSOR). The penalty method is the default
+  as it only needs a few tridiagonal solves per time step, whereas PSOR needs many sweeps over the grid. The sweeps
+  update the odd and the even nodes in turn (red-black ordering), so each half sweep is vectorized. The grid from the
+  latest solve is stored, so the price, delta, gamma and theta for the same underlying value and report date come from
+  a single solve.
+  """
+
+  def __init__(self, maturity_date: QfDate, risk_free_rate: float, volatility: float, expiration_boundary: Callable[[float], float],
+               upper_boundary: Optional[Callable[[float], Tuple[float, float]]] = None,
+               lower_boundary: Optional[Callable[[float], Tuple[float, float]]] = None,
+               early_exercise: bool = False, exercise_boundary: Optional[Callable[[float], float]] = None,
+               exercise_method: Literal["Penalty", "PSOR"] = "Penalty", solver: Literal["Thomas", "cpplib"] = "Thomas",
+               n_space: int = 400, n_time: int = 200, theta: float = 0.5, rannacher_steps: int = 2, n_std: float = 6.) -> None:
+    """Constructor method
+
+    @param maturity_date        The maturity date for the contract
+    @param risk_free_rate       The prevailing risk-free rate
+    @param volatility           The volatility of the underlying
+    @param expiration_boundary  Function giving the payoff at maturity for a value of the underlying
+    @param upper_boundary       Function giving the upper barrier level and the payoff on it for a time to maturity. Optional,
+                                defaults to None i.e. no upper barrier
+    @param lower_boundary       Function giving the lower barrier level and the payoff on it for a time to maturity. Optional,
+                                defaults to None i.e. no lower barrier
+    @param early_exercise       Boolean flag specifying if the contract can be exercised early. Optional, defaults to False
+    @param exercise_boundary    Function giving the payoff on early exercise for a value of the underlying. Optional, defaults
+                                to None i.e. the expiration boundary is used
+    @param exercise_method      The method for handling early exercise ('Penalty' or 'PSOR'). Optional, defaults to 'Penalty'
+    @param solver               The solver for the tridiagonal systems ('Thomas' or 'cpplib'). Optional, defaults to 'Thomas'
+    @param n_space              The number of space steps. Optional, defaults to 400
+    @param n_time               The number of time steps. Optional, defaults to 200
+    @param theta                The implicitness of the scheme in [0, 1]. Optional, defaults to 0.5 i.e. Crank-Nicolson
+    @param rannacher_steps      The number of fully implicit steps taken first. Optional, defaults to 2
+    @param n_std                The number of standard deviations to the truncated grid boundaries. Optional, defaults to 6
+    @raises AssertionError      Raised if the maturity date doesn't use 'Business/252' convention or a parameter is invalid
+    @return                     None
+    """
+    assert maturity_date.convention == "Business/252", f"Maturity date has an invalid day count convention! ({maturity_date.convention} != 'Business/252')"
+    assert exercise_method.lower() in ["penalty", "psor"], f"Invalid exercise method specified! ({exercise_method} not in ['Penalty', 'PSOR'])"
+    assert solver.lower() in ["thomas", "cpplib"], f"Invalid solver specified! ({solver} not in ['Thomas', 'cpplib'])"
+    assert 0. <= theta <= 1., f"Theta must be in [0, 1]! ({theta})"
+    assert n_space >= 3 and n_time >= 1, f"The grid must have at least 3 space steps and 1 time step! ({n_space}, {n_time})"
+
+    self.__maturity_date       = maturity_date
+    self.__rf                  = risk_free_rate
+    self.__vol                 = volatility
+    self.__expiration_boundary = expiration_boundary
+    self.__upper_boundary      = upper_boundary
+    self.__lower_boundary      = lower_boundary
+    self.__early_exercise      = early_exercise
+    self.__exercise_boundary   = exercise_boundary if exercise_boundary is not None else expiration_boundary
+    self.__exercise_method     = exercise_method.lower()
+    self.__solver              = solver.lower()
+    self.__n_space             = n_space
+    self.__n_time              = n_time
+    self.__theta               = theta
+    self.__rannacher_steps     = rannacher_steps
+    self.__n_std               = n_std
+
+    # The latest solved grid and the parameters it was solved for
+    self.__grid_key = None
+    self.__grid     = None
+
+
+  @timed
+  def __call__(self, underlying_value: float, report_date: QfDate, vol: Optional[float] = None) -> float:
+    if report_date > self.__maturity_date:
+      # Expired contract is worthless
+      return 0
+
+    if self.__maturity_date == report_date:
+      return float(_evaluate(self.__expiration_boundary, np.array([underlying_value]))[0])
+
+    knocked = self.__knocked(underlying_value, report_date)
+    if knocked is not None:
+      return knocked
+
+    return self.__interpolate(underlying_value, report_date, vol)[0]
+
+
+  def __str__(self) -> str:
+    """Simple string representation"""
+    return f"Finite Difference Pricer"
+
+
+  def __repr__(self) -> str:
+    """Exhaustive string representation"""
+    return f"Finite Difference Pricer\nMaturity Date: {self.__maturity_date}\nRisk-free Rate: {self.__rf}\nVolatility: {self.__vol}\n" +\
+           f"Early Exercise: {self.__early_exercise}\nGrid: {self.__n_space} x {self.__n_time}\nTheta: {self.__theta}"
+
+
+  @property
+  def volatility(self) -> float:
+    return self.__vol
+
+
+  def delta(self, underlying_value: float, report_date: QfDate) -> float:
+    if report_date >= self.__maturity_date or self.__knocked(underlying_value, report_date) is not None:
+      # Expired or knocked out contract has no sensitivities
+      return 0
+
+    return self.__interpolate(underlying_value, report_date)[1]
+
+
+  def vega(self, underlying_value: float, report_date: QfDate, difference: float = 1e-3) -> float:
+    if report_date >= self.__maturity_date or self.__knocked(underlying_value, report_date) is not None:
+      # Expired or knocked out contract has no sensitivities
+      return 0
+
+    return (self(underlying_value, report_date, vol = self.__vol + difference / 2) -\
+            self(underlying_value, report_date, vol = self.__vol - difference / 2)) / difference
+
+
+  def gamma(self, underlying_value: float, report_date: QfDate) -> float:
+    if report_date >= self.__maturity_date or self.__knocked(underlying_value, report_date) is not None:
+      # Expired or knocked out contract has no sensitivities
+      return 0
+
+    return self.__interpolate(underlying_value, report_date)[2]
+
+
+  def theta(self, underlying_value: float, report_date: QfDate) -> float:
+    """The theta of the contract
+
+    Calculates the theta (sensitivity to the passage of time, per year) from the last two time levels of the grid
+
+    @param underlying_value  The value of the underlying security
+    @param report_date       The valuation date
+    @return                  The theta of the contract
+    """
+    if report_date >= self.__maturity_date or self.__knocked(underlying_value, report_date) is not None:
+      # Expired or knocked out contract has no sensitivities
+      return 0
+
+    return self.__interpolate(underlying_value, report_date)[3]
+
+
+  def greeks(self, underlying_value: float, report_date: QfDate) -> Dict[str, float]:
+    """Method for calculating the price and the grid greeks from a single solve
+
+    @param underlying_value  The value of the underlying security
+    @param report_date       The valuation date
+    @return                  Dictionary with the keys 'price', 'delta', 'gamma' and 'theta'
+    """
+    return {"price": self(underlying_value, report_date),
+            "delta": self.delta(underlying_value, report_date),
+            "gamma": self.gamma(underlying_value, report_date),
+            "theta": self.theta(underlying_value, report_date)}
+
+
+  def grid(self, underlying_value: float, report_date: QfDate, vol: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Method for accessing the solved grid
+
+    @param underlying_value  The value of the underlying security
+    @param report_date       The valuation date
+    @param vol               The volatility of the underlying. Optional, defaults to None i.e. the instance variable is used
+    @return                  The values of the underlying on the grid and the values of the contract on them
+    """
+    spots, values, _, _ = self.__solve(underlying_value, report_date, vol)
+    return spots.copy(), values.copy()
+
+
+  def __knocked(self, underlying_value: float, report_date: QfDate) -> Optional[float]:
+    """Method that returns the payoff on a barrier if the underlying is beyond it and None otherwise"""
+    years = report_date.timedelta(self.__maturity_date)
+
+    if self.__lower_boundary is not None:
+      level, payoff = self.__lower_boundary(years)
+      if underlying_value <= level:
+        return payoff
+
+    if self.__upper_boundary is not None:
+      level, payoff = self.__upper_boundary(years)
+      if underlying_value >= level:
+        return payoff
+
+    return None
+
+
+  def __interpolate(self, underlying_value: float, report_date: QfDate, vol: Optional[float] = None) -> Tuple[float, float, float, float]:
+    """Method that interpolates the price, delta, gamma and theta at the underlying value from the grid
+
+    A quadratic is fitted through the three grid points nearest to the underlying value in log-spot and the
+    derivatives are converted to the spot with \f$V_S = V_x / S\f$ and \f$V_{SS} = (V_{xx} - V_x) / S^2\f$.
+    """
+    spots, values, previous, dt = self.__solve(underlying_value, report_date, vol)
+
+    x  = np.log(spots)
+    x0 = np.log(underlying_value)
+    i  = int(np.clip(np.searchsorted(x, x0), 1, len(x) - 2))
+
+    # Uniform grid so the central differences are exact for the quadratic
+    dx  = x[i + 1] - x[i]
+    u   = x0 - x[i]
+    v_x  = (values[i + 1] - values[i - 1]) / (2 * dx)
+    v_xx = (values[i + 1] - 2 * values[i] + values[i - 1]) / dx ** 2
+
+    price = values[i] + u * v_x + u ** 2 * v_xx / 2
+    v_x_0 = v_x + u * v_xx
+
+    prev_price = previous[i] + u * (previous[i + 1] - previous[i - 1]) / (2 * dx) +\
+                 u ** 2 * (previous[i + 1] - 2 * previous[i] + previous[i - 1]) / (2 * dx ** 2)
+
+    delta = v_x_0 / underlying_value
+    gamma = (v_xx - v_x_0) / underlying_value ** 2
+    theta = -(price - prev_price) / dt
+
+    return (float(price), float(delta), float(gamma), float(theta))
+
+
+  def __solve(self, underlying_value: float, report_date: QfDate, vol: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+    """Method that solves the PDE on the grid
+
+    @param underlying_value  The value of the underlying security
+    @param report_date       The valuation date
+    @param vol               The volatility of the underlying. Optional, defaults to None i.e. the instance variable is used
+    @return                  The values of the underlying on the grid, the values of the contract at the report date and
+                             one time step later and the length of the time step in years
+    """
+    vol = self.__vol if vol is None else vol
+    key = (underlying_value, report_date, vol)
+
+    if self.__grid_key == key:
+      return self.__grid
+
+    years = report_date.timedelta(self.__maturity_date)
+    dt    = years / self.__n_time
+    taus  = dt * np.arange(0, self.__n_time + 1)
+
+    # The barrier levels and payoffs over the time to maturity
+    lower = [self.__lower_boundary(tau) for tau in taus] if self.__lower_boundary is not None else None
+    upper = [self.__upper_boundary(tau) for tau in taus] if self.__upper_boundary is not None else None
+
+    # Truncate the grid at the barriers if they are within the far-field distance
+    x0         = np.log(underlying_value)
+    half_width = self.__n_std * vol * np.sqrt(years)
+    x_min, x_max = x0 - half_width, x0 + half_width
+    has_lower = has_upper = False
+
+    if lower is not None:
+      level = min(level for level, _ in lower)
+      if level > 0 and np.log(level) > x_min:
+        x_min, has_lower = np.log(level), True
+
+    if upper is not None:
+      level = max(level for level, _ in upper)
+      if np.log(level) < x_max:
+        x_max, has_upper = np.log(level), True
+
+    x     = np.linspace(x_min, x_max, self.__n_space + 1)
+    dx    = x[1] - x[0]
+    spots = np.exp(x)
+
+    # Coefficients of the operator L V = 1/2 vol^2 V_xx + (r - 1/2 vol^2) V_x - r V on the interior nodes
+    drift = self.__rf - vol ** 2 / 2
+    a = vol ** 2 / (2 * dx ** 2) - drift / (2 * dx)
+    b = -vol ** 2 / dx ** 2 - self.__rf
+    c = vol ** 2 / (2 * dx ** 2) + drift / (2 * dx)
+
+    values   = _evaluate(self.__expiration_boundary, spots)
+    previous = values
+    exercise = _evaluate(self.__exercise_boundary, spots) if self.__early_exercise else None
+
+    # The matrices only depend on theta, so they are formed once for each theta used
+    systems = {}
+
+    for step in range(1, self.__n_time + 1):
+      tau   = taus[step]
+      theta = 1. if step <= self.__rannacher_steps else self.__theta
+
+      if theta not in systems:
+        systems[theta] = self.__system(a, b, c, dt, theta)
+
+      rhs = values.copy()
+      rhs[1:-1] += (1 - theta) * dt * (a * values[:-2] + b * values[1:-1] + c * values[2:])
+
+      # Dirichlet values on the edges
+      rhs[0]  = lower[step][1] if has_lower else self.__far_field(spots[0], tau)
+      rhs[-1] = upper[step][1] if has_upper else self.__far_field(spots[-1], tau)
+
+      if self.__early_exercise:
+        if not has_lower: rhs[0]  = max(rhs[0], exercise[0])
+        if not has_upper: rhs[-1] = max(rhs[-1], exercise[-1])
+
+        new_values = self.__solve_obstacle(systems[theta], rhs, exercise, values)
+      else:
+        new_values = self.__solve_linear(systems[theta], rhs)
+
+      # Knock out the nodes beyond time dependent barriers
+      if has_lower:
+        new_values[spots <= lower[step][0]] = lower[step][1]
+      if has_upper:
+        new_values[spots >= upper[step][0]] = upper[step][1]
+
+      previous, values = values, new_values
+
+    self.__grid_key = key
+    self.__grid     = (spots, values, previous, dt)
+
+    return self.__grid
+
+
+  def __far_field(self, spot: float, tau: float) -> float:
+    """The discounted payoff at the forward used as the value on a truncated grid boundary"""
+    forward = spot * np.exp(self.__rf * tau)
+    return float(np.exp(-self.__rf * tau) * _evaluate(self.__expiration_boundary, np.array([forward]))[0])
+
+
+  def __system(self, a: float, b: float, c: float, dt: float, theta: float) -> Dict[str, any]:
+    """Method that forms the bands of the implicit matrix I - theta dt L with identity rows on the edges"""
+    n = self.__n_space + 1
+
+    lower_band = np.full(n - 1, -theta * dt * a)
+    diag_band  = np.full(n, 1 - theta * dt * b)
+    upper_band = np.full(n - 1, -theta * dt * c)
+
+    diag_band[0] = diag_band[-1] = 1.
+    upper_band[0] = lower_band[-1] = 0.
+
+    system = {"lower": lower_band, "diag": diag_band, "upper": upper_band, "penalized": False}
+
+    if self.__solver == "cpplib":
+      from ....cpplib import LinearSystem
+      # ILU(0) is exact for a tridiagonal matrix so the preconditioned solver converges immediately
+      system["handle"] = LinearSystem(sparse.diags([lower_band, diag_band, upper_band], [-1, 0, 1], format="csr"),
+                                      solver="CGNR", preconditioner="ILU0", tol=1e-20)
+
+    return system
+
+
+  def __solve_linear(self, system: Dict[str, any], rhs: np.ndarray, penalty: Optional[np.ndarray] = None) -> np.ndarray:
+    """Method that solves the tridiagonal system with an optional penalty added on the diagonal"""
+    diag_band = system["diag"] if penalty is None else system["diag"] + penalty
+
+    if self.__solver == "cpplib":
+      # Only the diagonal changes with the penalty, so it is replaced on the prebuilt system
+      if penalty is not None or system["penalized"]:
+        system["handle"].set_diagonal(diag_band)
+        system["penalized"] = penalty is not None
+
+      return system["handle"].solve(rhs)
+
+    # The banded LAPACK solver is the Thomas algorithm for a tridiagonal matrix
+    bands = np.zeros((3, len(rhs)))
+    bands[0, 1:]  = system["upper"]
+    bands[1]      = diag_band
+    bands[2, :-1] = system["lower"]
+
+    return linalg.solve_banded((1, 1), bands, rhs, overwrite_ab=True, check_finite=False)
+
+
+  def __solve_obstacle(self, system: Dict[str, any], rhs: np.ndarray, exercise: np.ndarray, guess: np.ndarray,
+                       max_iter: int = 100, tol: float = 1e-10) -> np.ndarray:
+    """Method that solves the linear complementarity problem for early exercise with the penalty method or PSOR"""
+
+    if self.__exercise_method == "penalty":
+      # Penalty iteration of Forsyth & Vetzal. Converges once the set of exercised nodes stops changing
+      large  = 1 / tol
+      values = self.__solve_linear(system, rhs)
+
+      for _ in range(max_iter):
+        active = values < exercise
+        active[0] = active[-1] = False
+        penalty = large * active
+
+        new_values = self.__solve_linear(system, rhs + penalty * exercise, penalty)
+
+        if np.array_equal(new_values < exercise, values < exercise) and \
+           np.max(np.abs(new_values - values)) < tol * max(1., np.max(np.abs(new_values))):
+          return new_values
+
+        values = new_values
+
+      return values
+
+    # Projected SOR with red-black ordering. The nodes of one color only depend on the nodes of the other
+    omega = 1.2
+    lower, diag, upper = system["lower"], system["diag"], system["upper"]
+    values = np.maximum(guess, exercise)
+    values[0], values[-1] = rhs[0], rhs[-1]
+    n = len(values)
+
+    for _ in range(max_iter * 10):
+      error = 0.
+
+      for first in (1, 2):
+        nodes        = slice(first, n - 1, 2)
+        gauss_seidel = (rhs[nodes] - lower[first - 1:n - 2:2] * values[first - 1:n - 2:2] -
+                        upper[nodes] * values[first + 1:n:2]) / diag[nodes]
+        new_values   = np.maximum(exercise[nodes], values[nodes] + omega * (gauss_seidel - values[nodes]))
+        error       += np.sum((new_values - values[nodes]) ** 2)
+        values[nodes] = new_values
+
+      if error < tol ** 2:
+        break
+
+    return values
@@ -0,0 +1,490 @@
+"""@package quantform.pylib.equity.pricer.LatticePricer
+@author Kasper Rantamäki
+Submodule with a vectorized binomial/trinomial lattice pricer for European and American options
+"""
+from typing import Callable, Dict, List, Literal, Optional, Sequence, Tuple, Union
+import numpy as np
+
+from .EquityPricerABC import EquityPricerABC
+from ...QfDate import QfDate
+from ...lazy import lazy_import
+from ...instrumentation import timed, observe
+
+optimize = lazy_import("scipy.optimize")
+
+
+class LatticePricer(EquityPricerABC):
+  """Option pricer based on recombining binomial (Cox-Ross-Rubinstein) or trinomial (Boyle) lattices
+
+  The backward induction is done one time slice at a time as array operations, with all strikes given to the pricer
+  valued on the same lattice. Discrete dividends are handled with the escrowed dividend model, i.e. the lattice is built
+  for the underlying less the present value of the dividends paid before maturity and the present value of the remaining
+  dividends is added back when evaluating the exercise value on a node. The values on the first time slices of the latest
+  lattice are stored, so the price, delta, gamma and theta for the same underlying value and report date come from a
+  single backward induction. Without early exercise the values on the first time slices are instead formed from the
+  terminal payoffs with the state prices of the underlying alone.
+  """
+
+  def __init__(self, maturity_date: QfDate, type: Literal["Call", "Put"], strike: Union[float, np.ndarray], risk_free_rate: float,
+               volatility: Optional[float] = None, american: bool = False, lattice: Literal["Binomial", "Trinomial"] = "Binomial",
+               n_steps: int = 500, dividends: Optional[List[Tuple[QfDate, float]]] = None, market_price: Optional[float] = None,
+               underlying_value: Optional[float] = None, report_date: Optional[QfDate] = None, n_std: float = 6.) -> None:
+    """Constructor method
+
+    Constructor method that stores the passed parameters as instance variables. As with 'BlackScholesPricer' the implied
+    volatility is calculated from the market price if the volatility is not given, which requires a single strike.
+
+    @param maturity_date     The maturity date for the option
+    @param type              The type of option ('Call' or 'Put')
+    @param strike            The strike price of the option or an array of strike prices valued on the same lattice
+    @param risk_free_rate    The prevailing risk-free rate
+    @param volatility        The volatility of the underlying. Optional, defaults to None
+    @param american          Boolean flag specifying if the option can be exercised early. Optional, defaults to False
+    @param lattice           The type of lattice ('Binomial' or 'Trinomial'). Optional, defaults to 'Binomial'
+    @param n_steps           The number of time steps in the lattice. Optional, defaults to 500
+    @param dividends         List of the ex-dividend dates and the cash dividends. Optional, defaults to None i.e. no dividends
+    @param market_price      The market price for the option. Optional, defaults to None
+    @param underlying_value  The value of the underlying for the market price. Optional, defaults to None
+    @param report_date       The date for the market price and the underlying value. Optional, defaults to None
+    @param n_std             The number of standard deviations at which the lattice is truncated. Optional, defaults to 6
+    @raises AssertionError   Raised if the maturity date doesn't use 'Business/252' convention or a parameter is invalid
+    @raises AssertionError   Raised if volatility is not given and cannot be computed
+    @return                  None
+    """
+    assert maturity_date.convention == "Business/252", f"Maturity date has an invalid day count convention! ({maturity_date.convention} != 'Business/252')"
+    assert type.lower() in ["call", "put"], f"Invalid option type specified! ({type} not in ['Call', 'Put'])"
+    assert lattice.lower() in ["binomial", "trinomial"], f"Invalid lattice specified! ({lattice} not in ['Binomial', 'Trinomial'])"
+    assert n_steps >= 2, f"The lattice must have at least two time steps! ({n_steps} < 2)"
+    assert (volatility is not None) or ((market_price is not None) and (underlying_value is not None) and (report_date is not None)), "Either volatility or market parameters need to be defined!"
+
+    self.__maturity_date = maturity_date
+    self.__option_type   = type
+    self.__strike        = strike
+    self.__strikes       = np.atleast_1d(np.asarray(strike, dtype=np.float64))
+    self.__rf            = risk_free_rate
+    self.__vol           = volatility
+    self.__american      = american
+    self.__lattice       = lattice.lower()
+    self.__n_steps       = n_steps
+    self.__dividends     = dividends if dividends is not None else []
+    self.__n_std         = n_std
+
+    # The latest lattice and the parameters it was formed for
+    self.__lattice_key    = None
+    self.__lattice_values = None
+
+    self.__vol_type         = "Given"
+    self.__report_date      = report_date
+    self.__underlying_value = underlying_value
+
+    if volatility is None:
+      assert np.ndim(strike) == 0, "Implied volatility can only be calculated for a single strike!"
+      self.__vol = self.implied_volatility(market_price, underlying_value, report_date)
+      self.__vol_type = "Implied"
+
+
+  @timed
+  def __call__(self, underlying_value: float, report_date: QfDate, vol: Optional[float] = None) -> Union[float, np.ndarray]:
+    if report_date > self.__maturity_date:
+      # Expired option is worthless
+      return self.__shaped(np.zeros(len(self.__strikes)))
+
+    if self.__maturity_date == report_date:
+      return self.__shaped(self.__payoff(np.array([underlying_value]))[:, 0])
+
+    values, _, _ = self.__induct(underlying_value, report_date, vol)
+
+    return self.__shaped(values[0][:, 0])
+
+
+  def __str__(self) -> str:
+    """Simple string representation"""
+    return f"{self.__lattice.capitalize()} {'American' if self.__american else 'European'} {self.__option_type} Option Pricer"
+
+
+  def __repr__(self) -> str:
+    """Exhaustive string representation"""
+    return f"{self.__lattice.capitalize()} Lattice Pricer\nOption Type: {self.__option_type}\nAmerican: {self.__american}\n" +\
+           f"Maturity Date: {self.__maturity_date}\nStrike: {self.__strike}\nRisk-free Rate: {self.__rf}\nVolatility: {self.__vol}\n" +\
+           f"Steps: {self.__n_steps}\nDividends: {[(str(date), amount) for date, amount in self.__dividends]}"
+
+
+  @property
+  def volatility(self) -> float:
+    return self.__vol
+
+
+  def delta(self, underlying_value: float, report_date: QfDate) -> Union[float, np.ndarray]:
+    if report_date >= self.__maturity_date:
+      # Expired option has no sensitivities
+      return self.__shaped(np.zeros(len(self.__strikes)))
+
+    values, spots, _ = self.__induct(underlying_value, report_date)
+
+    return self.__shaped((values[1][:, -1] - values[1][:, 0]) / (spots[1][-1] - spots[1][0]))
+
+
+  def vega(self, underlying_value: float, report_date: QfDate, difference: float = 1e-3) -> Union[float, np.ndarray]:
+    if report_date >= self.__maturity_date:
+      # Expired option has no sensitivities
+      return self.__shaped(np.zeros(len(self.__strikes)))
+
+    return (self(underlying_value, report_date, vol = self.__vol + difference / 2) -\
+            self(underlying_value, report_date, vol = self.__vol - difference / 2)) / difference
+
+
+  def gamma(self, underlying_value: float, report_date: QfDate) -> Union[float, np.ndarray]:
+    if report_date >= self.__maturity_date:
+      # Expired option has no sensitivities
+      return self.__shaped(np.zeros(len(self.__strikes)))
+
+    values, spots, _ = self.__induct(underlying_value, report_date)
+
+    # The first slice with three nodes
+    slice_i = 2 if self.__lattice == "binomial" else 1
+    v, s    = values[slice_i], spots[slice_i]
+    mid     = 1
+
+    upper_delta = (v[:, -1] - v[:, mid]) / (s[-1] - s[mid])
+    lower_delta = (v[:, mid] - v[:, 0]) / (s[mid] - s[0])
+
+    return self.__shaped((upper_delta - lower_delta) / ((s[-1] - s[0]) / 2))
+
+
+  def theta(self, underlying_value: float, report_date: QfDate) -> Union[float, np.ndarray]:
+    """The theta of the option
+
+    Calculates the theta (sensitivity to the passage of time, per year) from the middle node two time steps into the lattice
+
+    @param underlying_value  The value of the underlying security
+    @param report_date       The valuation date
+    @return                  The theta of the option
+    """
+    if report_date >= self.__maturity_date:
+      # Expired option has no sensitivities
+      return self.__shaped(np.zeros(len(self.__strikes)))
+
+    values, _, dt = self.__induct(underlying_value, report_date)
+    mid = (values[2].shape[1] - 1) // 2
+
+    # For the binomial lattice the middle node after two steps is at the initial value of the underlying
+    steps = 2 if self.__lattice == "binomial" else 1
+    later = values[2][:, mid] if self.__lattice == "binomial" else values[1][:, (values[1].shape[1] - 1) // 2]
+
+    return self.__shaped((later - values[0][:, 0]) / (steps * dt))
+
+
+  @classmethod
+  @timed
+  def batch_risk(cls, pricers: Sequence[EquityPricerABC], underlying_values: np.ndarray, report_date: QfDate,
+                 measures: Sequence[str] = ("price", "delta", "gamma", "vega", "theta"),
+                 vol_shifts: Optional[Sequence[float]] = None) -> Dict[str, np.ndarray]:
+    """Method for calculating the price and greeks for a group of pricers over a vector of underlying values
+
+    Pricers that differ only by their strikes are merged into a single pricer with an array of strikes, so that they are
+    valued on one shared lattice. Without cash dividends the values are homogeneous in the underlying and the strike i.e.
+    \f$V(S, K) = S V(1, K/S)\f$, so the underlying values are folded into the strikes of a lattice on a unit underlying.
+    The price, delta, gamma and theta for all of the underlying values then come from a single backward induction per
+    volatility shift.
+
+    @param pricers            The lattice pricers to evaluate
+    @param underlying_values  The values of the underlying security
+    @param report_date        The valuation date
+    @param measures           The calculated quantities out of 'price', 'delta', 'gamma', 'vega' and 'theta'. Optional,
+                              defaults to all of them
+    @param vol_shifts         Absolute shifts added to the volatilities of the pricers. Optional, defaults to None i.e. the
+                              volatilities are not shifted
+    @return                   Dictionary with the requested measures as arrays of shape (n_underlying_values, n_pricers) or
+                              (n_underlying_values, n_vol_shifts, n_pricers) if 'vol_shifts' is given
+    """
+    spots  = np.atleast_1d(np.asarray(underlying_values, dtype=np.float64))
+    shifts = np.zeros(1) if vol_shifts is None else np.atleast_1d(np.asarray(vol_shifts, dtype=np.float64))
+    result = {measure: np.zeros((len(spots), len(shifts), len(pricers))) for measure in measures}
+
+    # The delta is homogeneous of degree zero, the gamma of degree minus one and the other measures of degree one
+    degrees = {"price": 1, "delta": 0, "gamma": -1, "vega": 1, "theta": 1}
+
+    groups = {}
+    for j, pricer in enumerate(pricers):
+      key = (pricer.__maturity_date, pricer.__option_type.lower(), pricer.__rf, pricer.__vol, pricer.__american, pricer.__lattice,
+             pricer.__n_steps, tuple((str(date), amount) for date, amount in pricer.__dividends), pricer.__n_std)
+      groups.setdefault(key, []).append(j)
+
+    for indexes in groups.values():
+      first   = pricers[indexes[0]]
+      strikes = np.array([pricers[j].__strike for j in indexes], dtype=np.float64)
+      folded  = len(first.__dividends) == 0 and bool((spots > 0).all())
+      strikes = (strikes[None, :] / spots[:, None]).ravel() if folded else strikes
+
+      for k, shift in enumerate(shifts):
+        merged = LatticePricer(first.__maturity_date, first.__option_type, strikes, first.__rf, first.__vol + shift, first.__american,
+                               first.__lattice, first.__n_steps, first.__dividends, n_std = first.__n_std)
+        values = {"price": merged, "delta": merged.delta, "gamma": merged.gamma, "vega": merged.vega, "theta": merged.theta}
+
+        # The vega is calculated last, as the bumped lattices replace the stored one
+        for measure in sorted(measures, key=lambda measure: measure == "vega"):
+          if folded:
+            result[measure][:, k, indexes] = spots[:, None] ** degrees[measure] * values[measure](1., report_date).reshape(len(spots), len(indexes))
+            continue
+
+          for i, spot in enumerate(spots):
+            result[measure][i, k, indexes] = values[measure](spot, report_date)
+
+    if vol_shifts is None:
+      return {measure: values[:, 0, :] for measure, values in result.items()}
+
+    return result
+
+
+  @timed
+  def implied_volatility(self, market_price: float, underlying_value: float, report_date: QfDate) -> float:
+    """Method for calculating the implied volatility
+
+    Method that calculates the volatility implicit in the option price
+
+    @param market_price      The market price for the option
+    @param underlying_value  The value of the underlying for the market price
+    @param report_date       The date for the market price and the underlying value
+    @return                  The implied volatility
+    """
+    assert self.__maturity_date >= report_date, f"Report date must be at most maturity date! ({report_date} > {self.__maturity_date})"
+
+    if (self.__vol_type == "Implied") and (self.__report_date == report_date) and (self.__underlying_value == underlying_value):
+      return self.__vol
+
+    diff_func = self._diff_factory(market_price, underlying_value, report_date)
+
+    # The transition probabilities are only valid if the volatility dominates the drift over a time step
+    lower = max(1e-6, 1.5 * abs(self.__rf) * np.sqrt(report_date.timedelta(self.__maturity_date) / self.__n_steps))
+    assert diff_func(lower) < 0, f"Implied volatility can't be calculated as the lower bound difference is not negative! (Lower bound is {diff_func(lower)})"
+
+    upper = 0.01
+    while diff_func(upper) < 0 and upper < 100:
+        upper += 0.1
+
+    assert upper < 100, "Implied volatility can't be calculated as the difference is not positive for any upped bound!"
+
+    result = optimize.root_scalar(diff_func, method="bisect", bracket=(lower, upper))
+    observe("LatticePricer.implied_volatility.iterations", (result.iterations,))
+
+    return result.root
+
+
+  def __shaped(self, values: np.ndarray) -> Union[float, np.ndarray]:
+    """Method that returns a float for a single strike and an array otherwise"""
+    if np.ndim(self.__strike) == 0:
+      return float(values[0])
+
+    return values
+
+
+  def __payoff(self, spots: np.ndarray) -> np.ndarray:
+    """The exercise values as an array of shape (n_strikes, n_spots)"""
+    if self.__option_type.lower() == "call":
+      return np.maximum(spots[None, :] - self.__strikes[:, None], 0.)
+
+    return np.maximum(self.__strikes[:, None] - spots[None, :], 0.)
+
+
+  def __induct(self, underlying_value: float, report_date: QfDate,
+               vol: Optional[float] = None) -> Tuple[List[np.ndarray], List[np.ndarray], float]:
+    """Method that runs the backward induction over the lattice
+
+    The lattice is truncated on each time slice at 'n_std' standard deviations of the distribution of the underlying on
+    that slice away from the initial value, as the nodes beyond that don't contribute to the price. When the window widens
+    during the backward induction the missing neighbours on the edges are filled with the discounted payoff at the forward
+    (and the exercise value for American options), which is essentially exact that far away. The first three time slices
+    are always kept whole for the greeks.
+
+    Without early exercise the values on the third time slice are the terminal payoffs weighted by the discounted
+    probabilities of reaching them (state prices), which are formed for the underlying alone instead of inducing the
+    values of every strike backward.
+
+    @param underlying_value  The value of the underlying security
+    @param report_date       The valuation date
+    @param vol               The volatility of the underlying. Optional, defaults to None i.e. the instance variable is used
+    @return                  The option values and the values of the underlying on the first three time slices and the
+                             length of the time step in years
+    """
+    vol = self.__vol if vol is None else vol
+    key = (underlying_value, report_date, vol)
+
+    if self.__lattice_key == key:
+      return self.__lattice_values
+
+    n     = self.__n_steps
+    years = report_date.timedelta(self.__maturity_date)
+    dt    = years / n
+    disc  = np.exp(-self.__rf * dt)
+
+    # Present value of the remaining dividends on each time slice (escrowed dividend model)
+    times        = dt * np.arange(n + 1)
+    dividend_pvs = np.zeros(n + 1)
+    for date, amount in self.__dividends:
+      t = report_date.timedelta(date)
+      if 0 <= t <= years:
+        dividend_pvs += np.where(times < t, amount * np.exp(-self.__rf * (t - times)), 0.)
+
+    base = underlying_value - dividend_pvs[0]
+    assert base > 0, f"The present value of the dividends exceeds the value of the underlying! ({dividend_pvs[0]} >= {underlying_value})"
+
+    # The nodes on slice i are base * u^k for offsets k in [-i, i], in steps of two for the binomial lattice
+    if self.__lattice == "binomial":
+      # Cox-Ross-Rubinstein
+      spacing  = 2
+      log_u    = vol * np.sqrt(dt)
+      p_up     = (np.exp(self.__rf * dt) - np.exp(-log_u)) / (np.exp(log_u) - np.exp(-log_u))
+      probs    = (disc * (1 - p_up), disc * p_up)
+    else:
+      # Boyle with the Kamrad-Ritchken probabilities
+      spacing  = 1
+      log_u    = vol * np.sqrt(2 * dt)
+      half_up, half_down = np.exp(vol * np.sqrt(dt / 2)), np.exp(-vol * np.sqrt(dt / 2))
+      p_up     = ((np.exp(self.__rf * dt / 2) - half_down) / (half_up - half_down)) ** 2
+      p_down   = ((half_up - np.exp(self.__rf * dt / 2)) / (half_up - half_down)) ** 2
+      probs    = (disc * p_down, disc * (1 - p_up - p_down), disc * p_up)
+
+    assert 0 < p_up < 1, f"The lattice has invalid transition probabilities! (Try increasing the number of steps)"
+
+    spots_at = lambda i, offsets: base * np.exp(log_u * offsets) + dividend_pvs[i]
+
+    # An American call on an underlying without dividends is never exercised early
+    exercise = self.__american and not (self.__option_type.lower() == "call" and len(self.__dividends) == 0 and self.__rf >= 0)
+
+    def window(i: int) -> int:
+      """The largest offset kept on slice i"""
+      max_offset = min(i, max(2, int(np.ceil(self.__n_std * vol * np.sqrt(i * dt) / log_u))))
+      return max_offset - (max_offset - i) % spacing
+
+    saved = {}
+
+    if exercise:
+      self.__backward(window, spots_at, probs, spacing, log_u, base, years, dt, saved)
+    else:
+      self.__forward(window, spots_at, probs, spacing, saved)
+
+    self.__lattice_key    = key
+    self.__lattice_values = ([saved[i] for i in range(3)], [spots_at(i, np.arange(-i, i + 1, spacing)) for i in range(3)], dt)
+
+    return self.__lattice_values
+
+
+  def __forward(self, window: Callable[[int], int], spots_at: Callable[[int, np.ndarray], np.ndarray], probs: Tuple[float, ...],
+                spacing: int, saved: Dict[int, np.ndarray]) -> None:
+    """Method that values the first three time slices of a lattice without early exercise with state prices
+
+    The state prices of moving by each offset over the time steps after the third slice are the powers of the discounted
+    transition probabilities under convolution, which are formed by repeated squaring. The values of all strikes on the
+    third slice are then matrix products of the state prices with the terminal payoffs.
+    """
+    n = self.__n_steps
+
+    # The mass moving out of the window is dropped instead of being valued on ghost nodes, so the window is twice as wide
+    reach = min(n, 2 * window(n))
+
+    def convolve(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+      """The convolution of two arrays centered on offset zero, truncated to the window"""
+      values = np.convolve(first, second)
+      center = (len(values) - 1) // 2
+      return values[max(0, center - reach):center + reach + 1]
+
+    # The offset of the underlying moves by -1 and +1 on the binomial and by -1, 0 and +1 on the trinomial lattice
+    kernel = np.array([probs[0], 0., probs[1]]) if spacing == 2 else np.array(probs)
+    prices = np.ones(1)
+
+    steps = n - 2
+    while steps > 0:
+      if steps % 2 == 1:
+        prices = convolve(prices, kernel)
+      steps //= 2
+      if steps > 0:
+        kernel = convolve(kernel, kernel)
+
+    half     = (len(prices) - 1) // 2
+    payoffs  = self.__payoff(spots_at(n, np.arange(-half - 2, half + 3)))
+    saved[2] = np.stack([payoffs[:, 2 + start:2 + start + len(prices)] @ prices for start in range(-2, 3, spacing)], axis=1)
+
+    for i in (1, 0):
+      width    = saved[i + 1].shape[1] - (len(probs) - 1)
+      saved[i] = sum(prob * saved[i + 1][:, branch:branch + width] for branch, prob in enumerate(probs))
+
+
+  def __backward(self, window: Callable[[int], int], spots_at: Callable[[int, np.ndarray], np.ndarray], probs: Tuple[float, ...],
+                 spacing: int, log_u: float, base: float, years: float, dt: float, saved: Dict[int, np.ndarray]) -> None:
+    """Method that runs the backward induction with early exercise one time slice at a time
+
+    The values are held as arrays of shape (n_nodes, n_strikes), so that the nodes of a slice are contiguous in memory.
+    """
+    n    = self.__n_steps
+    call = self.__option_type.lower() == "call"
+
+    def ghost(i: int, offsets: np.ndarray) -> np.ndarray:
+      """The far-field values on slice i at the given offsets"""
+      tau   = years - i * dt
+      value = np.exp(-self.__rf * tau) * self.__payoff(base * np.exp(log_u * offsets + self.__rf * tau))
+
+      return np.maximum(value, self.__payoff(spots_at(i, offsets))).T
+
+    n_strikes = len(self.__strikes)
+    n_nodes   = (2 * window(n)) // spacing + 1
+
+    # Without dividends the exercise values only depend on the offset, so they are formed once for all of the slices.
+    # The values of a slice are then a view, which for the binomial lattice is taken from the offsets of its parity
+    reach = window(n) + spacing
+    if not self.__dividends:
+      exercise_values = self.__payoff(spots_at(0, np.arange(-reach, reach + 1))).T
+      exercise_values = [np.ascontiguousarray(exercise_values[parity::spacing]) for parity in range(spacing)]
+    else:
+      exercise_values = None
+
+    # Two buffers with room for a ghost node on both sides that are swapped between the slices
+    buffers = [np.empty((n_nodes + 4, n_strikes)), np.empty((n_nodes + 4, n_strikes))]
+    temp    = np.empty((n_nodes + 4, n_strikes))
+
+    offset = window(n)
+    width  = (2 * offset) // spacing + 1
+    buffers[0][1:1 + width] = self.__payoff(spots_at(n, np.arange(-offset, offset + 1, spacing))).T
+    if n == 2:
+      saved[2] = buffers[0][1:1 + width].T.copy()
+
+    current = 0
+
+    for i in range(n - 1, -1, -1):
+      values = buffers[current]
+      lo, hi = 1, 1 + width
+
+      # Widen the window on slice i + 1 with ghost nodes if slice i keeps more nodes
+      if window(i) > offset - 1:
+        values[[0, hi]] = ghost(i + 1, np.array([-offset - spacing, offset + spacing]))
+        lo, hi  = 0, hi + 1
+        offset += spacing
+
+      width        = hi - lo - (len(probs) - 1)
+      offset      -= 1
+      continuation = buffers[1 - current][1:1 + width]
+
+      np.multiply(values[lo:lo + width], probs[0], out=continuation)
+      for branch in range(1, len(probs)):
+        np.multiply(values[lo + branch:lo + branch + width], probs[branch], out=temp[:width])
+        continuation += temp[:width]
+
+      # The exercise value is only positive below the largest strike (put) or above the smallest strike (call)
+      spots = spots_at(i, np.arange(-offset, offset + 1, spacing))
+      nodes = slice(np.searchsorted(spots, self.__strikes.min()), width) if call else slice(0, np.searchsorted(spots, self.__strikes.max()))
+
+      if exercise_values is not None:
+        first     = reach - offset
+        exercised = exercise_values[first % spacing][first // spacing:first // spacing + width]
+      else:
+        exercised = temp[:width]
+        if call:
+          np.subtract(spots[nodes, None], self.__strikes[None, :], out=exercised[nodes])
+        else:
+          np.subtract(self.__strikes[None, :], spots[nodes, None], out=exercised[nodes])
+
+      np.maximum(continuation[nodes], exercised[nodes], out=continuation[nodes])
+
+      current = 1 - current
+
+      if i <= 2:
+        saved[i] = continuation.T.copy()
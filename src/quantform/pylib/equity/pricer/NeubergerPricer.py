@@ -7,6 +7,7 @@ from typing import Callable, Literal
 
 from .EquityPricerABC import EquityPricerABC
 from ...QfDate import QfDate
+from ...instrumentation import timed
 
 
 class NeubergerPricer(EquityPricerABC):
@@ -23,6 +24,7 @@ class NeubergerPricer(EquityPricerABC):
     self.__vol           = volatility 
     
     
+  @timed
   def __call__(self, underlying_value: float, report_date: QfDate) -> float:
     return np.log(underlying_value / self.__strike) - 0.5 * np.square(self.__vol) * report_date.timedelta(self.__maturity_date)
   
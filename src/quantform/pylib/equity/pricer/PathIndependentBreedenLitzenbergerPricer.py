@@ -5,14 +5,17 @@ value of which is derived from the stock price process at the maturity of the co
 """
 import numpy as np
 from typing import Callable, Literal, Optional, Tuple
-from scipy.integrate import quad
-from scipy.stats import norm
 
 from .EquityPricerABC import EquityPricerABC
 from .BlackScholesPricer import BlackScholesPricer
 from ...curve import ImpliedVolatilityCurve, ProbabilityDensityCurve
 from ..utils import discount
 from ...QfDate import QfDate
+from ...numerics import norm_pdf
+from ...lazy import lazy_import
+from ...instrumentation import timed
+
+integrate = lazy_import("scipy.integrate")
 
 
 class PathIndependentBreedenLitzenbergerPricer(EquityPricerABC):
@@ -47,6 +50,7 @@ class PathIndependentBreedenLitzenbergerPricer(EquityPricerABC):
       raise ValueError(f"Invalid option pricer specified! ({option_pricer} not in ['BlackScholes'])")
 
 
+  @timed
   def __call__(self, underlying_value: float, report_date: QfDate, integration_interval: Optional[Tuple[float, float]] = None) -> float:
     """
     """
@@ -56,7 +60,7 @@ class PathIndependentBreedenLitzenbergerPricer(EquityPricerABC):
     def integrand(x: float) -> float:
       return self.__payoff(x) * self.__pricer(self.__maturity_date, 'Call', x, self.__rf, self.__vol(x)).gamma(underlying_value, report_date)
     
-    return quad(integrand, integration_interval[0], integration_interval[1])[0]
+    return integrate.quad(integrand, integration_interval[0], integration_interval[1])[0]
 
 
   def __str__(self) -> str:
@@ -87,10 +91,10 @@ class PathIndependentBreedenLitzenbergerPricer(EquityPricerABC):
       d_plus = self.__pricer(self.__maturity_date, 'Call', x, self.__rf, vol).d_plus(underlying_value, report_date)
       timedelta = report_date.timedelta(self.__maturity_date)
       
-      return -self.__payoff(x) * (d_plus * norm.pdf(d_plus) + vol * np.sqrt(timedelta) * norm.pdf(d_plus)) \
+      return -self.__payoff(x) * (d_plus * norm_pdf(d_plus) + vol * np.sqrt(timedelta) * norm_pdf(d_plus)) \
         / np.square(underlying_value * vol * np.sqrt(timedelta))
     
-    return quad(integrand, integration_interval[0], integration_interval[1])[0]
+    return integrate.quad(integrand, integration_interval[0], integration_interval[1])[0]
 
 
   def gamma(self, underlying_value: float, report_date: QfDate, integration_interval: Optional[Tuple[float, float]] = None) -> float:
@@ -110,10 +114,10 @@ class PathIndependentBreedenLitzenbergerPricer(EquityPricerABC):
       d_plus = self.__pricer(self.__maturity_date, 'Call', x, self.__rf, vol).d_plus(underlying_value, report_date)
       timedelta = report_date.timedelta(self.__maturity_date)
       
-      return -self.__payoff(x) * (vol * d_plus * norm.pdf(d_plus) * (d_plus / vol - np.sqrt(timedelta)) - norm.pdf(d_plus)) \
+      return -self.__payoff(x) * (vol * d_plus * norm_pdf(d_plus) * (d_plus / vol - np.sqrt(timedelta)) - norm_pdf(d_plus)) \
         / (underlying_value * np.sqrt(timedelta) * np.square(vol))
     
-    return quad(integrand, integration_interval[0], integration_interval[1])[0]
+    return integrate.quad(integrand, integration_interval[0], integration_interval[1])[0]
 
 
   def implied_density(self, underlying_value: float, report_date: QfDate, integration_interval: Optional[Tuple[float, float]] = None) -> ProbabilityDensityCurve:
@@ -126,7 +130,7 @@ class PathIndependentBreedenLitzenbergerPricer(EquityPricerABC):
     def unnorm_pdf(x: float) -> float:
       return self.__pricer(self.__maturity_date, 'Call', x, self.__rf, self.__vol(x)).gamma(underlying_value, report_date) / discount(self.__rf, report_date.timedelta(self.__maturity_date))
     
-    norm_factor = 1 / quad(unnorm_pdf, integration_interval[0], integration_interval[1])[0]
+    norm_factor = 1 / integrate.quad(unnorm_pdf, integration_interval[0], integration_interval[1])[0]
 
     def pdf(x: float) -> float:
       return norm_factor * unnorm_pdf(x)
@@ -3,10 +3,12 @@
 Module for class implementations of various derivatives pricers
 """
 
-__all__ = ["EquityPricerABC", "BlackScholesPricer", "PathIndependentBreedenLitzenbergerPricer", "NeubergerPricer"] 
+__all__ = ["EquityPricerABC", "BlackScholesPricer", "PathIndependentBreedenLitzenbergerPricer", "NeubergerPricer", "FiniteDifferencePricer", "LatticePricer"] 
 
 
 from .EquityPricerABC import EquityPricerABC
 from .BlackScholesPricer import BlackScholesPricer
 from .PathIndependentBreedenLitzenbergerPricer import PathIndependentBreedenLitzenbergerPricer
 from .NeubergerPricer import NeubergerPricer
+from .FiniteDifferencePricer import FiniteDifferencePricer
+from .LatticePricer import LatticePricer
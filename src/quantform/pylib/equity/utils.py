@@ -2,13 +2,21 @@
 @author Kasper Rantamäki
 Module with general utility functions
 """
-from typing import Tuple, Callable, Literal
+from __future__ import annotations
+from typing import Tuple, Callable, Literal, Union, List
 import numpy as np
 
 from ..QfDate import QfDate
+from ..lazy import lazy_import
 
+pd = lazy_import("pandas")
 
-__all__ = ["discount", "parse_option_id", "form_option_id", "bisection_method"]
+
+__all__ = ["discount", "parse_option_id", "form_option_id", "parse_option_ids", "form_option_ids", "bisection_method"]
+
+
+# The serial number of a date is the number of days since this date (as with QuantLib and Excel)
+_serial_epoch = np.datetime64("1899-12-30", "D")
 
 
 def discount(risk_free_rate: float, time_to_maturity: float, cashflow: float = 1.) -> float:
@@ -75,6 +83,108 @@ def form_option_id(underlying: str, maturity_date: QfDate, option_type: Literal[
   return underlying + contract_name
 
 
+def parse_option_ids(contract_ids: Union[np.ndarray, pd.Series, List[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+  """Vectorized version of 'parse_option_id' for a whole column of option ids
+
+  The ids are viewed as a matrix of character codes (without copying for string arrays), from which the fixed width
+  suffixes (maturity date, type and strike) are picked with a single fancy index and decoded with integer arithmetic.
+  The maturity dates are returned as serial numbers (the days since 1899-12-30, as with QuantLib) so that no date
+  objects are formed.
+
+  @param contract_ids     The option identifiers (e.g. 'AAPL250815C00237500')
+  @raises AssertionError  Raised if any of the ids is malformed or has an invalid maturity date
+  @return                 A tuple of arrays for the underlyings, the maturity date serial numbers, boolean flags that are
+                          True for calls and the strikes
+  """
+  ids = np.asarray(contract_ids)
+  if ids.dtype.kind not in "SU":
+    ids = ids.astype(str)
+
+  ids = np.ascontiguousarray(ids)
+  n   = len(ids)
+
+  if n == 0:
+    return (np.array([], dtype=str), np.array([], dtype=np.int32), np.array([], dtype=bool), np.array([], dtype=np.float64))
+
+  # Unicode strings are stored as four byte code points and byte strings as single bytes
+  char_type = np.uint32 if ids.dtype.kind == 'U' else np.uint8
+  width     = ids.dtype.itemsize // np.dtype(char_type).itemsize
+  lengths   = np.char.str_len(ids)
+  assert lengths.min() >= 15, "The option ids must have at least 15 characters!"
+
+  matrix = ids.view(char_type).reshape(n, width)
+  starts = np.arange(n, dtype=np.int64) * width + lengths - 15
+  suffix = np.take(matrix.ravel(), starts[:, None] + np.arange(15)).astype(np.int64)
+
+  digits = suffix - ord('0')
+  digits[:, 6] = 0
+
+  assert ((digits >= 0) & (digits <= 9)).all(), "The option ids have non-numeric dates or strikes!"
+  assert np.isin(suffix[:, 6], [ord('C'), ord('P')]).all(), "The option types must be either 'C' or 'P'!"
+
+  years  = 2000 + 10 * digits[:, 0] + digits[:, 1]
+  months = 10 * digits[:, 2] + digits[:, 3]
+  days   = 10 * digits[:, 4] + digits[:, 5]
+
+  # The years are always within 2000-2099, but the months and the days (against the length of the month) are validated
+  valid_months = (months >= 1) & (months <= 12)
+  month_starts = (years - 1970).astype("datetime64[Y]") + (np.where(valid_months, months, 1) - 1).astype("timedelta64[M]")
+  month_days   = ((month_starts + 1).astype("datetime64[D]") - month_starts.astype("datetime64[D]")).astype(np.int64)
+  invalid      = ~valid_months | (days < 1) | (days > month_days)
+  assert not invalid.any(), f"The option ids have invalid maturity dates! ({', '.join(ids[invalid][:5].astype(str))}" +\
+                            f"{', ...' if invalid.sum() > 5 else ''})"
+
+  dates   = month_starts.astype("datetime64[D]")
+  serials = (dates + (days - 1).astype("timedelta64[D]") - _serial_epoch).astype(np.int32)
+
+  is_call = suffix[:, 6] == ord('C')
+  strikes = (digits[:, 7:] @ (10 ** np.arange(7, -1, -1))) / 1000
+
+  # Zero out the suffixes so that the remaining characters read as the underlyings
+  prefix = matrix[:, :max(width - 15, 1)].copy()
+  prefix[np.arange(prefix.shape[1])[None, :] >= (lengths[:, None] - 15)] = 0
+  underlyings = prefix.view(f"{ids.dtype.kind}{prefix.shape[1]}").ravel().astype(str)
+
+  return (underlyings, serials, is_call, strikes)
+
+
+def form_option_ids(underlyings: Union[np.ndarray, str], maturity_serials: np.ndarray, is_call: np.ndarray, strikes: np.ndarray) -> np.ndarray:
+  """Vectorized version of 'form_option_id' for whole columns of contract details
+
+  @param underlyings       The identifiers (tickers) of the underlyings as an array or a single identifier for all
+  @param maturity_serials  The serial numbers of the maturity dates (the days since 1899-12-30)
+  @param is_call           Boolean flags that are True for calls and False for puts
+  @param strikes           The strike prices
+  @return                  The option identifiers (e.g. 'AAPL250815C00237500')
+  """
+  dates  = _serial_epoch + np.asarray(maturity_serials).astype("timedelta64[D]")
+  months = dates.astype("datetime64[M]")
+
+  years  = dates.astype("datetime64[Y]").astype(np.int64) + 1970 - 2000
+  month  = months.astype(np.int64) % 12 + 1
+  day    = (dates - months.astype("datetime64[D]")).astype(np.int64) + 1
+  strike = np.round(np.asarray(strikes, dtype=np.float64) * 1000).astype(np.int64)
+
+  # The suffix as a matrix of digits: YYMMDD, the type and the eight digit strike
+  suffix = np.empty((len(dates), 15), dtype=np.uint32)
+  suffix[:, 0:2] = np.stack([years // 10 % 10, years % 10], axis=1) + ord('0')
+  suffix[:, 2:4] = np.stack([month // 10, month % 10], axis=1) + ord('0')
+  suffix[:, 4:6] = np.stack([day // 10, day % 10], axis=1) + ord('0')
+  suffix[:, 6]   = np.where(np.asarray(is_call, dtype=bool), ord('C'), ord('P'))
+  suffix[:, 7:]  = (strike[:, None] // (10 ** np.arange(7, -1, -1))) % 10 + ord('0')
+
+  # The suffixes are written right after the underlyings into a matrix of code points that is then viewed as strings
+  names   = np.broadcast_to(np.asarray(underlyings).astype(str), (len(dates),))
+  width   = names.dtype.itemsize // 4
+  lengths = np.char.str_len(names)
+
+  matrix = np.zeros((len(dates), width + 15), dtype=np.uint32)
+  matrix[:, :width] = np.ascontiguousarray(names).view(np.uint32).reshape(len(dates), width)
+  np.put(matrix, (np.arange(len(dates), dtype=np.int64) * (width + 15) + lengths)[:, None] + np.arange(15), suffix)
+
+  return matrix.view(f"U{width + 15}").ravel()
+
+
 def bisection_method(func: Callable, lower: float, upper: float, tol: float = 1e-6) -> float:
   """Generic bisection method for finding the root of a function
   
@@ -0,0 +1,291 @@
+"""@package quantform.pylib.instrumentation
+@author Kasper Rantamäki
+Submodule with opt-in instrumentation of the hot paths of the library
+
+The instrumented functions report into the recorder installed with the 'instrument' context manager. Outside of the
+context nothing is recorded and the hooks cost a single context variable lookup, so they can be left in place in
+production code. The active recorder is held in a context variable, so each thread and asyncio task records into the
+recorder of its own context. Work handed to another thread is recorded if it is run in a copy of the context (see
+'contextvars.copy_context'). The recorder collects
+  - call counts and cumulative wall times of the functions decorated with 'timed' (e.g. the pricer calls),
+  - counters incremented with 'count',
+  - histograms of the values passed to 'observe' (e.g. the implied volatility solver and linsolve iterations) and
+  - the hit rate of the QfDate year fraction cache over the recorded period.
+
+Example:
+  with instrument() as recorder:
+    option_chain.implied_volatility(underlying_value, report_date, risk_free_rate)
+
+  print(recorder.to_prometheus())
+"""
+from __future__ import annotations
+from typing import Callable, Dict, Iterator, Optional, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from bisect import bisect_left
+import functools
+import time
+import json
+
+from .QfDate import year_fraction_cache_info
+
+
+# The default histogram buckets (upper bounds) for iteration counts and residuals
+ITERATION_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+RESIDUAL_BUCKETS  = tuple(10. ** exponent for exponent in range(-16, 1, 2))
+
+
+# The recorder of the innermost active 'instrument' context, None when instrumentation is disabled
+_recorder: ContextVar[Optional[Recorder]] = ContextVar("quantform_recorder", default=None)
+
+
+class Recorder:
+  """Collection of the metrics recorded within an 'instrument' context"""
+
+  def __init__(self, parent: Optional[Recorder] = None) -> None:
+    """Constructor method
+
+    @param parent  The recorder to which the recorded metrics are forwarded as well e.g. the one of an enclosing
+                   context. Optional, defaults to None
+    @return        None
+    """
+    self.__parent      = parent
+    self.__lock        = Lock()
+    self.__timers      = {}  # name -> [calls, seconds]
+    self.__counters    = {}  # name -> value
+    self.__histograms  = {}  # name -> [buckets, bucket counts, count, sum]
+    self.__start       = time.perf_counter()
+    self.__stop        = None
+    self.__cache_start = year_fraction_cache_info()
+    self.__cache       = None
+
+
+  def add_time(self, name: str, seconds: float) -> None:
+    """Method for recording a single timed call
+
+    @param name     The name of the timed function
+    @param seconds  The wall time of the call
+    @return         None
+    """
+    with self.__lock:
+      timer = self.__timers.setdefault(name, [0, 0.])
+      timer[0] += 1
+      timer[1] += seconds
+
+    if self.__parent is not None:
+      self.__parent.add_time(name, seconds)
+
+
+  def count(self, name: str, value: float = 1) -> None:
+    """Method for incrementing a counter
+
+    @param name   The name of the counter
+    @param value  The increment. Optional, defaults to 1
+    @return       None
+    """
+    with self.__lock:
+      self.__counters[name] = self.__counters.get(name, 0) + value
+
+    if self.__parent is not None:
+      self.__parent.count(name, value)
+
+
+  def observe(self, name: str, values: Sequence[float], buckets: Sequence[float] = ITERATION_BUCKETS) -> None:
+    """Method for adding values into a histogram
+
+    @param name     The name of the histogram
+    @param values   The observed values
+    @param buckets  The upper bounds of the buckets in increasing order. Only used on the first observation of the
+                    histogram. Optional, defaults to the iteration buckets
+    @return         None
+    """
+    with self.__lock:
+      if name not in self.__histograms:
+        self.__histograms[name] = [tuple(buckets), [0] * (len(buckets) + 1), 0, 0.]
+
+      histogram = self.__histograms[name]
+      for value in map(float, values):
+        # The last count is for the values above all of the bounds
+        histogram[1][bisect_left(histogram[0], value)] += 1
+        histogram[2]        += 1
+        histogram[3]        += value
+
+    if self.__parent is not None:
+      self.__parent.observe(name, values, buckets)
+
+
+  def _close(self) -> None:
+    """Method for freezing the elapsed time and the cache statistics when the context exits"""
+    self.__stop  = time.perf_counter()
+    self.__cache = self.__cache_delta()
+
+
+  def __cache_delta(self) -> Dict[str, int]:
+    """Method for the year fraction cache hits and misses over the recording"""
+    if self.__cache is not None:
+      return self.__cache
+
+    current = year_fraction_cache_info()
+
+    # The statistics are reset if the cache is cleared, in which case the current values are all there is
+    cleared = current["hits"] < self.__cache_start["hits"] or current["misses"] < self.__cache_start["misses"]
+    hits    = current["hits"] if cleared else current["hits"] - self.__cache_start["hits"]
+    misses  = current["misses"] if cleared else current["misses"] - self.__cache_start["misses"]
+
+    return {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses > 0 else None}
+
+
+  @property
+  def elapsed(self) -> float:
+    """The wall time of the recording in seconds"""
+    return (self.__stop if self.__stop is not None else time.perf_counter()) - self.__start
+
+
+  def to_dict(self) -> Dict[str, any]:
+    """Method for getting the recorded metrics as a dictionary
+
+    @return  Dictionary with the elapsed time ('elapsed_seconds'), the timed functions ('timers') with the number
+             of calls ('calls'), the cumulative time ('seconds') and the mean time per call ('mean_seconds'), the
+             counters ('counters') with their rate per second of the recording ('rates'), the histograms ('histograms')
+             with the bucket bounds ('buckets', the last bucket being unbounded), the counts per bucket ('counts'), the
+             number ('count') and the sum ('sum') of the observations and the year fraction cache statistics
+             ('qfdate_cache')
+    """
+    elapsed = self.elapsed
+
+    with self.__lock:
+      timers     = {name: {"calls": calls, "seconds": seconds, "mean_seconds": seconds / calls}
+                    for name, (calls, seconds) in self.__timers.items()}
+      counters   = dict(self.__counters)
+      histograms = {name: {"buckets": list(buckets), "counts": list(counts), "count": count, "sum": total}
+                    for name, (buckets, counts, count, total) in self.__histograms.items()}
+
+    return {"elapsed_seconds": elapsed, "timers": timers, "counters": counters,
+            "rates": {name: value / elapsed for name, value in counters.items()} if elapsed > 0 else {},
+            "histograms": histograms, "qfdate_cache": self.__cache_delta()}
+
+
+  def to_json(self, indent: Optional[int] = 2) -> str:
+    """Method for exporting the recorded metrics as JSON
+
+    @param indent  The indentation passed to 'json.dumps'. Optional, defaults to 2
+    @return        The metrics of 'to_dict' as a JSON string
+    """
+    return json.dumps(self.to_dict(), indent=indent)
+
+
+  def to_prometheus(self, prefix: str = "quantform") -> str:
+    """Method for exporting the recorded metrics in the Prometheus text exposition format
+
+    @param prefix  The prefix of the metric names. Optional, defaults to 'quantform'
+    @return        The metrics as text
+    """
+    metrics = self.to_dict()
+    lines   = []
+
+    def family(name: str, kind: str, description: str) -> None:
+      lines.extend([f"# HELP {prefix}_{name} {description}", f"# TYPE {prefix}_{name} {kind}"])
+
+    family("calls_total", "counter", "Number of calls of the instrumented functions")
+    lines.extend(f'{prefix}_calls_total{{function="{name}"}} {timer["calls"]}' for name, timer in metrics["timers"].items())
+
+    family("call_seconds_total", "counter", "Cumulative wall time of the instrumented functions")
+    lines.extend(f'{prefix}_call_seconds_total{{function="{name}"}} {timer["seconds"]!r}' for name, timer in metrics["timers"].items())
+
+    family("events_total", "counter", "Counted events")
+    lines.extend(f'{prefix}_events_total{{name="{name}"}} {value!r}' for name, value in metrics["counters"].items())
+
+    family("observations", "histogram", "Distributions of the observed values e.g. solver iterations")
+    for name, histogram in metrics["histograms"].items():
+      cumulative = 0
+      for bound, count in zip(histogram["buckets"] + ["+Inf"], histogram["counts"]):
+        cumulative += count
+        lines.append(f'{prefix}_observations_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+      lines.append(f'{prefix}_observations_sum{{name="{name}"}} {histogram["sum"]!r}')
+      lines.append(f'{prefix}_observations_count{{name="{name}"}} {histogram["count"]}')
+
+    family("qfdate_cache_hits_total", "counter", "Hits of the QfDate year fraction cache")
+    lines.append(f'{prefix}_qfdate_cache_hits_total {metrics["qfdate_cache"]["hits"]}')
+    family("qfdate_cache_misses_total", "counter", "Misses of the QfDate year fraction cache")
+    lines.append(f'{prefix}_qfdate_cache_misses_total {metrics["qfdate_cache"]["misses"]}')
+
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def instrument() -> Iterator[Recorder]:
+  """Context manager that enables the instrumentation
+
+  The metrics recorded within the context are collected into the yielded recorder, which can still be exported once
+  the context has exited. Contexts can be nested, in which case the inner one records only its own period and the
+  outer one records the periods of the inner ones as well.
+
+  @return  The recorder
+  """
+  recorder = Recorder(_recorder.get())
+  token    = _recorder.set(recorder)
+
+  try:
+    yield recorder
+  finally:
+    _recorder.reset(token)
+    recorder._close()
+
+
+def enabled() -> bool:
+  """Function for checking whether the instrumentation is enabled, e.g. before gathering costly statistics
+
+  @return  True within an 'instrument' context
+  """
+  return _recorder.get() is not None
+
+
+def timed(func: Callable) -> Callable:
+  """Decorator for recording the number of calls and the cumulative wall time of a function
+
+  The timer is named after the qualified name of the function (e.g. 'BlackScholesPricer.__call__').
+
+  @param func  The function to be timed
+  @return      The decorated function
+  """
+  name = func.__qualname__
+
+  @functools.wraps(func)
+  def wrapper(*args, **kwargs):
+    recorder = _recorder.get()
+    if recorder is None:
+      return func(*args, **kwargs)
+
+    start = time.perf_counter()
+    try:
+      return func(*args, **kwargs)
+    finally:
+      recorder.add_time(name, time.perf_counter() - start)
+
+  return wrapper
+
+
+def count(name: str, value: float = 1) -> None:
+  """Function for incrementing a counter, if the instrumentation is enabled
+
+  @param name   The name of the counter
+  @param value  The increment. Optional, defaults to 1
+  @return       None
+  """
+  recorder = _recorder.get()
+  if recorder is not None:
+    recorder.count(name, value)
+
+
+def observe(name: str, values: Sequence[float], buckets: Sequence[float] = ITERATION_BUCKETS) -> None:
+  """Function for adding values into a histogram, if the instrumentation is enabled
+
+  @param name     The name of the histogram
+  @param values   The observed values
+  @param buckets  The upper bounds of the buckets. Optional, defaults to the iteration buckets
+  @return         None
+  """
+  recorder = _recorder.get()
+  if recorder is not None:
+    recorder.observe(name, values, buckets)
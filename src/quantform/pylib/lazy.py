@@ -0,0 +1,58 @@
+"""@package quantform.pylib.lazy
+@author Kasper Rantamäki
+Internal module for deferring the imports of heavy dependencies
+
+Importing e.g. matplotlib, QuantLib, pandas or the scipy submodules takes from tens to hundreds of milliseconds each,
+which dominates the startup time of short-lived scripts that only need a fraction of the library. The modules of the
+library therefore bind these dependencies to lazy proxies that import the real module on the first attribute access.
+"""
+from types import ModuleType
+import importlib
+import sys
+
+
+__all__ = ["LazyModule", "lazy_import"]
+
+
+class LazyModule(ModuleType):
+  """Proxy for a module that is imported on the first attribute access
+
+  After the import the attributes of the real module are copied into the proxy, so later accesses are plain attribute
+  lookups without any indirection.
+  """
+
+  def __init__(self, name: str) -> None:
+    """Constructor method
+
+    @param name  The fully qualified name of the module (e.g. 'scipy.interpolate')
+    @return      None
+    """
+    super().__init__(name)
+
+
+  def __getattr__(self, attribute: str) -> any:
+    """Imports the module and returns the attribute. Only called for attributes not yet in the proxy"""
+    module = importlib.import_module(self.__name__)
+    self.__dict__.update(module.__dict__)
+
+    return getattr(module, attribute)
+
+
+  def __dir__(self) -> list:
+    return dir(importlib.import_module(self.__name__))
+
+
+  def __repr__(self) -> str:
+    return f"<lazy module '{self.__name__}'{' (loaded)' if self.__name__ in sys.modules else ''}>"
+
+
+def lazy_import(name: str) -> ModuleType:
+  """Function for getting a lazily imported module
+
+  @param name  The fully qualified name of the module (e.g. 'matplotlib.pyplot')
+  @return      The module itself if it has already been imported and otherwise a proxy that imports it on first use
+  """
+  if name in sys.modules:
+    return sys.modules[name]
+
+  return LazyModule(name)
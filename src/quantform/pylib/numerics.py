@@ -0,0 +1,66 @@
+"""@package quantform.pylib.numerics
+@author Kasper Rantamäki
+Internal module with fast kernels for the standard normal distribution
+
+The functions in 'scipy.stats.norm' go through the generic machinery of the continuous distributions, which costs tens
+of microseconds per call. That is significant on the scalar hot paths of the pricers, so these functions call the
+special functions directly: 'math.erfc' and 'math.exp' for scalars and the 'scipy.special' ufuncs for arrays.
+"""
+from typing import Union
+from math import erfc, exp, sqrt, pi
+import numpy as np
+
+from .lazy import lazy_import
+
+special = lazy_import("scipy.special")
+
+
+__all__ = ["norm_cdf", "norm_pdf", "norm_ppf"]
+
+
+_sqrt_2       = sqrt(2.)
+_inv_sqrt_2pi = 1. / sqrt(2. * pi)
+
+
+def norm_cdf(x: Union[float, np.ndarray], loc: float = 0., scale: float = 1.) -> Union[float, np.ndarray]:
+  """The cumulative distribution function of the normal distribution
+
+  @param x      The point or an array of points
+  @param loc    The mean of the distribution. Optional, defaults to 0
+  @param scale  The standard deviation of the distribution. Optional, defaults to 1
+  @return       The value of the distribution function as a float for a scalar and as an array otherwise
+  """
+  if isinstance(x, (float, int)):
+    return 0.5 * erfc(-(x - loc) / (scale * _sqrt_2))
+
+  return special.ndtr((np.asarray(x) - loc) / scale)
+
+
+def norm_pdf(x: Union[float, np.ndarray], loc: float = 0., scale: float = 1.) -> Union[float, np.ndarray]:
+  """The probability density function of the normal distribution
+
+  @param x      The point or an array of points
+  @param loc    The mean of the distribution. Optional, defaults to 0
+  @param scale  The standard deviation of the distribution. Optional, defaults to 1
+  @return       The value of the density function as a float for a scalar and as an array otherwise
+  """
+  if isinstance(x, (float, int)):
+    z = (x - loc) / scale
+    return _inv_sqrt_2pi * exp(-z * z / 2) / scale
+
+  z = (np.asarray(x) - loc) / scale
+  return _inv_sqrt_2pi * np.exp(-z * z / 2) / scale
+
+
+def norm_ppf(p: Union[float, np.ndarray], loc: float = 0., scale: float = 1.) -> Union[float, np.ndarray]:
+  """The percent point function (the inverse of the distribution function) of the normal distribution
+
+  @param p      The probability or an array of probabilities
+  @param loc    The mean of the distribution. Optional, defaults to 0
+  @param scale  The standard deviation of the distribution. Optional, defaults to 1
+  @return       The quantile as a float for a scalar and as an array otherwise
+  """
+  if isinstance(p, (float, int)):
+    return loc + scale * float(special.ndtri(p))
+
+  return loc + scale * special.ndtri(np.asarray(p))
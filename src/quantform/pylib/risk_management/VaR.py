@@ -3,13 +3,17 @@
 Submodule implementing some Value-at-Risk calculations for wanter 
 market variables
 """
+from __future__ import annotations
 from typing import Optional, List, Literal, Tuple
 from math import floor, sqrt
 from itertools import product
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.stats import norm
+
+from ..numerics import norm_cdf
+from ..lazy import lazy_import
+
+pd  = lazy_import("pandas")
+plt = lazy_import("matplotlib.pyplot")
 
 
 class VaR:
@@ -106,7 +110,7 @@ class VaR:
 
     if self.__scenario_losses is None:
       scenarios = self.__data.iloc[-1, :] * (self.__returns + 1)
-      self.__scenario_losses = ((scenarios - self.__data.iloc[-1, :]) * self.__quantities).sum(axis=1).to_numpy().sort()
+      self.__scenario_losses = np.sort(((scenarios - self.__data.iloc[-1, :]) * self.__quantities).sum(axis=1).to_numpy())
     
     percentile_index = floor(len(self.__scenario_losses) * (1 - confidence_level))
 
@@ -126,7 +130,7 @@ class VaR:
     @return                  The value of the VaR measure
     """
     return sum(self.__data.iloc[-1, :].to_numpy()) * \
-           norm.cdf(1 - confidence_level, loc=0, scale=sqrt(self.__portfolio_var)) * \
+           norm_cdf(1 - confidence_level, loc=0, scale=sqrt(self.__portfolio_var)) * \
            sqrt(self.__portfolio_var * time_horizon) 
   
 
@@ -151,7 +155,7 @@ class VaR:
     @return                    The value of the VaR measure
     """
     return sum(self.__data.iloc[-1, :].to_numpy()) * \
-           norm.cdf(1 - confidence_level, loc=0, scale=sqrt(standard_deviation)) * \
+           norm_cdf(1 - confidence_level, loc=0, scale=sqrt(standard_deviation)) * \
            sqrt(standard_deviation * time_horizon) 
 
 
@@ -4,10 +4,12 @@ A submodule for a generic surface defined by a set of (x, y) points and z values
 """
 import numpy as np
 from typing import Tuple
-from scipy.interpolate import CloughTocher2DInterpolator
-from scipy.ndimage import gaussian_filter
 
 from .SurfaceABC import SurfaceABC
+from ..lazy import lazy_import
+
+interpolate = lazy_import("scipy.interpolate")
+ndimage     = lazy_import("scipy.ndimage")
 
 
 class GenericSurface(SurfaceABC):
@@ -70,11 +72,11 @@ class GenericSurface(SurfaceABC):
       values_reshapen.append(cur_row_arr)
           
       # Apply the Gaussian filter to the reshapen array and flatten the result
-      self.__values = gaussian_filter(np.array(values_reshapen), self.__gaussian_sd).flatten()
+      self.__values = ndimage.gaussian_filter(np.array(values_reshapen), self.__gaussian_sd).flatten()
       
       print(len(self.__values))
     
-    self.__interpolator = CloughTocher2DInterpolator(self.__points, self.__values)
+    self.__interpolator = interpolate.CloughTocher2DInterpolator(self.__points, self.__values)
 
 
   def __call__(self, point: Tuple[float, float]) -> float:
@@ -2,12 +2,16 @@
 @author Kasper Rantamäki
 Submodule with a generic abstract base class for various surfaces
 """
+from __future__ import annotations
 from typing import Optional, Tuple
 from abc import ABC, abstractmethod
 from itertools import product
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
+
+from ..lazy import lazy_import
+
+matplotlib = lazy_import("matplotlib")
+plt        = lazy_import("matplotlib.pyplot")
 
 
 class SurfaceABC(ABC):
@@ -11,9 +11,9 @@ from setuptools import setup, find_packages
 
 
 # Compile the C++ functionality
-proc = subprocess.run("g++ -c -fPIC -static -std=c++17 -mavx -fopenmp -Wall quantform/cpplib/linsolve.cpp -lm -o quantform/cpplib/linsolve.o".split(' '), capture_output=True)
+proc = subprocess.run("g++ -c -fPIC -static -std=c++17 -mavx -fopenmp -Wall quantform/cpplib/clinsolve.cpp -lm -o quantform/cpplib/clinsolve.o".split(' '), capture_output=True)
 if proc.returncode == 0:
-  proc = subprocess.run("g++ -shared -o quantform/cpplib/linsolve.so quantform/cpplib/linsolve.o -lgomp".split(' '), capture_output=True)
+  proc = subprocess.run("g++ -shared -o quantform/cpplib/clinsolve.so quantform/cpplib/clinsolve.o -lgomp".split(' '), capture_output=True)
 else:
   raise RuntimeError(f"Could not compile the 'linsolve' submodule! Cause:\n{proc.stdout}")
 if proc.returncode != 0:
@@ -37,9 +37,13 @@ setup(
                       "quantform.pylib.equity.stochastic_process",
                       "quantform.pylib.curve",
                       "quantform.pylib.risk_management",
-                      "quantform.pylib.surface"
+                      "quantform.pylib.surface",
+                      "quantform.cpplib",
+                      "quantform.db",
+                      "quantform.broker_api"
                       ],
-  install_requires = ["pandas",  # TODO: add version specifiers
+  package_data     = {"quantform.cpplib": ["clinsolve.so"]},
+  install_requires = ["pandas",
                       "numpy",
                       "matplotlib",
                       "scipy",
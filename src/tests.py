@@ -3,4 +3,9 @@
 The main test file
 
 File that works as the entrypoint for running the test suite
-"""
\ No newline at end of file
+"""
+import unittest
+
+
+if __name__ == "__main__":
+  unittest.main(module=None, argv=["tests.py", "discover", "-s", "tests", "-t", "."])
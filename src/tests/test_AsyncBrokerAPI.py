@@ -0,0 +1,135 @@
+"""@package tests.test_AsyncBrokerAPI
+@author Kasper Rantamäki
+Tests for the thread pool adapter of the asynchronous broker API
+"""
+from typing import Optional
+import threading
+import unittest
+import asyncio
+import time
+import pandas as pd
+
+from quantform.broker_api import BrokerAPI, ThreadedBrokerAPI
+
+
+class FakeBroker(BrokerAPI):
+  """Broker answering every request after a delay while counting the calls and the calls in flight"""
+
+  def __init__(self, delay: float = 0.05, **kwargs) -> None:
+    self.__delay     = delay
+    self.__lock      = threading.Lock()
+    self.calls       = {}  # method name -> number of calls
+    self.active      = 0
+    self.max_active  = 0
+
+
+  def __del__(self) -> None:
+    pass
+
+
+  def __call(self, name: str) -> None:
+    with self.__lock:
+      self.calls[name] = self.calls.get(name, 0) + 1
+      self.active     += 1
+      self.max_active  = max(self.max_active, self.active)
+
+    time.sleep(self.__delay)
+
+    with self.__lock:
+      self.active -= 1
+
+
+  def bid(self, instrument_id: str, bid_price: float, bid_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    self.__call("bid")
+    return 0, bid_price, bid_size
+
+
+  def ask(self, instrument_id: str, ask_price: float, ask_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    self.__call("ask")
+    return 0, ask_price, ask_size
+
+
+  def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    self.__call("snap")
+    return 0, pd.DataFrame({"InstrumentID": instrument_ids, "Bid Price": 1., "Ask Price": 1.1})
+
+
+  def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    self.__call("history")
+    timestamps = pd.date_range(start_time, end_time, freq=step_size)
+    return 0, pd.DataFrame({"Timestamp": timestamps, "Close Value": range(len(timestamps))})
+
+
+  def fields(self, instrument_ids: list[str], field_ids: list[str],
+             field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    self.__call("fields")
+    return 0, pd.DataFrame({"InstrumentID": instrument_ids, **{field_id: 0. for field_id in field_ids}})
+
+
+class TestThreadedBrokerAPI(unittest.TestCase):
+
+  def test_concurrency_bound(self):
+    broker = FakeBroker()
+
+    async def run():
+      async with ThreadedBrokerAPI(broker, max_concurrency=3) as api:
+        return await api.history_many([f"I{i}" for i in range(12)], "2025-01-01", "2025-01-10", "1D")
+
+    results = asyncio.run(run())
+
+    self.assertEqual(broker.calls["history"], 12)
+    self.assertEqual(broker.max_active, 3)
+    self.assertTrue(all(code == 0 and len(df) == 10 for code, df in results.values()))
+
+
+  def test_identical_requests_are_coalesced(self):
+    broker = FakeBroker()
+    api    = ThreadedBrokerAPI(broker)
+
+    async def run():
+      return await asyncio.gather(*(api.history("SPY", "2025-01-01", "2025-01-10", "1D") for _ in range(5)),
+                                  *(api.snap(["SPY", "QQQ"]) for _ in range(3)))
+
+    results = asyncio.run(run())
+
+    self.assertEqual(broker.calls, {"history": 1, "snap": 1})
+    self.assertEqual(api.stats, {"requests": 2, "coalesced": 6})
+
+    # The waiters get their own frames
+    results[0][1].loc[0, "Close Value"] = -1
+    self.assertEqual(results[1][1].loc[0, "Close Value"], 0)
+
+
+  def test_orders_are_not_coalesced(self):
+    broker = FakeBroker()
+    api    = ThreadedBrokerAPI(broker)
+
+    async def run():
+      return await asyncio.gather(*(api.bid("SPY", 100., 1.) for _ in range(4)),
+                                  *(api.ask("SPY", 101., 1.) for _ in range(4)))
+
+    results = asyncio.run(run())
+
+    self.assertEqual(broker.calls, {"bid": 4, "ask": 4})
+    self.assertEqual(api.stats, {"requests": 8, "coalesced": 0})
+    self.assertEqual(results[0], (0, 100., 1.))
+
+
+  def test_several_event_loops(self):
+    broker = FakeBroker(delay=0.01)
+    api    = ThreadedBrokerAPI(broker, max_concurrency=2)
+
+    async def run(instrument_ids):
+      return await api.history_many(instrument_ids, "2025-01-01", "2025-01-10", "1D")
+
+    # The semaphore of the first loop must not be used by the second one
+    for loop in range(3):
+      results = asyncio.run(run([f"I{loop}.{i}" for i in range(6)]))
+      self.assertEqual(len(results), 6)
+
+    self.assertEqual(broker.calls["history"], 18)
+    self.assertLessEqual(broker.max_active, 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,102 @@
+"""@package tests.test_CachedConnection
+@author Kasper Rantamäki
+Tests for the query cache in front of a database connection
+"""
+import tempfile
+import unittest
+import time
+import os
+import pandas as pd
+
+from quantform.db import SQLiteConnection, CachedConnection, QueryCache
+
+
+class TestCachedConnection(unittest.TestCase):
+
+  def setUp(self):
+    self.directory  = tempfile.TemporaryDirectory()
+    self.connection = CachedConnection(SQLiteConnection(os.path.join(self.directory.name, "test.db")))
+    self.connection.insert_sql("main", "trades", pd.DataFrame({"id": [1, 2], "price": [1., 2.]}))
+    self.connection.insert_sql("main", "quotes", pd.DataFrame({"id": [1], "bid": [1.]}))
+
+
+  def tearDown(self):
+    self.connection.close()
+    self.directory.cleanup()
+
+
+  def test_repeated_queries_are_served_from_memory(self):
+    first  = self.connection.select_sql("SELECT * FROM trades WHERE id > ?", (0,))
+    second = self.connection.select_sql("select *   from TRADES where id > ?", (0,))
+
+    pd.testing.assert_frame_equal(first, second)
+    self.assertEqual(self.connection.cache.stats["hits"], 1)
+
+    # The results are copies, so modifying one doesn't modify the cached result
+    second.loc[0, "price"] = -1.
+    self.assertEqual(self.connection.select_sql("SELECT * FROM trades WHERE id > ?", (0,))["price"].tolist(), [1., 2.])
+
+
+  def test_writes_invalidate_the_tables_they_touch(self):
+    self.connection.select_sql("SELECT * FROM trades")
+    self.connection.select_sql("SELECT * FROM quotes")
+
+    self.connection.insert_sql("main", "trades", pd.DataFrame({"id": [3], "price": [3.]}))
+    self.assertEqual(len(self.connection.cache), 1)
+    self.assertEqual(len(self.connection.select_sql("SELECT * FROM trades")), 3)
+
+    self.connection.delete_sql("DELETE FROM trades WHERE id = ?", (3,))
+    self.assertEqual(len(self.connection.select_sql("SELECT * FROM trades")), 2)
+
+    self.connection("UPDATE quotes SET bid = 2.")
+    self.assertEqual(len(self.connection.cache), 0)
+    self.assertEqual(self.connection.select_sql("SELECT bid FROM quotes")["bid"].tolist(), [2.])
+
+
+  def test_views_are_resolved_into_their_tables(self):
+    self.connection("CREATE VIEW expensive AS SELECT * FROM trades WHERE price > 1")
+    self.connection("CREATE VIEW nested AS SELECT * FROM expensive")
+
+    self.assertEqual(len(self.connection.select_sql("SELECT * FROM nested")), 1)
+    self.connection.select_sql("SELECT * FROM quotes")
+
+    self.connection.insert_sql("main", "trades", pd.DataFrame({"id": [3], "price": [3.]}))
+    self.assertEqual(len(self.connection.cache), 1)
+    self.assertEqual(len(self.connection.select_sql("SELECT * FROM nested")), 2)
+
+
+  def test_entries_expire(self):
+    connection = CachedConnection(self.connection.connection, ttl=0.05)
+
+    connection.select_sql("SELECT * FROM trades")
+    connection.select_sql("SELECT * FROM trades")
+    time.sleep(0.1)
+    connection.select_sql("SELECT * FROM trades")
+
+    self.assertEqual({name: connection.cache.stats[name] for name in ["hits", "misses"]}, {"hits": 1, "misses": 2})
+
+
+  def test_byte_limit_evicts_least_recently_used(self):
+    frame = pd.DataFrame({"value": range(1000)}, dtype="float64")
+    size  = int(frame.memory_usage(index=True, deep=True).sum())
+    cache = QueryCache(ttl=None, max_bytes=2 * size + size // 2)
+
+    for key in ["a", "b"]:
+      cache.put(key, frame, frozenset(["t"]), cache.version(["t"]))
+    cache.get("a")
+    cache.put("c", frame, frozenset(["t"]), cache.version(["t"]))
+
+    self.assertIsNotNone(cache.get("a"))
+    self.assertIsNone(cache.get("b"))
+    self.assertIsNotNone(cache.get("c"))
+    self.assertEqual(cache.stats["evictions"], 1)
+    self.assertLessEqual(cache.nbytes, 2 * size + size // 2)
+
+    # A result larger than the limit is not stored at all
+    cache.put("d", pd.concat([frame] * 3), frozenset(["t"]), cache.version(["t"]))
+    self.assertIsNone(cache.get("d"))
+    self.assertEqual(len(cache), 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,111 @@
+"""@package tests.test_ConnectionPool
+@author Kasper Rantamäki
+Tests for the bounded pool of database connections
+"""
+import threading
+import unittest
+import os
+
+from quantform.db import ConnectionPool
+
+
+class FakeConnection:
+  """Connection recording the process that opened it and whether it has been closed"""
+
+  def __init__(self) -> None:
+    self.pid    = os.getpid()
+    self.closed = False
+
+
+  def close(self) -> None:
+    self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+
+  def test_reentrant_acquire(self):
+    pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.1)
+
+    with pool.acquire() as outer:
+      with pool.acquire() as inner:
+        self.assertIs(inner, outer)
+      # The connection stays held by the thread until the outer context exits
+      with pool.acquire() as again:
+        self.assertIs(again, outer)
+
+    self.assertEqual(pool.size, 1)
+    with pool.acquire() as connection:
+      self.assertIs(connection, outer)
+
+
+  def test_bounded_size_with_timeout(self):
+    pool     = ConnectionPool(FakeConnection, max_size=2, timeout=0.05)
+    acquired = threading.Barrier(3)
+    release  = threading.Event()
+
+    def hold():
+      with pool.acquire():
+        acquired.wait()
+        release.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(2)]
+    for thread in threads:
+      thread.start()
+    acquired.wait()
+
+    with self.assertRaises(TimeoutError):
+      with pool.acquire():
+        pass
+    self.assertEqual(pool.size, 2)
+
+    release.set()
+    for thread in threads:
+      thread.join()
+
+    with pool.acquire():
+      self.assertEqual(pool.size, 2)
+
+
+  def test_close(self):
+    pool = ConnectionPool(FakeConnection, max_size=2)
+
+    with pool.acquire() as held:
+      pool.close()
+      self.assertFalse(held.closed)
+
+    self.assertTrue(held.closed)
+    self.assertEqual(pool.size, 0)
+    with self.assertRaises(RuntimeError):
+      with pool.acquire():
+        pass
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "Forking is not supported on the platform")
+  def test_fork_reset(self):
+    pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.1)
+
+    with pool.acquire() as parent:
+      reader, writer = os.pipe()
+      pid = os.fork()
+
+      if pid == 0:
+        # The connection held by the parent must neither be reused nor count towards the size in the child
+        try:
+          with pool.acquire() as child:
+            ok = child is not parent and child.pid == os.getpid() and not parent.closed and pool.size == 1
+          os.write(writer, b"1" if ok else b"0")
+        finally:
+          os._exit(0)
+
+      os.close(writer)
+      result = os.read(reader, 1)
+      os.close(reader)
+      os.waitpid(pid, 0)
+
+    self.assertEqual(result, b"1")
+    with pool.acquire() as connection:
+      self.assertIs(connection, parent)
+
+
+if __name__ == "__main__":
+  unittest.main()
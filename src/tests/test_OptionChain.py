@@ -0,0 +1,55 @@
+"""@package tests.test_OptionChain
+@author Kasper Rantamäki
+Tests for the columnar option chains
+"""
+import unittest
+import numpy as np
+
+from quantform.pylib.QfDate import QfDate
+from quantform.pylib.equity.derivative import OptionChain
+from quantform.pylib.equity.pricer.BlackScholesPricer import BlackScholesPricer
+
+
+_contract_ids = ["AAPL261218C00200000", "AAPL261218P00210000", "AAPL270115C00250000", "AAPL250101P00200000"]
+
+
+class TestOptionChain(unittest.TestCase):
+
+  def setUp(self):
+    self.chain       = OptionChain.from_contract_ids(_contract_ids)
+    self.report_date = QfDate(2026, 10, 19, "Frankfurt", "Business/252")
+
+
+  def test_matches_the_pricer(self):
+    prices = self.chain.price(205., self.report_date, 0.03, 0.25)
+    greeks = self.chain.greeks(205., self.report_date, 0.03, 0.25)
+
+    self.assertEqual(set(greeks), {"delta", "gamma", "vega", "theta", "rho"})
+
+    for i, serial in enumerate(self.chain.maturity_serials):
+      maturity_date = QfDate.from_serial_number(int(serial), "Frankfurt", "Business/252")
+      pricer        = BlackScholesPricer(maturity_date, "Call" if self.chain.is_call[i] else "Put", self.chain.strikes[i], 0.03, 0.25)
+      expected      = pricer.greeks(205., self.report_date)
+
+      self.assertAlmostEqual(prices[i], expected["price"], places=10)
+      for greek, values in greeks.items():
+        self.assertAlmostEqual(values[i], expected[greek], places=10)
+
+
+  def test_implied_volatility_recovers_the_volatility(self):
+    vols = self.chain.implied_volatility(205., self.report_date, 0.03, self.chain.price(205., self.report_date, 0.03, 0.25))
+
+    np.testing.assert_allclose(vols[:3], 0.25, atol=1e-8)
+    self.assertTrue(np.isnan(vols[3]))
+
+
+  def test_invalid_maturity_dates(self):
+    self.assertEqual(len(OptionChain.from_contract_ids(["AAPL280229C00200000"])), 1)
+
+    for contract_id in ["AAPL251301C00200000", "AAPL250132C00200000", "AAPL250229C00200000", "AAPL250800C00200000"]:
+      with self.assertRaisesRegex(AssertionError, contract_id):
+        OptionChain.from_contract_ids(_contract_ids + [contract_id])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,108 @@
+"""@package tests.test_QuoteFeed
+@author Kasper Rantamäki
+Tests for the quote subscriptions and the replay feed
+"""
+import unittest
+import asyncio
+import pandas as pd
+
+from quantform.broker_api import ReplayFeed
+
+
+def _tape(n_quotes: int, instrument_ids: list[str]) -> pd.DataFrame:
+  """Function for a quote tape cycling through the instruments with the bid increasing by one per quote"""
+  return pd.DataFrame({"Timestamp":    pd.date_range("2025-08-15 15:30", periods=n_quotes, freq="ms"),
+                       "InstrumentID": [instrument_ids[i % len(instrument_ids)] for i in range(n_quotes)],
+                       "Bid":          [float(i) for i in range(n_quotes)],
+                       "BidSize":      1.,
+                       "Ask":          [float(i) + .5 for i in range(n_quotes)],
+                       "AskSize":      1.})
+
+
+class TestReplayFeed(unittest.TestCase):
+
+  def test_conflation_keeps_the_latest_quote(self):
+    with ReplayFeed(_tape(100, ["A", "B"])) as feed:
+      subscription = feed.subscribe(["A", "B"])
+      feed.start()
+      feed.join()
+
+      quotes = subscription.poll()
+
+    self.assertEqual({quote.InstrumentID: quote.Bid for quote in quotes}, {"A": 98., "B": 99.})
+    self.assertEqual(subscription.stats, {"published": 100, "delivered": 2, "dropped": 98})
+
+
+  def test_drop_oldest_is_bounded(self):
+    with ReplayFeed(_tape(100, ["A", "B"])) as feed:
+      subscription = feed.subscribe(["A"], policy="drop_oldest", capacity=10)
+      feed.start()
+      feed.join()
+
+      quotes = subscription.poll()
+
+    self.assertEqual([quote.Bid for quote in quotes], [float(i) for i in range(80, 100, 2)])
+    self.assertEqual(subscription.stats["dropped"], 40)
+
+
+  def test_iteration_ends_with_the_tape(self):
+    with ReplayFeed(_tape(50, ["A", "B"])) as feed:
+      subscription = feed.subscribe(["A", "B"], policy="drop_oldest")
+      feed.start()
+
+      quotes = list(subscription)
+
+    self.assertEqual(len(quotes), 50)
+    self.assertTrue(subscription.closed)
+
+    with ReplayFeed(_tape(50, ["A", "B"]), close_at_end=False) as feed:
+      subscription = feed.subscribe(["A"])
+      feed.start()
+      feed.join()
+
+      self.assertFalse(subscription.closed)
+
+
+  def test_async_iteration(self):
+    async def consume(feed):
+      subscription = feed.subscribe(["A", "B"], policy="drop_oldest")
+      feed.start()
+      return [quote async for quote in subscription]
+
+    with ReplayFeed(_tape(200, ["A", "B"]), speed=100.) as feed:
+      quotes = asyncio.run(consume(feed))
+
+    self.assertEqual(len(quotes), 200)
+
+
+  def test_cancelled_async_consumer(self):
+    feed      = ReplayFeed(_tape(2000, ["A", "B"]), speed=10.)
+    cancelled = feed.subscribe(["A"])
+    abandoned = feed.subscribe(["A"])
+    other     = feed.subscribe(["B"], policy="drop_oldest", capacity=2000)
+
+    # The consumer gives up on the first quote and its loop is closed afterwards
+    async def consume():
+      with self.assertRaises(asyncio.TimeoutError):
+        await asyncio.wait_for(cancelled.__anext__(), 0.01)
+
+    asyncio.run(consume())
+
+    # The loop of the consumer is closed while it is still waiting for the first quote
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(abandoned.__anext__())
+    loop.run_until_complete(asyncio.sleep(0.01))
+    loop.close()
+
+    feed.start()
+    feed.join(timeout=5.)
+
+    self.assertEqual(feed.replayed, 2000)
+    self.assertEqual(len(other.poll()), 1000)
+    self.assertEqual(cancelled.latest()["A"].Bid, 1998.)
+    self.assertFalse(task.done())
+    feed.close()
+
+
+if __name__ == "__main__":
+  unittest.main()
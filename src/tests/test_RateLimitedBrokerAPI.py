@@ -0,0 +1,142 @@
+"""@package tests.test_RateLimitedBrokerAPI
+@author Kasper Rantamäki
+Tests for the rate limiter and the request batching of the rate limited broker API
+"""
+from typing import Optional
+import threading
+import unittest
+import time
+import pandas as pd
+
+from quantform.broker_api import BrokerAPI, RateLimitedBrokerAPI
+
+
+class ThrottlingBroker(BrokerAPI):
+  """Broker recording the time and the arguments of every request and answering the given requests with 429"""
+
+  def __init__(self, throttled: frozenset[int] = frozenset(), **kwargs) -> None:
+    self.__throttled = throttled
+    self.__lock      = threading.Lock()
+    self.requests    = []  # (time, method name, instrument ids)
+
+
+  def __del__(self) -> None:
+    pass
+
+
+  def __request(self, name: str, instrument_ids: list[str]) -> bool:
+    """Method for recording a request, False if it is throttled"""
+    with self.__lock:
+      self.requests.append((time.monotonic(), name, list(instrument_ids)))
+      return len(self.requests) - 1 not in self.__throttled
+
+
+  def bid(self, instrument_id: str, bid_price: float, bid_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    return (0, bid_price, bid_size) if self.__request("bid", [instrument_id]) else (429, None, None)
+
+
+  def ask(self, instrument_id: str, ask_price: float, ask_size: float, **kwargs) -> tuple[int, Optional[float], Optional[float]]:
+    return (0, ask_price, ask_size) if self.__request("ask", [instrument_id]) else (429, None, None)
+
+
+  def snap(self, instrument_ids: list[str], **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    if not self.__request("snap", instrument_ids):
+      return 429, None
+    return 0, pd.DataFrame({"InstrumentID": list(instrument_ids), "Bid Price": 1., "Ask Price": 1.1})
+
+
+  def history(self, instrument_id: str, start_time: str, end_time: str, step_size: str, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    if not self.__request("history", [instrument_id]):
+      return 429, None
+    return 0, pd.DataFrame({"Timestamp": pd.date_range(start_time, end_time, freq=step_size)})
+
+
+  def fields(self, instrument_ids: list[str], field_ids: list[str],
+             field_map: Optional[dict[str, str]] = None, **kwargs) -> tuple[int, Optional[pd.DataFrame]]:
+    if not self.__request("fields", instrument_ids):
+      return 429, None
+    return 0, pd.DataFrame({"InstrumentID": list(instrument_ids), **{field_id: 0. for field_id in field_ids}})
+
+
+def _run(targets: list) -> list:
+  """Function for running the targets in threads of their own and collecting their return values"""
+  results = [None] * len(targets)
+
+  def run(i):
+    results[i] = targets[i]()
+
+  threads = [threading.Thread(target=run, args=(i,)) for i in range(len(targets))]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  return results
+
+
+class TestRateLimitedBrokerAPI(unittest.TestCase):
+
+  def test_requests_within_the_window(self):
+    broker = ThrottlingBroker(throttled=frozenset([3, 7]))
+    api    = RateLimitedBrokerAPI(broker, limits=[(4, 0.2)], backoff=0.01)
+
+    results = _run([lambda i=i: api.history(f"I{i}", "2025-01-01", "2025-01-03", "1D") for i in range(12)])
+
+    # Every throttled request is retried
+    self.assertTrue(all(code == 0 and len(df) == 3 for code, df in results))
+    self.assertEqual(api.stats, {"calls": 12, "requests": 14, "throttled": 2})
+
+    # No four consecutive requests are more than 0.2 seconds apart
+    times = [request[0] for request in broker.requests]
+    self.assertGreaterEqual(min(later - earlier for earlier, later in zip(times, times[4:])), 0.2 - 1e-3)
+
+
+  def test_orders_go_first(self):
+    broker = ThrottlingBroker()
+    api    = RateLimitedBrokerAPI(broker, limits=[(1, 0.3)])
+
+    # The first request takes the only token, so the others queue up until it returns
+    api.history("I0", "2025-01-01", "2025-01-03", "1D")
+
+    data  = [threading.Thread(target=api.history, args=(f"I{i}", "2025-01-01", "2025-01-03", "1D")) for i in range(1, 4)]
+    order = threading.Thread(target=api.bid, args=("SPY", 100., 1.))
+    for thread in data:
+      thread.start()
+    time.sleep(0.05)
+    order.start()
+
+    for thread in [*data, order]:
+      thread.join()
+
+    self.assertEqual([request[1] for request in broker.requests], ["history", "bid", "history", "history", "history"])
+
+
+  def test_batches_and_results(self):
+    broker = ThrottlingBroker(throttled=frozenset([1, 4]))
+    api    = RateLimitedBrokerAPI(broker, limits=[(2, 0.05)], max_snap_batch=7, backoff=0.01)
+
+    calls   = [[f"I{j}" for j in range(i, i + 3 * (i % 4) + 1)] for i in range(20)]
+    calls  += [["I3", "I1", "I3", "I2"], []]
+    results = _run([lambda instrument_ids=instrument_ids: api.snap(instrument_ids) for instrument_ids in calls])
+
+    self.assertTrue(all(len(request[2]) <= 7 for request in broker.requests))
+    self.assertEqual(api.stats["throttled"], 2)
+
+    # Each caller gets exactly its own instruments back, without duplicates and in the order they were asked for
+    for instrument_ids, (code, df) in zip(calls, results):
+      self.assertEqual(code, 0)
+      self.assertEqual(df["InstrumentID"].tolist(), list(dict.fromkeys(instrument_ids)))
+
+
+  def test_calls_without_instruments(self):
+    api = RateLimitedBrokerAPI(ThrottlingBroker())
+
+    code, df = api.snap([])
+    self.assertEqual((code, len(df)), (0, 0))
+
+    code, df = api.fields([], ["Volume"])
+    self.assertEqual((code, len(df)), (0, 0))
+
+
+if __name__ == "__main__":
+  unittest.main()
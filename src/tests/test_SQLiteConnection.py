@@ -0,0 +1,110 @@
+"""@package tests.test_SQLiteConnection
+@author Kasper Rantamäki
+Tests for the SQLite connection and its single writer thread
+"""
+import concurrent.futures
+import tempfile
+import threading
+import unittest
+import os
+import pandas as pd
+
+from quantform.db import SQLiteConnection
+
+
+class TestSQLiteConnection(unittest.TestCase):
+
+  def setUp(self):
+    self.directory  = tempfile.TemporaryDirectory()
+    self.connection = SQLiteConnection(os.path.join(self.directory.name, "test.db"))
+    self.connection("CREATE TABLE trades (id INTEGER PRIMARY KEY, price REAL)")
+
+
+  def tearDown(self):
+    self.connection.close()
+    self.directory.cleanup()
+
+
+  def count(self) -> int:
+    return int(self.connection.select_sql("SELECT COUNT(*) AS n FROM trades")["n"].iloc[0])
+
+
+  def test_failing_job_is_rolled_back_alone(self):
+    started = threading.Event()
+    release = threading.Event()
+
+    # The writer is kept busy, so that the jobs below are queued and committed as one batch
+    def block(connection):
+      started.set()
+      release.wait()
+
+    blocker = self.connection.write(block, wait=False)
+    started.wait()
+
+    def fail(connection):
+      connection.execute("INSERT INTO trades VALUES (100, 1.)")
+      raise ValueError("Failing job")
+
+    futures = [self.connection.write(lambda connection, i=i: connection.execute("INSERT INTO trades VALUES (?, ?)", (i, float(i))).rowcount, wait=False)
+               for i in range(5)]
+    failing = self.connection.write(fail, wait=False)
+    futures += [self.connection.write(lambda connection, i=i: connection.execute("INSERT INTO trades VALUES (?, ?)", (i, float(i))).rowcount, wait=False)
+                for i in range(5, 10)]
+    release.set()
+
+    blocker.result()
+    self.assertEqual([future.result() for future in futures], [1] * 10)
+    with self.assertRaises(ValueError):
+      failing.result()
+
+    self.assertEqual(self.count(), 10)
+    self.assertTrue(self.connection.select_sql("SELECT * FROM trades WHERE id = 100").empty)
+
+
+  def test_concurrent_inserts(self):
+    def insert(i):
+      return self.connection.insert_sql("main", "trades", pd.DataFrame({"id": range(100 * i, 100 * (i + 1)), "price": 1.}))
+
+    with concurrent.futures.ThreadPoolExecutor(16) as executor:
+      inserted = list(executor.map(insert, range(64)))
+
+    self.assertEqual(inserted, [100] * 64)
+    self.assertEqual(self.count(), 6400)
+
+
+  def test_writes_fail_after_close(self):
+    self.connection.close()
+
+    with self.assertRaises(RuntimeError):
+      self.connection.write(lambda connection: connection.execute("INSERT INTO trades VALUES (1, 1.)"))
+    with self.assertRaises(RuntimeError):
+      self.connection("DELETE FROM trades")
+    with self.assertRaises(RuntimeError):
+      self.connection.insert_sql("main", "trades", pd.DataFrame({"id": [1], "price": [1.]}))
+    with self.assertRaises(RuntimeError):
+      self.connection.delete_sql("DELETE FROM trades")
+
+
+  @unittest.skipUnless(hasattr(os, "fork"), "Forking is not supported on the platform")
+  def test_fork_reset(self):
+    self.connection.insert_sql("main", "trades", pd.DataFrame({"id": [1], "price": [1.]}))
+
+    pid = os.fork()
+    if pid == 0:
+      # The writer thread is not inherited, so the child must start a writer of its own
+      try:
+        inserted = self.connection.insert_sql("main", "trades", pd.DataFrame({"id": [2], "price": [2.]}))
+        code     = 0 if inserted == 1 and self.count() == 2 else 1
+      except BaseException:
+        code = 2
+      os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+
+    self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+    self.assertEqual(self.count(), 2)
+    self.assertEqual(self.connection.insert_sql("main", "trades", pd.DataFrame({"id": [3], "price": [3.]})), 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,62 @@
+"""@package tests.test_SimulatedBrokerAPI
+@author Kasper Rantamäki
+Tests for the order matching of the simulated broker
+"""
+import unittest
+import pandas as pd
+
+from quantform.broker_api import SimulatedBrokerAPI
+
+
+def _quotes(n_quotes: int) -> pd.DataFrame:
+  """Function for a quote tape of a single instrument with the prices rising by 0.1 per second"""
+  return pd.DataFrame({"Timestamp":    pd.date_range("2025-08-15 15:30", periods=n_quotes, freq="s"),
+                       "InstrumentID": "SPY",
+                       "Bid":          [100. + 0.1 * i for i in range(n_quotes)],
+                       "BidSize":      10.,
+                       "Ask":          [100.2 + 0.1 * i for i in range(n_quotes)],
+                       "AskSize":      10.})
+
+
+class TestSimulatedBrokerAPI(unittest.TestCase):
+
+  def test_only_resting_orders_are_kept(self):
+    broker = SimulatedBrokerAPI(_quotes(100))
+
+    self.assertEqual(broker.bid("SPY", 100.2, 5.), (0, 100.2, 5.))
+    self.assertEqual(broker.bid("SPY", 100.2, 20., time_in_force="IOC"), (1, 100.2, 5.))
+    broker.bid("SPY", 99., 5.)
+    broker.ask("SPY", 105., 1.)
+
+    self.assertIn("Resting orders: 2", repr(broker))
+    self.assertEqual(broker.open_orders()["OrderID"].tolist(), [2, 3])
+
+    # The resting sell is filled once the quoted bid crosses its price and the resting buy is cancelled
+    broker.advance()
+    self.assertEqual(broker.cancel(2), 1)
+    self.assertEqual(broker.cancel(3), 0)
+
+    self.assertIn("Resting orders: 0", repr(broker))
+    self.assertTrue(broker.open_orders().empty)
+    self.assertEqual(broker.positions, {"SPY": 9.})
+
+
+  def test_bounded_fills(self):
+    broker = SimulatedBrokerAPI(_quotes(10), max_fills=2)
+
+    for _ in range(5):
+      broker.bid("SPY", 100.2, 1.)
+
+    self.assertEqual(len(broker.fills), 2)
+    self.assertEqual(broker.positions, {"SPY": 5.})
+    self.assertAlmostEqual(broker.cash, -501.)
+
+    broker = SimulatedBrokerAPI(_quotes(10), max_fills=0)
+    broker.bid("SPY", 100.2, 1.)
+
+    self.assertTrue(broker.fills.empty)
+    self.assertEqual(broker.positions, {"SPY": 1.})
+
+
+if __name__ == "__main__":
+  unittest.main()
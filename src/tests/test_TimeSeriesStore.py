@@ -0,0 +1,48 @@
+"""@package tests.test_TimeSeriesStore
+@author Kasper Rantamäki
+Tests for the columnar time series store
+"""
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from quantform.db import TimeSeriesStore
+
+
+class TestTimeSeriesStore(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.store     = TimeSeriesStore(self.directory.name, partition="month")
+    self.index     = pd.date_range("2024-01-30", periods=4, freq="D")
+
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+
+  def test_merge_is_column_wise(self):
+    self.store.write("SPY", pd.DataFrame({"a": [1., 2., 3., 4.], "b": [5., 6., 7., 8.]}, index=self.index))
+    self.store.write("SPY", pd.DataFrame({"b": [60., np.nan], "c": [1., 2.]}, index=self.index[1:3]))
+
+    arrays = self.store.read_arrays("SPY")
+
+    np.testing.assert_array_equal(arrays["index"], self.index.to_numpy(dtype="datetime64[ns]"))
+    np.testing.assert_array_equal(arrays["a"], [1., 2., 3., 4.])
+    np.testing.assert_array_equal(arrays["b"], [5., 60., 7., 8.])
+    np.testing.assert_array_equal(arrays["c"], [np.nan, 1., 2., np.nan])
+
+
+  def test_timezone_aware_timestamps_are_stored_in_utc(self):
+    times = pd.date_range("2024-01-30 09:30", periods=4, freq="D", tz="America/New_York")
+    self.store.write("SPY", pd.DataFrame({"time": times}, index=self.index))
+
+    arrays = self.store.read_arrays("SPY")
+
+    self.assertEqual(arrays["time"].dtype, np.dtype("datetime64[ns]"))
+    np.testing.assert_array_equal(arrays["time"], times.tz_convert(None).to_numpy(dtype="datetime64[ns]"))
+
+
+if __name__ == "__main__":
+  unittest.main()